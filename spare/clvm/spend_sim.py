@@ -14,7 +14,6 @@ from spare.consensus.cost_calculator import NPCResult
 from spare.consensus.default_constants import DEFAULT_CONSTANTS
 from spare.full_node.bundle_tools import simple_solution_generator
 from spare.full_node.coin_store import CoinStore
-from spare.full_node.mempool import Mempool
 from spare.full_node.mempool_check_conditions import get_name_puzzle_conditions, get_puzzle_and_solution_for_coin
 from spare.full_node.mempool_manager import MempoolManager
 from spare.types.blockchain_format.coin import Coin
@@ -298,7 +297,7 @@ class SpendSim:
         self.blocks = new_block_list
         await self.coin_store.rollback_to_block(block_height)
         old_pool = self.mempool_manager.mempool
-        self.mempool_manager.mempool = Mempool(old_pool.mempool_info, old_pool.fee_estimator)
+        self.mempool_manager.mempool = type(old_pool)(old_pool.mempool_info, old_pool.fee_estimator)
         self.block_height = block_height
         if new_br_list:
             self.timestamp = new_br_list[-1].timestamp
@@ -4,6 +4,7 @@ import asyncio
 import logging
 import sys
 from pathlib import Path
+from typing import Optional
 
 import click
 
@@ -171,13 +172,53 @@ def create_cmd(
 @click.option("-l", "--list_duplicates", help="List plots with duplicate IDs", default=False, is_flag=True)
 @click.option("--debug-show-memo", help="Shows memo to recreate the same exact plot", default=False, is_flag=True)
 @click.option("--challenge-start", help="Begins at a different [start] for -n [challenges]", type=int, default=None)
+@click.option(
+    "-w", "--workers-per-disk", help="Checks plots in parallel with this many threads per disk", type=int, default=None
+)
+@click.option(
+    "-o",
+    "--output",
+    help="Writes one JSON line with the result of each plot to this file as soon as it's checked",
+    type=click.Path(),
+    default=None,
+)
+@click.option("--resume", help="Skips the plots already in the --output file", default=False, is_flag=True)
+@click.option(
+    "--early-exit",
+    help="Stops after this many challenges if a plot is clearly fine or clearly broken",
+    type=int,
+    default=None,
+)
 @click.pass_context
 def check_cmd(
-    ctx: click.Context, num: int, grep_string: str, list_duplicates: bool, debug_show_memo: bool, challenge_start: int
+    ctx: click.Context,
+    num: int,
+    grep_string: str,
+    list_duplicates: bool,
+    debug_show_memo: bool,
+    challenge_start: int,
+    workers_per_disk: Optional[int],
+    output: Optional[str],
+    resume: bool,
+    early_exit: Optional[int],
 ):
     from spare.plotting.check_plots import check_plots
 
-    check_plots(ctx.obj["root_path"], num, challenge_start, grep_string, list_duplicates, debug_show_memo)
+    if resume and output is None:
+        raise click.UsageError("--resume requires --output")
+
+    check_plots(
+        ctx.obj["root_path"],
+        num,
+        challenge_start,
+        grep_string,
+        list_duplicates,
+        debug_show_memo,
+        workers_per_disk,
+        None if output is None else Path(output),
+        resume,
+        early_exit,
+    )
 
 
 @plots_cmd.command("add", short_help="Adds a directory of plots")
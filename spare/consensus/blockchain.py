@@ -27,6 +27,7 @@ from spare.consensus.multiprocess_validation import (
     pre_validate_blocks_multiprocessing,
 )
 from spare.full_node.block_height_map import BlockHeightMap
+from spare.full_node.block_record_cache import load_block_record_cache, write_block_record_cache
 from spare.full_node.block_store import BlockStore
 from spare.full_node.coin_store import CoinStore
 from spare.full_node.mempool_check_conditions import get_name_puzzle_conditions
@@ -95,6 +96,9 @@ class Blockchain(BlockchainInterface):
     block_store: BlockStore
     # Used to verify blocks in parallel
     pool: Executor
+    # where the block records close to the peak are saved on shutdown, to
+    # speed up the next startup. None if disabled
+    _block_record_cache_path: Optional[Path]
     # Set holding seen compact proofs, in order to avoid duplicates.
     _seen_compact_proofs: Set[Tuple[VDFInfo, uint32]]
 
@@ -115,6 +119,7 @@ class Blockchain(BlockchainInterface):
         multiprocessing_context: Optional[BaseContext] = None,
         *,
         single_threaded: bool = False,
+        block_record_cache: bool = False,
     ) -> "Blockchain":
         """
         Initializes a blockchain with the BlockRecords from disk, assuming they have all been
@@ -143,6 +148,7 @@ class Blockchain(BlockchainInterface):
         self.coin_store = coin_store
         self.block_store = block_store
         self._shut_down = False
+        self._block_record_cache_path = blockchain_dir / "block-records" if block_record_cache else None
         await self._load_chain_from_store(blockchain_dir)
         self._seen_compact_proofs = set()
         return self
@@ -158,7 +164,7 @@ class Blockchain(BlockchainInterface):
         self.__height_map = await BlockHeightMap.create(blockchain_dir, self.block_store.db_wrapper)
         self.__block_records = {}
         self.__heights_in_cache = {}
-        block_records, peak = await self.block_store.get_block_records_close_to_peak(self.constants.BLOCKS_CACHE_SIZE)
+        block_records, peak = await self._load_block_records_close_to_peak()
         for block in block_records.values():
             self.add_block_record(block)
 
@@ -172,6 +178,34 @@ class Blockchain(BlockchainInterface):
         assert self.__height_map.contains_height(self._peak_height)
         assert not self.__height_map.contains_height(uint32(self._peak_height + 1))
 
+    async def _load_block_records_close_to_peak(self) -> Tuple[Dict[bytes32, BlockRecord], Optional[bytes32]]:
+        if self._block_record_cache_path is not None:
+            peak = await self.block_store.get_peak()
+            if peak is not None:
+                cached = load_block_record_cache(
+                    self._block_record_cache_path, peak[0], self.constants.BLOCKS_CACHE_SIZE
+                )
+                if cached is not None:
+                    log.info(f"loaded {len(cached)} block records from {self._block_record_cache_path}")
+                    return {br.header_hash: br for br in cached}, peak[0]
+        return await self.block_store.get_block_records_close_to_peak(self.constants.BLOCKS_CACHE_SIZE)
+
+    async def write_block_record_cache(self) -> None:
+        """
+        Saves the block records close to the peak, so the next startup doesn't
+        have to load them from the database. Only call this on shutdown, once no
+        more blocks are being added.
+        """
+        if self._block_record_cache_path is None:
+            return
+        peak = self.get_peak()
+        if peak is None:
+            return
+        min_height = peak.height - self.constants.BLOCKS_CACHE_SIZE
+        records = [br for br in self.__block_records.values() if br.height >= min_height]
+        await write_block_record_cache(self._block_record_cache_path, peak, self.constants.BLOCKS_CACHE_SIZE, records)
+        log.info(f"saved {len(records)} block records to {self._block_record_cache_path}")
+
     def get_peak(self) -> Optional[BlockRecord]:
         """
         Return the peak of the blockchain
@@ -262,7 +296,8 @@ class Blockchain(BlockchainInterface):
             None,
         )
         # Always add the block to the database
-        async with self.block_store.db_wrapper.writer():
+        # The unspent coin index is part of this transaction, its changes are only kept once the DB commits
+        async with self.coin_store.unspent_index_transaction():
             try:
                 header_hash: bytes32 = block.header_hash
                 # Perform the DB operations to update the state, and rollback if something goes wrong
@@ -631,10 +666,17 @@ class Blockchain(BlockchainInterface):
         wp_summaries: Optional[List[SubEpochSummary]] = None,
         *,
         validate_signatures: bool,
+        block_records: Optional[BlockchainInterface] = None,
+        prev_blocks: Optional[Dict[bytes32, FullBlock]] = None,
     ) -> List[PreValidationResult]:
+        """
+        block_records and prev_blocks can be used to pre-validate blocks that
+        build on blocks that have been pre-validated, but not added to the
+        chain yet
+        """
         return await pre_validate_blocks_multiprocessing(
             self.constants,
-            self,
+            self if block_records is None else block_records,
             blocks,
             self.pool,
             True,
@@ -643,6 +685,7 @@ class Blockchain(BlockchainInterface):
             batch_size,
             wp_summaries,
             validate_signatures=validate_signatures,
+            prev_blocks=prev_blocks,
         )
 
     async def run_generator(self, unfinished_block: bytes, generator: BlockGenerator, height: uint32) -> NPCResult:
@@ -179,9 +179,14 @@ async def pre_validate_blocks_multiprocessing(
     wp_summaries: Optional[List[SubEpochSummary]] = None,
     *,
     validate_signatures: bool = True,
+    prev_blocks: Optional[Dict[bytes32, FullBlock]] = None,
 ) -> List[PreValidationResult]:
     """
-    This method must be called under the blockchain lock
+    This method must be called under the blockchain lock. The task holding the lock may add blocks to the chain
+    while this runs, a long sync pre-validates a batch of blocks while it adds the previous one. That's safe because
+    adding blocks doesn't change the block records and blocks looked up here by hash (the sync only drops cached
+    records more than BLOCKS_CACHE_SIZE below the blocks it adds), and the blocks that aren't in the chain yet are
+    passed in through block_records and prev_blocks.
     If all the full blocks pass pre-validation, (only validates header), returns the list of required iters.
     if any validation issue occurs, returns False.
 
@@ -194,6 +199,7 @@ async def pre_validate_blocks_multiprocessing(
         blocks: list of full blocks to validate (must be connected to current chain)
         npc_results
         get_block_generator
+        prev_blocks: blocks preceding the ones to validate, that are not in the block store yet
     """
     prev_b: Optional[BlockRecord] = None
     # Collects all the recent blocks (up to the previous sub-epoch)
@@ -289,7 +295,7 @@ async def pre_validate_blocks_multiprocessing(
         prev_b = block_rec
         diff_ssis.append((difficulty, sub_slot_iters))
 
-    block_dict: Dict[bytes32, FullBlock] = {}
+    block_dict: Dict[bytes32, FullBlock] = {} if prev_blocks is None else dict(prev_blocks)
     for i, block in enumerate(blocks):
         block_dict[block.header_hash] = block
         if not block_record_was_present[i]:
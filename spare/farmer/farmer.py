@@ -1,23 +1,27 @@
 from __future__ import annotations
 
 import asyncio
-import json
 import logging
+import ssl
 import time
 import traceback
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Set, Tuple
+from typing import Any, Coroutine, Dict, List, Optional, Set, Tuple
 
-import aiohttp
 from blspy import AugSchemeMPL, G1Element, G2Element, PrivateKey
 
 from spare.consensus.constants import ConsensusConstants
+from spare.consensus.pot_iterations import calculate_sp_interval_iters
 from spare.daemon.keychain_proxy import KeychainProxy, connect_to_keychain_and_validate, wrap_local_keychain
+from spare.farmer.plot_index import FarmerPlotIndex
+from spare.farmer.pool_client import PartialRetryQueue, PoolClient, PoolRequestError, QueuedPartial
+from spare.farmer.signage_point_state import PoolStateSnapshot, ProofTimings, SignagePointState
 from spare.plot_sync.delta import Delta
 from spare.plot_sync.receiver import Receiver
 from spare.pools.pool_config import PoolWalletConfig, add_auth_key, load_pool_config
 from spare.protocols import farmer_protocol, harvester_protocol
 from spare.protocols.pool_protocol import (
+    POOL_PARTIAL_TIME_LIMIT,
     AuthenticationPayload,
     ErrorResponse,
     GetFarmerResponse,
@@ -44,6 +48,8 @@ from spare.util.hash import std_hash
 from spare.util.ints import uint8, uint16, uint64
 from spare.util.keychain import Keychain
 from spare.util.logging import TimedDuplicateFilter
+from spare.util.lru_cache import LRUCache
+from spare.util.path import path_from_root
 from spare.wallet.derive_keys import (
     find_authentication_sk,
     find_owner_sk,
@@ -82,6 +88,9 @@ class Farmer:
         self.pool_config = pool_config
         # Keep track of all sps, keyed on challenge chain signage point hash
         self.sps: Dict[bytes32, List[farmer_protocol.NewSignagePoint]] = {}
+        # The thresholds and pool states the proofs of space of each signage point are checked against, also keyed
+        # on challenge chain signage point hash
+        self.sp_states: Dict[bytes32, SignagePointState] = {}
 
         # Keep track of harvester plot identifier (str), target sp index, and PoSpace for each challenge
         self.proofs_of_space: Dict[bytes32, List[Tuple[str, ProofOfSpace]]] = {}
@@ -97,10 +106,21 @@ class Farmer:
         self.cache_add_time: Dict[bytes32, uint64] = {}
 
         self.plot_sync_receivers: Dict[bytes32, Receiver] = {}
+        # The plots of recently disconnected harvesters and when they disconnected, used to only sync the differences
+        # if they connect again. Kept for the last `plot_sync_known_harvesters` harvesters, for up to
+        # `plot_sync_known_plots_max_age` seconds
+        self.plot_sync_known_plots: LRUCache[bytes32, Tuple[float, Dict[str, harvester_protocol.Plot]]] = LRUCache(
+            farmer_config.get("plot_sync_known_harvesters", 10)
+        )
+        self.plot_sync_known_plots_max_age: int = farmer_config.get("plot_sync_known_plots_max_age", 3600)
+        self.plot_index = FarmerPlotIndex()
 
         self.cache_clear_task: Optional[asyncio.Task[None]] = None
         self.update_pool_state_task: Optional[asyncio.Task[None]] = None
         self.constants = consensus_constants
+        self.pool_sp_interval_iters = calculate_sp_interval_iters(
+            consensus_constants, consensus_constants.POOL_SUB_SLOT_ITERS
+        )
         self._shut_down = False
         self.server: Any = None
         self.state_changed_callback: Optional[StateChangedProtocol] = None
@@ -122,6 +142,24 @@ class Farmer:
 
         self.all_root_sks: List[PrivateKey] = []
 
+        # Partials are submitted in the background, at most `max_concurrent_partials` at once
+        self.max_concurrent_partials: int = farmer_config.get("max_concurrent_partials", 10)
+        self.partial_semaphore: Optional[asyncio.Semaphore] = None
+        self.partial_tasks: Set[asyncio.Task[None]] = set()
+
+        # From pool URL to the client which sends all requests to that pool
+        self.pool_clients: Dict[str, PoolClient] = {}
+        self.pool_ssl_context: Optional[ssl.SSLContext] = None
+        # Partials which didn't reach their pool are retried until they are `partial_retry_max_age` seconds old
+        self.partial_retry_queue = PartialRetryQueue(
+            path_from_root(root_path, farmer_config.get("partial_retry_queue_path", "db/partial_retry_queue.json")),
+            farmer_config.get("partial_retry_queue_size", 1000),
+            farmer_config.get("partial_retry_max_age", POOL_PARTIAL_TIME_LIMIT),
+        )
+        self.partial_retry_task: Optional[asyncio.Task[None]] = None
+
+        self.proof_timings = ProofTimings()
+
     def get_connections(self, request_node_type: Optional[NodeType]) -> List[Dict[str, Any]]:
         return default_get_connections(server=self.server, request_node_type=request_node_type)
 
@@ -190,6 +228,8 @@ class Farmer:
                 if await self.setup_keys():
                     self.update_pool_state_task = asyncio.create_task(self._periodically_update_pool_state_task())
                     self.cache_clear_task = asyncio.create_task(self._periodically_clear_cache_and_refresh_task())
+                    self.partial_retry_queue.load()
+                    self.partial_retry_task = asyncio.create_task(self._periodically_retry_partials_task())
                     log.debug("start_task: initialized")
                     self.started = True
                     return
@@ -201,6 +241,16 @@ class Farmer:
         self._shut_down = True
 
     async def _await_closed(self, shutting_down: bool = True) -> None:
+        for task in self.partial_tasks.copy():
+            task.cancel()
+        if len(self.partial_tasks) > 0:
+            await asyncio.wait(self.partial_tasks)
+        if self.partial_retry_task is not None:
+            await self.partial_retry_task
+        await self.partial_retry_queue.save()
+        for pool_client in self.pool_clients.values():
+            await pool_client.close()
+        self.pool_clients.clear()
         if self.cache_clear_task is not None:
             await self.cache_clear_task
         if self.update_pool_state_task is not None:
@@ -244,7 +294,9 @@ class Farmer:
             self.harvester_handshake_task = None
 
         if peer.connection_type is NodeType.HARVESTER:
-            self.plot_sync_receivers[peer.peer_node_id] = Receiver(peer, self.plot_sync_callback)
+            self.plot_sync_receivers[peer.peer_node_id] = Receiver(
+                peer, self.plot_sync_callback, self.take_known_plots(peer.peer_node_id)
+            )
             self.harvester_handshake_task = asyncio.create_task(handshake_task())
 
     def set_server(self, server: SpareServer) -> None:
@@ -254,6 +306,96 @@ class Farmer:
         if self.state_changed_callback is not None:
             self.state_changed_callback(change, data)
 
+    def get_partial_semaphore(self) -> asyncio.Semaphore:
+        if self.partial_semaphore is None:
+            self.partial_semaphore = asyncio.Semaphore(self.max_concurrent_partials)
+        return self.partial_semaphore
+
+    def get_pool_ssl_context(self) -> ssl.SSLContext:
+        if self.pool_ssl_context is None:
+            self.pool_ssl_context = ssl_context_for_root(get_mozilla_ca_crt(), log=self.log)
+        return self.pool_ssl_context
+
+    def get_pool_client(self, pool_url: str) -> PoolClient:
+        pool_client = self.pool_clients.get(pool_url)
+        if pool_client is None:
+            pool_client = PoolClient(
+                pool_url,
+                self.get_pool_ssl_context(),
+                self.config.get("pool_max_concurrent_requests", 4),
+                self.config.get("pool_min_request_interval", 0.0),
+            )
+            self.pool_clients[pool_url] = pool_client
+        return pool_client
+
+    def update_sp_state(self, new_signage_point: farmer_protocol.NewSignagePoint) -> None:
+        sp_state = self.sp_states.get(new_signage_point.challenge_chain_sp)
+        if sp_state is None:
+            sp_state = SignagePointState()
+            self.sp_states[new_signage_point.challenge_chain_sp] = sp_state
+        sp_state.thresholds.append(
+            (new_signage_point, calculate_sp_interval_iters(self.constants, new_signage_point.sub_slot_iters))
+        )
+        sp_state.pools = {
+            p2_singleton_puzzle_hash: PoolStateSnapshot(
+                pool_dict["pool_config"],
+                pool_dict["authentication_token_timeout"],
+                self.get_authentication_sk(pool_dict["pool_config"]),
+            )
+            for p2_singleton_puzzle_hash, pool_dict in self.pool_state.items()
+        }
+
+    def start_partial_task(self, coroutine: Coroutine[Any, Any, None]) -> None:
+        task = asyncio.create_task(coroutine)
+        self.partial_tasks.add(task)
+        task.add_done_callback(self.partial_tasks.discard)
+
+    async def submit_partial(self, partial: QueuedPartial) -> None:
+        pool_state_dict: Optional[Dict[str, Any]] = self.pool_state.get(partial.p2_singleton_puzzle_hash)
+        if pool_state_dict is None:
+            self.log.info(f"Did not find pool info for {partial.p2_singleton_puzzle_hash}, dropping partial")
+            return
+        pool_client = self.get_pool_client(partial.pool_url)
+        if partial.attempts == 0:
+            pool_client.metrics.partials_submitted += 1
+        else:
+            pool_client.metrics.partials_retried += 1
+        try:
+            pool_response = await pool_client.request("POST", "/partial", json_data=partial.request)
+        except PoolRequestError as e:
+            self.log.error(f"Error sending partial to {partial.pool_url}, retrying later: {e}")
+            dropped = self.partial_retry_queue.put(partial)
+            if dropped is not None:
+                self.get_pool_client(dropped.pool_url).metrics.partials_dropped += 1
+            return
+
+        self.log.info(f"Pool response: {pool_response}")
+        if "error_code" in pool_response:
+            self.log.error(f"Error in pooling: {pool_response['error_code'], pool_response['error_message']}")
+            pool_client.metrics.reject_partial(pool_response["error_code"])
+            pool_state_dict["pool_errors_24h"].append(pool_response)
+            if pool_response["error_code"] == PoolErrorCode.PROOF_NOT_GOOD_ENOUGH.value:
+                self.log.error("Partial not good enough, forcing pool farmer update to get our current difficulty.")
+                pool_state_dict["next_farmer_update"] = 0
+                await self.update_pool_state()
+        else:
+            pool_client.metrics.partials_accepted += 1
+            new_difficulty = pool_response["new_difficulty"]
+            pool_state_dict["points_acknowledged_since_start"] += new_difficulty
+            pool_state_dict["points_acknowledged_24h"].append((time.time(), new_difficulty))
+            pool_state_dict["current_difficulty"] = new_difficulty
+
+        self.state_changed(
+            "submitted_partial",
+            {
+                "launcher_id": bytes32.from_hexstr(partial.request["payload"]["launcher_id"]).hex(),
+                "pool_url": partial.pool_url,
+                "current_difficulty": pool_state_dict["current_difficulty"],
+                "points_acknowledged_since_start": pool_state_dict["points_acknowledged_since_start"],
+                "points_acknowledged_24h": pool_state_dict["points_acknowledged_24h"],
+            },
+        )
+
     def handle_failed_pool_response(self, p2_singleton_puzzle_hash: bytes32, error_message: str) -> None:
         self.log.error(error_message)
         self.pool_state[p2_singleton_puzzle_hash]["pool_errors_24h"].append(
@@ -264,36 +406,45 @@ class Farmer:
         self.log.info(f"peer disconnected {connection.get_peer_logging()}")
         self.state_changed("close_connection", {})
         if connection.connection_type is NodeType.HARVESTER:
-            del self.plot_sync_receivers[connection.peer_node_id]
+            receiver = self.plot_sync_receivers.pop(connection.peer_node_id)
+            if len(receiver.plots()) > 0:
+                self.plot_sync_known_plots.put(connection.peer_node_id, (time.time(), receiver.plots()))
+            self.plot_index.remove_harvester(connection.peer_node_id)
             self.state_changed("harvester_removed", {"node_id": connection.peer_node_id})
 
+    def take_known_plots(self, peer_id: bytes32) -> Optional[Dict[str, harvester_protocol.Plot]]:
+        known = self.plot_sync_known_plots.get(peer_id)
+        if known is None:
+            return None
+        self.plot_sync_known_plots.remove(peer_id)
+        disconnect_time, plots = known
+        if time.time() - disconnect_time > self.plot_sync_known_plots_max_age:
+            return None
+        return plots
+
+    def evict_known_plots(self, now: float) -> None:
+        # oldest first
+        for peer_id, (disconnect_time, _) in list(self.plot_sync_known_plots.cache.items()):
+            if now - disconnect_time <= self.plot_sync_known_plots_max_age:
+                break
+            self.plot_sync_known_plots.remove(peer_id)
+
     async def plot_sync_callback(self, peer_id: bytes32, delta: Optional[Delta]) -> None:
         log.debug(f"plot_sync_callback: peer_id {peer_id}, delta {delta}")
         receiver: Receiver = self.plot_sync_receivers[peer_id]
         harvester_updated: bool = delta is not None and not delta.empty()
+        if delta is not None:
+            self.plot_index.update(peer_id, receiver.plots(), delta)
         if receiver.initial_sync() or harvester_updated:
             self.state_changed("harvester_update", receiver.to_dict(True))
 
     async def _pool_get_pool_info(self, pool_config: PoolWalletConfig) -> Optional[Dict[str, Any]]:
         try:
-            async with aiohttp.ClientSession(trust_env=True) as session:
-                async with session.get(
-                    f"{pool_config.pool_url}/pool_info", ssl=ssl_context_for_root(get_mozilla_ca_crt(), log=self.log)
-                ) as resp:
-                    if resp.ok:
-                        response: Dict[str, Any] = json.loads(await resp.text())
-                        self.log.info(f"GET /pool_info response: {response}")
-                        return response
-                    else:
-                        self.handle_failed_pool_response(
-                            pool_config.p2_singleton_puzzle_hash,
-                            f"Error in GET /pool_info {pool_config.pool_url}, {resp.status}",
-                        )
-
-        except Exception as e:
-            self.handle_failed_pool_response(
-                pool_config.p2_singleton_puzzle_hash, f"Exception in GET /pool_info {pool_config.pool_url}, {e}"
-            )
+            response = await self.get_pool_client(pool_config.pool_url).request("GET", "/pool_info")
+            self.log.info(f"GET /pool_info response: {response}")
+            return response
+        except PoolRequestError as e:
+            self.handle_failed_pool_response(pool_config.p2_singleton_puzzle_hash, f"{e}")
 
         return None
 
@@ -313,29 +464,17 @@ class Farmer:
             "signature": bytes(signature).hex(),
         }
         try:
-            async with aiohttp.ClientSession(trust_env=True) as session:
-                async with session.get(
-                    f"{pool_config.pool_url}/farmer",
-                    params=get_farmer_params,
-                    ssl=ssl_context_for_root(get_mozilla_ca_crt(), log=self.log),
-                ) as resp:
-                    if resp.ok:
-                        response: Dict[str, Any] = json.loads(await resp.text())
-                        log_level = logging.INFO
-                        if "error_code" in response:
-                            log_level = logging.WARNING
-                            self.pool_state[pool_config.p2_singleton_puzzle_hash]["pool_errors_24h"].append(response)
-                        self.log.log(log_level, f"GET /farmer response: {response}")
-                        return response
-                    else:
-                        self.handle_failed_pool_response(
-                            pool_config.p2_singleton_puzzle_hash,
-                            f"Error in GET /farmer {pool_config.pool_url}, {resp.status}",
-                        )
-        except Exception as e:
-            self.handle_failed_pool_response(
-                pool_config.p2_singleton_puzzle_hash, f"Exception in GET /farmer {pool_config.pool_url}, {e}"
+            response = await self.get_pool_client(pool_config.pool_url).request(
+                "GET", "/farmer", params=get_farmer_params
             )
+            log_level = logging.INFO
+            if "error_code" in response:
+                log_level = logging.WARNING
+                self.pool_state[pool_config.p2_singleton_puzzle_hash]["pool_errors_24h"].append(response)
+            self.log.log(log_level, f"GET /farmer response: {response}")
+            return response
+        except PoolRequestError as e:
+            self.handle_failed_pool_response(pool_config.p2_singleton_puzzle_hash, f"{e}")
         return None
 
     async def _pool_post_farmer(
@@ -355,29 +494,17 @@ class Farmer:
         post_farmer_request = PostFarmerRequest(post_farmer_payload, signature)
         self.log.debug(f"POST /farmer request {post_farmer_request}")
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{pool_config.pool_url}/farmer",
-                    json=post_farmer_request.to_json_dict(),
-                    ssl=ssl_context_for_root(get_mozilla_ca_crt(), log=self.log),
-                ) as resp:
-                    if resp.ok:
-                        response: Dict[str, Any] = json.loads(await resp.text())
-                        log_level = logging.INFO
-                        if "error_code" in response:
-                            log_level = logging.WARNING
-                            self.pool_state[pool_config.p2_singleton_puzzle_hash]["pool_errors_24h"].append(response)
-                        self.log.log(log_level, f"POST /farmer response: {response}")
-                        return response
-                    else:
-                        self.handle_failed_pool_response(
-                            pool_config.p2_singleton_puzzle_hash,
-                            f"Error in POST /farmer {pool_config.pool_url}, {resp.status}",
-                        )
-        except Exception as e:
-            self.handle_failed_pool_response(
-                pool_config.p2_singleton_puzzle_hash, f"Exception in POST /farmer {pool_config.pool_url}, {e}"
+            response = await self.get_pool_client(pool_config.pool_url).request(
+                "POST", "/farmer", json_data=post_farmer_request.to_json_dict()
             )
+            log_level = logging.INFO
+            if "error_code" in response:
+                log_level = logging.WARNING
+                self.pool_state[pool_config.p2_singleton_puzzle_hash]["pool_errors_24h"].append(response)
+            self.log.log(log_level, f"POST /farmer response: {response}")
+            return response
+        except PoolRequestError as e:
+            self.handle_failed_pool_response(pool_config.p2_singleton_puzzle_hash, f"{e}")
         return None
 
     async def _pool_put_farmer(
@@ -397,28 +524,16 @@ class Farmer:
         put_farmer_request = PutFarmerRequest(put_farmer_payload, signature)
         self.log.debug(f"PUT /farmer request {put_farmer_request}")
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.put(
-                    f"{pool_config.pool_url}/farmer",
-                    json=put_farmer_request.to_json_dict(),
-                    ssl=ssl_context_for_root(get_mozilla_ca_crt(), log=self.log),
-                ) as resp:
-                    if resp.ok:
-                        response: Dict[str, Any] = json.loads(await resp.text())
-                        log_level = logging.INFO
-                        if "error_code" in response:
-                            log_level = logging.WARNING
-                            self.pool_state[pool_config.p2_singleton_puzzle_hash]["pool_errors_24h"].append(response)
-                        self.log.log(log_level, f"PUT /farmer response: {response}")
-                    else:
-                        self.handle_failed_pool_response(
-                            pool_config.p2_singleton_puzzle_hash,
-                            f"Error in PUT /farmer {pool_config.pool_url}, {resp.status}",
-                        )
-        except Exception as e:
-            self.handle_failed_pool_response(
-                pool_config.p2_singleton_puzzle_hash, f"Exception in PUT /farmer {pool_config.pool_url}, {e}"
+            response = await self.get_pool_client(pool_config.pool_url).request(
+                "PUT", "/farmer", json_data=put_farmer_request.to_json_dict()
             )
+            log_level = logging.INFO
+            if "error_code" in response:
+                log_level = logging.WARNING
+                self.pool_state[pool_config.p2_singleton_puzzle_hash]["pool_errors_24h"].append(response)
+            self.log.log(log_level, f"PUT /farmer response: {response}")
+        except PoolRequestError as e:
+            self.handle_failed_pool_response(pool_config.p2_singleton_puzzle_hash, f"{e}")
 
     def get_authentication_sk(self, pool_config: PoolWalletConfig) -> Optional[PrivateKey]:
         if pool_config.p2_singleton_puzzle_hash in self.authentication_keys:
@@ -664,6 +779,21 @@ class Farmer:
 
         return {"harvesters": harvesters}
 
+    def get_plot_aggregates(self) -> Dict[str, Any]:
+        harvesters: List[Dict[str, Any]] = []
+        for node_id, harvester in self.plot_index.harvesters().items():
+            harvesters.append({"node_id": node_id, **harvester.aggregate().to_dict()})
+        return {"total": self.plot_index.total().to_dict(), "harvesters": harvesters}
+
+    def get_proof_timings(self) -> Dict[str, Any]:
+        return self.proof_timings.to_json_dict()
+
+    def get_pool_client_metrics(self) -> Dict[str, Any]:
+        return {
+            "pools": {pool_url: client.metrics.to_json_dict() for pool_url, client in self.pool_clients.items()},
+            "partial_retry_queue_size": len(self.partial_retry_queue),
+        }
+
     def get_receiver(self, node_id: bytes32) -> Receiver:
         receiver: Optional[Receiver] = self.plot_sync_receivers.get(node_id)
         if receiver is None:
@@ -688,6 +818,21 @@ class Farmer:
             time_slept += 1
             await asyncio.sleep(1)
 
+    async def _periodically_retry_partials_task(self) -> None:
+        while not self._shut_down:
+            try:
+                due, expired = self.partial_retry_queue.take_due(time.time())
+                for partial in expired:
+                    self.log.info(f"Dropping partial for {partial.pool_url} after {partial.attempts} attempts")
+                    self.get_pool_client(partial.pool_url).metrics.partials_dropped += 1
+                for partial in due:
+                    self.start_partial_task(self.submit_partial(partial))
+                await self.partial_retry_queue.save()
+            except Exception:
+                log.error(f"_periodically_retry_partials_task failed: {traceback.format_exc()}")
+
+            await asyncio.sleep(1)
+
     async def _periodically_clear_cache_and_refresh_task(self) -> None:
         time_slept = 0
         refresh_slept = 0
@@ -699,12 +844,14 @@ class Farmer:
                     for key, add_time in self.cache_add_time.items():
                         if now - float(add_time) > self.constants.SUB_SLOT_TIME_TARGET * 3:
                             self.sps.pop(key, None)
+                            self.sp_states.pop(key, None)
                             self.proofs_of_space.pop(key, None)
                             self.quality_str_to_identifiers.pop(key, None)
                             self.number_of_responses.pop(key, None)
                             removed_keys.append(key)
                     for key in removed_keys:
                         self.cache_add_time.pop(key, None)
+                    self.evict_known_plots(now)
                     time_slept = 0
                     log.debug(
                         f"Cleared farmer cache. Num sps: {len(self.sps)} {len(self.proofs_of_space)} "
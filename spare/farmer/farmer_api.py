@@ -1,15 +1,14 @@
 from __future__ import annotations
 
-import json
 import time
 from typing import Any, Dict, List, Optional, Tuple
 
-import aiohttp
 from blspy import AugSchemeMPL, G2Element, PrivateKey
 
-from spare import __version__
-from spare.consensus.pot_iterations import calculate_iterations_quality, calculate_sp_interval_iters
+from spare.consensus.pot_iterations import calculate_iterations_quality
 from spare.farmer.farmer import Farmer
+from spare.farmer.pool_client import QueuedPartial
+from spare.farmer.signage_point_state import PoolStateSnapshot
 from spare.harvester.harvester_api import HarvesterAPI
 from spare.protocols import farmer_protocol, harvester_protocol
 from spare.protocols.harvester_protocol import (
@@ -17,19 +16,17 @@ from spare.protocols.harvester_protocol import (
     PlotSyncPathList,
     PlotSyncPlotList,
     PlotSyncStart,
+    PlotSyncSummary,
     PoolDifficulty,
 )
 from spare.protocols.pool_protocol import (
-    PoolErrorCode,
     PostPartialPayload,
     PostPartialRequest,
     get_current_authentication_token,
 )
 from spare.protocols.protocol_message_types import ProtocolMessageTypes
 from spare.server.outbound_message import NodeType, make_msg
-from spare.server.server import ssl_context_for_root
 from spare.server.ws_connection import WSSpareConnection
-from spare.ssl.create_ssl import get_mozilla_ca_crt
 from spare.types.blockchain_format.pool_target import PoolTarget
 from spare.types.blockchain_format.proof_of_space import (
     generate_plot_public_key,
@@ -77,24 +74,26 @@ class FarmerAPI:
                 )
                 return None
 
-        if new_proof_of_space.sp_hash not in self.farmer.sps:
+        sp_state = self.farmer.sp_states.get(new_proof_of_space.sp_hash)
+        if sp_state is None:
             self.farmer.log.warning(
                 f"Received response for a signage point that we do not have {new_proof_of_space.sp_hash}"
             )
             return None
 
-        sps = self.farmer.sps[new_proof_of_space.sp_hash]
-        for sp in sps:
+        # The quality string doesn't depend on the signage point, only on its hash
+        with self.farmer.proof_timings.measure("verify_proof"):
             computed_quality_string = verify_and_get_quality_string(
                 new_proof_of_space.proof,
                 self.farmer.constants,
                 new_proof_of_space.challenge_hash,
                 new_proof_of_space.sp_hash,
             )
-            if computed_quality_string is None:
-                self.farmer.log.error(f"Invalid proof of space {new_proof_of_space.proof}")
-                return None
+        if computed_quality_string is None:
+            self.farmer.log.error(f"Invalid proof of space {new_proof_of_space.proof}")
+            return None
 
+        for sp, sp_interval_iters in sp_state.thresholds:
             self.farmer.number_of_responses[new_proof_of_space.sp_hash] += 1
 
             required_iters: uint64 = calculate_iterations_quality(
@@ -106,7 +105,7 @@ class FarmerAPI:
             )
 
             # If the iters are good enough to make a block, proceed with the block making flow
-            if required_iters < calculate_sp_interval_iters(self.farmer.constants, sp.sub_slot_iters):
+            if required_iters < sp_interval_iters:
                 # Proceed at getting the signatures for this PoSpace
                 request = harvester_protocol.RequestSignatures(
                     new_proof_of_space.plot_identifier,
@@ -132,21 +131,25 @@ class FarmerAPI:
                 )
                 self.farmer.cache_add_time[computed_quality_string] = uint64(int(time.time()))
 
-                await peer.send_message(make_msg(ProtocolMessageTypes.request_signatures, request))
+                with self.farmer.proof_timings.measure("request_block_signatures"):
+                    await peer.send_message(make_msg(ProtocolMessageTypes.request_signatures, request))
 
             p2_singleton_puzzle_hash = new_proof_of_space.proof.pool_contract_puzzle_hash
             if p2_singleton_puzzle_hash is not None:
                 # Otherwise, send the proof of space to the pool
                 # When we win a block, we also send the partial to the pool
-                if p2_singleton_puzzle_hash not in self.farmer.pool_state:
+                pool_snapshot = sp_state.pools.get(p2_singleton_puzzle_hash)
+                pool_state_dict: Optional[Dict] = self.farmer.pool_state.get(p2_singleton_puzzle_hash)
+                if pool_snapshot is None or pool_state_dict is None:
                     self.farmer.log.info(f"Did not find pool info for {p2_singleton_puzzle_hash}")
                     return
-                pool_state_dict: Dict = self.farmer.pool_state[p2_singleton_puzzle_hash]
-                pool_url = pool_state_dict["pool_config"].pool_url
+                pool_url = pool_snapshot.pool_config.pool_url
                 if pool_url == "":
                     return
 
-                if pool_state_dict["current_difficulty"] is None:
+                # The difficulty is updated by the responses to the partials, so it's not part of the snapshot
+                current_difficulty = pool_state_dict["current_difficulty"]
+                if current_difficulty is None:
                     self.farmer.log.warning(
                         f"No pool specific difficulty has been set for {p2_singleton_puzzle_hash}, "
                         f"check communication with the pool, skipping this partial to {pool_url}."
@@ -157,135 +160,108 @@ class FarmerAPI:
                     self.farmer.constants.DIFFICULTY_CONSTANT_FACTOR,
                     computed_quality_string,
                     new_proof_of_space.proof.size,
-                    pool_state_dict["current_difficulty"],
+                    current_difficulty,
                     new_proof_of_space.sp_hash,
                 )
-                if required_iters >= calculate_sp_interval_iters(
-                    self.farmer.constants, self.farmer.constants.POOL_SUB_SLOT_ITERS
-                ):
-                    self.farmer.log.info(
-                        f"Proof of space not good enough for pool {pool_url}: {pool_state_dict['current_difficulty']}"
-                    )
+                if required_iters >= self.farmer.pool_sp_interval_iters:
+                    self.farmer.log.info(f"Proof of space not good enough for pool {pool_url}: {current_difficulty}")
                     return
 
-                authentication_token_timeout = pool_state_dict["authentication_token_timeout"]
-                if authentication_token_timeout is None:
+                if pool_snapshot.authentication_token_timeout is None:
                     self.farmer.log.warning(
                         f"No pool specific authentication_token_timeout has been set for {p2_singleton_puzzle_hash}"
                         f", check communication with the pool."
                     )
                     return
 
-                # Submit partial to pool
-                is_eos = new_proof_of_space.signage_point_index == 0
-
-                payload = PostPartialPayload(
-                    pool_state_dict["pool_config"].launcher_id,
-                    get_current_authentication_token(authentication_token_timeout),
-                    new_proof_of_space.proof,
-                    new_proof_of_space.sp_hash,
-                    is_eos,
-                    peer.peer_node_id,
+                # Submit the partial in the background to not hold up the proofs of space which come in after this one
+                self.farmer.start_partial_task(
+                    self._submit_partial(new_proof_of_space, peer, pool_snapshot, pool_state_dict, current_difficulty)
                 )
+                return
 
-                # The plot key is 2/2 so we need the harvester's half of the signature
-                m_to_sign = payload.get_hash()
-                request = harvester_protocol.RequestSignatures(
-                    new_proof_of_space.plot_identifier,
-                    new_proof_of_space.challenge_hash,
-                    new_proof_of_space.sp_hash,
-                    [m_to_sign],
-                )
-                response: Any = await peer.call_api(HarvesterAPI.request_signatures, request)
-                if not isinstance(response, harvester_protocol.RespondSignatures):
-                    self.farmer.log.error(f"Invalid response from harvester: {response}")
-                    return
+    async def _submit_partial(
+        self,
+        new_proof_of_space: harvester_protocol.NewProofOfSpace,
+        peer: WSSpareConnection,
+        pool_snapshot: PoolStateSnapshot,
+        pool_state_dict: Dict,
+        current_difficulty: uint64,
+    ) -> None:
+        assert pool_snapshot.authentication_token_timeout is not None
+        p2_singleton_puzzle_hash = pool_snapshot.pool_config.p2_singleton_puzzle_hash
+        pool_url = pool_snapshot.pool_config.pool_url
+        async with self.farmer.get_partial_semaphore():
+            is_eos = new_proof_of_space.signage_point_index == 0
+
+            payload = PostPartialPayload(
+                pool_snapshot.pool_config.launcher_id,
+                get_current_authentication_token(pool_snapshot.authentication_token_timeout),
+                new_proof_of_space.proof,
+                new_proof_of_space.sp_hash,
+                is_eos,
+                peer.peer_node_id,
+            )
 
-                assert len(response.message_signatures) == 1
+            # The plot key is 2/2 so we need the harvester's half of the signature
+            m_to_sign = payload.get_hash()
+            request = harvester_protocol.RequestSignatures(
+                new_proof_of_space.plot_identifier,
+                new_proof_of_space.challenge_hash,
+                new_proof_of_space.sp_hash,
+                [m_to_sign],
+            )
+            with self.farmer.proof_timings.measure("request_partial_signatures"):
+                response: Any = await peer.call_api(HarvesterAPI.request_signatures, request)
+            if not isinstance(response, harvester_protocol.RespondSignatures):
+                self.farmer.log.error(f"Invalid response from harvester: {response}")
+                return
 
-                plot_signature: Optional[G2Element] = None
-                for sk in self.farmer.get_private_keys():
-                    pk = sk.get_g1()
-                    if pk == response.farmer_pk:
-                        agg_pk = generate_plot_public_key(response.local_pk, pk, True)
-                        assert agg_pk == new_proof_of_space.proof.plot_public_key
-                        sig_farmer = AugSchemeMPL.sign(sk, m_to_sign, agg_pk)
-                        taproot_sk: PrivateKey = generate_taproot_sk(response.local_pk, pk)
-                        taproot_sig: G2Element = AugSchemeMPL.sign(taproot_sk, m_to_sign, agg_pk)
+            assert len(response.message_signatures) == 1
 
-                        plot_signature = AugSchemeMPL.aggregate(
-                            [sig_farmer, response.message_signatures[0][1], taproot_sig]
-                        )
-                        assert AugSchemeMPL.verify(agg_pk, m_to_sign, plot_signature)
+            if pool_snapshot.authentication_sk is None:
+                self.farmer.log.error(f"No authentication sk for {p2_singleton_puzzle_hash}")
+                return
 
-                authentication_sk: Optional[PrivateKey] = self.farmer.get_authentication_sk(
-                    pool_state_dict["pool_config"]
-                )
-                if authentication_sk is None:
-                    self.farmer.log.error(f"No authentication sk for {p2_singleton_puzzle_hash}")
-                    return
+            with self.farmer.proof_timings.measure("sign_partial"):
+                plot_signature: Optional[G2Element] = None
+                sk: Optional[PrivateKey] = self.farmer.pool_sks_map.get(bytes(response.farmer_pk))
+                if sk is not None:
+                    agg_pk = generate_plot_public_key(response.local_pk, response.farmer_pk, True)
+                    assert agg_pk == new_proof_of_space.proof.plot_public_key
+                    sig_farmer = AugSchemeMPL.sign(sk, m_to_sign, agg_pk)
+                    taproot_sk: PrivateKey = generate_taproot_sk(response.local_pk, response.farmer_pk)
+                    taproot_sig: G2Element = AugSchemeMPL.sign(taproot_sk, m_to_sign, agg_pk)
+
+                    plot_signature = AugSchemeMPL.aggregate(
+                        [sig_farmer, response.message_signatures[0][1], taproot_sig]
+                    )
+                    assert AugSchemeMPL.verify(agg_pk, m_to_sign, plot_signature)
 
-                authentication_signature = AugSchemeMPL.sign(authentication_sk, m_to_sign)
+                authentication_signature = AugSchemeMPL.sign(pool_snapshot.authentication_sk, m_to_sign)
 
                 assert plot_signature is not None
 
                 agg_sig: G2Element = AugSchemeMPL.aggregate([plot_signature, authentication_signature])
 
-                post_partial_request: PostPartialRequest = PostPartialRequest(payload, agg_sig)
-                self.farmer.log.info(
-                    f"Submitting partial for {post_partial_request.payload.launcher_id.hex()} to {pool_url}"
-                )
-                pool_state_dict["points_found_since_start"] += pool_state_dict["current_difficulty"]
-                pool_state_dict["points_found_24h"].append((time.time(), pool_state_dict["current_difficulty"]))
-                self.farmer.log.debug(f"POST /partial request {post_partial_request}")
-                try:
-                    async with aiohttp.ClientSession() as session:
-                        async with session.post(
-                            f"{pool_url}/partial",
-                            json=post_partial_request.to_json_dict(),
-                            ssl=ssl_context_for_root(get_mozilla_ca_crt(), log=self.farmer.log),
-                            headers={"User-Agent": f"Spare Blockchain v.{__version__}"},
-                        ) as resp:
-                            if resp.ok:
-                                pool_response: Dict = json.loads(await resp.text())
-                                self.farmer.log.info(f"Pool response: {pool_response}")
-                                if "error_code" in pool_response:
-                                    self.farmer.log.error(
-                                        f"Error in pooling: "
-                                        f"{pool_response['error_code'], pool_response['error_message']}"
-                                    )
-                                    pool_state_dict["pool_errors_24h"].append(pool_response)
-                                    if pool_response["error_code"] == PoolErrorCode.PROOF_NOT_GOOD_ENOUGH.value:
-                                        self.farmer.log.error(
-                                            "Partial not good enough, forcing pool farmer update to "
-                                            "get our current difficulty."
-                                        )
-                                        pool_state_dict["next_farmer_update"] = 0
-                                        await self.farmer.update_pool_state()
-                                else:
-                                    new_difficulty = pool_response["new_difficulty"]
-                                    pool_state_dict["points_acknowledged_since_start"] += new_difficulty
-                                    pool_state_dict["points_acknowledged_24h"].append((time.time(), new_difficulty))
-                                    pool_state_dict["current_difficulty"] = new_difficulty
-                            else:
-                                self.farmer.log.error(f"Error sending partial to {pool_url}, {resp.status}")
-                except Exception as e:
-                    self.farmer.log.error(f"Error connecting to pool: {e}")
-                    return
-
-                self.farmer.state_changed(
-                    "submitted_partial",
-                    {
-                        "launcher_id": post_partial_request.payload.launcher_id.hex(),
-                        "pool_url": pool_url,
-                        "current_difficulty": pool_state_dict["current_difficulty"],
-                        "points_acknowledged_since_start": pool_state_dict["points_acknowledged_since_start"],
-                        "points_acknowledged_24h": pool_state_dict["points_acknowledged_24h"],
-                    },
+            post_partial_request: PostPartialRequest = PostPartialRequest(payload, agg_sig)
+            self.farmer.log.info(
+                f"Submitting partial for {post_partial_request.payload.launcher_id.hex()} to {pool_url}"
+            )
+            pool_state_dict["points_found_since_start"] += current_difficulty
+            pool_state_dict["points_found_24h"].append((time.time(), current_difficulty))
+            self.farmer.log.debug(f"POST /partial request {post_partial_request}")
+            with self.farmer.proof_timings.measure("post_partial"):
+                await self.farmer.submit_partial(
+                    QueuedPartial(
+                        pool_url,
+                        p2_singleton_puzzle_hash,
+                        current_difficulty,
+                        post_partial_request.to_json_dict(),
+                        time.time(),
+                    )
                 )
 
-                return
-
     @api_request()
     async def respond_signatures(self, response: harvester_protocol.RespondSignatures):
         """
@@ -494,6 +470,7 @@ class FarmerAPI:
             return
 
         self.farmer.sps[new_signage_point.challenge_chain_sp].append(new_signage_point)
+        self.farmer.update_sp_state(new_signage_point)
         self.farmer.cache_add_time[new_signage_point.challenge_chain_sp] = uint64(int(time.time()))
         self.farmer.state_changed("new_signage_point", {"sp_hash": new_signage_point.challenge_chain_sp})
 
@@ -544,6 +521,10 @@ class FarmerAPI:
     async def plot_sync_loaded(self, message: PlotSyncPlotList, peer: WSSpareConnection):
         await self.farmer.plot_sync_receivers[peer.peer_node_id].process_loaded(message)
 
+    @api_request(peer_required=True)
+    async def plot_sync_summary(self, message: PlotSyncSummary, peer: WSSpareConnection):
+        await self.farmer.plot_sync_receivers[peer.peer_node_id].process_summary(message)
+
     @api_request(peer_required=True)
     async def plot_sync_removed(self, message: PlotSyncPathList, peer: WSSpareConnection):
         await self.farmer.plot_sync_receivers[peer.peer_node_id].process_removed(message)
@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import logging
+import operator
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Union, overload
+
+from sortedcontainers import SortedKeyList
+
+from spare.consensus.pos_quality import UI_ACTUAL_SPACE_CONSTANT_FACTOR, _expected_plot_size
+from spare.plot_sync.delta import Delta
+from spare.protocols.harvester_protocol import Plot
+from spare.types.blockchain_format.sized_bytes import bytes32
+
+log = logging.getLogger(__name__)
+
+# Plot attributes which can be `None` and therefore can't be used to sort
+restricted_sort_keys: List[str] = ["pool_contract_puzzle_hash", "pool_public_key", "plot_public_key"]
+
+
+@dataclass
+class PlotAggregate:
+    plot_count: int = 0
+    total_plot_size: int = 0
+    total_effective_plot_size: int = 0
+    k_sizes: Dict[int, int] = field(default_factory=dict)
+    pool_contracts: Dict[Optional[bytes32], int] = field(default_factory=dict)
+
+    def add(self, plot: Plot) -> None:
+        self.plot_count += 1
+        self.total_plot_size += plot.file_size
+        self.total_effective_plot_size += int(_expected_plot_size(plot.size) * UI_ACTUAL_SPACE_CONSTANT_FACTOR)
+        self.k_sizes[plot.size] = self.k_sizes.get(plot.size, 0) + 1
+        self.pool_contracts[plot.pool_contract_puzzle_hash] = (
+            self.pool_contracts.get(plot.pool_contract_puzzle_hash, 0) + 1
+        )
+
+    def remove(self, plot: Plot) -> None:
+        self.plot_count -= 1
+        self.total_plot_size -= plot.file_size
+        self.total_effective_plot_size -= int(_expected_plot_size(plot.size) * UI_ACTUAL_SPACE_CONSTANT_FACTOR)
+        self.k_sizes[plot.size] -= 1
+        if self.k_sizes[plot.size] == 0:
+            del self.k_sizes[plot.size]
+        self.pool_contracts[plot.pool_contract_puzzle_hash] -= 1
+        if self.pool_contracts[plot.pool_contract_puzzle_hash] == 0:
+            del self.pool_contracts[plot.pool_contract_puzzle_hash]
+
+    def merge(self, other: PlotAggregate) -> None:
+        self.plot_count += other.plot_count
+        self.total_plot_size += other.total_plot_size
+        self.total_effective_plot_size += other.total_effective_plot_size
+        for k_size, count in other.k_sizes.items():
+            self.k_sizes[k_size] = self.k_sizes.get(k_size, 0) + count
+        for pool_contract, count in other.pool_contracts.items():
+            self.pool_contracts[pool_contract] = self.pool_contracts.get(pool_contract, 0) + count
+
+    def unmerge(self, other: PlotAggregate) -> None:
+        self.plot_count -= other.plot_count
+        self.total_plot_size -= other.total_plot_size
+        self.total_effective_plot_size -= other.total_effective_plot_size
+        for k_size, count in other.k_sizes.items():
+            self.k_sizes[k_size] -= count
+            if self.k_sizes[k_size] == 0:
+                del self.k_sizes[k_size]
+        for pool_contract, count in other.pool_contracts.items():
+            self.pool_contracts[pool_contract] -= count
+            if self.pool_contracts[pool_contract] == 0:
+                del self.pool_contracts[pool_contract]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "plot_count": self.plot_count,
+            "total_plot_size": self.total_plot_size,
+            "total_effective_plot_size": self.total_effective_plot_size,
+            "k_sizes": {str(k_size): count for k_size, count in sorted(self.k_sizes.items())},
+            "pool_contracts": {
+                "None" if pool_contract is None else pool_contract.hex(): count
+                for pool_contract, count in self.pool_contracts.items()
+            },
+        }
+
+
+class SortedPlotView(Sequence[Plot]):
+    """
+    Read only view of a sorted plot list, optionally in reversed order, which can be handed to `Paginator` without
+    copying the list.
+    """
+
+    _plots: SortedKeyList
+    _reverse: bool
+
+    def __init__(self, plots: SortedKeyList, reverse: bool) -> None:
+        self._plots = plots
+        self._reverse = reverse
+
+    def __len__(self) -> int:
+        return len(self._plots)
+
+    @overload
+    def __getitem__(self, index: int) -> Plot:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[Plot]:
+        ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Plot, List[Plot]]:
+        length = len(self._plots)
+        if isinstance(index, slice):
+            start, stop, step = index.indices(length)
+            if step != 1:
+                raise ValueError("SortedPlotView only supports contiguous slices")
+            if not self._reverse:
+                return list(self._plots[start:stop])
+            return list(reversed(self._plots[max(length - stop, 0) : max(length - start, 0)]))
+        if index < 0:
+            index += length
+        if index < 0 or index >= length:
+            raise IndexError(index)
+        plot: Plot = self._plots[length - 1 - index if self._reverse else index]
+        return plot
+
+
+class HarvesterPlotIndex:
+    _plots: Dict[str, Plot]
+    _aggregate: PlotAggregate
+    # Sorted lists are only created for the sort keys which were requested at least once, and are maintained
+    # incrementally after that.
+    _sorted: Dict[str, SortedKeyList]
+
+    def __init__(self) -> None:
+        self._plots = {}
+        self._aggregate = PlotAggregate()
+        self._sorted = {}
+
+    def plot_count(self) -> int:
+        return len(self._plots)
+
+    def aggregate(self) -> PlotAggregate:
+        return self._aggregate
+
+    def add(self, plot: Plot) -> None:
+        existing = self._plots.get(plot.filename)
+        if existing is not None:
+            self.remove(existing.filename)
+        self._plots[plot.filename] = plot
+        self._aggregate.add(plot)
+        for sorted_plots in self._sorted.values():
+            sorted_plots.add(plot)
+
+    def remove(self, filename: str) -> None:
+        plot = self._plots.pop(filename, None)
+        if plot is None:
+            return
+        self._aggregate.remove(plot)
+        for sorted_plots in self._sorted.values():
+            sorted_plots.remove(plot)
+
+    def sorted_plots(self, sort_key: str, reverse: bool = False) -> SortedPlotView:
+        if sort_key in restricted_sort_keys:
+            raise KeyError(f"Can't sort by optional attributes: {restricted_sort_keys}")
+        sorted_plots = self._sorted.get(sort_key)
+        if sorted_plots is None:
+            # Sort by plot_id also since its unique
+            sorted_plots = SortedKeyList(self._plots.values(), key=operator.attrgetter(sort_key, "plot_id"))
+            self._sorted[sort_key] = sorted_plots
+        return SortedPlotView(sorted_plots, reverse)
+
+
+class FarmerPlotIndex:
+    """
+    Aggregated view of the valid plots of all connected harvesters. It's kept up to date by the update deltas of the
+    plot sync receivers, so that summaries don't need to walk all plots.
+    """
+
+    _harvesters: Dict[bytes32, HarvesterPlotIndex]
+    _total: PlotAggregate
+
+    def __init__(self) -> None:
+        self._harvesters = {}
+        self._total = PlotAggregate()
+
+    def total(self) -> PlotAggregate:
+        return self._total
+
+    def harvester(self, node_id: bytes32) -> HarvesterPlotIndex:
+        harvester = self._harvesters.get(node_id)
+        if harvester is None:
+            raise KeyError(f"Plot index missing for {node_id}")
+        return harvester
+
+    def harvesters(self) -> Dict[bytes32, HarvesterPlotIndex]:
+        return self._harvesters
+
+    def update(self, node_id: bytes32, plots: Dict[str, Plot], delta: Delta) -> None:
+        harvester = self._harvesters.setdefault(node_id, HarvesterPlotIndex())
+        self._total.unmerge(harvester.aggregate())
+        for filename in delta.valid.removals:
+            harvester.remove(filename)
+        for plot in delta.valid.additions.values():
+            harvester.add(plot)
+        if harvester.plot_count() != len(plots):
+            # An initial sync drops all previous plots of the harvester without listing them as removals
+            log.debug(f"update: rebuild plot index for {node_id}, {harvester.plot_count()} / {len(plots)}")
+            harvester = HarvesterPlotIndex()
+            for plot in plots.values():
+                harvester.add(plot)
+            self._harvesters[node_id] = harvester
+        self._total.merge(harvester.aggregate())
+
+    def remove_harvester(self, node_id: bytes32) -> None:
+        harvester = self._harvesters.pop(node_id, None)
+        if harvester is not None:
+            self._total.unmerge(harvester.aggregate())
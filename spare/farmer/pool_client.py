@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import ssl
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from spare import __version__
+from spare.protocols.pool_protocol import POOL_PARTIAL_TIME_LIMIT
+from spare.types.blockchain_format.sized_bytes import bytes32
+from spare.util.files import write_file_async
+from spare.util.ints import uint64
+from spare.util.latency_histogram import LatencyHistogram
+
+log = logging.getLogger(__name__)
+
+
+class PoolRequestError(Exception):
+    """
+    A request which didn't get a response from the pool, or got one with a non OK HTTP status
+    """
+
+    def __init__(self, method: str, url: str, status: Optional[int] = None, reason: Optional[str] = None) -> None:
+        self.status = status
+        if status is not None:
+            super().__init__(f"Error in {method} {url}, {status}")
+        else:
+            super().__init__(f"Exception in {method} {url}, {reason}")
+
+
+@dataclass
+class PoolClientMetrics:
+    latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+    requests: int = 0
+    failed_requests: int = 0
+    partials_submitted: int = 0
+    partials_accepted: int = 0
+    # From pool error code to the number of partials rejected with it
+    partials_rejected: Dict[int, int] = field(default_factory=dict)
+    partials_retried: int = 0
+    partials_dropped: int = 0
+
+    def reject_partial(self, error_code: int) -> None:
+        self.partials_rejected[error_code] = self.partials_rejected.get(error_code, 0) + 1
+
+    def to_json_dict(self) -> Dict[str, Any]:
+        return {
+            "latency": self.latency.to_json_dict(),
+            "requests": self.requests,
+            "failed_requests": self.failed_requests,
+            "partials_submitted": self.partials_submitted,
+            "partials_accepted": self.partials_accepted,
+            "partials_rejected": {str(error_code): count for error_code, count in self.partials_rejected.items()},
+            "partials_retried": self.partials_retried,
+            "partials_dropped": self.partials_dropped,
+        }
+
+
+class PoolClient:
+    """
+    Sends the requests to one pool over a single pooled HTTP session. At most `max_concurrent_requests` requests are
+    in flight at once, and consecutive requests start at least `min_request_interval` seconds apart.
+    """
+
+    _pool_url: str
+    _ssl_context: Optional[ssl.SSLContext]
+    _max_concurrent_requests: int
+    _min_request_interval: float
+    _semaphore: asyncio.Semaphore
+    _next_request_time: float
+    _session: Optional[aiohttp.ClientSession]
+    metrics: PoolClientMetrics
+
+    def __init__(
+        self,
+        pool_url: str,
+        ssl_context: Optional[ssl.SSLContext],
+        max_concurrent_requests: int = 4,
+        min_request_interval: float = 0.0,
+    ) -> None:
+        self._pool_url = pool_url
+        self._ssl_context = ssl_context
+        self._max_concurrent_requests = max_concurrent_requests
+        self._min_request_interval = min_request_interval
+        self._semaphore = asyncio.Semaphore(max_concurrent_requests)
+        self._next_request_time = 0.0
+        self._session = None
+        self.metrics = PoolClientMetrics()
+
+    def pool_url(self) -> str:
+        return self._pool_url
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._max_concurrent_requests),
+                headers={"User-Agent": f"Spare Blockchain v.{__version__}"},
+                trust_env=True,
+            )
+        return self._session
+
+    async def _wait_for_turn(self) -> None:
+        now = time.monotonic()
+        start = max(now, self._next_request_time)
+        self._next_request_time = start + self._min_request_interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        *,
+        params: Optional[Dict[str, Any]] = None,
+        json_data: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        url = f"{self._pool_url}{path}"
+        async with self._semaphore:
+            await self._wait_for_turn()
+            self.metrics.requests += 1
+            start = time.monotonic()
+            try:
+                async with self._get_session().request(
+                    method, url, params=params, json=json_data, ssl=self._ssl_context
+                ) as resp:
+                    if not resp.ok:
+                        raise PoolRequestError(method, url, status=resp.status)
+                    response: Dict[str, Any] = json.loads(await resp.text())
+                    return response
+            except PoolRequestError:
+                self.metrics.failed_requests += 1
+                raise
+            except Exception as e:
+                self.metrics.failed_requests += 1
+                raise PoolRequestError(method, url, reason=str(e)) from e
+            finally:
+                self.metrics.latency.record(time.monotonic() - start)
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+@dataclass
+class QueuedPartial:
+    pool_url: str
+    p2_singleton_puzzle_hash: bytes32
+    difficulty: uint64
+    # `PostPartialRequest.to_json_dict()`
+    request: Dict[str, Any]
+    created: float
+    attempts: int = 0
+    next_attempt: float = 0.0
+
+    def to_json_dict(self) -> Dict[str, Any]:
+        return {
+            "pool_url": self.pool_url,
+            "p2_singleton_puzzle_hash": self.p2_singleton_puzzle_hash.hex(),
+            "difficulty": self.difficulty,
+            "request": self.request,
+            "created": self.created,
+            "attempts": self.attempts,
+            "next_attempt": self.next_attempt,
+        }
+
+    @classmethod
+    def from_json_dict(cls, json_dict: Dict[str, Any]) -> QueuedPartial:
+        return cls(
+            json_dict["pool_url"],
+            bytes32.from_hexstr(json_dict["p2_singleton_puzzle_hash"]),
+            uint64(json_dict["difficulty"]),
+            json_dict["request"],
+            json_dict["created"],
+            json_dict["attempts"],
+            json_dict["next_attempt"],
+        )
+
+
+class PartialRetryQueue:
+    """
+    Partials which failed to reach their pool, kept on disk so that they survive a farmer restart. The queue holds at
+    most `max_size` partials, the oldest ones are dropped first. Partials are dropped once they are `max_age` seconds
+    old, which is capped to `POOL_PARTIAL_TIME_LIMIT` since pools reject anything older as too late.
+    """
+
+    _path: Path
+    _max_size: int
+    _max_age: float
+    _partials: Deque[QueuedPartial]
+    _changed: bool
+
+    def __init__(self, path: Path, max_size: int = 1000, max_age: float = POOL_PARTIAL_TIME_LIMIT) -> None:
+        self._path = path
+        self._max_size = max_size
+        self._max_age = min(max_age, POOL_PARTIAL_TIME_LIMIT)
+        self._partials = deque()
+        self._changed = False
+
+    def __len__(self) -> int:
+        return len(self._partials)
+
+    def load(self) -> None:
+        if not self._path.exists():
+            return
+        try:
+            entries: List[Dict[str, Any]] = json.loads(self._path.read_text())
+            partials = [QueuedPartial.from_json_dict(entry) for entry in entries[-self._max_size :]]
+            # The ones which got too old while the farmer was down would only be rejected by the pool
+            now = time.time()
+            self._partials = deque(partial for partial in partials if now - partial.created <= self._max_age)
+            self._changed = len(self._partials) != len(partials)
+            log.info(
+                f"Loaded {len(self._partials)} partials to retry from {self._path}, "
+                f"dropped {len(partials) - len(self._partials)} expired ones"
+            )
+        except Exception as e:
+            log.error(f"Failed to load the partial retry queue from {self._path}: {e}")
+            self._partials.clear()
+
+    async def save(self) -> None:
+        if not self._changed:
+            return
+        self._changed = False
+        data = json.dumps([partial.to_json_dict() for partial in self._partials])
+        await write_file_async(self._path, data, file_mode=0o644)
+
+    def put(self, partial: QueuedPartial) -> Optional[QueuedPartial]:
+        """
+        Adds a partial to retry after an exponential backoff, returns the partial which had to be dropped to make room
+        for it, if any.
+        """
+        partial.attempts += 1
+        partial.next_attempt = time.time() + min(2**partial.attempts, 60)
+        self._partials.append(partial)
+        self._changed = True
+        if len(self._partials) > self._max_size:
+            return self._partials.popleft()
+        return None
+
+    def take_due(self, now: float) -> Tuple[List[QueuedPartial], List[QueuedPartial]]:
+        """
+        Removes the partials which are due to be retried and the ones older than `max_age`, which pools don't accept
+        anymore, and returns both.
+        """
+        due: List[QueuedPartial] = []
+        expired: List[QueuedPartial] = []
+        remaining: Deque[QueuedPartial] = deque()
+        for partial in self._partials:
+            if now - partial.created > self._max_age:
+                expired.append(partial)
+            elif partial.next_attempt <= now:
+                due.append(partial)
+            else:
+                remaining.append(partial)
+        if len(remaining) != len(self._partials):
+            self._partials = remaining
+            self._changed = True
+        return due, expired
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import contextlib
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from blspy import PrivateKey
+
+from spare.pools.pool_config import PoolWalletConfig
+from spare.protocols import farmer_protocol
+from spare.types.blockchain_format.sized_bytes import bytes32
+from spare.util.ints import uint8, uint64
+from spare.util.latency_histogram import LatencyHistogram
+
+
+@dataclass(frozen=True)
+class PoolStateSnapshot:
+    """
+    The parts of a pool state which don't change while the proofs of a signage point come in
+    """
+
+    pool_config: PoolWalletConfig
+    authentication_token_timeout: Optional[uint8]
+    authentication_sk: Optional[PrivateKey]
+
+
+@dataclass
+class SignagePointState:
+    """
+    Everything the proofs of space for one signage point are checked against, prepared when the signage point arrives
+    """
+
+    # The signage points for this hash, each with its `calculate_sp_interval_iters` threshold
+    thresholds: List[Tuple[farmer_protocol.NewSignagePoint, uint64]] = field(default_factory=list)
+    # From p2_singleton_puzzle_hash to the pool state at the time of the latest signage point
+    pools: Dict[bytes32, PoolStateSnapshot] = field(default_factory=dict)
+
+
+class ProofTimings:
+    """
+    Latency histograms of the stages a proof of space goes through in the farmer
+    """
+
+    _stages: Dict[str, LatencyHistogram]
+
+    def __init__(self) -> None:
+        self._stages = {}
+
+    def record(self, stage: str, seconds: float) -> None:
+        histogram = self._stages.get(stage)
+        if histogram is None:
+            histogram = LatencyHistogram()
+            self._stages[stage] = histogram
+        histogram.record(seconds)
+
+    @contextlib.contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(stage, time.monotonic() - start)
+
+    def to_json_dict(self) -> Dict[str, Any]:
+        return {stage: histogram.to_json_dict() for stage, histogram in self._stages.items()}
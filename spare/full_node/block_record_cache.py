@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import logging
+import mmap
+import struct
+from array import array
+from pathlib import Path
+from typing import List, Optional
+
+from spare.consensus.block_record import BlockRecord
+from spare.types.blockchain_format.sized_bytes import bytes32
+from spare.util.files import write_file_async
+
+log = logging.getLogger(__name__)
+
+# A snapshot of the block records close to the peak, written on shutdown and
+# read back on startup instead of loading them from the database. (The sub
+# epoch summaries and the height-to-hash map are already cached on disk by
+# BlockHeightMap.) The file layout is:
+#
+#   header (see _HEADER)
+#   record offsets: (num_records + 1) x uint64, relative to the record data
+#   record data: the serialized BlockRecords, back to back
+#
+# all integers are little endian.
+
+BLOCK_RECORD_CACHE_MAGIC = b"SPAREBRC"
+BLOCK_RECORD_CACHE_VERSION = 1
+
+# magic, version, peak hash, peak height, number of blocks the cache covers
+# below the peak, number of records, size of record data
+_HEADER = struct.Struct("<8sI32sIIIQ")
+
+
+def _offsets(blobs: List[bytes]) -> array:  # type: ignore[type-arg]
+    offsets = array("Q", [0])
+    for blob in blobs:
+        offsets.append(offsets[-1] + len(blob))
+    return offsets
+
+
+def serialize_block_record_cache(peak: BlockRecord, blocks_n: int, records: List[BlockRecord]) -> bytes:
+    record_blobs = [bytes(r) for r in records]
+    record_offsets = _offsets(record_blobs)
+    header = _HEADER.pack(
+        BLOCK_RECORD_CACHE_MAGIC,
+        BLOCK_RECORD_CACHE_VERSION,
+        peak.header_hash,
+        peak.height,
+        blocks_n,
+        len(record_blobs),
+        record_offsets[-1],
+    )
+    return b"".join([header, _to_little_endian(record_offsets), *record_blobs])
+
+
+def _to_little_endian(column: array) -> bytes:  # type: ignore[type-arg]
+    if struct.pack("=H", 1) != struct.pack("<H", 1):
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _from_little_endian(typecode: str, buf: memoryview) -> array:  # type: ignore[type-arg]
+    column = array(typecode)
+    column.frombytes(buf)
+    if struct.pack("=H", 1) != struct.pack("<H", 1):
+        column.byteswap()
+    return column
+
+
+async def write_block_record_cache(
+    path: Path,
+    peak: BlockRecord,
+    blocks_n: int,
+    records: List[BlockRecord],
+) -> None:
+    await write_file_async(path, serialize_block_record_cache(peak, blocks_n, records))
+
+
+def parse_block_record_cache(buf: memoryview, peak_hash: bytes32, blocks_n: int) -> Optional[List[BlockRecord]]:
+    """
+    Returns the block records in the cache, or None if
+    the cache is not for this peak, not for (at least) blocks_n blocks below
+    the peak, from a different version, or corrupt
+    """
+    if len(buf) < _HEADER.size:
+        return None
+    magic, version, cache_peak, peak_height, cache_blocks_n, num_records, records_size = _HEADER.unpack_from(buf)
+    if magic != BLOCK_RECORD_CACHE_MAGIC or version != BLOCK_RECORD_CACHE_VERSION:
+        return None
+    if cache_peak != peak_hash or cache_blocks_n < blocks_n:
+        return None
+    records_start = _HEADER.size + (num_records + 1) * 8
+    if len(buf) != records_start + records_size:
+        return None
+    record_offsets = _from_little_endian("Q", buf[_HEADER.size : records_start])
+    if record_offsets[-1] != records_size:
+        return None
+
+    min_height = peak_height - blocks_n
+    records: List[BlockRecord] = []
+    found_peak = False
+    for i in range(num_records):
+        start = records_start + record_offsets[i]
+        end = records_start + record_offsets[i + 1]
+        record = BlockRecord.from_bytes(bytes(buf[start:end]))
+        if record.height < min_height:
+            continue
+        if record.header_hash == peak_hash:
+            found_peak = record.height == peak_height
+        records.append(record)
+    if not found_peak:
+        return None
+    return records
+
+
+def load_block_record_cache(path: Path, peak_hash: bytes32, blocks_n: int) -> Optional[List[BlockRecord]]:
+    """
+    Loads the block record cache file, if there is one and it's valid for the
+    specified peak. The file is removed, since it becomes stale as soon as
+    the peak changes.
+    """
+    try:
+        with open(path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                view = memoryview(buf)
+                try:
+                    ret = parse_block_record_cache(view, peak_hash, blocks_n)
+                finally:
+                    view.release()
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        log.warning(f"failed to load block record cache {path}: {e}")
+        ret = None
+
+    try:
+        path.unlink()
+    except OSError as e:
+        log.warning(f"failed to remove block record cache {path}: {e}")
+
+    if ret is None:
+        log.info(f"block record cache {path} is stale or invalid, loading block records from the database")
+    return ret
@@ -15,7 +15,12 @@ from spare.types.full_block import FullBlock
 from spare.types.weight_proof import SubEpochChallengeSegment, SubEpochSegments
 from spare.util.db_wrapper import DBWrapper2, execute_fetchone
 from spare.util.errors import Err
-from spare.util.full_block_utils import GeneratorBlockInfo, block_info_from_block, generator_from_block
+from spare.util.full_block_utils import (
+    FullBlockView,
+    GeneratorBlockInfo,
+    block_info_from_block,
+    generator_from_block,
+)
 from spare.util.ints import uint32
 from spare.util.lru_cache import LRUCache
 
@@ -291,6 +296,20 @@ class BlockStore:
             return block
         return None
 
+    async def get_full_block_view(self, header_hash: bytes32) -> Optional[FullBlockView]:
+        """
+        Like get_full_block(), but returns a lazily parsed view of the block.
+        Use this when only a few fields are needed, or the block is just
+        passed on in serialized form.
+        """
+        cached: Optional[FullBlock] = self.block_cache.get(header_hash)
+        if cached is not None:
+            return FullBlockView.from_full_block(cached)
+        block_bytes = await self.get_full_block_bytes(header_hash)
+        if block_bytes is None:
+            return None
+        return FullBlockView(block_bytes)
+
     async def get_full_block_bytes(self, header_hash: bytes32) -> Optional[bytes]:
         cached = self.block_cache.get(header_hash)
         if cached is not None:
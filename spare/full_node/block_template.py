@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import logging
+from bisect import bisect_right
+from typing import Iterable, List, Optional, Tuple
+
+from blspy import AugSchemeMPL, G2Element
+
+from spare.consensus.default_constants import DEFAULT_CONSTANTS
+from spare.types.blockchain_format.coin import Coin
+from spare.types.blockchain_format.sized_bytes import bytes32
+from spare.types.mempool_item import MempoolItem
+from spare.types.spend_bundle import SpendBundle
+
+log = logging.getLogger(__name__)
+
+
+class BlockTemplate:
+    """
+    The spend bundle the next block would be made from, maintained as items
+    enter and leave the mempool instead of being rebuilt when a block is made.
+
+    Like Mempool.create_bundle_from_mempool_items(), the template is the
+    longest run of mempool items, in order of decreasing fee rate, whose cost
+    and fees fit in a block. Alongside the items we keep the cumulative cost
+    and fee, and the aggregate signature of every prefix of the template. The
+    signatures are only aggregated when the template is read, and only for
+    the part of the template that changed since the last read.
+
+    Removing an item while the template doesn't hold all mempool items may
+    make room for items we don't know about, so the template is marked stale
+    and rebuilt from the mempool the next time it's read.
+    """
+
+    _max_block_clvm_cost: int
+    _items: List[MempoolItem]
+    # the negated fee rate of each item, to find where new items go
+    _keys: List[float]
+    _additions: List[List[Coin]]
+    # cumulative cost and fee of the items up to, and including, each index
+    _cost_sums: List[int]
+    _fee_sums: List[int]
+    # aggregate signature of the items up to, and including, each index. May be
+    # shorter than _items, the remaining signatures are aggregated on demand
+    _signatures: List[G2Element]
+    # True if all items in the mempool fit in the template. If not, _next_key
+    # is the key of the first item that didn't fit
+    _complete: bool
+    _next_key: float
+    _cached_bundle: Optional[Tuple[SpendBundle, List[Coin]]]
+    stale: bool
+
+    def __init__(self, max_block_clvm_cost: int) -> None:
+        self._max_block_clvm_cost = max_block_clvm_cost
+        self._reset()
+
+    def _reset(self) -> None:
+        self._items = []
+        self._keys = []
+        self._additions = []
+        self._cost_sums = []
+        self._fee_sums = []
+        self._signatures = []
+        self._complete = True
+        self._next_key = 0.0
+        self._cached_bundle = None
+        self.stale = False
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def cost(self) -> int:
+        return self._cost_sums[-1] if len(self._cost_sums) > 0 else 0
+
+    @property
+    def fees(self) -> int:
+        return self._fee_sums[-1] if len(self._fee_sums) > 0 else 0
+
+    def _fits(self, cost_sum: int, fee_sum: int) -> bool:
+        return cost_sum <= self._max_block_clvm_cost and fee_sum <= DEFAULT_CONSTANTS.MAX_COIN_AMOUNT
+
+    def _recompute_from(self, index: int) -> None:
+        """
+        Recomputes the cumulative sums from index onwards, dropping the items
+        that no longer fit in the block
+        """
+        del self._cost_sums[index:]
+        del self._fee_sums[index:]
+        del self._signatures[index:]
+        cost_sum = self._cost_sums[-1] if index > 0 else 0
+        fee_sum = self._fee_sums[-1] if index > 0 else 0
+        for i in range(index, len(self._items)):
+            item = self._items[i]
+            cost_sum += item.cost
+            fee_sum += item.fee
+            if not self._fits(cost_sum, fee_sum):
+                self._next_key = self._keys[i]
+                del self._items[i:]
+                del self._keys[i:]
+                del self._additions[i:]
+                self._complete = False
+                break
+            self._cost_sums.append(cost_sum)
+            self._fee_sums.append(fee_sum)
+        self._cached_bundle = None
+
+    def add(self, item: MempoolItem) -> None:
+        """
+        Called when item has been added to the mempool
+        """
+        if self.stale:
+            return
+        key = -item.fee_per_cost
+        # items with the same fee rate are ordered by when they were added
+        index = bisect_right(self._keys, key)
+        if index == len(self._items):
+            # the item goes after the last one in the template. It's only
+            # included if it also goes before the first item that didn't fit
+            if not self._complete and key >= self._next_key:
+                return
+            if not self._fits(self.cost + item.cost, self.fees + item.fee):
+                self._complete = False
+                self._next_key = key
+                return
+        assert item.npc_result.conds is not None
+        additions = [
+            Coin(spend.coin_id, puzzle_hash, amount)
+            for spend in item.npc_result.conds.spends
+            for puzzle_hash, amount, _ in spend.create_coin
+        ]
+        self._items.insert(index, item)
+        self._keys.insert(index, key)
+        self._additions.insert(index, additions)
+        self._recompute_from(index)
+
+    def remove(self, names: List[bytes32]) -> None:
+        """
+        Called when the named items have been removed from the mempool
+        """
+        if self.stale or len(names) == 0:
+            return
+        if not self._complete:
+            self.stale = True
+            self._cached_bundle = None
+            return
+        removed = set(names)
+        first = next((i for i, item in enumerate(self._items) if item.name in removed), None)
+        if first is None:
+            return
+        keep = [i for i in range(first, len(self._items)) if self._items[i].name not in removed]
+        self._items[first:] = [self._items[i] for i in keep]
+        self._keys[first:] = [self._keys[i] for i in keep]
+        self._additions[first:] = [self._additions[i] for i in keep]
+        self._recompute_from(first)
+
+    def invalidate(self) -> None:
+        """
+        Marks the template stale, so that adds and removes are ignored until
+        it's rebuilt. Used when many items are about to be added in no
+        particular order, where inserting them one by one would be quadratic
+        """
+        self.stale = True
+        self._cached_bundle = None
+
+    def rebuild(self, items: Iterable[MempoolItem]) -> None:
+        """
+        Builds the template from scratch, from the mempool items in order of
+        decreasing fee rate
+        """
+        self._reset()
+        for item in items:
+            self.add(item)
+            if not self._complete:
+                break
+
+    def bundle(self) -> Optional[Tuple[SpendBundle, List[Coin]]]:
+        """
+        Returns the aggregated spend bundle of the template, and the coins it
+        creates. The template must not be stale.
+        """
+        assert not self.stale
+        if len(self._items) == 0:
+            return None
+        if self._cached_bundle is not None:
+            return self._cached_bundle
+
+        for i in range(len(self._signatures), len(self._items)):
+            signature = self._items[i].spend_bundle.aggregated_signature
+            if i > 0:
+                signature = AugSchemeMPL.aggregate([self._signatures[i - 1], signature])
+            self._signatures.append(signature)
+
+        coin_spends = []
+        additions: List[Coin] = []
+        for item, item_additions in zip(self._items, self._additions):
+            coin_spends += item.spend_bundle.coin_spends
+            additions += item_additions
+        log.info(
+            f"Block template: {len(self._items)} spend bundles, cost {self.cost}. Proportion "
+            f"full: {self.cost / self._max_block_clvm_cost}"
+        )
+        self._cached_bundle = (SpendBundle(coin_spends, self._signatures[-1]), additions)
+        return self._cached_bundle
@@ -1,14 +1,18 @@
 from __future__ import annotations
 
+import asyncio
+import contextlib
 import dataclasses
 import logging
 import sqlite3
 import time
-from typing import Any, Dict, List, Optional, Set, Tuple, Union
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple, Union
 
+import aiosqlite
 import typing_extensions
 from aiosqlite import Cursor
 
+from spare.full_node.unspent_coin_index import UnspentCoinIndex
 from spare.protocols.wallet_protocol import CoinState
 from spare.types.blockchain_format.coin import Coin
 from spare.types.blockchain_format.sized_bytes import bytes32
@@ -30,9 +34,14 @@ class CoinStore:
 
     db_wrapper: DBWrapper2
     coins_added_at_height_cache: LRUCache[uint32, List[CoinRecord]]
+    # optional in-memory index of all unspent coins. Lookups that hit it don't
+    # need to go to the database
+    unspent_index: Optional[UnspentCoinIndex] = None
+    # the task whose transaction the unspent index is currently journaling
+    _unspent_index_writer: Optional[asyncio.Task[Any]] = None
 
     @classmethod
-    async def create(cls, db_wrapper: DBWrapper2) -> CoinStore:
+    async def create(cls, db_wrapper: DBWrapper2, *, unspent_index_shards: Optional[int] = None) -> CoinStore:
         self = CoinStore(db_wrapper, LRUCache(100))
 
         async with self.db_wrapper.writer_maybe_transaction() as conn:
@@ -83,8 +92,104 @@ class CoinStore:
             log.info("DB: Creating index coin_parent_index")
             await conn.execute("CREATE INDEX IF NOT EXISTS coin_parent_index on coin_record(coin_parent)")
 
+        if unspent_index_shards is not None:
+            self.unspent_index = UnspentCoinIndex(unspent_index_shards)
+            await self.rebuild_unspent_index()
+
         return self
 
+    def _serving_index(self) -> Optional[UnspentCoinIndex]:
+        # while a transaction is open, the index may hold changes the database
+        # hasn't committed, so lookups go to the database instead
+        if self.unspent_index is None or not self.unspent_index.ready or self.unspent_index.in_transaction():
+            return None
+        return self.unspent_index
+
+    async def rebuild_unspent_index(self) -> None:
+        """
+        Populates the unspent coin index from the coin_record table
+        """
+        assert self.unspent_index is not None
+        start = time.monotonic()
+        self.unspent_index.clear()
+        async with self.db_wrapper.reader() as conn:
+            async with conn.execute(
+                "SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
+                "coin_parent, amount, timestamp FROM coin_record INDEXED BY coin_spent_index WHERE spent_index=0"
+            ) as cursor:
+                while True:
+                    rows = await cursor.fetchmany(10000)
+                    if len(rows) == 0:
+                        break
+                    self.unspent_index.add(
+                        CoinRecord(self.row_to_coin(row), row[0], row[1], row[2], row[6]) for row in rows
+                    )
+        self.unspent_index.ready = True
+        log.info(f"Loaded {len(self.unspent_index)} unspent coins into the index in {time.monotonic() - start:0.2f}s")
+
+    async def check_unspent_index(self) -> List[bytes32]:
+        """
+        Compares the unspent coin index against the coin_record table. Returns
+        the names of all coins that differ between the two (an empty list means
+        the index is consistent)
+        """
+        assert self.unspent_index is not None
+        mismatches: List[bytes32] = []
+        seen: Set[bytes32] = set()
+        async with self.db_wrapper.reader() as conn:
+            async with conn.execute(
+                "SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
+                "coin_parent, amount, timestamp FROM coin_record INDEXED BY coin_spent_index WHERE spent_index=0"
+            ) as cursor:
+                while True:
+                    rows = await cursor.fetchmany(10000)
+                    if len(rows) == 0:
+                        break
+                    for row in rows:
+                        record = CoinRecord(self.row_to_coin(row), row[0], row[1], row[2], row[6])
+                        name = record.name
+                        seen.add(name)
+                        if self.unspent_index.get(name) != record:
+                            mismatches.append(name)
+        mismatches.extend(record.name for record in self.unspent_index.records() if record.name not in seen)
+        if len(mismatches) > 0:
+            log.error(f"unspent coin index is inconsistent with the database, {len(mismatches)} coins differ")
+        return mismatches
+
+    @contextlib.asynccontextmanager
+    async def unspent_index_transaction(self) -> AsyncIterator[aiosqlite.Connection]:
+        """
+        Opens a write transaction (see DBWrapper2.writer_maybe_transaction())
+        and scopes changes to the unspent coin index to it. The changes are
+        only kept once the database transaction committed. If it is rolled
+        back, or the commit itself fails, the changes made to the index are
+        undone. Nested scopes in the same task are part of the outermost one.
+        This must be the outermost write transaction of the task, otherwise the
+        index commits before the database does.
+        """
+        task = asyncio.current_task()
+        assert task is not None
+        index = self.unspent_index
+        if index is None or self._unspent_index_writer is task:
+            async with self.db_wrapper.writer_maybe_transaction() as conn:
+                yield conn
+            return
+
+        try:
+            async with self.db_wrapper.writer_maybe_transaction() as conn:
+                # only start the journal once we hold the write lock, another
+                # task may still be journaling its own transaction
+                index.begin()
+                self._unspent_index_writer = task
+                yield conn
+        except BaseException:
+            if index.in_transaction():
+                index.abort()
+            raise
+        finally:
+            self._unspent_index_writer = None
+        index.commit()
+
     async def num_unspent(self) -> int:
         async with self.db_wrapper.reader_no_transaction() as conn:
             async with conn.execute("SELECT COUNT(*) FROM coin_record WHERE spent_index=0") as cursor:
@@ -150,8 +255,11 @@ class CoinStore:
             )
             additions.append(reward_coin_r)
 
-        await self._add_coin_records(additions)
-        await self._set_spent(tx_removals, height)
+        async with self.unspent_index_transaction():
+            await self._add_coin_records(additions)
+            if self.unspent_index is not None:
+                self.unspent_index.add(additions)
+            await self._set_spent(tx_removals, height)
 
         end = time.monotonic()
         log.log(
@@ -165,6 +273,12 @@ class CoinStore:
 
     # Checks DB and DiffStores for CoinRecord with coin_name and returns it
     async def get_coin_record(self, coin_name: bytes32) -> Optional[CoinRecord]:
+        index = self._serving_index()
+        if index is not None:
+            record = index.get(coin_name)
+            if record is not None:
+                return record
+
         async with self.db_wrapper.reader_no_transaction() as conn:
             async with conn.execute(
                 "SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
@@ -183,6 +297,12 @@ class CoinStore:
 
         coins: List[CoinRecord] = []
 
+        index = self._serving_index()
+        if index is not None:
+            coins, names = index.get_many(names)
+            if len(names) == 0:
+                return coins
+
         async with self.db_wrapper.reader_no_transaction() as conn:
             cursors: List[Cursor] = []
             for names_chunk in chunks(names, SQLITE_MAX_VARIABLE_NUMBER):
@@ -370,6 +490,16 @@ class CoinStore:
             return []
 
         coins: Set[CoinState] = set()
+
+        index = self._serving_index()
+        if index is not None and not include_spent_coins:
+            for record in index.get_by_puzzle_hashes(puzzle_hashes):
+                if min_height == 0 or record.confirmed_block_index >= min_height:
+                    coins.add(CoinState(record.coin, None, record.confirmed_block_index))
+                    if len(coins) >= max_items:
+                        break
+            return list(coins)
+
         async with self.db_wrapper.reader_no_transaction() as conn:
             for puzzles in chunks(puzzle_hashes, SQLITE_MAX_VARIABLE_NUMBER):
                 puzzle_hashes_db: Tuple[Any, ...]
@@ -467,8 +597,10 @@ class CoinStore:
         """
 
         coin_changes: Dict[bytes32, CoinRecord] = {}
+        # the coins that become unspent again, to update the unspent index with
+        unspent_again: List[CoinRecord] = []
         # Add coins that are confirmed in the reverted blocks to the list of updated coins.
-        async with self.db_wrapper.writer_maybe_transaction() as conn:
+        async with self.unspent_index_transaction() as conn:
             async with conn.execute(
                 "SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
                 "coin_parent, amount, timestamp FROM coin_record WHERE confirmed_index>?",
@@ -479,6 +611,8 @@ class CoinStore:
                     record = CoinRecord(coin, uint32(0), row[1], row[2], uint64(0))
                     coin_changes[record.name] = record
 
+            deleted: List[bytes32] = list(coin_changes.keys())
+
             # Delete reverted blocks from storage
             await conn.execute("DELETE FROM coin_record WHERE confirmed_index>?", (block_index,))
 
@@ -493,6 +627,7 @@ class CoinStore:
                     record = CoinRecord(coin, row[0], uint32(0), row[2], row[6])
                     if record.name not in coin_changes:
                         coin_changes[record.name] = record
+                        unspent_again.append(record)
 
             if self.db_wrapper.db_version == 2:
                 await conn.execute("UPDATE coin_record SET spent_index=0 WHERE spent_index>?", (block_index,))
@@ -500,6 +635,9 @@ class CoinStore:
                 await conn.execute(
                     "UPDATE coin_record SET spent_index = 0, spent = 0 WHERE spent_index>?", (block_index,)
                 )
+            if self.unspent_index is not None:
+                self.unspent_index.remove(deleted)
+                self.unspent_index.add(unspent_again)
         self.coins_added_at_height_cache = LRUCache(self.coins_added_at_height_cache.capacity)
         return list(coin_changes.values())
 
@@ -581,3 +719,5 @@ class CoinStore:
                 raise ValueError(
                     f"Invalid operation to set spent, total updates {rows_updated} expected {len(coin_names)}"
                 )
+        if self.unspent_index is not None:
+            self.unspent_index.remove(coin_names)
@@ -9,9 +9,10 @@ import random
 import sqlite3
 import time
 import traceback
+from collections import deque
 from multiprocessing.context import BaseContext
 from pathlib import Path
-from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple, Union
 
 from blspy import AugSchemeMPL
 
@@ -22,6 +23,7 @@ from spare.consensus.blockchain_interface import BlockchainInterface
 from spare.consensus.constants import ConsensusConstants
 from spare.consensus.cost_calculator import NPCResult
 from spare.consensus.difficulty_adjustment import get_next_sub_slot_iters_and_difficulty
+from spare.consensus.full_block_to_block_record import block_to_block_record
 from spare.consensus.make_sub_epoch_summary import next_sub_epoch_summary
 from spare.consensus.multiprocess_validation import PreValidationResult
 from spare.consensus.pot_iterations import calculate_sp_iters
@@ -36,6 +38,7 @@ from spare.full_node.lock_queue import LockClient, LockQueue
 from spare.full_node.mempool_manager import MempoolManager
 from spare.full_node.signage_point import SignagePoint
 from spare.full_node.subscriptions import PeerSubscriptions
+from spare.full_node.sync_pipeline import AdaptiveBatchSize, PendingBlockRecords, PreValidatedBlocks
 from spare.full_node.sync_store import SyncStore
 from spare.full_node.tx_processing_queue import TransactionQueue
 from spare.full_node.weight_proof import WeightProofHandler
@@ -351,7 +354,10 @@ class FullNode:
 
         self._block_store = await BlockStore.create(self.db_wrapper)
         self._hint_store = await HintStore.create(self.db_wrapper)
-        self._coin_store = await CoinStore.create(self.db_wrapper)
+        unspent_index_shards: Optional[int] = None
+        if self.config.get("unspent_coin_index", False):
+            unspent_index_shards = self.config.get("unspent_coin_index_shards", 64)
+        self._coin_store = await CoinStore.create(self.db_wrapper, unspent_index_shards=unspent_index_shards)
         self.log.info("Initializing blockchain from disk")
         start_time = time.time()
         reserved_cores = self.config.get("reserved_cores", 0)
@@ -366,6 +372,7 @@ class FullNode:
             reserved_cores=reserved_cores,
             multiprocessing_context=self.multiprocessing_context,
             single_threaded=single_threaded,
+            block_record_cache=self.config.get("block_record_cache", True),
         )
 
         self._mempool_manager = MempoolManager(
@@ -373,6 +380,9 @@ class FullNode:
             consensus_constants=self.constants,
             multiprocessing_context=self.multiprocessing_context,
             single_threaded=single_threaded,
+            mempool_backend=self.config.get("mempool_backend", "sqlite"),
+            pre_validation_batch_size=self.config.get("tx_pre_validation_batch_size", 16),
+            pre_validation_batch_window=self.config.get("tx_pre_validation_batch_window", 0.01),
         )
 
         # Blocks are validated under high priority, and transactions under low priority. This guarantees blocks will
@@ -910,6 +920,11 @@ class FullNode:
         if self._sync_task is not None:
             with contextlib.suppress(asyncio.CancelledError):
                 await self._sync_task
+        if self._blockchain is not None:
+            try:
+                await self._blockchain.write_block_record_cache()
+            except Exception as e:
+                self.log.warning(f"failed to save the block record cache: {e}")
 
     async def _sync(self) -> None:
         """
@@ -1065,56 +1080,165 @@ class FullNode:
             self.blockchain, fork_point_height, peers_with_peak, node_next_block_check
         )
         batch_size = self.constants.MAX_BLOCK_COUNT_PER_REQUESTS
+        # the number of peers to download batches of blocks from at the same time
+        download_peers = max(1, self.config.get("sync_download_peers", 4))
+        # downloaded batches are pre-validated together, up to this many blocks
+        max_prevalidation_blocks = max(batch_size, self.config.get("sync_max_prevalidation_blocks", 128))
+        prevalidation_size = AdaptiveBatchSize(batch_size, max_prevalidation_blocks)
+        # the blocks pre-validated, but not added to the chain yet
+        pending = PendingBlockRecords(self.blockchain)
+
+        async def fetch_range(
+            request: RequestBlocks, peers: List[WSSpareConnection]
+        ) -> Optional[Tuple[WSSpareConnection, List[FullBlock]]]:
+            if len(peers) == 0:
+                return None
+            # the first peer is the one the range is striped to, the others
+            # are only asked if that fails
+            for peer in peers[:1] + random.sample(peers[1:], len(peers) - 1):
+                if peer.closed:
+                    if peer in peers_with_peak:
+                        peers_with_peak.remove(peer)
+                    continue
+                response = await peer.call_api(FullNodeAPI.request_blocks, request, timeout=30)
+                if response is None:
+                    await peer.close()
+                    if peer in peers_with_peak:
+                        peers_with_peak.remove(peer)
+                elif isinstance(response, RespondBlocks):
+                    return peer, response.blocks
+            return None
 
         async def fetch_block_batches(
             batch_queue: asyncio.Queue[Optional[Tuple[WSSpareConnection, List[FullBlock]]]]
         ) -> None:
             start_height, end_height = 0, 0
             new_peers_with_peak: List[WSSpareConnection] = peers_with_peak[:]
+            # batches are downloaded from several peers at the same time, and
+            # handed over in order
+            downloads: Deque[Tuple[int, int, asyncio.Task[Optional[Tuple[WSSpareConnection, List[FullBlock]]]]]]
+            downloads = deque()
             try:
-                for start_height in range(fork_point_height, target_peak_sb_height, batch_size):
-                    end_height = min(target_peak_sb_height, start_height + batch_size)
-                    request = RequestBlocks(uint32(start_height), uint32(end_height), True)
-                    fetched = False
-                    for peer in random.sample(new_peers_with_peak, len(new_peers_with_peak)):
-                        if peer.closed:
-                            peers_with_peak.remove(peer)
-                            continue
-                        response = await peer.call_api(FullNodeAPI.request_blocks, request, timeout=30)
-                        if response is None:
-                            await peer.close()
-                            peers_with_peak.remove(peer)
-                        elif isinstance(response, RespondBlocks):
-                            await batch_queue.put((peer, response.blocks))
-                            fetched = True
+                ranges = iter(range(fork_point_height, target_peak_sb_height, batch_size))
+                stripe = 0
+                while True:
+                    while len(downloads) < min(download_peers, max(len(new_peers_with_peak), 1)):
+                        next_start = next(ranges, None)
+                        if next_start is None:
                             break
-                    if fetched is False:
+                        next_end = min(target_peak_sb_height, next_start + batch_size)
+                        request = RequestBlocks(uint32(next_start), uint32(next_end), True)
+                        peers: List[WSSpareConnection] = []
+                        if len(new_peers_with_peak) > 0:
+                            first = stripe % len(new_peers_with_peak)
+                            peers = new_peers_with_peak[first:] + new_peers_with_peak[:first]
+                        stripe += 1
+                        downloads.append((next_start, next_end, asyncio.create_task(fetch_range(request, peers))))
+                    if len(downloads) == 0:
+                        break
+                    start_height, end_height, download = downloads.popleft()
+                    fetched = await download
+                    if fetched is None:
                         self.log.error(f"failed fetching {start_height} to {end_height} from peers")
                         return
+                    await batch_queue.put(fetched)
                     if self.sync_store.peers_changed.is_set():
                         new_peers_with_peak = self.get_peers_with_peak(peak_hash)
                         self.sync_store.peers_changed.clear()
             except Exception as e:
                 self.log.error(f"Exception fetching {start_height} to {end_height} from peer {e}")
             finally:
+                for _, _, download in downloads:
+                    download.cancel()
                 # finished signal with None
                 await batch_queue.put(None)
 
+        async def pre_validate_batches(
+            segments: List[Tuple[WSSpareConnection, List[FullBlock]]],
+            validated_queue: asyncio.Queue[Optional[PreValidatedBlocks]],
+        ) -> bool:
+            # Pre-validates the blocks of several downloaded batches together. If they fail, the batches are
+            # pre-validated one by one, to find out which peer sent the invalid block
+            all_blocks = [block for _, blocks in segments for block in blocks]
+            # blocks we already have are skipped, like add_block_batch() does
+            skip = len(all_blocks)
+            for i, block in enumerate(all_blocks):
+                if not self.blockchain.contains_block(block.header_hash):
+                    skip = i
+                    break
+            blocks_to_validate = all_blocks[skip:]
+            results: List[PreValidationResult] = []
+            if len(blocks_to_validate) > 0:
+                start = time.monotonic()
+                results = await self.pre_validate_block_batch(blocks_to_validate, summaries, pending)
+                prevalidation_size.update(len(blocks_to_validate), time.monotonic() - start)
+                if len(results) != len(blocks_to_validate) or any(r.error is not None for r in results):
+                    if len(segments) > 1:
+                        for segment in segments:
+                            if not await pre_validate_batches([segment], validated_queue):
+                                return False
+                        return True
+                    peer = segments[0][0]
+                    error = next(r.error for r in results if r.error is not None)
+                    self.log.error(f"Invalid block from peer: {peer.get_peer_logging()} {Err(error)}")
+                    await validated_queue.put(PreValidatedBlocks(peer, segments[0][1], [], [], False))
+                    return False
+                for block, result in zip(blocks_to_validate, results):
+                    assert result.required_iters is not None
+                    block_record = block_to_block_record(self.constants, pending, result.required_iters, block, None)
+                    pending.add_pending(block, block_record)
+
+            offset = 0
+            for peer, blocks in segments:
+                begin = max(offset, skip) - skip
+                end = max(offset + len(blocks), skip) - skip
+                offset += len(blocks)
+                await validated_queue.put(
+                    PreValidatedBlocks(peer, blocks, blocks_to_validate[begin:end], results[begin:end], True)
+                )
+            return True
+
         async def validate_block_batches(
-            inner_batch_queue: asyncio.Queue[Optional[Tuple[WSSpareConnection, List[FullBlock]]]]
+            inner_batch_queue: asyncio.Queue[Optional[Tuple[WSSpareConnection, List[FullBlock]]]],
+            validated_queue: asyncio.Queue[Optional[PreValidatedBlocks]],
         ) -> None:
-            advanced_peak: bool = False
-            while True:
+            done = False
+            while not done:
                 res: Optional[Tuple[WSSpareConnection, List[FullBlock]]] = await inner_batch_queue.get()
                 if res is None:
                     self.log.debug("done fetching blocks")
+                    break
+                # pick up the batches that have already been downloaded, to
+                # pre-validate them together
+                segments = [res]
+                num_blocks = len(res[1])
+                while num_blocks < prevalidation_size.size and not inner_batch_queue.empty():
+                    res = inner_batch_queue.get_nowait()
+                    if res is None:
+                        done = True
+                        break
+                    segments.append(res)
+                    num_blocks += len(res[1])
+                if not await pre_validate_batches(segments, validated_queue):
+                    return
+            await validated_queue.put(None)
+
+        async def add_block_batches(validated_queue: asyncio.Queue[Optional[PreValidatedBlocks]]) -> None:
+            advanced_peak: bool = False
+            while True:
+                res: Optional[PreValidatedBlocks] = await validated_queue.get()
+                if res is None:
                     return None
-                peer, blocks = res
-                start_height = blocks[0].height
-                end_height = blocks[-1].height
-                success, state_change_summary = await self.add_block_batch(
-                    blocks, peer, None if advanced_peak else uint32(fork_point_height), summaries
-                )
+                peer = res.peer
+                start_height = res.fetched[0].height
+                end_height = res.fetched[-1].height
+                success = res.valid
+                state_change_summary: Optional[StateChangeSummary] = None
+                if success and len(res.blocks) > 0:
+                    success, state_change_summary = await self.add_prevalidated_blocks(
+                        res.blocks, res.results, peer, None if advanced_peak else uint32(fork_point_height)
+                    )
+                    pending.remove_pending([block.header_hash for block in res.blocks])
                 if success is False:
                     if peer in peers_with_peak:
                         peers_with_peak.remove(peer)
@@ -1136,16 +1260,24 @@ class FullNode:
                 await self.send_peak_to_wallets()
                 self.blockchain.clean_block_record(end_height - self.constants.BLOCKS_CACHE_SIZE)
 
+        # downloading, pre-validating and adding blocks to the chain run
+        # concurrently, with bounded buffers between them. Pre-validation of a
+        # batch overlaps with adding the previous one to the chain. Both run
+        # under the blockchain lock our caller holds, see
+        # pre_validate_blocks_multiprocessing() for why that's safe
         batch_queue_input: asyncio.Queue[Optional[Tuple[WSSpareConnection, List[FullBlock]]]] = asyncio.Queue(
             maxsize=buffer_size
         )
+        validated_queue: asyncio.Queue[Optional[PreValidatedBlocks]] = asyncio.Queue(maxsize=1)
         fetch_task = asyncio.Task(fetch_block_batches(batch_queue_input))
-        validate_task = asyncio.Task(validate_block_batches(batch_queue_input))
+        validate_task = asyncio.Task(validate_block_batches(batch_queue_input, validated_queue))
+        add_task = asyncio.Task(add_block_batches(validated_queue))
         try:
-            await asyncio.gather(fetch_task, validate_task)
+            await asyncio.gather(fetch_task, validate_task, add_task)
         except Exception as e:
-            assert validate_task.done()
-            fetch_task.cancel()  # no need to cancel validate_task, if we end up here validate_task is already done
+            fetch_task.cancel()
+            validate_task.cancel()
+            add_task.cancel()
             self.log.error(f"sync from fork point failed err: {e}")
 
     async def send_peak_to_wallets(self) -> None:
@@ -1231,11 +1363,36 @@ class FullNode:
         if len(blocks_to_validate) == 0:
             return True, None
 
+        pre_validation_results = await self.pre_validate_block_batch(blocks_to_validate, wp_summaries)
+        for i, block in enumerate(blocks_to_validate):
+            if pre_validation_results[i].error is not None:
+                self.log.error(
+                    f"Invalid block from peer: {peer.get_peer_logging()} {Err(pre_validation_results[i].error)}"
+                )
+                return False, None
+
+        return await self.add_prevalidated_blocks(blocks_to_validate, pre_validation_results, peer, fork_point)
+
+    async def pre_validate_block_batch(
+        self,
+        blocks_to_validate: List[FullBlock],
+        wp_summaries: Optional[List[SubEpochSummary]],
+        pending: Optional[PendingBlockRecords] = None,
+    ) -> List[PreValidationResult]:
+        """
+        Pre-validates a contiguous batch of blocks that are not in the chain yet. If pending is set, the batch may
+        build on the (pre-validated) blocks in it, rather than on blocks already added to the chain
+        """
         # Validates signatures in multiprocessing since they take a while, and we don't have cached transactions
         # for these blocks (unlike during normal operation where we validate one at a time)
         pre_validate_start = time.monotonic()
         pre_validation_results: List[PreValidationResult] = await self.blockchain.pre_validate_blocks_multiprocessing(
-            blocks_to_validate, {}, wp_summaries=wp_summaries, validate_signatures=True
+            blocks_to_validate,
+            {},
+            wp_summaries=wp_summaries,
+            validate_signatures=True,
+            block_records=pending,
+            prev_blocks=None if pending is None else pending.blocks,
         )
         pre_validate_end = time.monotonic()
         pre_validate_time = pre_validate_end - pre_validate_start
@@ -1245,14 +1402,18 @@ class FullNode:
             f"Block pre-validation time: {pre_validate_end - pre_validate_start:0.2f} seconds "
             f"({len(blocks_to_validate)} blocks, start height: {blocks_to_validate[0].height})",
         )
-        for i, block in enumerate(blocks_to_validate):
-            if pre_validation_results[i].error is not None:
-                self.log.error(
-                    f"Invalid block from peer: {peer.get_peer_logging()} {Err(pre_validation_results[i].error)}"
-                )
-                return False, None
+        return pre_validation_results
 
+    async def add_prevalidated_blocks(
+        self,
+        blocks_to_validate: List[FullBlock],
+        pre_validation_results: List[PreValidationResult],
+        peer: WSSpareConnection,
+        fork_point: Optional[uint32],
+    ) -> Tuple[bool, Optional[StateChangeSummary]]:
+        # Precondition: the blocks passed pre-validation
         agg_state_change_summary: Optional[StateChangeSummary] = None
+        add_start = time.monotonic()
 
         for i, block in enumerate(blocks_to_validate):
             assert pre_validation_results[i].required_iters is not None
@@ -1288,7 +1449,7 @@ class FullNode:
         if agg_state_change_summary is not None:
             self._state_changed("new_peak")
             self.log.debug(
-                f"Total time for {len(blocks_to_validate)} blocks: {time.time() - pre_validate_start}, "
+                f"Total time for adding {len(blocks_to_validate)} blocks: {time.monotonic() - add_start}, "
                 f"advanced: True"
             )
         return True, agg_state_change_summary
@@ -54,7 +54,7 @@ from spare.types.spend_bundle import SpendBundle
 from spare.types.transaction_queue_entry import TransactionQueueEntry
 from spare.types.unfinished_block import UnfinishedBlock
 from spare.util.api_decorators import api_request
-from spare.util.full_block_utils import header_block_from_block
+from spare.util.full_block_utils import FullBlockView, header_block_from_block
 from spare.util.generator_tools import get_block_header, tx_removals_and_additions
 from spare.util.hash import std_hash
 from spare.util.ints import uint8, uint32, uint64, uint128
@@ -273,11 +273,11 @@ class FullNodeAPI:
         if request.tip in self.full_node.pow_creation:
             event = self.full_node.pow_creation[request.tip]
             await event.wait()
-            wp = await self.full_node.weight_proof_handler.get_proof_of_weight(request.tip)
+            wp = await self.full_node.weight_proof_handler.get_serialized_proof_of_weight(request.tip)
         else:
             event = asyncio.Event()
             self.full_node.pow_creation[request.tip] = event
-            wp = await self.full_node.weight_proof_handler.get_proof_of_weight(request.tip)
+            wp = await self.full_node.weight_proof_handler.get_serialized_proof_of_weight(request.tip)
             event.set()
         tips = list(self.full_node.pow_creation.keys())
 
@@ -296,9 +296,8 @@ class FullNodeAPI:
             and self.full_node.full_node_store.serialized_wp_message_tip == request.tip
         ):
             return self.full_node.full_node_store.serialized_wp_message
-        message = make_msg(
-            ProtocolMessageTypes.respond_proof_of_weight, full_node_protocol.RespondProofOfWeight(wp, request.tip)
-        )
+        # wp is the serialized WeightProof, so this is a serialized RespondProofOfWeight
+        message = make_msg(ProtocolMessageTypes.respond_proof_of_weight, wp + request.tip)
         self.full_node.full_node_store.serialized_wp_message_tip = request.tip
         self.full_node.full_node_store.serialized_wp_message = message
         return message
@@ -318,11 +317,13 @@ class FullNodeAPI:
         if header_hash is None:
             return make_msg(ProtocolMessageTypes.reject_block, RejectBlock(request.height))
 
-        block: Optional[FullBlock] = await self.full_node.block_store.get_full_block(header_hash)
+        block: Optional[FullBlockView] = await self.full_node.block_store.get_full_block_view(header_hash)
         if block is not None:
-            if not request.include_transaction_block and block.transactions_generator is not None:
-                block = dataclasses.replace(block, transactions_generator=None)
-            return make_msg(ProtocolMessageTypes.respond_block, full_node_protocol.RespondBlock(block))
+            # RespondBlock only wraps the block, so the serialized block is the
+            # serialized message
+            if request.include_transaction_block:
+                return make_msg(ProtocolMessageTypes.respond_block, bytes(block))
+            return make_msg(ProtocolMessageTypes.respond_block, block.bytes_without_generator())
         return make_msg(ProtocolMessageTypes.reject_block, RejectBlock(request.height))
 
     @api_request(reply_types=[ProtocolMessageTypes.respond_blocks, ProtocolMessageTypes.reject_blocks])
@@ -340,49 +341,31 @@ class FullNodeAPI:
                 msg = make_msg(ProtocolMessageTypes.reject_blocks, reject)
                 return msg
 
-        if not request.include_transaction_block:
-            blocks: List[FullBlock] = []
-            for i in range(request.start_height, request.end_height + 1):
-                header_hash_i: Optional[bytes32] = self.full_node.blockchain.height_to_hash(uint32(i))
-                if header_hash_i is None:
-                    reject = RejectBlocks(request.start_height, request.end_height)
-                    return make_msg(ProtocolMessageTypes.reject_blocks, reject)
-
-                block: Optional[FullBlock] = await self.full_node.block_store.get_full_block(header_hash_i)
-                if block is None:
-                    reject = RejectBlocks(request.start_height, request.end_height)
-                    return make_msg(ProtocolMessageTypes.reject_blocks, reject)
-                block = dataclasses.replace(block, transactions_generator=None)
-                blocks.append(block)
-            msg = make_msg(
-                ProtocolMessageTypes.respond_blocks,
-                full_node_protocol.RespondBlocks(request.start_height, request.end_height, blocks),
-            )
-        else:
-            blocks_bytes: List[bytes] = []
-            for i in range(request.start_height, request.end_height + 1):
-                header_hash_i = self.full_node.blockchain.height_to_hash(uint32(i))
-                if header_hash_i is None:
-                    reject = RejectBlocks(request.start_height, request.end_height)
-                    return make_msg(ProtocolMessageTypes.reject_blocks, reject)
-                block_bytes: Optional[bytes] = await self.full_node.block_store.get_full_block_bytes(header_hash_i)
-                if block_bytes is None:
-                    reject = RejectBlocks(request.start_height, request.end_height)
-                    msg = make_msg(ProtocolMessageTypes.reject_blocks, reject)
-                    return msg
-
-                blocks_bytes.append(block_bytes)
-
-            respond_blocks_manually_streamed: bytes = (
-                bytes(uint32(request.start_height))
-                + bytes(uint32(request.end_height))
-                + len(blocks_bytes).to_bytes(4, "big", signed=False)
-            )
-            for block_bytes in blocks_bytes:
-                respond_blocks_manually_streamed += block_bytes
-            msg = make_msg(ProtocolMessageTypes.respond_blocks, respond_blocks_manually_streamed)
+        # we're building the RespondBlocks manually to avoid parsing and
+        # re-serializing the blocks, the views are streamed as they're stored
+        blocks_bytes: List[bytes] = []
+        for i in range(request.start_height, request.end_height + 1):
+            header_hash_i: Optional[bytes32] = self.full_node.blockchain.height_to_hash(uint32(i))
+            if header_hash_i is None:
+                reject = RejectBlocks(request.start_height, request.end_height)
+                return make_msg(ProtocolMessageTypes.reject_blocks, reject)
+            block: Optional[FullBlockView] = await self.full_node.block_store.get_full_block_view(header_hash_i)
+            if block is None:
+                reject = RejectBlocks(request.start_height, request.end_height)
+                return make_msg(ProtocolMessageTypes.reject_blocks, reject)
 
-        return msg
+            if request.include_transaction_block:
+                blocks_bytes.append(bytes(block))
+            else:
+                blocks_bytes.append(block.bytes_without_generator())
+
+        respond_blocks_manually_streamed: bytes = (
+            bytes(uint32(request.start_height))
+            + bytes(uint32(request.end_height))
+            + len(blocks_bytes).to_bytes(4, "big", signed=False)
+        )
+        respond_blocks_manually_streamed += b"".join(blocks_bytes)
+        return make_msg(ProtocolMessageTypes.respond_blocks, respond_blocks_manually_streamed)
 
     @api_request()
     async def reject_block(self, request: full_node_protocol.RejectBlock) -> None:
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import logging
 import sqlite3
+from abc import ABCMeta, abstractmethod
 from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
@@ -11,6 +12,7 @@ from chia_rs import Coin
 
 from spare.consensus.cost_calculator import NPCResult
 from spare.consensus.default_constants import DEFAULT_CONSTANTS
+from spare.full_node.block_template import BlockTemplate
 from spare.full_node.fee_estimation import FeeMempoolInfo, MempoolInfo, MempoolItemInfo
 from spare.full_node.fee_estimator_interface import FeeEstimatorInterface
 from spare.types.blockchain_format.sized_bytes import bytes32
@@ -46,21 +48,156 @@ class InternalMempoolItem:
     height_added_to_mempool: uint32
 
 
-class Mempool:
-    _db_conn: sqlite3.Connection
-    # it's expensive to serialize and deserialize G2Element, so we keep those in
-    # this separate dictionary
-    _items: Dict[bytes32, InternalMempoolItem]
+class MempoolBase(metaclass=ABCMeta):
+    """
+    The mempool operations all backends implement, selected with the full_node
+    "mempool_backend" config option, and the parts they share
+    """
+
+    mempool_info: MempoolInfo
+    fee_estimator: FeeEstimatorInterface
+    block_template: BlockTemplate
 
     # the most recent block height and timestamp that we know of
     _block_height: uint32
     _timestamp: uint64
 
     def __init__(self, mempool_info: MempoolInfo, fee_estimator: FeeEstimatorInterface):
-        self._db_conn = sqlite3.connect(":memory:")
-        self._items = {}
         self._block_height = uint32(0)
         self._timestamp = uint64(0)
+        self.mempool_info = mempool_info
+        self.fee_estimator = fee_estimator
+        self.block_template = BlockTemplate(mempool_info.max_block_clvm_cost)
+
+    @abstractmethod
+    def total_mempool_fees(self) -> int:
+        pass
+
+    @abstractmethod
+    def total_mempool_cost(self) -> CLVMCost:
+        pass
+
+    @abstractmethod
+    def all_spends(self) -> Iterator[MempoolItem]:
+        """
+        All items, in the order they were added to the mempool
+        """
+
+    @abstractmethod
+    def all_spend_ids(self) -> List[bytes32]:
+        pass
+
+    @abstractmethod
+    def spends_by_feerate(self) -> Iterator[MempoolItem]:
+        """
+        All items by decreasing fee per cost, items with the same fee per cost in
+        the order they were added to the mempool
+        """
+
+    @abstractmethod
+    def size(self) -> int:
+        pass
+
+    @abstractmethod
+    def get_spend_by_id(self, spend_bundle_id: bytes32) -> Optional[MempoolItem]:
+        pass
+
+    @abstractmethod
+    def get_spends_by_coin_id(self, spent_coin_id: bytes32) -> List[MempoolItem]:
+        pass
+
+    @abstractmethod
+    def get_min_fee_rate(self, cost: int) -> float:
+        """
+        Gets the minimum fpc rate that a transaction with specified cost will need in order to get included.
+        """
+
+    @abstractmethod
+    def new_tx_block(self, block_height: uint32, timestamp: uint64) -> None:
+        """
+        Remove all items that became invalid because of this new height and
+        timestamp. (we don't know about which coins were spent in this new block
+        here, so those are handled separately)
+        """
+
+    @abstractmethod
+    def remove_from_pool(self, items: List[bytes32], reason: MempoolRemoveReason) -> None:
+        """
+        Removes an item from the mempool.
+        """
+
+    @abstractmethod
+    def add_to_pool(self, item: MempoolItem) -> Optional[Err]:
+        """
+        Adds an item to the mempool by kicking out transactions (if it doesn't fit), in order of increasing fee per cost
+        """
+
+    def at_full_capacity(self, cost: int) -> bool:
+        """
+        Checks whether the mempool is at full capacity and cannot accept a transaction with size cost.
+        """
+
+        return self.total_mempool_cost() + cost > self.mempool_info.max_size_in_cost
+
+    def create_bundle_from_block_template(self) -> Optional[Tuple[SpendBundle, List[Coin]]]:
+        """
+        Returns the same spend bundle and additions as
+        create_bundle_from_mempool_items() does when including all items, from
+        the incrementally maintained block template
+        """
+        if self.block_template.stale:
+            self.block_template.rebuild(self.spends_by_feerate())
+        return self.block_template.bundle()
+
+    def create_bundle_from_mempool_items(
+        self, item_inclusion_filter: Callable[[bytes32], bool]
+    ) -> Optional[Tuple[SpendBundle, List[Coin]]]:
+        cost_sum = 0  # Checks that total cost does not exceed block maximum
+        fee_sum = 0  # Checks that total fees don't exceed 64 bits
+        spend_bundles: List[SpendBundle] = []
+        additions: List[Coin] = []
+        log.info(f"Starting to make block, max cost: {self.mempool_info.max_block_clvm_cost}")
+        for item in self.spends_by_feerate():
+            if not item_inclusion_filter(item.name):
+                continue
+            log.info("Cumulative cost: %d, fee per cost: %0.4f", cost_sum, item.fee_per_cost)
+            if (
+                item.cost + cost_sum > self.mempool_info.max_block_clvm_cost
+                or item.fee + fee_sum > DEFAULT_CONSTANTS.MAX_COIN_AMOUNT
+            ):
+                break
+            spend_bundles.append(item.spend_bundle)
+            cost_sum += item.cost
+            fee_sum += item.fee
+            if item.npc_result.conds is not None:
+                for spend in item.npc_result.conds.spends:
+                    for puzzle_hash, amount, _ in spend.create_coin:
+                        coin = Coin(spend.coin_id, puzzle_hash, amount)
+                        additions.append(coin)
+        if len(spend_bundles) == 0:
+            return None
+        log.info(
+            f"Cumulative cost of block (real cost should be less) {cost_sum}. Proportion "
+            f"full: {cost_sum / self.mempool_info.max_block_clvm_cost}"
+        )
+        agg = SpendBundle.aggregate(spend_bundles)
+        return agg, additions
+
+
+class Mempool(MempoolBase):
+    """
+    A mempool backed by an in-memory SQLite database
+    """
+
+    _db_conn: sqlite3.Connection
+    # it's expensive to serialize and deserialize G2Element, so we keep those in
+    # this separate dictionary
+    _items: Dict[bytes32, InternalMempoolItem]
+
+    def __init__(self, mempool_info: MempoolInfo, fee_estimator: FeeEstimatorInterface):
+        super().__init__(mempool_info, fee_estimator)
+        self._db_conn = sqlite3.connect(":memory:")
+        self._items = {}
 
         with self._db_conn:
             # name means SpendBundle hash
@@ -103,9 +240,6 @@ class Mempool:
             self._db_conn.execute("CREATE INDEX spend_by_coin ON spends(coin_id)")
             self._db_conn.execute("CREATE INDEX spend_by_bundle ON spends(tx)")
 
-        self.mempool_info: MempoolInfo = mempool_info
-        self.fee_estimator: FeeEstimatorInterface = fee_estimator
-
     def __del__(self) -> None:
         self._db_conn.close()
 
@@ -247,6 +381,7 @@ class Mempool:
 
         for name in items:
             self._items.pop(name)
+        self.block_template.remove(items)
 
         for spend_bundle_ids in chunks(items, SQLITE_MAX_VARIABLE_NUMBER):
             args = ",".join(["?"] * len(spend_bundle_ids))
@@ -363,47 +498,8 @@ class Mempool:
                 item.spend_bundle, item.npc_result, item.height_added_to_mempool
             )
 
+        self.block_template.add(item)
+
         info = FeeMempoolInfo(self.mempool_info, self.total_mempool_cost(), self.total_mempool_fees(), datetime.now())
         self.fee_estimator.add_mempool_item(info, MempoolItemInfo(item.cost, item.fee, item.height_added_to_mempool))
         return None
-
-    def at_full_capacity(self, cost: int) -> bool:
-        """
-        Checks whether the mempool is at full capacity and cannot accept a transaction with size cost.
-        """
-
-        return self.total_mempool_cost() + cost > self.mempool_info.max_size_in_cost
-
-    def create_bundle_from_mempool_items(
-        self, item_inclusion_filter: Callable[[bytes32], bool]
-    ) -> Optional[Tuple[SpendBundle, List[Coin]]]:
-        cost_sum = 0  # Checks that total cost does not exceed block maximum
-        fee_sum = 0  # Checks that total fees don't exceed 64 bits
-        spend_bundles: List[SpendBundle] = []
-        additions: List[Coin] = []
-        log.info(f"Starting to make block, max cost: {self.mempool_info.max_block_clvm_cost}")
-        for item in self.spends_by_feerate():
-            if not item_inclusion_filter(item.name):
-                continue
-            log.info("Cumulative cost: %d, fee per cost: %0.4f", cost_sum, item.fee_per_cost)
-            if (
-                item.cost + cost_sum > self.mempool_info.max_block_clvm_cost
-                or item.fee + fee_sum > DEFAULT_CONSTANTS.MAX_COIN_AMOUNT
-            ):
-                break
-            spend_bundles.append(item.spend_bundle)
-            cost_sum += item.cost
-            fee_sum += item.fee
-            if item.npc_result.conds is not None:
-                for spend in item.npc_result.conds.spends:
-                    for puzzle_hash, amount, _ in spend.create_coin:
-                        coin = Coin(spend.coin_id, puzzle_hash, amount)
-                        additions.append(coin)
-        if len(spend_bundles) == 0:
-            return None
-        log.info(
-            f"Cumulative cost of block (real cost should be less) {cost_sum}. Proportion "
-            f"full: {cost_sum / self.mempool_info.max_block_clvm_cost}"
-        )
-        agg = SpendBundle.aggregate(spend_bundles)
-        return agg, additions
@@ -1,13 +1,12 @@
 from __future__ import annotations
 
-import asyncio
 import logging
 import time
 from concurrent.futures import Executor
 from concurrent.futures.process import ProcessPoolExecutor
 from dataclasses import dataclass
 from multiprocessing.context import BaseContext
-from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple, TypeVar
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple, Type, TypeVar
 
 from blspy import GTElement
 from chiabip158 import PyBIP158
@@ -19,9 +18,11 @@ from spare.full_node.bitcoin_fee_estimator import create_bitcoin_fee_estimator
 from spare.full_node.bundle_tools import simple_solution_generator
 from spare.full_node.fee_estimation import FeeBlockInfo, MempoolInfo, MempoolItemInfo
 from spare.full_node.fee_estimator_interface import FeeEstimatorInterface
-from spare.full_node.mempool import MEMPOOL_ITEM_FEE_LIMIT, Mempool, MempoolRemoveReason
+from spare.full_node.mempool import MEMPOOL_ITEM_FEE_LIMIT, Mempool, MempoolBase, MempoolRemoveReason
 from spare.full_node.mempool_check_conditions import get_name_puzzle_conditions, mempool_check_time_locks
+from spare.full_node.native_mempool import NativeMempool
 from spare.full_node.pending_tx_cache import ConflictTxCache, PendingTxCache
+from spare.full_node.pre_validation_batcher import PreValidationBatcher
 from spare.types.blockchain_format.coin import Coin
 from spare.types.blockchain_format.sized_bytes import bytes32, bytes48
 from spare.types.clvm_cost import CLVMCost
@@ -32,7 +33,6 @@ from spare.types.mempool_item import MempoolItem
 from spare.types.spend_bundle import SpendBundle
 from spare.types.spend_bundle_conditions import SpendBundleConditions
 from spare.util import cached_bls
-from spare.util.cached_bls import LOCAL_CACHE
 from spare.util.condition_tools import pkm_pairs
 from spare.util.db_wrapper import SQLITE_INT_MAX
 from spare.util.errors import Err, ValidationError
@@ -49,17 +49,13 @@ log = logging.getLogger(__name__)
 MEMPOOL_MIN_FEE_INCREASE = uint64(10000000)
 
 
-# TODO: once the 1.8.0 soft-fork has activated, we don't really need to pass
-# the constants through here
-def validate_clvm_and_signature(
-    spend_bundle_bytes: bytes, max_cost: int, constants: ConsensusConstants, height: uint32
-) -> Tuple[Optional[Err], bytes, Dict[bytes32, bytes]]:
-    """
-    Validates CLVM and aggregate signature for a spendbundle. This is meant to be called under a ProcessPoolExecutor
-    in order to validate the heavy parts of a transaction in a different thread. Returns an optional error,
-    the NPCResult and a cache of the new pairings validated (if not error)
-    """
-
+def _validate_clvm_and_signature(
+    spend_bundle_bytes: bytes,
+    max_cost: int,
+    constants: ConsensusConstants,
+    height: uint32,
+    cache: LRUCache[bytes32, GTElement],
+) -> Tuple[Optional[Err], bytes]:
     additional_data = constants.AGG_SIG_ME_ADDITIONAL_DATA
 
     try:
@@ -71,7 +67,7 @@ def validate_clvm_and_signature(
         )
 
         if result.error is not None:
-            return Err(result.error), b"", {}
+            return Err(result.error), b""
 
         pks: List[bytes48] = []
         msgs: List[bytes] = []
@@ -79,18 +75,59 @@ def validate_clvm_and_signature(
         pks, msgs = pkm_pairs(result.conds, additional_data, soft_fork=True)
 
         # Verify aggregated signature
-        cache: LRUCache[bytes32, GTElement] = LRUCache(10000)
         if not cached_bls.aggregate_verify(pks, msgs, bundle.aggregated_signature, True, cache):
-            return Err.BAD_AGGREGATE_SIGNATURE, b"", {}
-        new_cache_entries: Dict[bytes32, bytes] = {}
-        for k, v in cache.cache.items():
-            new_cache_entries[k] = bytes(v)
+            return Err.BAD_AGGREGATE_SIGNATURE, b""
     except ValidationError as e:
-        return e.code, b"", {}
+        return e.code, b""
     except Exception:
-        return Err.UNKNOWN, b"", {}
+        return Err.UNKNOWN, b""
+
+    return None, bytes(result)
 
-    return None, bytes(result), new_cache_entries
+
+# TODO: once the 1.8.0 soft-fork has activated, we don't really need to pass
+# the constants through here
+def validate_clvm_and_signature(
+    spend_bundle_bytes: bytes, max_cost: int, constants: ConsensusConstants, height: uint32
+) -> Tuple[Optional[Err], bytes, Dict[bytes32, bytes]]:
+    """
+    Validates CLVM and aggregate signature for a spendbundle. This is meant to be called under a ProcessPoolExecutor
+    in order to validate the heavy parts of a transaction in a different thread. Returns an optional error,
+    the NPCResult and a cache of the new pairings validated (if not error)
+    """
+
+    cache: LRUCache[bytes32, GTElement] = LRUCache(10000)
+    err, result_bytes = _validate_clvm_and_signature(spend_bundle_bytes, max_cost, constants, height, cache)
+    if err is not None:
+        return err, b"", {}
+    new_cache_entries: Dict[bytes32, bytes] = {}
+    for k, v in cache.cache.items():
+        new_cache_entries[k] = bytes(v)
+
+    return None, result_bytes, new_cache_entries
+
+
+def validate_clvm_and_signature_batch(
+    spend_bundles_bytes: List[bytes], max_cost: int, constants: ConsensusConstants, height: uint32
+) -> Tuple[List[Tuple[Optional[Err], bytes]], Dict[bytes32, bytes]]:
+    """
+    Like validate_clvm_and_signature(), but for a batch of spendbundles, to pay the cost of sending a job to the
+    process pool once. The bundles share a pairing cache, so a pairing is only computed once per batch. Every
+    signature is still verified against its own bundle; adding up signatures across bundles would let invalid
+    signatures cancel each other out. Returns an optional error and the NPCResult for each bundle, and the pairings
+    computed for the whole batch
+    """
+
+    cache: LRUCache[bytes32, GTElement] = LRUCache(10000 * max(len(spend_bundles_bytes), 1))
+    results = [
+        _validate_clvm_and_signature(spend_bundle_bytes, max_cost, constants, height, cache)
+        for spend_bundle_bytes in spend_bundles_bytes
+    ]
+    new_cache_entries: Dict[bytes32, bytes] = {}
+    for k, v in cache.cache.items():
+        new_cache_entries[k] = bytes(v)
+
+    return results, new_cache_entries
 
 
 @dataclass
@@ -143,6 +180,14 @@ def compute_assert_height(
     return ret
 
 
+# the data structures backing the mempool, selectable with the full_node
+# "mempool_backend" config option
+MEMPOOL_BACKENDS: Dict[str, Type[MempoolBase]] = {
+    "sqlite": Mempool,
+    "native": NativeMempool,
+}
+
+
 class MempoolManager:
     pool: Executor
     constants: ConsensusConstants
@@ -156,7 +201,8 @@ class MempoolManager:
     _pending_cache: PendingTxCache
     seen_cache_size: int
     peak: Optional[BlockRecordProtocol]
-    mempool: Mempool
+    mempool: MempoolBase
+    pre_validation_batcher: PreValidationBatcher
 
     def __init__(
         self,
@@ -165,8 +211,15 @@ class MempoolManager:
         multiprocessing_context: Optional[BaseContext] = None,
         *,
         single_threaded: bool = False,
+        mempool_backend: str = "sqlite",
+        pre_validation_batch_size: int = 16,
+        pre_validation_batch_window: float = 0.01,
     ):
         self.constants: ConsensusConstants = consensus_constants
+        if mempool_backend not in MEMPOOL_BACKENDS:
+            raise ValueError(
+                f"unknown mempool backend {mempool_backend!r}, expected one of: {', '.join(MEMPOOL_BACKENDS)}"
+            )
 
         # Keep track of seen spend_bundles
         self.seen_bundle_hashes: Dict[bytes32, bytes32] = {}
@@ -195,6 +248,14 @@ class MempoolManager:
                 initializer=setproctitle,
                 initargs=(f"{getproctitle()}_worker",),
             )
+        self.pre_validation_batcher = PreValidationBatcher(
+            self.pool,
+            validate_clvm_and_signature_batch,
+            self.max_block_clvm_cost,
+            self.constants,
+            max_batch_size=pre_validation_batch_size,
+            batch_window=pre_validation_batch_window,
+        )
 
         # The mempool will correspond to a certain peak
         self.peak: Optional[BlockRecordProtocol] = None
@@ -204,9 +265,10 @@ class MempoolManager:
             FeeRate(uint64(self.nonzero_fee_minimum_fpc)),
             CLVMCost(uint64(self.max_block_clvm_cost)),
         )
-        self.mempool: Mempool = Mempool(mempool_info, self.fee_estimator)
+        self.mempool: MempoolBase = MEMPOOL_BACKENDS[mempool_backend](mempool_info, self.fee_estimator)
 
     def shut_down(self) -> None:
+        self.pre_validation_batcher.close()
         self.pool.shutdown(wait=True)
 
     def create_bundle_from_mempool(
@@ -219,11 +281,9 @@ class MempoolManager:
         if self.peak is None or self.peak.header_hash != last_tb_header_hash:
             return None
         if item_inclusion_filter is None:
-
-            def always(bundle_name: bytes32) -> bool:
-                return True
-
-            item_inclusion_filter = always
+            # all items are candidates, which is what the block template
+            # is kept up to date with
+            return self.mempool.create_bundle_from_block_template()
         return self.mempool.create_bundle_from_mempool_items(item_inclusion_filter)
 
     def get_filter(self) -> bytes:
@@ -281,19 +341,10 @@ class MempoolManager:
 
         assert self.peak is not None
 
-        err, cached_result_bytes, new_cache_entries = await asyncio.get_running_loop().run_in_executor(
-            self.pool,
-            validate_clvm_and_signature,
-            new_spend_bytes,
-            self.max_block_clvm_cost,
-            self.constants,
-            self.peak.height,
-        )
+        err, cached_result_bytes = await self.pre_validation_batcher.validate(new_spend_bytes, self.peak.height)
 
         if err is not None:
             raise ValidationError(err)
-        for cache_entry_key, cached_entry_value in new_cache_entries.items():
-            LOCAL_CACHE.put(cache_entry_key, GTElement.from_bytes_unchecked(cached_entry_value))
         ret: NPCResult = NPCResult.from_bytes(cached_result_bytes)
         end_time = time.time()
         duration = end_time - start_time
@@ -601,7 +652,10 @@ class MempoolManager:
                 self.mempool.remove_from_pool(list(spendbundle_ids_to_remove), MempoolRemoveReason.BLOCK_INCLUSION)
         else:
             old_pool = self.mempool
-            self.mempool = Mempool(old_pool.mempool_info, old_pool.fee_estimator)
+            self.mempool = type(old_pool)(old_pool.mempool_info, old_pool.fee_estimator)
+            # the items are re-added in the order they were added, not by fee
+            # rate. Build the template once they're all in
+            self.mempool.block_template.invalidate()
             self.seen_bundle_hashes = {}
             for item in old_pool.all_spends():
                 _, result, err = await self.add_spend_bundle(
@@ -632,6 +686,9 @@ class MempoolManager:
             f"minimum fee rate (in FPC) to get in for 5M cost tx: {self.mempool.get_min_fee_rate(5000000)}"
         )
         self.mempool.fee_estimator.new_block(FeeBlockInfo(new_peak.height, included_items))
+        # aggregate the block template now, rather than when we're asked to
+        # make a block
+        self.mempool.create_bundle_from_block_template()
         return txs_added
 
     def get_items_not_in_filter(self, mempool_filter: PyBIP158, limit: int = 100) -> List[SpendBundle]:
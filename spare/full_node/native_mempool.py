@@ -0,0 +1,300 @@
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from sortedcontainers import SortedDict, SortedList
+
+from spare.consensus.cost_calculator import NPCResult
+from spare.full_node.fee_estimation import FeeMempoolInfo, MempoolInfo, MempoolItemInfo
+from spare.full_node.fee_estimator_interface import FeeEstimatorInterface
+from spare.full_node.mempool import MEMPOOL_ITEM_FEE_LIMIT, MempoolBase, MempoolRemoveReason
+from spare.types.blockchain_format.sized_bytes import bytes32
+from spare.types.clvm_cost import CLVMCost
+from spare.types.mempool_item import MempoolItem
+from spare.types.spend_bundle import SpendBundle
+from spare.util.errors import Err
+from spare.util.ints import uint32, uint64
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class NativeMempoolItem:
+    spend_bundle: SpendBundle
+    npc_result: NPCResult
+    height_added_to_mempool: uint32
+    name: bytes32
+    cost: int
+    fee: int
+    assert_height: Optional[uint32]
+    assert_before_height: Optional[uint32]
+    assert_before_seconds: Optional[uint64]
+    # the order the item was added to the mempool in. It's the tie-breaker for
+    # items with the same fee rate
+    seq: int
+
+    @property
+    def fee_per_cost(self) -> float:
+        return self.fee / self.cost
+
+    @property
+    def feerate_key(self) -> Tuple[float, int]:
+        # sorts by fee per cost descending, then by seq ascending
+        return (-self.fee_per_cost, self.seq)
+
+
+class NativeMempool(MempoolBase):
+    """
+    A mempool that keeps its items in in-process data structures rather than an
+    in-memory SQLite database. It behaves exactly like Mempool.
+
+    * items are ordered by fee rate in a sorted dict, keyed by
+      (-fee_per_cost, seq)
+    * a coin ID -> spend bundle names multimap answers get_spends_by_coin_id()
+    * items with assert_before_height or assert_before_seconds are also kept in
+      sorted lists, to find the items that expire at a given height or time
+    * the total cost and fee are maintained incrementally
+    """
+
+    _native_items: Dict[bytes32, NativeMempoolItem]
+    _by_feerate: SortedDict
+    _by_coin_id: Dict[bytes32, Set[bytes32]]
+    _expires_at_height: SortedList
+    _expires_at_seconds: SortedList
+    _total_cost: int
+    _total_fee: int
+    _next_seq: int
+
+    def __init__(self, mempool_info: MempoolInfo, fee_estimator: FeeEstimatorInterface):
+        super().__init__(mempool_info, fee_estimator)
+        self._native_items = {}
+        self._by_feerate = SortedDict()
+        self._by_coin_id = {}
+        self._expires_at_height = SortedList()
+        self._expires_at_seconds = SortedList()
+        self._total_cost = 0
+        self._total_fee = 0
+        self._next_seq = 1
+
+    def _to_item(self, item: NativeMempoolItem) -> MempoolItem:
+        return MempoolItem(
+            item.spend_bundle,
+            uint64(item.fee),
+            item.npc_result,
+            item.name,
+            uint32(item.height_added_to_mempool),
+            item.assert_height,
+            item.assert_before_height,
+            item.assert_before_seconds,
+        )
+
+    def total_mempool_fees(self) -> int:
+        return uint64(self._total_fee)
+
+    def total_mempool_cost(self) -> CLVMCost:
+        return CLVMCost(uint64(self._total_cost))
+
+    def all_spends(self) -> Iterator[MempoolItem]:
+        # in the order the items were added, like the rowid order of the
+        # SQLite mempool
+        for item in list(self._native_items.values()):
+            yield self._to_item(item)
+
+    def all_spend_ids(self) -> List[bytes32]:
+        return list(self._native_items.keys())
+
+    def spends_by_feerate(self) -> Iterator[MempoolItem]:
+        for name in list(self._by_feerate.values()):
+            item = self._native_items.get(name)
+            if item is not None:
+                yield self._to_item(item)
+
+    def size(self) -> int:
+        return len(self._native_items)
+
+    def get_spend_by_id(self, spend_bundle_id: bytes32) -> Optional[MempoolItem]:
+        item = self._native_items.get(spend_bundle_id)
+        return None if item is None else self._to_item(item)
+
+    def get_spends_by_coin_id(self, spent_coin_id: bytes32) -> List[MempoolItem]:
+        names = self._by_coin_id.get(spent_coin_id, set())
+        items = sorted((self._native_items[name] for name in names), key=lambda i: i.seq)
+        return [self._to_item(item) for item in items]
+
+    def get_min_fee_rate(self, cost: int) -> float:
+        """
+        Gets the minimum fpc rate that a transaction with specified cost will need in order to get included.
+        """
+
+        if self.at_full_capacity(cost):
+            current_cost = self._total_cost
+
+            # Iterates through all spends in increasing fee per cost
+            for name in reversed(self._by_feerate.values()):
+                item = self._native_items[name]
+                current_cost -= item.cost
+                # Removing one at a time, until our transaction of size cost fits
+                if current_cost + cost <= self.mempool_info.max_size_in_cost:
+                    return item.fee_per_cost
+
+            raise ValueError(
+                f"Transaction with cost {cost} does not fit in mempool of max cost {self.mempool_info.max_size_in_cost}"
+            )
+        else:
+            return 0
+
+    def _expiring_before(self, block_height: int, timestamp: int, inclusive: bool) -> List[NativeMempoolItem]:
+        """
+        Returns the items with an assert_before_height below block_height, or
+        an assert_before_seconds below timestamp (or at, if inclusive), in the
+        order they were added to the mempool
+        """
+        if inclusive:
+            by_height = self._expires_at_height.irange(maximum=(block_height, float("inf")))
+            by_seconds = self._expires_at_seconds.irange(maximum=(timestamp, float("inf")))
+        else:
+            by_height = self._expires_at_height.irange(maximum=(block_height, 0), inclusive=(True, False))
+            by_seconds = self._expires_at_seconds.irange(maximum=(timestamp, 0), inclusive=(True, False))
+        names: Set[bytes32] = set()
+        for _, _, name in by_height:
+            names.add(name)
+        for _, _, name in by_seconds:
+            names.add(name)
+        return sorted((self._native_items[name] for name in names), key=lambda i: i.seq)
+
+    def new_tx_block(self, block_height: uint32, timestamp: uint64) -> None:
+        """
+        Remove all items that became invalid because of this new height and
+        timestamp. (we don't know about which coins were spent in this new block
+        here, so those are handled separately)
+        """
+        to_remove = [item.name for item in self._expiring_before(block_height, timestamp, inclusive=True)]
+
+        self.remove_from_pool(to_remove, MempoolRemoveReason.EXPIRED)
+        self._block_height = block_height
+        self._timestamp = timestamp
+
+    def remove_from_pool(self, items: List[bytes32], reason: MempoolRemoveReason) -> None:
+        """
+        Removes an item from the mempool.
+        """
+        if items == []:
+            return
+
+        removed: List[NativeMempoolItem] = []
+        for name in items:
+            item = self._native_items.pop(name)
+            removed.append(item)
+            del self._by_feerate[item.feerate_key]
+            assert item.npc_result.conds is not None
+            for spend in item.npc_result.conds.spends:
+                coin_id = bytes32(spend.coin_id)
+                names = self._by_coin_id[coin_id]
+                names.discard(name)
+                if len(names) == 0:
+                    del self._by_coin_id[coin_id]
+            if item.assert_before_height is not None:
+                self._expires_at_height.remove((item.assert_before_height, item.seq, name))
+            if item.assert_before_seconds is not None:
+                self._expires_at_seconds.remove((item.assert_before_seconds, item.seq, name))
+            self._total_cost -= item.cost
+            self._total_fee -= item.fee
+        self.block_template.remove(items)
+
+        if reason != MempoolRemoveReason.BLOCK_INCLUSION:
+            info = FeeMempoolInfo(
+                self.mempool_info, self.total_mempool_cost(), self.total_mempool_fees(), datetime.now()
+            )
+            for item in sorted(removed, key=lambda i: i.seq):
+                self.fee_estimator.remove_mempool_item(
+                    info, MempoolItemInfo(item.cost, item.fee, item.height_added_to_mempool)
+                )
+
+    def add_to_pool(self, item: MempoolItem) -> Optional[Err]:
+        """
+        Adds an item to the mempool by kicking out transactions (if it doesn't fit), in order of increasing fee per cost
+        """
+
+        assert item.fee < MEMPOOL_ITEM_FEE_LIMIT
+        assert item.npc_result.conds is not None
+        assert item.cost <= self.mempool_info.max_block_clvm_cost
+
+        # we have certain limits on transactions that will expire soon
+        # (in the next 15 minutes)
+        block_cutoff = self._block_height + 48
+        time_cutoff = self._timestamp + 900
+        if (item.assert_before_height is not None and item.assert_before_height < block_cutoff) or (
+            item.assert_before_seconds is not None and item.assert_before_seconds < time_cutoff
+        ):
+            # the transactions that expire soon, in order of highest fee rate
+            # along with the cumulative cost of such transactions
+            expiring = sorted(
+                self._expiring_before(block_cutoff, time_cutoff, inclusive=False), key=lambda i: i.feerate_key
+            )
+            cumulative_costs: List[int] = []
+            cumulative_cost = 0
+            for expiring_item in expiring:
+                cumulative_cost += expiring_item.cost
+                cumulative_costs.append(cumulative_cost)
+
+            to_remove: List[bytes32] = []
+            # starting with the lowest fee rate
+            for expiring_item, cumulative_cost in zip(reversed(expiring), reversed(cumulative_costs)):
+                # there's space for us, stop pruning
+                if cumulative_cost + item.cost <= self.mempool_info.max_block_clvm_cost:
+                    break
+
+                # we can't evict any more transactions, abort (and don't
+                # evict what we put aside in "to_remove" list)
+                if expiring_item.fee_per_cost > item.fee_per_cost:
+                    return Err.INVALID_FEE_LOW_FEE
+                to_remove.append(expiring_item.name)
+            self.remove_from_pool(to_remove, MempoolRemoveReason.EXPIRED)
+            # if we don't find any entries, it's OK to add this entry
+
+        if self._total_cost + item.cost > self.mempool_info.max_size_in_cost:
+            # pick the items with the lowest fee per cost to remove. Keep the
+            # highest fee rate items as long as they fit together with this one
+            budget = self.mempool_info.max_size_in_cost - item.cost
+            kept_cost = 0
+            evict: List[NativeMempoolItem] = []
+            for name in self._by_feerate.values():
+                pool_item = self._native_items[name]
+                kept_cost += pool_item.cost
+                if kept_cost > budget:
+                    evict.append(pool_item)
+            evict.sort(key=lambda i: i.seq)
+            self.remove_from_pool([i.name for i in evict], MempoolRemoveReason.POOL_FULL)
+
+        native_item = NativeMempoolItem(
+            item.spend_bundle,
+            item.npc_result,
+            item.height_added_to_mempool,
+            item.name,
+            int(item.cost),
+            int(item.fee),
+            item.assert_height,
+            item.assert_before_height,
+            item.assert_before_seconds,
+            self._next_seq,
+        )
+        self._next_seq += 1
+        self._native_items[item.name] = native_item
+        self._by_feerate[native_item.feerate_key] = item.name
+        for spend in item.npc_result.conds.spends:
+            self._by_coin_id.setdefault(bytes32(spend.coin_id), set()).add(item.name)
+        if item.assert_before_height is not None:
+            self._expires_at_height.add((item.assert_before_height, native_item.seq, item.name))
+        if item.assert_before_seconds is not None:
+            self._expires_at_seconds.add((item.assert_before_seconds, native_item.seq, item.name))
+        self._total_cost += native_item.cost
+        self._total_fee += native_item.fee
+
+        self.block_template.add(item)
+
+        info = FeeMempoolInfo(self.mempool_info, self.total_mempool_cost(), self.total_mempool_fees(), datetime.now())
+        self.fee_estimator.add_mempool_item(info, MempoolItemInfo(item.cost, item.fee, item.height_added_to_mempool))
+        return None
@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from blspy import GTElement
+
+from spare.consensus.constants import ConsensusConstants
+from spare.types.blockchain_format.sized_bytes import bytes32
+from spare.util.cached_bls import LOCAL_CACHE
+from spare.util.errors import Err
+from spare.util.ints import uint32
+
+log = logging.getLogger(__name__)
+
+BatchResult = Tuple[List[Tuple[Optional[Err], bytes]], Dict[bytes32, bytes]]
+BatchValidator = Callable[[List[bytes], int, ConsensusConstants, uint32], BatchResult]
+
+
+@dataclass
+class BatchSizeStats:
+    batches: int = 0
+    spend_bundles: int = 0
+    # wall clock time from sending the batches to the pool, until the
+    # results came back
+    seconds: float = 0.0
+
+    def to_json_dict(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "spend_bundles": self.spend_bundles,
+            "seconds": self.seconds,
+            "spend_bundles_per_second": self.spend_bundles / self.seconds if self.seconds > 0 else 0.0,
+        }
+
+
+@dataclass
+class PreValidationMetrics:
+    """
+    Spend bundle pre-validation throughput, broken down by batch size. Batch
+    sizes are bucketed by powers of two, the bucket is the smallest batch size
+    it covers.
+    """
+
+    batches: int = 0
+    spend_bundles: int = 0
+    by_batch_size: Dict[int, BatchSizeStats] = field(default_factory=dict)
+
+    def record(self, batch_size: int, seconds: float) -> None:
+        self.batches += 1
+        self.spend_bundles += batch_size
+        bucket = 1 << (batch_size.bit_length() - 1)
+        stats = self.by_batch_size.setdefault(bucket, BatchSizeStats())
+        stats.batches += 1
+        stats.spend_bundles += batch_size
+        stats.seconds += seconds
+
+    def to_json_dict(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "spend_bundles": self.spend_bundles,
+            "average_batch_size": self.spend_bundles / self.batches if self.batches > 0 else 0.0,
+            "by_batch_size": {str(size): stats.to_json_dict() for size, stats in sorted(self.by_batch_size.items())},
+        }
+
+
+@dataclass
+class _PendingBatch:
+    height: uint32
+    spend_bundles: List[bytes] = field(default_factory=list)
+    futures: List[asyncio.Future[Tuple[Optional[Err], bytes]]] = field(default_factory=list)
+
+
+class PreValidationBatcher:
+    """
+    Coalesces spend bundles waiting for pre-validation into batches, and runs
+    each batch as a single job in the process pool. A batch is sent once it has
+    max_batch_size spend bundles, or once batch_window seconds have passed
+    since its first spend bundle arrived. All spend bundles in a batch are
+    validated at the same height, a bundle for a different height starts a new
+    batch.
+
+    With a max_batch_size of 1, every spend bundle is sent to the pool right
+    away.
+    """
+
+    _pool: Executor
+    _validate_batch: BatchValidator
+    _max_cost: int
+    _constants: ConsensusConstants
+    max_batch_size: int
+    batch_window: float
+    _pending: Optional[_PendingBatch]
+    _flush_handle: Optional[asyncio.TimerHandle]
+    _in_flight: int
+    # keep a reference to the running batches, so they aren't garbage collected
+    _tasks: Set[asyncio.Task[None]]
+    metrics: PreValidationMetrics
+
+    def __init__(
+        self,
+        pool: Executor,
+        validate_batch: BatchValidator,
+        max_cost: int,
+        constants: ConsensusConstants,
+        *,
+        max_batch_size: int = 16,
+        batch_window: float = 0.01,
+    ) -> None:
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be at least 1, not {max_batch_size}")
+        if batch_window < 0:
+            raise ValueError(f"batch_window must not be negative, not {batch_window}")
+        self._pool = pool
+        self._validate_batch = validate_batch
+        self._max_cost = max_cost
+        self._constants = constants
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window
+        self._pending = None
+        self._flush_handle = None
+        self._in_flight = 0
+        self._tasks = set()
+        self.metrics = PreValidationMetrics()
+
+    async def validate(self, spend_bundle_bytes: bytes, height: uint32) -> Tuple[Optional[Err], bytes]:
+        """
+        Validates the CLVM and signature of a serialized spend bundle at the
+        specified height, as part of a batch. Returns an optional error and the
+        serialized NPCResult
+        """
+        loop = asyncio.get_running_loop()
+        if self._pending is not None and self._pending.height != height:
+            self._flush()
+        if self._pending is None:
+            self._pending = _PendingBatch(height)
+            self._flush_handle = loop.call_later(self.batch_window, self._flush)
+        future: asyncio.Future[Tuple[Optional[Err], bytes]] = loop.create_future()
+        self._pending.spend_bundles.append(spend_bundle_bytes)
+        self._pending.futures.append(future)
+        if len(self._pending.spend_bundles) >= self.max_batch_size:
+            self._flush()
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch = self._pending
+        self._pending = None
+        if batch is None or len(batch.spend_bundles) == 0:
+            return
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: _PendingBatch) -> None:
+        start = time.monotonic()
+        self._in_flight += 1
+        try:
+            results, new_cache_entries = await asyncio.get_running_loop().run_in_executor(
+                self._pool,
+                self._validate_batch,
+                batch.spend_bundles,
+                self._max_cost,
+                self._constants,
+                batch.height,
+            )
+        except BaseException as e:
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+            return
+        finally:
+            self._in_flight -= 1
+
+        duration = time.monotonic() - start
+        self.metrics.record(len(batch.spend_bundles), duration)
+        log.log(
+            logging.DEBUG if duration < 2 else logging.WARNING,
+            f"pre-validated a batch of {len(batch.spend_bundles)} spend bundles in {duration:0.4f} seconds",
+        )
+        for cache_entry_key, cached_entry_value in new_cache_entries.items():
+            LOCAL_CACHE.put(cache_entry_key, GTElement.from_bytes_unchecked(cached_entry_value))
+        for future, result in zip(batch.futures, results):
+            if not future.done():
+                future.set_result(result)
+
+    def close(self) -> None:
+        """
+        Fails the spend bundles still waiting for their batch to be sent
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch = self._pending
+        self._pending = None
+        if batch is not None:
+            for future in batch.futures:
+                if not future.done():
+                    future.cancel()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        ret = self.metrics.to_json_dict()
+        ret["max_batch_size"] = self.max_batch_size
+        ret["batch_window"] = self.batch_window
+        ret["waiting"] = 0 if self._pending is None else len(self._pending.spend_bundles)
+        ret["batches_in_flight"] = self._in_flight
+        return ret
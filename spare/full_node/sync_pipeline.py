@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from spare.consensus.block_record import BlockRecord
+from spare.consensus.blockchain_interface import BlockchainInterface
+from spare.consensus.multiprocess_validation import PreValidationResult
+from spare.server.ws_connection import WSSpareConnection
+from spare.types.blockchain_format.sized_bytes import bytes32
+from spare.types.blockchain_format.sub_epoch_summary import SubEpochSummary
+from spare.types.full_block import FullBlock
+from spare.util.ints import uint32
+
+
+class PendingBlockRecords(BlockchainInterface):
+    """
+    The blockchain, plus the block records of blocks that have been
+    pre-validated but not added to it yet. During a long sync this lets the
+    next batch of blocks be pre-validated while the previous one is still
+    being added to the chain.
+
+    Height lookups go straight to the blockchain. The pending blocks may not be
+    part of the heaviest chain yet, so callers already have to handle them
+    not being found by height.
+    """
+
+    _blockchain: BlockchainInterface
+    _records: Dict[bytes32, BlockRecord]
+    # the full blocks of the pending block records, used to look up generators
+    # referenced by later blocks
+    blocks: Dict[bytes32, FullBlock]
+
+    def __init__(self, blockchain: BlockchainInterface) -> None:
+        self._blockchain = blockchain
+        self._records = {}
+        self.blocks = {}
+
+    def add_pending(self, block: FullBlock, block_record: BlockRecord) -> None:
+        self._records[block_record.header_hash] = block_record
+        self.blocks[block_record.header_hash] = block
+
+    def remove_pending(self, header_hashes: List[bytes32]) -> None:
+        for header_hash in header_hashes:
+            self._records.pop(header_hash, None)
+            self.blocks.pop(header_hash, None)
+
+    def get_peak(self) -> Optional[BlockRecord]:
+        return self._blockchain.get_peak()
+
+    def get_peak_height(self) -> Optional[uint32]:
+        return self._blockchain.get_peak_height()
+
+    def block_record(self, header_hash: bytes32) -> BlockRecord:
+        block_record = self._records.get(header_hash)
+        if block_record is not None:
+            return block_record
+        return self._blockchain.block_record(header_hash)
+
+    def height_to_block_record(self, height: uint32) -> BlockRecord:
+        return self._blockchain.height_to_block_record(height)
+
+    def get_ses_heights(self) -> List[uint32]:
+        return self._blockchain.get_ses_heights()
+
+    def get_ses(self, height: uint32) -> SubEpochSummary:
+        return self._blockchain.get_ses(height)
+
+    def height_to_hash(self, height: uint32) -> Optional[bytes32]:
+        return self._blockchain.height_to_hash(height)
+
+    def contains_block(self, header_hash: bytes32) -> bool:
+        return header_hash in self._records or self._blockchain.contains_block(header_hash)
+
+    def contains_height(self, height: uint32) -> bool:
+        return self._blockchain.contains_height(height)
+
+    def remove_block_record(self, header_hash: bytes32) -> None:
+        del self._records[header_hash]
+
+    def add_block_record(self, block_record: BlockRecord) -> None:
+        self._records[block_record.header_hash] = block_record
+
+
+class AdaptiveBatchSize:
+    """
+    Picks how many blocks to pre-validate at a time. Larger batches keep more
+    worker processes busy and pay the per-batch overhead less often, but delay
+    the first commit and hold more blocks in memory. The size is doubled when a
+    batch pre-validates faster than the lower time target, and halved when it
+    takes longer than the upper one.
+    """
+
+    size: int
+    minimum: int
+    maximum: int
+    low_seconds: float
+    high_seconds: float
+
+    def __init__(
+        self, minimum: int, maximum: int, low_seconds: float = 1.0, high_seconds: float = 5.0, initial: int = 0
+    ) -> None:
+        if minimum < 1 or maximum < minimum:
+            raise ValueError(f"invalid batch size range: {minimum} - {maximum}")
+        self.minimum = minimum
+        self.maximum = maximum
+        self.low_seconds = low_seconds
+        self.high_seconds = high_seconds
+        self.size = min(max(initial, minimum), maximum)
+
+    def update(self, num_blocks: int, seconds: float) -> None:
+        # a batch smaller than the target (because the download fell behind)
+        # doesn't say anything about whether the target should grow
+        if seconds < self.low_seconds and num_blocks >= self.size:
+            self.size = min(self.size * 2, self.maximum)
+        elif seconds > self.high_seconds:
+            self.size = max(self.size // 2, self.minimum)
+
+
+@dataclass
+class PreValidatedBlocks:
+    """
+    A batch of blocks downloaded from a peer, after pre-validation. blocks are
+    the ones that weren't in the chain yet, along with their pre-validation
+    results.
+    """
+
+    peer: WSSpareConnection
+    fetched: List[FullBlock]
+    blocks: List[FullBlock]
+    results: List[PreValidationResult]
+    valid: bool
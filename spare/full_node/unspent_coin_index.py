@@ -0,0 +1,287 @@
+from __future__ import annotations
+
+import logging
+import mmap
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from spare.types.blockchain_format.coin import Coin
+from spare.types.blockchain_format.sized_bytes import bytes32
+from spare.types.coin_record import CoinRecord
+from spare.util.ints import uint32, uint64
+
+log = logging.getLogger(__name__)
+
+# widths (in bytes) of the columns stored for every unspent coin. The columns
+# are laid out back to back in one anonymous memory map per shard, each column
+# being `capacity` entries long.
+_PARENT_WIDTH = 32
+_PUZZLE_HASH_WIDTH = 32
+_AMOUNT_WIDTH = 8
+_HEIGHT_WIDTH = 4
+_TIMESTAMP_WIDTH = 8
+_COINBASE_WIDTH = 1
+_ROW_WIDTH = _PARENT_WIDTH + _PUZZLE_HASH_WIDTH + _AMOUNT_WIDTH + _HEIGHT_WIDTH + _TIMESTAMP_WIDTH + _COINBASE_WIDTH
+
+_INITIAL_SHARD_CAPACITY = 1024
+
+
+class _Shard:
+    """
+    A columnar table of unspent coins backed by an anonymous memory map. Coin
+    names map to row slots, freed slots are reused before the table grows.
+    """
+
+    __slots__ = (
+        "capacity",
+        "slots",
+        "free",
+        "buf",
+        "parents",
+        "puzzle_hashes",
+        "amounts",
+        "heights",
+        "timestamps",
+        "coinbase",
+    )
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.slots: Dict[bytes32, int] = {}
+        self.free: List[int] = []
+        self._map(capacity)
+
+    def _map(self, capacity: int) -> None:
+        self.buf = mmap.mmap(-1, capacity * _ROW_WIDTH)
+        view = memoryview(self.buf)
+        offset = 0
+        self.parents = view[offset : offset + capacity * _PARENT_WIDTH]
+        offset += capacity * _PARENT_WIDTH
+        self.puzzle_hashes = view[offset : offset + capacity * _PUZZLE_HASH_WIDTH]
+        offset += capacity * _PUZZLE_HASH_WIDTH
+        self.amounts = view[offset : offset + capacity * _AMOUNT_WIDTH].cast("Q")
+        offset += capacity * _AMOUNT_WIDTH
+        self.heights = view[offset : offset + capacity * _HEIGHT_WIDTH].cast("I")
+        offset += capacity * _HEIGHT_WIDTH
+        self.timestamps = view[offset : offset + capacity * _TIMESTAMP_WIDTH].cast("Q")
+        offset += capacity * _TIMESTAMP_WIDTH
+        self.coinbase = view[offset : offset + capacity * _COINBASE_WIDTH]
+
+    def _release(self) -> None:
+        for column in (self.parents, self.puzzle_hashes, self.amounts, self.heights, self.timestamps, self.coinbase):
+            column.release()
+        self.buf.close()
+
+    def _grow(self) -> None:
+        old = (self.parents, self.puzzle_hashes, self.amounts, self.heights, self.timestamps, self.coinbase)
+        old_buf = self.buf
+        old_capacity = self.capacity
+        self.capacity = old_capacity * 2
+        self._map(self.capacity)
+        self.parents[: old_capacity * _PARENT_WIDTH] = old[0]
+        self.puzzle_hashes[: old_capacity * _PUZZLE_HASH_WIDTH] = old[1]
+        self.amounts[:old_capacity] = old[2]
+        self.heights[:old_capacity] = old[3]
+        self.timestamps[:old_capacity] = old[4]
+        self.coinbase[:old_capacity] = old[5]
+        for column in old:
+            column.release()
+        old_buf.close()
+
+    def put(self, name: bytes32, record: CoinRecord) -> None:
+        slot = self.slots.get(name)
+        if slot is None:
+            if len(self.free) > 0:
+                slot = self.free.pop()
+            else:
+                slot = len(self.slots)
+                if slot >= self.capacity:
+                    self._grow()
+            self.slots[name] = slot
+        coin = record.coin
+        self.parents[slot * _PARENT_WIDTH : (slot + 1) * _PARENT_WIDTH] = coin.parent_coin_info
+        self.puzzle_hashes[slot * _PUZZLE_HASH_WIDTH : (slot + 1) * _PUZZLE_HASH_WIDTH] = coin.puzzle_hash
+        self.amounts[slot] = coin.amount
+        self.heights[slot] = record.confirmed_block_index
+        self.timestamps[slot] = record.timestamp
+        self.coinbase[slot] = 1 if record.coinbase else 0
+
+    def pop(self, name: bytes32) -> Optional[CoinRecord]:
+        slot = self.slots.pop(name, None)
+        if slot is None:
+            return None
+        record = self.read(slot)
+        self.free.append(slot)
+        return record
+
+    def puzzle_hash(self, slot: int) -> bytes32:
+        return bytes32(self.puzzle_hashes[slot * _PUZZLE_HASH_WIDTH : (slot + 1) * _PUZZLE_HASH_WIDTH])
+
+    def read(self, slot: int) -> CoinRecord:
+        coin = Coin(
+            bytes32(self.parents[slot * _PARENT_WIDTH : (slot + 1) * _PARENT_WIDTH]),
+            self.puzzle_hash(slot),
+            uint64(self.amounts[slot]),
+        )
+        return CoinRecord(
+            coin,
+            uint32(self.heights[slot]),
+            uint32(0),
+            self.coinbase[slot] == 1,
+            uint64(self.timestamps[slot]),
+        )
+
+
+class UnspentCoinIndex:
+    """
+    An in-process index of the unspent coin set, kept in step with the
+    coin_record table by CoinStore. Coins are sharded by the first byte of
+    their name, and each shard stores its rows column-wise in an anonymous
+    memory map. The index only ever holds unspent coins, so a miss does not
+    mean the coin doesn't exist; callers fall back to the database for those.
+
+    Changes can be journaled (see begin()/commit()/abort()) so that a failed
+    DB transaction can be undone in the index as well. While a journal is open
+    the index holds changes the database hasn't committed yet, so it must not
+    be used for lookups.
+    """
+
+    _shards: List[_Shard]
+    _shard_mask: int
+    # puzzle hash -> names of the unspent coins with that puzzle hash
+    _by_puzzle_hash: Dict[bytes32, Set[bytes32]]
+    # when not None, holds (name, previous record) for every mutation, in order
+    _journal: Optional[List[Tuple[bytes32, Optional[CoinRecord]]]]
+    # the index is only used for lookups once it has been populated
+    ready: bool
+
+    def __init__(self, num_shards: int = 64) -> None:
+        if num_shards <= 0 or num_shards > 256 or (num_shards & (num_shards - 1)) != 0:
+            raise ValueError(f"number of shards must be a power of 2, between 1 and 256, not {num_shards}")
+        self._shards = [_Shard(_INITIAL_SHARD_CAPACITY) for _ in range(num_shards)]
+        self._shard_mask = num_shards - 1
+        self._by_puzzle_hash = {}
+        self._journal = None
+        self.ready = False
+
+    def __len__(self) -> int:
+        return sum(len(shard.slots) for shard in self._shards)
+
+    def __contains__(self, name: bytes32) -> bool:
+        return name in self._shard(name).slots
+
+    def _shard(self, name: bytes32) -> _Shard:
+        return self._shards[name[0] & self._shard_mask]
+
+    def clear(self) -> None:
+        num_shards = len(self._shards)
+        for shard in self._shards:
+            shard._release()
+        self._shards = [_Shard(_INITIAL_SHARD_CAPACITY) for _ in range(num_shards)]
+        self._by_puzzle_hash = {}
+        self._journal = None
+        self.ready = False
+
+    def _put(self, name: bytes32, record: CoinRecord) -> Optional[CoinRecord]:
+        shard = self._shard(name)
+        slot = shard.slots.get(name)
+        previous = None if slot is None else shard.read(slot)
+        if previous is not None and previous.coin.puzzle_hash != record.coin.puzzle_hash:
+            self._unlink_puzzle_hash(previous.coin.puzzle_hash, name)
+        shard.put(name, record)
+        self._by_puzzle_hash.setdefault(record.coin.puzzle_hash, set()).add(name)
+        return previous
+
+    def _pop(self, name: bytes32) -> Optional[CoinRecord]:
+        previous = self._shard(name).pop(name)
+        if previous is not None:
+            self._unlink_puzzle_hash(previous.coin.puzzle_hash, name)
+        return previous
+
+    def _unlink_puzzle_hash(self, puzzle_hash: bytes32, name: bytes32) -> None:
+        names = self._by_puzzle_hash.get(puzzle_hash)
+        if names is None:
+            return
+        names.discard(name)
+        if len(names) == 0:
+            del self._by_puzzle_hash[puzzle_hash]
+
+    def add(self, records: Iterable[CoinRecord]) -> None:
+        """
+        Adds unspent coin records to the index. Spent records are ignored.
+        """
+        for record in records:
+            if record.spent:
+                continue
+            name = record.name
+            previous = self._put(name, record)
+            if self._journal is not None:
+                self._journal.append((name, previous))
+
+    def remove(self, names: Iterable[bytes32]) -> None:
+        """
+        Removes coins from the index, typically because they were just spent.
+        """
+        for name in names:
+            previous = self._pop(name)
+            if self._journal is not None and previous is not None:
+                self._journal.append((name, previous))
+
+    def get(self, name: bytes32) -> Optional[CoinRecord]:
+        shard = self._shard(name)
+        slot = shard.slots.get(name)
+        if slot is None:
+            return None
+        return shard.read(slot)
+
+    def get_many(self, names: Iterable[bytes32]) -> Tuple[List[CoinRecord], List[bytes32]]:
+        """
+        Returns the records found in the index, and the names that were not
+        """
+        found: List[CoinRecord] = []
+        missing: List[bytes32] = []
+        for name in names:
+            shard = self._shard(name)
+            slot = shard.slots.get(name)
+            if slot is None:
+                missing.append(name)
+            else:
+                found.append(shard.read(slot))
+        return found, missing
+
+    def get_by_puzzle_hashes(self, puzzle_hashes: Iterable[bytes32]) -> Iterator[CoinRecord]:
+        for puzzle_hash in puzzle_hashes:
+            for name in self._by_puzzle_hash.get(puzzle_hash, ()):
+                shard = self._shard(name)
+                yield shard.read(shard.slots[name])
+
+    def records(self) -> Iterator[CoinRecord]:
+        for shard in self._shards:
+            for slot in shard.slots.values():
+                yield shard.read(slot)
+
+    def begin(self) -> None:
+        """
+        Starts journaling changes, so they can be undone with abort()
+        """
+        assert self._journal is None
+        self._journal = []
+
+    def in_transaction(self) -> bool:
+        return self._journal is not None
+
+    def commit(self) -> None:
+        self._journal = None
+
+    def abort(self) -> None:
+        """
+        Undoes all changes made since begin()
+        """
+        journal = self._journal
+        self._journal = None
+        if journal is None:
+            return
+        for name, previous in reversed(journal):
+            if previous is None:
+                self._pop(name)
+            else:
+                self._put(name, previous)
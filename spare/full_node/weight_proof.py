@@ -6,10 +6,11 @@ import logging
 import math
 import pathlib
 import random
+import struct
 import tempfile
 from concurrent.futures.process import ProcessPoolExecutor
 from multiprocessing.context import BaseContext
-from typing import IO, Awaitable, Dict, List, Optional, Tuple
+from typing import IO, Dict, List, Optional, Tuple, Union
 
 from spare.consensus.block_header_validation import validate_finished_header_block
 from spare.consensus.block_record import BlockRecord
@@ -41,22 +42,61 @@ from spare.types.weight_proof import (
     WeightProof,
 )
 from spare.util.block_cache import BlockCache
-from spare.util.chunks import chunks
 from spare.util.hash import std_hash
 from spare.util.ints import uint8, uint32, uint64, uint128
+from spare.util.lru_cache import LRUCache
 from spare.util.setproctitle import getproctitle, setproctitle
 
 log = logging.getLogger(__name__)
 
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # python 3.7. The serialized segments are sent to each worker instead
+    shared_memory = None  # type: ignore[assignment]
+
 
 def _create_shutdown_file() -> IO:
     return tempfile.NamedTemporaryFile(prefix="spare_full_node_weight_proof_handler_executor_shutdown_trigger")
 
 
+@dataclasses.dataclass
+class WeightProofPrefix:
+    """
+    The part of a weight proof that stays the same for every tip, until the
+    next sub epoch summary is included in the chain
+    """
+
+    # the number of sub epoch summaries up to the tip, and the hash of the
+    # block that included the last one
+    key: Tuple[int, bytes32]
+    sub_epoch_data: List[SubEpochData]
+    # serialized sub_epoch_data, including the list length prefix
+    serialized_sub_epoch_data: bytes
+    # seed for sampling the sub epochs
+    seed: bytes32
+    # the genesis block, followed by the blocks that included each sub epoch
+    # summary
+    ses_blocks: List[BlockRecord]
+
+
+@dataclasses.dataclass
+class RecentChain:
+    """
+    The recent chain of a weight proof, and its serialized blocks
+    """
+
+    key: Tuple[int, bytes32]
+    blocks: List[HeaderBlock]
+    serialized_blocks: List[bytes]
+
+
 class WeightProofHandler:
     LAMBDA_L = 100
     C = 0.5
     MAX_SAMPLES = 20
+    # the challenge segments of this many sub epochs are kept in memory
+    SEGMENTS_CACHE_SIZE = 4 * MAX_SAMPLES
 
     def __init__(
         self,
@@ -66,6 +106,12 @@ class WeightProofHandler:
     ):
         self.tip: Optional[bytes32] = None
         self.proof: Optional[WeightProof] = None
+        self.serialized_proof: Optional[bytes] = None
+        self._prefix: Optional[WeightProofPrefix] = None
+        self._recent_chain: Optional[RecentChain] = None
+        self._segments_cache: LRUCache[bytes32, Tuple[List[SubEpochChallengeSegment], bytes]] = LRUCache(
+            self.SEGMENTS_CACHE_SIZE
+        )
         self.constants = constants
         self.blockchain = blockchain
         self.lock = asyncio.Lock()
@@ -73,6 +119,19 @@ class WeightProofHandler:
         self.multiprocessing_context = multiprocessing_context
 
     async def get_proof_of_weight(self, tip: bytes32) -> Optional[WeightProof]:
+        ret = await self._get_proof_of_weight(tip)
+        return None if ret is None else ret[0]
+
+    async def get_serialized_proof_of_weight(self, tip: bytes32) -> Optional[bytes]:
+        """
+        Returns the serialized weight proof for tip. The serialized form is
+        assembled from the cached serialized parts of the proof, rather than by
+        serializing the whole proof again
+        """
+        ret = await self._get_proof_of_weight(tip)
+        return None if ret is None else ret[1]
+
+    async def _get_proof_of_weight(self, tip: bytes32) -> Optional[Tuple[WeightProof, bytes]]:
         tip_rec = self.blockchain.try_block_record(tip)
         if tip_rec is None:
             log.error("unknown tip")
@@ -83,15 +142,15 @@ class WeightProofHandler:
             return None
 
         async with self.lock:
-            if self.proof is not None:
+            if self.proof is not None and self.serialized_proof is not None:
                 if self.proof.recent_chain_data[-1].header_hash == tip:
-                    return self.proof
-            wp = await self._create_proof_of_weight(tip)
-            if wp is None:
+                    return self.proof, self.serialized_proof
+            ret = await self._create_proof_of_weight(tip)
+            if ret is None:
                 return None
-            self.proof = wp
+            self.proof, self.serialized_proof = ret
             self.tip = tip
-            return wp
+            return ret
 
     def get_sub_epoch_data(self, tip_height: uint32, summary_heights: List[uint32]) -> List[SubEpochData]:
         sub_epoch_data: List[SubEpochData] = []
@@ -103,67 +162,150 @@ class WeightProofHandler:
             sub_epoch_data.append(_create_sub_epoch_data(ses))
         return sub_epoch_data
 
-    async def _create_proof_of_weight(self, tip: bytes32) -> Optional[WeightProof]:
+    async def _create_proof_of_weight(self, tip: bytes32) -> Optional[Tuple[WeightProof, bytes]]:
         """
-        Creates a weight proof object
+        Creates a weight proof object, and its serialized form
         """
         assert self.blockchain is not None
-        sub_epoch_segments: List[SubEpochChallengeSegment] = []
         tip_rec = self.blockchain.try_block_record(tip)
         if tip_rec is None:
             log.error("failed not tip in cache")
             return None
         log.info(f"create weight proof peak {tip} {tip_rec.height}")
-        recent_chain = await self._get_recent_chain(tip_rec.height)
+
+        summary_heights = [h for h in self.blockchain.get_ses_heights() if h <= tip_rec.height]
+        if len(summary_heights) < 2:
+            log.error("not enough sub epochs for weight proof")
+            return None
+        last_ses_hash = self.blockchain.height_to_hash(summary_heights[-1])
+        assert last_ses_hash is not None
+        # everything up to the last sub epoch summary is the same for every tip
+        # until the next sub epoch summary is included
+        key = (len(summary_heights), last_ses_hash)
+
+        prefix = await self._get_prefix(key, summary_heights)
+        if prefix is None:
+            return None
+        recent_chain = await self._get_recent_chain_suffix(key, tip_rec.height)
         if recent_chain is None:
             return None
 
-        summary_heights = self.blockchain.get_ses_heights()
+        rng = random.Random(prefix.seed)
+        weight_to_check = _get_weights_for_sampling(rng, tip_rec.weight, recent_chain.blocks)
+        sub_epoch_segments: List[SubEpochChallengeSegment] = []
+        serialized_segments: List[bytes] = []
+        sample_n = 0
+        for sub_epoch_n in range(len(summary_heights)):
+            # if we have enough sub_epoch samples, dont sample
+            if sample_n >= self.MAX_SAMPLES:
+                log.debug("reached sampled sub epoch cap")
+                break
+            prev_ses_block = prefix.ses_blocks[sub_epoch_n]
+            ses_block = prefix.ses_blocks[sub_epoch_n + 1]
+            if _sample_sub_epoch(prev_ses_block.weight, ses_block.weight, weight_to_check):  # type: ignore
+                sample_n += 1
+                cached = await self._get_sub_epoch_segments(prev_ses_block, ses_block, sub_epoch_n)
+                if cached is None:
+                    return None
+                sub_epoch_segments.extend(cached[0])
+                serialized_segments.append(cached[1])
+        log.debug(f"sub_epochs: {len(prefix.sub_epoch_data)}")
+
+        wp = WeightProof(prefix.sub_epoch_data, sub_epoch_segments, recent_chain.blocks)
+        serialized = b"".join(
+            [
+                prefix.serialized_sub_epoch_data,
+                len(sub_epoch_segments).to_bytes(4, "big"),
+                *serialized_segments,
+                len(recent_chain.blocks).to_bytes(4, "big"),
+                *recent_chain.serialized_blocks,
+            ]
+        )
+        return wp, serialized
+
+    async def _get_prefix(self, key: Tuple[int, bytes32], summary_heights: List[uint32]) -> Optional[WeightProofPrefix]:
+        if self._prefix is not None and self._prefix.key == key:
+            return self._prefix
+
         zero_hash = self.blockchain.height_to_hash(uint32(0))
         assert zero_hash is not None
-        prev_ses_block = await self.blockchain.get_block_record_from_db(zero_hash)
-        if prev_ses_block is None:
+        genesis = await self.blockchain.get_block_record_from_db(zero_hash)
+        if genesis is None:
             return None
-        sub_epoch_data = self.get_sub_epoch_data(tip_rec.height, summary_heights)
-        # use second to last ses as seed
-        seed = self.get_seed_for_proof(summary_heights, tip_rec.height)
-        rng = random.Random(seed)
-        weight_to_check = _get_weights_for_sampling(rng, tip_rec.weight, recent_chain)
-        sample_n = 0
         ses_blocks = await self.blockchain.get_block_records_at(summary_heights)
         if ses_blocks is None:
             return None
-
-        for sub_epoch_n, ses_height in enumerate(summary_heights):
-            if ses_height > tip_rec.height:
-                break
-
-            # if we have enough sub_epoch samples, dont sample
-            if sample_n >= self.MAX_SAMPLES:
-                log.debug("reached sampled sub epoch cap")
-                break
-            # sample sub epoch
-            # next sub block
-            ses_block = ses_blocks[sub_epoch_n]
+        for ses_block in ses_blocks:
             if ses_block is None or ses_block.sub_epoch_summary_included is None:
                 log.error("error while building proof")
                 return None
 
-            if _sample_sub_epoch(prev_ses_block.weight, ses_block.weight, weight_to_check):  # type: ignore
-                sample_n += 1
-                segments = await self.blockchain.get_sub_epoch_challenge_segments(ses_block.header_hash)
-                if segments is None:
-                    segments = await self.__create_sub_epoch_segments(ses_block, prev_ses_block, uint32(sub_epoch_n))
-                    if segments is None:
-                        log.error(
-                            f"failed while building segments for sub epoch {sub_epoch_n}, ses height {ses_height} "
-                        )
+        sub_epoch_data = self.get_sub_epoch_data(summary_heights[-1], summary_heights)
+        # use second to last ses as seed
+        seed = self.get_seed_for_proof(summary_heights, summary_heights[-1])
+        serialized_sub_epoch_data = b"".join(
+            [len(sub_epoch_data).to_bytes(4, "big"), *(bytes(data) for data in sub_epoch_data)]
+        )
+        self._prefix = WeightProofPrefix(key, sub_epoch_data, serialized_sub_epoch_data, seed, [genesis, *ses_blocks])
+        # the recent chain of the previous prefix starts in a sub epoch that
+        # is no longer one of the last two
+        self._recent_chain = None
+        return self._prefix
+
+    async def _get_sub_epoch_segments(
+        self, prev_ses_block: BlockRecord, ses_block: BlockRecord, sub_epoch_n: int
+    ) -> Optional[Tuple[List[SubEpochChallengeSegment], bytes]]:
+        """
+        Returns the challenge segments of a sub epoch, and their serialized
+        form (without the list length prefix)
+        """
+        cached = self._segments_cache.get(ses_block.header_hash)
+        if cached is not None:
+            return cached
+        segments = await self.blockchain.get_sub_epoch_challenge_segments(ses_block.header_hash)
+        if segments is None:
+            segments = await self.__create_sub_epoch_segments(ses_block, prev_ses_block, uint32(sub_epoch_n))
+            if segments is None:
+                log.error(f"failed while building segments for sub epoch {sub_epoch_n}, ses height {ses_block.height}")
+                return None
+            await self.blockchain.persist_sub_epoch_challenge_segments(ses_block.header_hash, segments)
+        cached = (segments, b"".join(bytes(segment) for segment in segments))
+        self._segments_cache.put(ses_block.header_hash, cached)
+        return cached
+
+    async def _get_recent_chain_suffix(self, key: Tuple[int, bytes32], tip_height: uint32) -> Optional[RecentChain]:
+        """
+        Returns the recent chain up to tip_height. While the tip stays in the
+        same sub epoch, the recent chain of the previous tip is extended with
+        the new blocks, instead of reading all of it again
+        """
+        cached = self._recent_chain
+        if cached is not None and cached.key == key:
+            last = cached.blocks[-1]
+            if self.blockchain.height_to_hash(last.height) == last.header_hash:
+                start_height = cached.blocks[0].height
+                if tip_height <= last.height:
+                    end = tip_height - start_height + 1
+                    return RecentChain(key, cached.blocks[:end], cached.serialized_blocks[:end])
+                headers = await self.blockchain.get_header_blocks_in_range(last.height + 1, tip_height, tx_filter=False)
+                blocks = list(cached.blocks)
+                serialized_blocks = list(cached.serialized_blocks)
+                for height in range(last.height + 1, tip_height + 1):
+                    header_hash = self.blockchain.height_to_hash(uint32(height))
+                    header_block = None if header_hash is None else headers.get(header_hash)
+                    if header_block is None:
+                        log.error("creating recent chain failed")
                         return None
-                    await self.blockchain.persist_sub_epoch_challenge_segments(ses_block.header_hash, segments)
-                sub_epoch_segments.extend(segments)
-            prev_ses_block = ses_block
-        log.debug(f"sub_epochs: {len(sub_epoch_data)}")
-        return WeightProof(sub_epoch_data, sub_epoch_segments, recent_chain)
+                    blocks.append(header_block)
+                    serialized_blocks.append(bytes(header_block))
+                self._recent_chain = RecentChain(key, blocks, serialized_blocks)
+                return self._recent_chain
+
+        recent_chain = await self._get_recent_chain(tip_height)
+        if recent_chain is None:
+            return None
+        self._recent_chain = RecentChain(key, recent_chain, [bytes(block) for block in recent_chain])
+        return self._recent_chain
 
     def get_seed_for_proof(self, summary_heights: List[uint32], tip_height) -> bytes32:
         count = 0
@@ -569,7 +711,8 @@ class WeightProofHandler:
         if summaries is None:
             log.warning("weight proof failed sub epoch data validation")
             return False, uint32(0)
-        summary_bytes, wp_segment_bytes, wp_recent_chain_bytes = vars_to_bytes(summaries, weight_proof)
+        summary_bytes, wp_recent_chain_bytes = vars_to_bytes(summaries, weight_proof)
+        wp_segment_bytes = bytes(SubEpochSegments(weight_proof.sub_epoch_segments))
         log.info("validate sub epoch challenge segments")
         seed = summaries[-2].get_hash()
         rng = random.Random(seed)
@@ -1494,11 +1637,10 @@ def _get_curr_diff_ssi(constants: ConsensusConstants, idx, summaries):
 
 def vars_to_bytes(summaries: List[SubEpochSummary], weight_proof: WeightProof):
     wp_recent_chain_bytes = bytes(RecentChainData(weight_proof.recent_chain_data))
-    wp_segment_bytes = bytes(SubEpochSegments(weight_proof.sub_epoch_segments))
     summary_bytes = []
     for summary in summaries:
         summary_bytes.append(bytes(summary))
-    return summary_bytes, wp_segment_bytes, wp_recent_chain_bytes
+    return summary_bytes, wp_recent_chain_bytes
 
 
 def summaries_from_bytes(summaries_bytes: List[bytes]) -> List[SubEpochSummary]:
@@ -1636,15 +1778,190 @@ def validate_total_iters(
     return total_iters == sub_slot_data.total_iters
 
 
-def _validate_vdf_batch(
+# the maximum number of challenge segments validated by a worker in one go
+SEGMENTS_PER_BATCH = 4
+
+
+@dataclasses.dataclass(frozen=True)
+class SegmentBatch:
+    """
+    A range of challenge segments of one sub epoch, and what's needed to
+    validate them on their own
+    """
+
+    sub_epoch_n: int
+    # index range of the segments, in the weight proof
+    start: int
+    end: int
+    # index of the first segment, and of the sampled segment, of the sub epoch
+    first_index: int
+    sampled_index: int
+    curr_ssi: uint64
+    prev_ssi: uint64
+    curr_difficulty: uint64
+    # the previous sub epoch summary, needed to validate the first segment of
+    # the sub epoch
+    prev_ses: Optional[bytes]
+
+
+class SharedSegments:
+    """
+    The serialized challenge segments of a weight proof, in a shared memory
+    block. Validation workers parse just the segments they're validating
+    from it, by index, instead of the segments being pickled to every
+    worker. The block starts with the number of segments and their offsets,
+    followed by the serialized segments.
+    """
+
+    _shm: Optional[shared_memory.SharedMemory]
+    # the name of the shared memory block, or the buffer itself if shared
+    # memory isn't available
+    ref: Union[str, bytes]
+
+    def __init__(self, segments: List[SubEpochChallengeSegment]) -> None:
+        blobs = [bytes(segment) for segment in segments]
+        offsets = [0]
+        for blob in blobs:
+            offsets.append(offsets[-1] + len(blob))
+        buf = b"".join([struct.pack(f"<I{len(offsets)}Q", len(blobs), *offsets), *blobs])
+        if shared_memory is None:
+            self._shm = None
+            self.ref = buf
+            return
+        self._shm = shared_memory.SharedMemory(create=True, size=max(len(buf), 1))
+        self._shm.buf[: len(buf)] = buf
+        self.ref = self._shm.name
+
+    def close(self) -> None:
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def __enter__(self) -> SharedSegments:
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+
+def _read_segments(buf: Union[bytes, memoryview], start: int, end: int) -> List[SubEpochChallengeSegment]:
+    (count,) = struct.unpack_from("<I", buf)
+    assert 0 <= start <= end <= count
+    offsets = struct.unpack_from(f"<{end - start + 1}Q", buf, 4 + start * 8)
+    base = 4 + (count + 1) * 8
+    return [
+        SubEpochChallengeSegment.from_bytes(bytes(buf[base + offsets[i] : base + offsets[i + 1]]))
+        for i in range(end - start)
+    ]
+
+
+def _get_segment_batches(
     constants: ConsensusConstants,
-    vdf_list: List[Tuple[bytes, bytes, bytes]],
+    rng: random.Random,
+    segments: List[SubEpochChallengeSegment],
+    summaries: List[SubEpochSummary],
+    validate_from: int,
+) -> Optional[List[SegmentBatch]]:
+    """
+    Checks that the first segment of each sub epoch leads to the reward chain
+    hash in its sub epoch summary (like _validate_sub_epoch_segments()), and
+    splits the segments of the sub epochs that need validating into batches.
+    Returns None if the check fails.
+    """
+    # the index of the first segment of each sub epoch, grouped like
+    # map_segments_by_sub_epoch()
+    sub_epoch_starts: List[Tuple[int, int]] = []
+    curr_sub_epoch_n = -1
+    for idx, segment in enumerate(segments):
+        if curr_sub_epoch_n < segment.sub_epoch_n:
+            curr_sub_epoch_n = segment.sub_epoch_n
+            sub_epoch_starts.append((curr_sub_epoch_n, idx))
+
+    batches: List[SegmentBatch] = []
+    rc_sub_slot_hash = constants.GENESIS_CHALLENGE
+    curr_ssi = constants.SUB_SLOT_ITERS_STARTING
+    for i, (sub_epoch_n, first_index) in enumerate(sub_epoch_starts):
+        end_index = sub_epoch_starts[i + 1][1] if i + 1 < len(sub_epoch_starts) else len(segments)
+        prev_ssi = curr_ssi
+        curr_difficulty, curr_ssi = _get_curr_diff_ssi(constants, sub_epoch_n, summaries)
+        # the sampled segments are picked in the same order as in
+        # _validate_sub_epoch_segments()
+        sampled_index = first_index + rng.choice(range(end_index - first_index))
+        prev_ses: Optional[SubEpochSummary] = None
+        if sub_epoch_n > 0:
+            rc_sub_slot = __get_rc_sub_slot(constants, segments[first_index], summaries, curr_ssi)
+            prev_ses = summaries[sub_epoch_n - 1]
+            rc_sub_slot_hash = rc_sub_slot.get_hash()
+        if not summaries[sub_epoch_n].reward_chain_hash == rc_sub_slot_hash:
+            log.error(f"failed reward_chain_hash validation sub_epoch {sub_epoch_n}")
+            return None
+
+        # skip validation up to fork height
+        if sub_epoch_n < validate_from:
+            continue
+
+        for start in range(first_index, end_index, SEGMENTS_PER_BATCH):
+            batches.append(
+                SegmentBatch(
+                    sub_epoch_n,
+                    start,
+                    min(start + SEGMENTS_PER_BATCH, end_index),
+                    first_index,
+                    sampled_index,
+                    curr_ssi,
+                    prev_ssi,
+                    curr_difficulty,
+                    None if prev_ses is None else bytes(prev_ses),
+                )
+            )
+    return batches
+
+
+def _validate_segment_batch(
+    constants: ConsensusConstants,
+    segments_ref: Union[str, bytes],
+    batch: SegmentBatch,
     shutdown_file_path: Optional[pathlib.Path] = None,
-):
-    for vdf_proof_bytes, class_group_bytes, info in vdf_list:
-        vdf = VDFProof.from_bytes(vdf_proof_bytes)
-        class_group = ClassgroupElement.from_bytes(class_group_bytes)
-        vdf_info = VDFInfo.from_bytes(info)
+) -> bool:
+    """
+    Validates a batch of challenge segments, including the proofs of space and
+    VDFs of the sampled segment. segments_ref is SharedSegments.ref
+    """
+    shm = None
+    if isinstance(segments_ref, str):
+        assert shared_memory is not None
+        try:
+            shm = shared_memory.SharedMemory(name=segments_ref)
+        except FileNotFoundError:
+            # the validation was cancelled, and the segments released
+            return False
+    try:
+        segments = _read_segments(segments_ref if shm is None else shm.buf, batch.start, batch.end)
+    finally:
+        if shm is not None:
+            shm.close()
+
+    prev_ses = None if batch.prev_ses is None else SubEpochSummary.from_bytes(batch.prev_ses)
+    vdfs_to_validate: List[Tuple[VDFProof, ClassgroupElement, VDFInfo]] = []
+    for idx, segment in enumerate(segments, start=batch.start):
+        first = idx == batch.first_index
+        valid_segment, _, _, _, vdf_list = _validate_segment(
+            constants,
+            segment,
+            batch.curr_ssi,
+            batch.prev_ssi,
+            batch.curr_difficulty,
+            prev_ses if first else None,
+            first,
+            idx == batch.sampled_index,
+        )
+        if not valid_segment:
+            log.error(f"failed to validate sub_epoch {segment.sub_epoch_n} segment {idx - batch.first_index} slots")
+            return False
+        vdfs_to_validate.extend(vdf_list)
+
+    for vdf, class_group, vdf_info in vdfs_to_validate:
         if not vdf.is_valid(constants, class_group, vdf_info):
             return False
 
@@ -1679,7 +1996,7 @@ async def validate_weight_proof_inner(
         return False, []
 
     loop = asyncio.get_running_loop()
-    summary_bytes, wp_segment_bytes, wp_recent_chain_bytes = vars_to_bytes(summaries, weight_proof)
+    summary_bytes, wp_recent_chain_bytes = vars_to_bytes(summaries, weight_proof)
     recent_blocks_validation_task = loop.run_in_executor(
         executor,
         validate_recent_blocks,
@@ -1690,35 +2007,37 @@ async def validate_weight_proof_inner(
     )
 
     if not skip_segment_validation:
-        segments_validated, vdfs_to_validate = _validate_sub_epoch_segments(
-            constants, rng, wp_segment_bytes, summary_bytes, validate_from
-        )
+        batches = _get_segment_batches(constants, rng, weight_proof.sub_epoch_segments, summaries, validate_from)
         await asyncio.sleep(0)  # break up otherwise multi-second sync code
-
-        if not segments_validated:
+        if batches is None:
             return False, []
 
-        vdf_chunks = chunks(vdfs_to_validate, num_processes)
-        vdf_tasks: List[Awaitable] = []
-        for chunk in vdf_chunks:
-            byte_chunks = []
-            for vdf_proof, classgroup, vdf_info in chunk:
-                byte_chunks.append((bytes(vdf_proof), bytes(classgroup), bytes(vdf_info)))
-            vdf_task = asyncio.get_running_loop().run_in_executor(
-                executor,
-                _validate_vdf_batch,
-                constants,
-                byte_chunks,
-                pathlib.Path(shutdown_file_name),
-            )
-            vdf_tasks.append(vdf_task)
-            # give other stuff a turn
-            await asyncio.sleep(0)
-
-        for vdf_task in asyncio.as_completed(fs=vdf_tasks):
-            validated = await vdf_task
-            if not validated:
-                return False, []
+        with SharedSegments(weight_proof.sub_epoch_segments) as shared_segments:
+            # the batches are small, and idle workers pick up the next one
+            # from the executor's queue as soon as they're done with the
+            # previous one. The batches with the sampled (most expensive)
+            # segments are queued first, so they don't end up last
+            batches.sort(key=lambda batch: batch.sampled_index < batch.start or batch.sampled_index >= batch.end)
+            vdf_tasks = [
+                loop.run_in_executor(
+                    executor,
+                    _validate_segment_batch,
+                    constants,
+                    shared_segments.ref,
+                    batch,
+                    pathlib.Path(shutdown_file_name),
+                )
+                for batch in batches
+            ]
+            try:
+                for vdf_task in asyncio.as_completed(fs=vdf_tasks):
+                    validated = await vdf_task
+                    if not validated:
+                        return False, []
+            finally:
+                # if a batch failed, don't start the ones still queued
+                for vdf_task in vdf_tasks:
+                    vdf_task.cancel()
 
     valid_recent_blocks, records_bytes = await recent_blocks_validation_task
 
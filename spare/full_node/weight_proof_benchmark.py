@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import sys
+import time
+from concurrent.futures.process import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Tuple
+
+from spare.consensus.default_constants import DEFAULT_CONSTANTS
+from spare.full_node.weight_proof import (
+    _create_shutdown_file,
+    _validate_sub_epoch_summaries,
+    validate_weight_proof_inner,
+)
+from spare.protocols.full_node_protocol import RespondProofOfWeight
+from spare.types.weight_proof import WeightProof
+
+# Measures how long validating a weight proof takes, depending on the number of
+# worker processes. The weight proof is read from a file holding either a
+# serialized WeightProof or a serialized RespondProofOfWeight message.
+#
+# usage: python -m spare.full_node.weight_proof_benchmark <weight-proof-file> [max-processes]
+
+
+def load_weight_proof(path: Path) -> WeightProof:
+    data = path.read_bytes()
+    try:
+        return WeightProof.from_bytes(data)
+    except Exception:
+        # a RespondProofOfWeight is the weight proof followed by the tip
+        return RespondProofOfWeight.from_bytes(data).wp
+
+
+async def validate(weight_proof: WeightProof, num_processes: int) -> Tuple[bool, float]:
+    summaries, sub_epoch_weight_list = _validate_sub_epoch_summaries(DEFAULT_CONSTANTS, weight_proof)
+    if summaries is None or sub_epoch_weight_list is None:
+        return False, 0.0
+    with ProcessPoolExecutor(max_workers=num_processes) as executor:
+        # warm up the workers, so process startup isn't part of the measurement
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(executor, abs, 0) for _ in range(num_processes)))
+        with _create_shutdown_file() as shutdown_file:
+            start = time.perf_counter()
+            valid, _ = await validate_weight_proof_inner(
+                DEFAULT_CONSTANTS,
+                executor,
+                shutdown_file.name,
+                num_processes,
+                weight_proof,
+                summaries,
+                sub_epoch_weight_list,
+                False,
+                0,
+            )
+            return valid, time.perf_counter() - start
+
+
+def main() -> None:
+    if len(sys.argv) < 2:
+        print("usage: python -m spare.full_node.weight_proof_benchmark <weight-proof-file> [max-processes]")
+        sys.exit(1)
+    weight_proof = load_weight_proof(Path(sys.argv[1]))
+    max_processes = int(sys.argv[2]) if len(sys.argv) > 2 else multiprocessing.cpu_count()
+
+    print(
+        f"weight proof: {len(weight_proof.sub_epochs)} sub epochs, {len(weight_proof.sub_epoch_segments)} "
+        f"segments, {len(weight_proof.recent_chain_data)} recent blocks"
+    )
+    print(f"{'processes':>10}{'seconds':>10}{'speedup':>10}")
+    process_counts: List[int] = []
+    n = 1
+    while n < max_processes:
+        process_counts.append(n)
+        n *= 2
+    process_counts.append(max_processes)
+    baseline = None
+    for num_processes in process_counts:
+        valid, seconds = asyncio.run(validate(weight_proof, num_processes))
+        if not valid:
+            print("weight proof failed validation")
+            sys.exit(1)
+        if baseline is None:
+            baseline = seconds
+        print(f"{num_processes:>10}{seconds:>10.3f}{baseline / seconds:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,11 +6,12 @@ import dataclasses
 import logging
 from concurrent.futures.thread import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 from typing_extensions import Literal
 
 from spare.consensus.constants import ConsensusConstants
+from spare.harvester.lookup_scheduler import LookupScheduler
 from spare.plot_sync.sender import Sender
 from spare.plotting.manager import PlotManager
 from spare.plotting.util import (
@@ -36,6 +37,7 @@ class Harvester:
     root_path: Path
     _shut_down: bool
     executor: ThreadPoolExecutor
+    lookup_scheduler: LookupScheduler
     state_changed_callback: Optional[StateChangedProtocol] = None
     constants: ConsensusConstants
     _refresh_lock: asyncio.Lock
@@ -75,6 +77,7 @@ class Harvester:
         self.plot_sync_sender = Sender(self.plot_manager)
         self._shut_down = False
         self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=config["num_threads"])
+        self.lookup_scheduler = LookupScheduler(self.executor, config.get("lookup_concurrency_per_disk", 4))
         self._server = None
         self.constants = constants
         self.state_changed_callback: Optional[StateChangedProtocol] = None
@@ -86,6 +89,7 @@ class Harvester:
 
     def _close(self) -> None:
         self._shut_down = True
+        self.lookup_scheduler.close()
         self.executor.shutdown(wait=True)
         self.plot_manager.stop_refreshing()
         self.plot_manager.reset()
@@ -159,6 +163,16 @@ class Harvester:
                 [str(s) for s in self.plot_manager.no_key_filenames],
             )
 
+    def get_lookup_metrics(self) -> Dict[str, Any]:
+        metrics = self.lookup_scheduler.get_metrics()
+        directories: Dict[int, Set[str]] = {}
+        with self.plot_manager:
+            for path, plot_info in self.plot_manager.plots.items():
+                directories.setdefault(plot_info.device, set()).add(str(path.parent))
+        for disk in metrics["disks"]:
+            disk["plot_directories"] = sorted(directories.get(disk["device"], set()))
+        return metrics
+
     def delete_plot(self, str_path: str) -> Literal[True]:
         remove_plot(Path(str_path))
         self.plot_manager.trigger_refresh()
@@ -9,10 +9,11 @@ from blspy import AugSchemeMPL, G1Element, G2Element
 
 from spare.consensus.pot_iterations import calculate_iterations_quality, calculate_sp_interval_iters
 from spare.harvester.harvester import Harvester
+from spare.harvester.lookup_scheduler import LookupKind
 from spare.plotting.util import PlotInfo, parse_plot_info
 from spare.protocols import harvester_protocol
 from spare.protocols.farmer_protocol import FarmingInfo
-from spare.protocols.harvester_protocol import Plot, PlotSyncResponse
+from spare.protocols.harvester_protocol import Plot, PlotSyncResponse, PlotSyncSummaryResponse
 from spare.protocols.protocol_message_types import ProtocolMessageTypes
 from spare.server.outbound_message import Message, make_msg
 from spare.server.ws_connection import WSSpareConnection
@@ -20,7 +21,6 @@ from spare.types.blockchain_format.proof_of_space import (
     ProofOfSpace,
     calculate_pos_challenge,
     generate_plot_public_key,
-    passes_plot_filter,
 )
 from spare.types.blockchain_format.sized_bytes import bytes32
 from spare.util.api_decorators import api_request
@@ -79,18 +79,14 @@ class HarvesterAPI:
         start = time.time()
         assert len(new_challenge.challenge_hash) == 32
 
-        loop = asyncio.get_running_loop()
-
-        def blocking_lookup(filename: Path, plot_info: PlotInfo) -> List[Tuple[bytes32, ProofOfSpace]]:
+        def blocking_lookup_qualities(
+            filename: Path, plot_info: PlotInfo, sp_challenge_hash: bytes32
+        ) -> List[Tuple[int, bytes32]]:
             # Uses the DiskProver object to lookup qualities. This is a blocking call,
-            # so it should be run in a thread pool.
+            # so it should be run in a thread pool. Returns the index and quality string
+            # of the qualities good enough to fetch the full proof for
             try:
                 plot_id = plot_info.prover.get_id()
-                sp_challenge_hash = calculate_pos_challenge(
-                    plot_id,
-                    new_challenge.challenge_hash,
-                    new_challenge.sp_hash,
-                )
                 try:
                     quality_strings = plot_info.prover.get_qualities_for_challenge(sp_challenge_hash)
                 except Exception as e:
@@ -101,7 +97,7 @@ class HarvesterAPI:
                     )
                     return []
 
-                responses: List[Tuple[bytes32, ProofOfSpace]] = []
+                good_qualities: List[Tuple[int, bytes32]] = []
                 if quality_strings is not None:
                     difficulty = new_challenge.difficulty
                     sub_slot_iters = new_challenge.sub_slot_iters
@@ -125,49 +121,81 @@ class HarvesterAPI:
                         )
                         sp_interval_iters = calculate_sp_interval_iters(self.harvester.constants, sub_slot_iters)
                         if required_iters < sp_interval_iters:
-                            # Found a very good proof of space! will fetch the whole proof from disk,
-                            # then send to farmer
-                            try:
-                                proof_xs = plot_info.prover.get_full_proof(
-                                    sp_challenge_hash, index, self.harvester.parallel_read
-                                )
-                            except Exception as e:
-                                self.harvester.log.error(f"Exception fetching full proof for {filename}. {e}")
-                                self.harvester.log.error(
-                                    f"File: {filename} Plot ID: {plot_id.hex()}, challenge: {sp_challenge_hash}, "
-                                    f"plot_info: {plot_info}"
-                                )
-                                continue
-
-                            responses.append(
-                                (
-                                    quality_str,
-                                    ProofOfSpace(
-                                        sp_challenge_hash,
-                                        plot_info.pool_public_key,
-                                        plot_info.pool_contract_puzzle_hash,
-                                        plot_info.plot_public_key,
-                                        uint8(plot_info.prover.get_size()),
-                                        proof_xs,
-                                    ),
-                                )
-                            )
-                return responses
+                            # Found a very good proof of space! the whole proof will be fetched from disk,
+                            # then sent to the farmer
+                            good_qualities.append((index, quality_str))
+                return good_qualities
             except Exception as e:
                 self.harvester.log.error(f"Unknown error: {e}")
                 return []
 
+        def blocking_lookup_proof(
+            filename: Path, plot_info: PlotInfo, sp_challenge_hash: bytes32, index: int
+        ) -> Optional[ProofOfSpace]:
+            # Fetches the full proof of space from disk. This is a blocking call, so it should be run
+            # in a thread pool
+            try:
+                proof_xs = plot_info.prover.get_full_proof(sp_challenge_hash, index, self.harvester.parallel_read)
+            except Exception as e:
+                self.harvester.log.error(f"Exception fetching full proof for {filename}. {e}")
+                self.harvester.log.error(
+                    f"File: {filename} Plot ID: {plot_info.prover.get_id().hex()}, challenge: {sp_challenge_hash}, "
+                    f"plot_info: {plot_info}"
+                )
+                return None
+            return ProofOfSpace(
+                sp_challenge_hash,
+                plot_info.pool_public_key,
+                plot_info.pool_contract_puzzle_hash,
+                plot_info.plot_public_key,
+                uint8(plot_info.prover.get_size()),
+                proof_xs,
+            )
+
         async def lookup_challenge(
             filename: Path, plot_info: PlotInfo
         ) -> Tuple[Path, List[harvester_protocol.NewProofOfSpace]]:
-            # Executes a DiskProverLookup in a thread pool, and returns responses
+            # Runs the DiskProver lookups in the thread pool, queued behind the other lookups on the
+            # same disk, and returns responses
             all_responses: List[harvester_protocol.NewProofOfSpace] = []
             if self.harvester._shut_down:
                 return filename, []
-            proofs_of_space_and_q: List[Tuple[bytes32, ProofOfSpace]] = await loop.run_in_executor(
-                self.harvester.executor, blocking_lookup, filename, plot_info
+            scheduler = self.harvester.lookup_scheduler
+            sp_challenge_hash = calculate_pos_challenge(
+                plot_info.prover.get_id(),
+                new_challenge.challenge_hash,
+                new_challenge.sp_hash,
             )
-            for quality_str, proof_of_space in proofs_of_space_and_q:
+            try:
+                qualities = await scheduler.run(
+                    plot_info.device,
+                    LookupKind.quality,
+                    blocking_lookup_qualities,
+                    filename,
+                    plot_info,
+                    sp_challenge_hash,
+                )
+                proofs = await asyncio.gather(
+                    *(
+                        scheduler.run(
+                            plot_info.device,
+                            LookupKind.full_proof,
+                            blocking_lookup_proof,
+                            filename,
+                            plot_info,
+                            sp_challenge_hash,
+                            index,
+                        )
+                        for index, _ in qualities
+                    )
+                )
+            except Exception as e:
+                if not self.harvester._shut_down:
+                    self.harvester.log.error(f"Lookup failed for {filename}: {e}")
+                return filename, []
+            for (_, quality_str), proof_of_space in zip(qualities, proofs):
+                if proof_of_space is None:
+                    continue
                 all_responses.append(
                     harvester_protocol.NewProofOfSpace(
                         new_challenge.challenge_hash,
@@ -184,21 +212,21 @@ class HarvesterAPI:
         total = 0
         with self.harvester.plot_manager:
             self.harvester.log.debug("new_signage_point_harvester lock acquired")
-            for try_plot_filename, try_plot_info in self.harvester.plot_manager.plots.items():
-                # Passes the plot filter (does not check sp filter yet though, since we have not reached sp)
-                # This is being executed at the beginning of the slot
-                total += 1
-                if passes_plot_filter(
-                    self.harvester.constants,
-                    try_plot_info.prover.get_id(),
-                    new_challenge.challenge_hash,
-                    new_challenge.sp_hash,
-                ):
-                    passed += 1
-                    awaitables.append(lookup_challenge(try_plot_filename, try_plot_info))
+            plots = self.harvester.plot_manager.plots
+            total = len(plots)
+            # Passes the plot filter (does not check sp filter yet though, since we have not reached sp)
+            # This is being executed at the beginning of the slot
+            for try_plot_filename in self.harvester.plot_manager.plot_id_table.passing_plot_filter(
+                self.harvester.constants,
+                new_challenge.challenge_hash,
+                new_challenge.sp_hash,
+            ):
+                passed += 1
+                awaitables.append(lookup_challenge(try_plot_filename, plots[try_plot_filename]))
             self.harvester.log.debug(f"new_signage_point_harvester {passed} plots passed the plot filter")
 
-        # Concurrently executes all lookups on disk, to take advantage of multiple disk parallelism
+        # Concurrently executes all lookups on disk, to take advantage of multiple disk parallelism. The
+        # lookup scheduler limits how many run on each disk
         total_proofs_found = 0
         for filename_sublist_awaitable in asyncio.as_completed(awaitables):
             filename, sublist = await filename_sublist_awaitable
@@ -318,3 +346,7 @@ class HarvesterAPI:
     @api_request()
     async def plot_sync_response(self, response: PlotSyncResponse) -> None:
         self.harvester.plot_sync_sender.set_response(response)
+
+    @api_request()
+    async def plot_sync_summary_response(self, response: PlotSyncSummaryResponse) -> None:
+        self.harvester.plot_sync_sender.set_summary_response(response)
@@ -0,0 +1,293 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import click
+from blspy import G1Element
+
+from spare.consensus.default_constants import DEFAULT_CONSTANTS
+from spare.consensus.pos_quality import _expected_plot_size
+from spare.harvester.harvester import Harvester
+from spare.harvester.harvester_api import HarvesterAPI
+from spare.plotting.util import PlotInfo
+from spare.protocols import harvester_protocol
+from spare.protocols.farmer_protocol import FarmingInfo
+from spare.protocols.protocol_message_types import ProtocolMessageTypes
+from spare.server.outbound_message import Message
+from spare.types.blockchain_format.sized_bytes import bytes32
+from spare.util.ints import uint8, uint64
+from spare.util.latency_histogram import LATENCY_BUCKETS
+
+# This is a development utility that replays a schedule of signage points
+# against a harvester with synthetic plots, to compare lookup scheduling
+# changes. The plots don't exist on disk, `SyntheticProver` stands in for the
+# `DiskProver` and sleeps for the configured read latency instead.
+
+# python spare/harvester/lookup_benchmark.py --plots 20000 --disks 8
+
+
+class SyntheticProver:
+    """
+    Implements the parts of `DiskProver` the harvester uses for lookups. The qualities and proofs are random, but
+    deterministic per plot and challenge.
+    """
+
+    def __init__(
+        self, filename: str, plot_id: bytes32, size: int, quality_latency: float, proof_latency: float, jitter: float
+    ) -> None:
+        self._filename = filename
+        self._plot_id = plot_id
+        self._size = size
+        self._quality_latency = quality_latency
+        self._proof_latency = proof_latency
+        self._jitter = jitter
+
+    def get_filename(self) -> str:
+        return self._filename
+
+    def get_id(self) -> bytes32:
+        return self._plot_id
+
+    def get_size(self) -> int:
+        return self._size
+
+    def _sleep(self, latency: float) -> None:
+        time.sleep(max(0.0, random.gauss(latency, latency * self._jitter)))
+
+    def get_qualities_for_challenge(self, challenge: bytes32) -> List[bytes32]:
+        self._sleep(self._quality_latency)
+        rng = random.Random(self._plot_id + challenge)
+        # On average a plot has one quality per challenge
+        count = sum(1 for _ in range(4) if rng.random() < 0.25)
+        return [bytes32(rng.getrandbits(256).to_bytes(32, "big")) for _ in range(count)]
+
+    def get_full_proof(self, challenge: bytes32, index: int, parallel_read: bool = True) -> bytes:
+        self._sleep(self._proof_latency)
+        rng = random.Random(self._plot_id + challenge + bytes([index]))
+        return rng.getrandbits(self._size * 64).to_bytes(self._size * 8, "big")
+
+
+@dataclass
+class SignagePointResult:
+    eligible_plots: int = 0
+    # Seconds from the signage point to each proof of space, and to the farming info which ends the lookups
+    time_to_proofs: List[float] = field(default_factory=list)
+    time_to_done: Optional[float] = None
+
+
+class RecordingPeer:
+    """
+    Stands in for the farmer connection, and records when the harvester responded for which signage point
+    """
+
+    def __init__(self) -> None:
+        self.started: Dict[bytes32, float] = {}
+        self.results: Dict[bytes32, SignagePointResult] = {}
+
+    async def send_message(self, message: Message) -> bool:
+        now = time.monotonic()
+        if message.type == ProtocolMessageTypes.new_proof_of_space.value:
+            proof = harvester_protocol.NewProofOfSpace.from_bytes(message.data)
+            result = self.results.setdefault(proof.sp_hash, SignagePointResult())
+            result.time_to_proofs.append(now - self.started[proof.sp_hash])
+        elif message.type == ProtocolMessageTypes.farming_info.value:
+            farming_info = FarmingInfo.from_bytes(message.data)
+            result = self.results.setdefault(farming_info.sp_hash, SignagePointResult())
+            result.eligible_plots = farming_info.passed
+            result.time_to_done = now - self.started[farming_info.sp_hash]
+        return True
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if len(values) == 0:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def histogram_percentile(counts: List[int], fraction: float) -> Optional[float]:
+    """
+    Returns the upper bound of the `LatencyHistogram` bucket which contains the given percentile, `None` if it's in
+    the last, unbounded bucket.
+    """
+    total = sum(counts)
+    if total == 0:
+        return 0.0
+    seen = 0
+    for bucket, count in enumerate(counts):
+        seen += count
+        if seen >= fraction * total:
+            return LATENCY_BUCKETS[bucket] if bucket < len(LATENCY_BUCKETS) else None
+    return None
+
+
+def sub_slot_iters_for_proof_fraction(k_size: int, difficulty: int, proof_fraction: float) -> uint64:
+    """
+    Returns the sub slot iterations which make about `proof_fraction` of the qualities good enough for a proof
+    """
+    constants = DEFAULT_CONSTANTS
+    sp_interval_iters = int(
+        proof_fraction * difficulty * constants.DIFFICULTY_CONSTANT_FACTOR / _expected_plot_size(k_size)
+    )
+    return uint64(max(1, sp_interval_iters) * constants.NUM_SPS_SUB_SLOT)
+
+
+def create_harvester(
+    root_path: Path,
+    plots: int,
+    disks: int,
+    k_size: int,
+    threads: int,
+    concurrency_per_disk: int,
+    quality_latency: float,
+    proof_latency: float,
+    jitter: float,
+) -> Harvester:
+    harvester = Harvester(
+        root_path,
+        {"num_threads": threads, "lookup_concurrency_per_disk": concurrency_per_disk},
+        DEFAULT_CONSTANTS,
+    )
+    harvester.plot_manager.set_public_keys([G1Element()], [G1Element()])
+    rng = random.Random(0)
+    with harvester.plot_manager:
+        for index in range(plots):
+            device = index % disks
+            path = root_path / f"disk-{device}" / f"plot-k{k_size}-{index}.plot"
+            plot_id = bytes32(rng.getrandbits(256).to_bytes(32, "big"))
+            prover: Any = SyntheticProver(str(path), plot_id, k_size, quality_latency, proof_latency, jitter)
+            harvester.plot_manager.plots[path] = PlotInfo(
+                prover, G1Element(), None, G1Element(), int(_expected_plot_size(k_size)), time.time(), device
+            )
+            harvester.plot_manager.plot_id_table.add(path, plot_id)
+    return harvester
+
+
+async def replay(
+    harvester: Harvester,
+    signage_points: int,
+    interval: float,
+    difficulty: int,
+    sub_slot_iters: uint64,
+) -> RecordingPeer:
+    await harvester._start()
+    harvester_api = HarvesterAPI(harvester)
+    peer = RecordingPeer()
+    rng = random.Random(1)
+    tasks: List[asyncio.Task[None]] = []
+    challenge_hash = bytes32(rng.getrandbits(256).to_bytes(32, "big"))
+    for index in range(signage_points):
+        signage_point_index = index % DEFAULT_CONSTANTS.NUM_SPS_SUB_SLOT
+        if signage_point_index == 0 and index > 0:
+            challenge_hash = bytes32(rng.getrandbits(256).to_bytes(32, "big"))
+        sp_hash = bytes32(rng.getrandbits(256).to_bytes(32, "big"))
+        new_challenge = harvester_protocol.NewSignagePointHarvester(
+            challenge_hash, uint64(difficulty), sub_slot_iters, uint8(signage_point_index), sp_hash, []
+        )
+        peer.started[sp_hash] = time.monotonic()
+        tasks.append(
+            asyncio.create_task(
+                harvester_api.new_signage_point_harvester(new_challenge, peer)  # type: ignore[arg-type]
+            )
+        )
+        await asyncio.sleep(interval)
+    await asyncio.gather(*tasks)
+    return peer
+
+
+def print_report(peer: RecordingPeer, harvester: Harvester, duration: float) -> None:
+    results = list(peer.results.values())
+    time_to_proofs = [seconds for result in results for seconds in result.time_to_proofs]
+    time_to_done = [result.time_to_done for result in results if result.time_to_done is not None]
+    eligible = [float(result.eligible_plots) for result in results]
+
+    print(f"signage points: {len(results)} in {duration:.2f} s")
+    print(f"{'':<22}{'p50':>10}{'p99':>10}{'max':>10}{'count':>10}")
+    for name, values, unit in [
+        ("eligible plots", eligible, ""),
+        ("time to proof", time_to_proofs, "s"),
+        ("time to done", time_to_done, "s"),
+    ]:
+        print(
+            f"{name:<22}{percentile(values, 0.5):>9.3f}{unit:<1}{percentile(values, 0.99):>9.3f}{unit:<1}"
+            f"{max(values, default=0.0):>9.3f}{unit:<1}{len(values):>10}"
+        )
+
+    print("lookup scheduler, per disk (seconds, p50/p99 are bucket upper bounds):")
+    print(f"{'disk':<6}{'kind':<12}{'stage':<9}{'p50':>8}{'p99':>8}{'avg':>9}{'max':>9}{'count':>8}")
+    for disk in harvester.lookup_scheduler.get_metrics()["disks"]:
+        for kind in ["quality", "full_proof"]:
+            for stage in ["wait", "service"]:
+                histogram = disk[kind][stage]
+                counts = [bucket["count"] for bucket in histogram["buckets"]]
+                p50 = histogram_percentile(counts, 0.5)
+                p99 = histogram_percentile(counts, 0.99)
+                print(
+                    f"{disk['device']:<6}{kind:<12}{stage:<9}"
+                    f"{'inf' if p50 is None else f'{p50:.3f}':>8}{'inf' if p99 is None else f'{p99:.3f}':>8}"
+                    f"{histogram['average_seconds']:>9.4f}{histogram['max_seconds']:>9.4f}{histogram['count']:>8}"
+                )
+
+
+@click.command()
+@click.option("--plots", default=10000, help="Number of synthetic plots")
+@click.option("--disks", default=4, help="Number of disks the plots are spread over")
+@click.option("--k-size", default=32, help="k size of the synthetic plots")
+@click.option("--threads", default=30, help="Harvester thread pool size, like harvester.num_threads")
+@click.option("--concurrency-per-disk", default=4, help="Like harvester.lookup_concurrency_per_disk")
+@click.option("--quality-latency", default=0.05, help="Seconds a quality lookup takes")
+@click.option("--proof-latency", default=0.4, help="Seconds a full proof lookup takes")
+@click.option("--jitter", default=0.2, help="Standard deviation of the latencies, relative to them")
+@click.option("--signage-points", default=64, help="Number of signage points to replay")
+@click.option("--interval", default=0.5, help="Seconds between two signage points, 9.375 on mainnet")
+@click.option("--plot-filter-bits", default=None, type=int, help="Overrides NUMBER_ZERO_BITS_PLOT_FILTER")
+@click.option("--proof-fraction", default=0.1, help="Fraction of the qualities which need a full proof lookup")
+def main(
+    plots: int,
+    disks: int,
+    k_size: int,
+    threads: int,
+    concurrency_per_disk: int,
+    quality_latency: float,
+    proof_latency: float,
+    jitter: float,
+    signage_points: int,
+    interval: float,
+    plot_filter_bits: Optional[int],
+    proof_fraction: float,
+) -> None:
+    logging.basicConfig(level=logging.WARNING)
+    with tempfile.TemporaryDirectory() as root:
+        harvester = create_harvester(
+            Path(root),
+            plots,
+            disks,
+            k_size,
+            threads,
+            concurrency_per_disk,
+            quality_latency,
+            proof_latency,
+            jitter,
+        )
+        if plot_filter_bits is not None:
+            harvester.constants = harvester.constants.replace(NUMBER_ZERO_BITS_PLOT_FILTER=plot_filter_bits)
+        difficulty = 1
+        sub_slot_iters = sub_slot_iters_for_proof_fraction(k_size, difficulty, proof_fraction)
+        start = time.monotonic()
+        try:
+            peer = asyncio.run(replay(harvester, signage_points, interval, difficulty, sub_slot_iters))
+        finally:
+            harvester.lookup_scheduler.close()
+            harvester.executor.shutdown(wait=True)
+        print_report(peer, harvester, time.monotonic() - start)
+
+
+if __name__ == "__main__":
+    main()
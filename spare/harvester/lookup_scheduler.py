@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
+from enum import IntEnum
+from functools import partial
+from typing import Any, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+from spare.util.latency_histogram import LatencyHistogram
+
+T = TypeVar("T")
+
+
+class LookupKind(IntEnum):
+    # lookups of a lower kind are served first
+    quality = 0
+    full_proof = 1
+
+
+@dataclass
+class _QueuedLookup:
+    kind: LookupKind
+    function: Callable[..., Any]
+    args: Tuple[Any, ...]
+    future: asyncio.Future[Any]
+    queued_at: float
+
+
+@dataclass
+class DiskLookups:
+    """
+    The lookups waiting for, and running on, one disk
+    """
+
+    device: int
+    queues: Dict[LookupKind, Deque[_QueuedLookup]] = field(
+        default_factory=lambda: {kind: deque() for kind in LookupKind}
+    )
+    in_flight: int = 0
+    errors: int = 0
+    # time spent waiting in the queue, and time spent reading from the disk
+    wait: Dict[LookupKind, LatencyHistogram] = field(
+        default_factory=lambda: {kind: LatencyHistogram() for kind in LookupKind}
+    )
+    service: Dict[LookupKind, LatencyHistogram] = field(
+        default_factory=lambda: {kind: LatencyHistogram() for kind in LookupKind}
+    )
+
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+    def pop(self) -> Optional[_QueuedLookup]:
+        for kind in LookupKind:
+            queue = self.queues[kind]
+            while len(queue) > 0:
+                lookup = queue.popleft()
+                if not lookup.future.done():
+                    return lookup
+        return None
+
+    def to_json_dict(self) -> Dict[str, Any]:
+        return {
+            "device": self.device,
+            "queued": self.queued(),
+            "in_flight": self.in_flight,
+            "errors": self.errors,
+            **{
+                kind.name: {"wait": self.wait[kind].to_json_dict(), "service": self.service[kind].to_json_dict()}
+                for kind in LookupKind
+            },
+        }
+
+
+class LookupScheduler:
+    """
+    Runs blocking plot lookups in the executor, with a queue per disk (keyed by
+    the st_dev of the plot file). At most max_concurrent_per_disk lookups run
+    on a disk at the same time, so a slow or spun down disk only ties up that
+    many executor threads, and the other disks keep being served. Within a
+    disk, quality lookups are run before full proof lookups.
+    """
+
+    _executor: Executor
+    max_concurrent_per_disk: int
+    _disks: Dict[int, DiskLookups]
+    _closed: bool
+
+    def __init__(self, executor: Executor, max_concurrent_per_disk: int) -> None:
+        if max_concurrent_per_disk < 1:
+            raise ValueError(f"max_concurrent_per_disk must be at least 1, not {max_concurrent_per_disk}")
+        self._executor = executor
+        self.max_concurrent_per_disk = max_concurrent_per_disk
+        self._disks = {}
+        self._closed = False
+
+    async def run(self, device: int, kind: LookupKind, function: Callable[..., T], *args: Any) -> T:
+        if self._closed:
+            raise RuntimeError("lookup scheduler is closed")
+        disk = self._disks.get(device)
+        if disk is None:
+            disk = DiskLookups(device)
+            self._disks[device] = disk
+        future: asyncio.Future[T] = asyncio.get_running_loop().create_future()
+        disk.queues[kind].append(_QueuedLookup(kind, function, args, future, time.monotonic()))
+        self._dispatch(disk)
+        return await future
+
+    def _dispatch(self, disk: DiskLookups) -> None:
+        loop = asyncio.get_running_loop()
+        while disk.in_flight < self.max_concurrent_per_disk:
+            lookup = disk.pop()
+            if lookup is None:
+                break
+            started = time.monotonic()
+            disk.wait[lookup.kind].record(started - lookup.queued_at)
+            disk.in_flight += 1
+            executor_future = loop.run_in_executor(self._executor, lookup.function, *lookup.args)
+            executor_future.add_done_callback(partial(self._done, disk, lookup, started))
+
+    def _done(
+        self, disk: DiskLookups, lookup: _QueuedLookup, started: float, executor_future: asyncio.Future[Any]
+    ) -> None:
+        disk.in_flight -= 1
+        disk.service[lookup.kind].record(time.monotonic() - started)
+        if executor_future.cancelled():
+            lookup.future.cancel()
+        elif executor_future.exception() is not None:
+            disk.errors += 1
+            if not lookup.future.done():
+                lookup.future.set_exception(executor_future.exception())  # type: ignore[arg-type]
+        elif not lookup.future.done():
+            lookup.future.set_result(executor_future.result())
+        if not self._closed:
+            self._dispatch(disk)
+
+    def close(self) -> None:
+        """
+        Fails the lookups that haven't started yet
+        """
+        self._closed = True
+        for disk in self._disks.values():
+            for queue in disk.queues.values():
+                for lookup in queue:
+                    if not lookup.future.done():
+                        lookup.future.set_exception(RuntimeError("lookup scheduler is closed"))
+                queue.clear()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "max_concurrent_per_disk": self.max_concurrent_per_disk,
+            "disks": [disk.to_json_dict() for disk in self._disks.values()],
+        }
@@ -16,6 +16,7 @@ from spare.plot_sync.exceptions import (
     PlotSyncException,
     SyncIdsMatchError,
 )
+from spare.plot_sync.summary import PlotSetSummary, plot_bucket
 from spare.plot_sync.util import ErrorCodes, State, T_PlotSyncMessage
 from spare.protocols.harvester_protocol import (
     Plot,
@@ -26,12 +27,14 @@ from spare.protocols.harvester_protocol import (
     PlotSyncPlotList,
     PlotSyncResponse,
     PlotSyncStart,
+    PlotSyncSummary,
+    PlotSyncSummaryResponse,
 )
 from spare.protocols.protocol_message_types import ProtocolMessageTypes
 from spare.server.outbound_message import make_msg
 from spare.server.ws_connection import WSSpareConnection
 from spare.types.blockchain_format.sized_bytes import bytes32
-from spare.util.ints import int16, uint32, uint64
+from spare.util.ints import int16, uint16, uint32, uint64
 from spare.util.misc import get_list_or_len
 
 log = logging.getLogger(__name__)
@@ -45,6 +48,7 @@ class Sync:
     plots_processed: uint32 = uint32(0)
     plots_total: uint32 = uint32(0)
     delta: Delta = field(default_factory=Delta)
+    differing_buckets: List[uint16] = field(default_factory=list)
     time_done: Optional[float] = None
 
     def in_progress(self) -> bool:
@@ -83,16 +87,21 @@ class Receiver:
     _duplicates: List[str]
     _total_plot_size: int
     _update_callback: ReceiverUpdateCallback
+    # The plots known from a previous connection or sync of the harvester, which can be confirmed by a summary sync
+    # instead of being transferred again.
+    _known_plots: Dict[str, Plot]
 
     def __init__(
         self,
         connection: WSSpareConnection,
         update_callback: ReceiverUpdateCallback,
+        known_plots: Optional[Dict[str, Plot]] = None,
     ) -> None:
         self._connection = connection
         self._current_sync = Sync()
         self._last_sync = Sync()
         self._plots = {}
+        self._known_plots = known_plots if known_plots is not None else {}
         self._invalid = []
         self._keys_missing = []
         self._duplicates = []
@@ -150,7 +159,15 @@ class Receiver:
         )
 
         async def send_response(plot_sync_error: Optional[PlotSyncError] = None) -> None:
-            if self._connection is not None:
+            if self._connection is not None and message_type == ProtocolMessageTypes.plot_sync_summary:
+                differing_buckets = self._current_sync.differing_buckets if plot_sync_error is None else []
+                await self._connection.send_message(
+                    make_msg(
+                        ProtocolMessageTypes.plot_sync_summary_response,
+                        PlotSyncSummaryResponse(message.identifier, differing_buckets, plot_sync_error),
+                    )
+                )
+            elif self._connection is not None:
                 await self._connection.send_message(
                     make_msg(
                         ProtocolMessageTypes.plot_sync_response,
@@ -186,6 +203,8 @@ class Receiver:
 
     async def _sync_started(self, data: PlotSyncStart) -> None:
         if data.initial:
+            if len(self._plots) > 0:
+                self._known_plots = self._plots.copy()
             self.reset()
         self._validate_identifier(data.identifier, True)
         if data.last_sync_id != self._last_sync.sync_id:
@@ -221,6 +240,35 @@ class Receiver:
     async def process_loaded(self, plot_infos: PlotSyncPlotList) -> None:
         await self._process(self._process_loaded, ProtocolMessageTypes.plot_sync_loaded, plot_infos)
 
+    async def _process_summary(self, summary: PlotSyncSummary) -> None:
+        self._validate_identifier(summary.identifier)
+        if self._current_sync.state != State.loaded or self._current_sync.next_message_id != 1:
+            raise ValueError(f"Unexpected summary in state {self._current_sync.state}")
+
+        differing_buckets = PlotSetSummary.from_plots(self._known_plots.values()).differing_buckets(
+            summary.bucket_hashes
+        )
+        # All known plots in the matching buckets are confirmed, the harvester sends the plots of the others
+        differing = set(differing_buckets)
+        for filename, plot in self._known_plots.items():
+            if plot_bucket(filename) not in differing:
+                self._current_sync.delta.valid.additions[filename] = plot
+                self._current_sync.bump_plots_processed()
+        log.info(
+            f"_process_summary: node_id {self.connection().peer_node_id}, {len(differing_buckets)} buckets differ, "
+            f"confirmed {self._current_sync.plots_processed} of {len(self._known_plots)} known plots"
+        )
+        self._known_plots = {}
+        self._current_sync.differing_buckets = differing_buckets
+
+        # Let the callback receiver know about the sync progress updates
+        await self.trigger_callback()
+
+        self._current_sync.bump_next_message_id()
+
+    async def process_summary(self, summary: PlotSyncSummary) -> None:
+        await self._process(self._process_summary, ProtocolMessageTypes.plot_sync_summary, summary)
+
     async def process_path_list(
         self,
         *,
@@ -329,6 +377,7 @@ class Receiver:
         self._keys_missing = self._current_sync.delta.keys_missing.additions.copy()
         self._duplicates = self._current_sync.delta.duplicates.additions.copy()
         self._total_plot_size = sum(plot.file_size for plot in self._plots.values())
+        self._known_plots = {}
         # Save current sync as last sync and create a new current sync
         self._last_sync = self._current_sync
         self._current_sync = Sync()
@@ -352,7 +401,7 @@ class Receiver:
                 "host": self._connection.peer_info.host,
                 "port": self._connection.peer_info.port,
             },
-            "plots": get_list_or_len(list(self._plots.values()), counts_only),
+            "plots": len(self._plots) if counts_only else list(self._plots.values()),
             "failed_to_open_filenames": get_list_or_len(self._invalid, counts_only),
             "no_key_filenames": get_list_or_len(self._keys_missing, counts_only),
             "duplicates": get_list_or_len(self._duplicates, counts_only),
@@ -11,6 +11,7 @@ from typing import Any, Generic, Iterable, List, Optional, Tuple, Type, TypeVar
 from typing_extensions import Protocol
 
 from spare.plot_sync.exceptions import AlreadyStartedError, InvalidConnectionTypeError
+from spare.plot_sync.summary import PlotSetSummary, plot_bucket
 from spare.plot_sync.util import Constants
 from spare.plotting.manager import PlotManager
 from spare.plotting.util import PlotInfo
@@ -22,12 +23,15 @@ from spare.protocols.harvester_protocol import (
     PlotSyncPlotList,
     PlotSyncResponse,
     PlotSyncStart,
+    PlotSyncSummary,
+    PlotSyncSummaryResponse,
 )
 from spare.protocols.protocol_message_types import ProtocolMessageTypes
+from spare.protocols.shared_protocol import Capability
 from spare.server.outbound_message import NodeType, make_msg
 from spare.server.ws_connection import WSSpareConnection
 from spare.util.generator_tools import list_to_batches
-from spare.util.ints import int16, uint32, uint64
+from spare.util.ints import int16, uint16, uint32, uint64
 
 log = logging.getLogger(__name__)
 
@@ -98,6 +102,13 @@ class Sender:
     _stop_requested = False
     _task: Optional[asyncio.Task[None]]
     _response: Optional[ExpectedResponse]
+    # In a summary sync the loaded plots are held back until the farmer responded to the summary of them, and then
+    # only the ones in the buckets which differ from the farmer's are sent.
+    _summary_sync: bool
+    _summary_disabled: bool
+    _summary_plots: List[Plot]
+    _summary_done_args: Optional[Tuple[List[str], List[str], List[str], List[str], float]]
+    _summary_differing_buckets: List[uint16]
 
     def __init__(self, plot_manager: PlotManager) -> None:
         self._plot_manager = plot_manager
@@ -109,6 +120,11 @@ class Sender:
         self._stop_requested = False
         self._task = None
         self._response = None
+        self._summary_sync = False
+        self._summary_disabled = False
+        self._summary_plots = []
+        self._summary_done_args = None
+        self._summary_differing_buckets = []
 
     def __str__(self) -> str:
         return f"sync_id {self._sync_id}, next_message_id {self._next_message_id}, messages {len(self._messages)}"
@@ -138,6 +154,7 @@ class Sender:
         if connection.connection_type != NodeType.FARMER:
             raise InvalidConnectionTypeError(connection.connection_type, NodeType.HARVESTER)
         self._connection = connection
+        self._summary_disabled = False
 
     def bump_next_message_id(self) -> None:
         self._next_message_id = uint64(self._next_message_id + 1)
@@ -190,6 +207,14 @@ class Sender:
         self._response.message = response
         return True
 
+    def set_summary_response(self, response: PlotSyncSummaryResponse) -> bool:
+        if not self.set_response(
+            PlotSyncResponse(response.identifier, int16(ProtocolMessageTypes.plot_sync_summary.value), response.error)
+        ):
+            return False
+        self._summary_differing_buckets = response.differing_buckets
+        return True
+
     def _add_message(self, message_type: ProtocolMessageTypes, payload_type: Any, *args: Any) -> None:
         assert self._sync_id != 0
         message_id = uint64(len(self._messages))
@@ -237,12 +262,17 @@ class Sender:
                     self._next_message_id = expected.message_id
                     recovered = True
             if not recovered:
+                if message_generator.message_type == ProtocolMessageTypes.plot_sync_summary:
+                    # Fall back to sending all plots
+                    self._summary_disabled = True
                 return failed(f"Not recoverable error {self._response.message}")
             return True
 
         if self._response.message_type == ProtocolMessageTypes.plot_sync_done:
             self._finalize_sync()
         else:
+            if self._response.message_type == ProtocolMessageTypes.plot_sync_summary:
+                self._add_summary_result()
             self.bump_next_message_id()
 
         return True
@@ -267,12 +297,24 @@ class Sender:
             sync_id = sync_id + 1
         log.debug(f"sync_start {sync_id}")
         self._sync_id = uint64(sync_id)
+        self._summary_sync = (
+            initial
+            and not self._summary_disabled
+            and self._connection is not None
+            and self._connection.has_capability(Capability.PLOT_SYNC_SUMMARY)
+        )
+        self._summary_plots = []
+        self._summary_done_args = None
+        self._summary_differing_buckets = []
         self._add_message(
             ProtocolMessageTypes.plot_sync_start, PlotSyncStart, initial, self._last_sync_id, uint32(int(count))
         )
 
     def process_batch(self, loaded: List[PlotInfo], remaining: int) -> None:
         log.debug(f"process_batch {self}: loaded {len(loaded)}, remaining {remaining}")
+        if self._summary_sync:
+            self._summary_plots.extend(_convert_plot_info_list(loaded))
+            return
         if len(loaded) > 0 or remaining == 0:
             converted = _convert_plot_info_list(loaded)
             self._add_message(ProtocolMessageTypes.plot_sync_loaded, PlotSyncPlotList, converted, remaining == 0)
@@ -280,25 +322,55 @@ class Sender:
     def sync_done(self, removed: List[Path], duration: float) -> None:
         log.debug(f"sync_done {self}: removed {len(removed)}, duration {duration}")
         removed_list = [str(x) for x in removed]
-        self._add_list_batched(
-            ProtocolMessageTypes.plot_sync_removed,
-            PlotSyncPathList,
-            removed_list,
-        )
         failed_to_open_list = [str(x) for x in list(self._plot_manager.failed_to_open_filenames)]
-        self._add_list_batched(ProtocolMessageTypes.plot_sync_invalid, PlotSyncPathList, failed_to_open_list)
         no_key_list = [str(x) for x in self._plot_manager.no_key_filenames]
+        duplicates_list = [str(x) for x in self._plot_manager.get_duplicates()]
+        if self._summary_sync:
+            # The rest of the messages are added once the summary response is in, see `_add_summary_result`
+            self._summary_done_args = (removed_list, failed_to_open_list, no_key_list, duplicates_list, duration)
+            summary = PlotSetSummary.from_plots(self._summary_plots)
+            self._add_message(ProtocolMessageTypes.plot_sync_summary, PlotSyncSummary, summary.to_bytes_list())
+            return
+        self._add_done_messages(removed_list, failed_to_open_list, no_key_list, duplicates_list, duration)
+
+    def _add_done_messages(
+        self,
+        removed_list: List[str],
+        failed_to_open_list: List[str],
+        no_key_list: List[str],
+        duplicates_list: List[str],
+        duration: float,
+    ) -> None:
+        self._add_list_batched(ProtocolMessageTypes.plot_sync_removed, PlotSyncPathList, removed_list)
+        self._add_list_batched(ProtocolMessageTypes.plot_sync_invalid, PlotSyncPathList, failed_to_open_list)
         self._add_list_batched(ProtocolMessageTypes.plot_sync_keys_missing, PlotSyncPathList, no_key_list)
-        duplicates_list = self._plot_manager.get_duplicates().copy()
         self._add_list_batched(ProtocolMessageTypes.plot_sync_duplicates, PlotSyncPathList, duplicates_list)
         self._add_message(ProtocolMessageTypes.plot_sync_done, PlotSyncDone, uint64(int(duration)))
 
+    def _add_summary_result(self) -> None:
+        # Only once, even if the summary was sent again after an error
+        if self._summary_done_args is None or self._next_message_id != len(self._messages) - 1:
+            return
+        differing_buckets = set(self._summary_differing_buckets)
+        plots = [plot for plot in self._summary_plots if plot_bucket(plot.filename) in differing_buckets]
+        log.info(
+            f"_add_summary_result {self}: {len(differing_buckets)} buckets differ, "
+            f"sending {len(plots)} of {len(self._summary_plots)} plots"
+        )
+        self._add_list_batched(ProtocolMessageTypes.plot_sync_loaded, PlotSyncPlotList, plots)
+        self._add_done_messages(*self._summary_done_args)
+        self._summary_done_args = None
+        self._summary_plots = []
+
     def _finalize_sync(self) -> None:
         log.debug(f"_finalize_sync {self}")
         assert self._sync_id != 0
         self._last_sync_id = self._sync_id
         self._next_message_id = uint64(0)
         self._messages.clear()
+        self._summary_sync = False
+        self._summary_plots = []
+        self._summary_done_args = None
         # Do this at the end since `_sync_id` is used as sync active indicator.
         self._sync_id = uint64(0)
 
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import hashlib
+from dataclasses import dataclass, field
+from typing import Iterable, List
+
+from spare.protocols.harvester_protocol import Plot
+from spare.types.blockchain_format.sized_bytes import bytes32
+from spare.util.ints import uint16
+
+# The plots of a harvester are spread over this many buckets by the hash of
+# their filename. A bucket's hash is the XOR of the digests of its plots, so it
+# can be updated as plots are added and removed. During an initial sync the
+# harvester sends the bucket hashes first, and then only the plots of the
+# buckets whose hash differs from the farmer's.
+PLOT_SET_SUMMARY_BUCKETS = 1024
+
+
+def plot_bucket(filename: str) -> int:
+    return int.from_bytes(hashlib.sha256(filename.encode()).digest()[:4], "big") % PLOT_SET_SUMMARY_BUCKETS
+
+
+def plot_digest(plot: Plot) -> int:
+    # The plot ID determines everything else in the Plot, except for the file
+    # details, so those (and the filename) are all there is to hash
+    digest = hashlib.sha256(
+        b"".join(
+            [
+                plot.filename.encode(),
+                b"\0",
+                plot.plot_id,
+                plot.file_size.to_bytes(8, "big"),
+                plot.time_modified.to_bytes(8, "big"),
+            ]
+        )
+    ).digest()
+    return int.from_bytes(digest, "big")
+
+
+@dataclass
+class PlotSetSummary:
+    bucket_hashes: List[int] = field(default_factory=lambda: [0] * PLOT_SET_SUMMARY_BUCKETS)
+
+    @classmethod
+    def from_plots(cls, plots: Iterable[Plot]) -> PlotSetSummary:
+        summary = cls()
+        for plot in plots:
+            summary.add(plot)
+        return summary
+
+    def add(self, plot: Plot) -> None:
+        self.bucket_hashes[plot_bucket(plot.filename)] ^= plot_digest(plot)
+
+    def remove(self, plot: Plot) -> None:
+        # XOR is its own inverse
+        self.add(plot)
+
+    def to_bytes_list(self) -> List[bytes32]:
+        return [bytes32(bucket_hash.to_bytes(32, "big")) for bucket_hash in self.bucket_hashes]
+
+    def differing_buckets(self, bucket_hashes: List[bytes32]) -> List[uint16]:
+        if len(bucket_hashes) != len(self.bucket_hashes):
+            raise ValueError(f"Invalid number of buckets {len(bucket_hashes)}, expected {len(self.bucket_hashes)}")
+        return [
+            uint16(bucket)
+            for bucket, (ours, theirs) in enumerate(zip(self.bucket_hashes, bucket_hashes))
+            if ours != int.from_bytes(theirs, "big")
+        ]
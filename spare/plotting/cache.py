@@ -1,12 +1,16 @@
 from __future__ import annotations
 
 import logging
+import os
+import struct
+import threading
 import time
 import traceback
+import zlib
 from dataclasses import dataclass, field
 from math import ceil
 from pathlib import Path
-from typing import Dict, ItemsView, KeysView, List, Optional, Tuple, ValuesView
+from typing import BinaryIO, Dict, Iterator, KeysView, List, Optional, Set, Tuple
 
 from blspy import G1Element
 from chiapos import DiskProver
@@ -14,14 +18,49 @@ from chiapos import DiskProver
 from spare.plotting.util import parse_plot_info
 from spare.types.blockchain_format.proof_of_space import generate_plot_public_key
 from spare.types.blockchain_format.sized_bytes import bytes32
-from spare.util.ints import uint16, uint64
+from spare.util.ints import uint64
 from spare.util.misc import VersionedBlob
 from spare.util.streamable import Streamable, streamable
 from spare.wallet.derive_keys import master_sk_to_local_sk
 
 log = logging.getLogger(__name__)
 
-CURRENT_VERSION: int = 1
+# The cache file is a log of records, which are appended when entries are added
+# or removed, and which is compacted once it holds more garbage than live data:
+#
+#   file header (see _FILE_HEADER)
+#   records: record header (see _RECORD_HEADER), path (utf-8), data
+#
+# The data of a put record is a serialized DiskCacheEntry, a remove record has
+# none. A last use record has no data either, it updates the last use of the
+# entry put before it. Only the record headers and paths are read on load, the data of an
+# entry is read and deserialized when the entry is first looked up. A record
+# with a broken header ends the log, the file is truncated there. An entry
+# with broken data is dropped when it's looked up.
+#
+# Version 1 was a VersionedBlob holding CacheDataV1, it's converted on the
+# first save after it's loaded.
+
+CACHE_MAGIC = b"SPAREPMC"
+LEGACY_VERSION: int = 1
+CURRENT_VERSION: int = 2
+
+# magic, version
+_FILE_HEADER = struct.Struct("<8sH")
+# crc32 of the rest of the header and the path, crc32 of the data, kind, last use, path size, data size
+_RECORD_HEADER = struct.Struct("<IIBQHI")
+
+_RECORD_PUT = 1
+_RECORD_REMOVE = 2
+_RECORD_LAST_USE = 3
+
+# Bumping the last use of an entry only gets it written to the cache file once
+# it moved by this much, so that the refresh (which bumps every plot it finds)
+# doesn't append to the file every time
+LAST_USE_SAVE_INTERVAL = 24 * 60 * 60
+
+# The log is only compacted if there is at least this much garbage in it
+COMPACTION_MIN_GARBAGE_BYTES = 16 * 1024 * 1024
 
 
 @streamable
@@ -74,6 +113,27 @@ class CacheEntry:
 
         return cls(prover, farmer_public_key, pool_public_key, pool_contract_puzzle_hash, plot_public_key, time.time())
 
+    @classmethod
+    def from_disk_cache_entry(cls, disk_cache_entry: DiskCacheEntry, last_use: float) -> "CacheEntry":
+        return cls(
+            DiskProver.from_bytes(disk_cache_entry.prover_data),
+            disk_cache_entry.farmer_public_key,
+            disk_cache_entry.pool_public_key,
+            disk_cache_entry.pool_contract_puzzle_hash,
+            disk_cache_entry.plot_public_key,
+            last_use,
+        )
+
+    def to_disk_cache_entry(self) -> DiskCacheEntry:
+        return DiskCacheEntry(
+            bytes(self.prover),
+            self.farmer_public_key,
+            self.pool_public_key,
+            self.pool_contract_puzzle_hash,
+            self.plot_public_key,
+            uint64(int(self.last_use)),
+        )
+
     def bump_last_use(self) -> None:
         self.last_use = time.time()
 
@@ -81,11 +141,81 @@ class CacheEntry:
         return time.time() - self.last_use > expiry_seconds
 
 
+@dataclass
+class StoredEntry:
+    """
+    A cache entry, and where its data is in the cache file
+    """
+
+    stored_last_use: float
+    # the offset, size and crc32 of the data in the cache file, offset is None if it's not written yet
+    offset: Optional[int] = None
+    size: int = 0
+    crc: int = 0
+    # None until the entry is first looked up
+    entry: Optional[CacheEntry] = None
+    # the last use in the cache file
+    saved_last_use: float = 0
+
+    def __post_init__(self) -> None:
+        if self.offset is not None:
+            self.saved_last_use = self.stored_last_use
+
+    @property
+    def last_use(self) -> float:
+        return self.entry.last_use if self.entry is not None else self.stored_last_use
+
+    def bump_last_use(self) -> None:
+        if self.entry is not None:
+            self.entry.bump_last_use()
+        else:
+            self.stored_last_use = time.time()
+
+    def expired(self, expiry_seconds: int) -> bool:
+        return time.time() - self.last_use > expiry_seconds
+
+    def record_size(self, path_size: int) -> int:
+        return _RECORD_HEADER.size + path_size + self.size
+
+
+def _record_header(kind: int, last_use: float, path: bytes, data_size: int, data_crc: int) -> bytes:
+    header = _RECORD_HEADER.pack(0, data_crc, kind, int(last_use), len(path), data_size)
+    header_crc = zlib.crc32(path, zlib.crc32(header[4:]))
+    return struct.pack("<I", header_crc) + header[4:] + path
+
+
+def _is_suspicious(prover: DiskProver, prover_size: int, estimated_c2_sizes: Dict[int, int]) -> bool:
+    # TODO, drop the below entry dropping after few versions or whenever we force a cache recreation.
+    #       it's here to filter invalid cache entries coming from bladebit RAM plotting.
+    #       Related: - https://github.com/Spare-Network/spare-blockchain/issues/13084
+    #                - https://github.com/Spare-Network/chiapos/pull/337
+    k = prover.get_size()
+    if k not in estimated_c2_sizes:
+        estimated_c2_sizes[k] = ceil(2**k / 100_000_000) * ceil(k / 8)
+    memo_size = len(prover.get_memo())
+    # Estimated C2 size + memo size + 2000 (static data + path)
+    # static data: version(2) + table pointers (<=96) + id(32) + k(1) => ~130
+    # path: up to ~1870, all above will lead to false positive.
+    # See https://github.com/Spare-Network/chiapos/blob/3ee062b86315823dd775453ad320b8be892c7df3/src/prover_disk.hpp#L282-L287  # noqa: E501
+    return prover_size > (estimated_c2_sizes[k] + memo_size + 2000)
+
+
 @dataclass
 class Cache:
     _path: Path
     _changed: bool = False
-    _data: Dict[Path, CacheEntry] = field(default_factory=dict)
+    _data: Dict[Path, StoredEntry] = field(default_factory=dict)
+    # entries which have to be written, removed entries which are still in the cache file, and
+    # entries whose last use has to be written
+    _unsaved: Set[Path] = field(default_factory=set)
+    _removed: Set[Path] = field(default_factory=set)
+    _used: Set[Path] = field(default_factory=set)
+    _file: Optional[BinaryIO] = None
+    _file_size: int = 0
+    _live_bytes: int = 0
+    _needs_compaction: bool = False
+    _estimated_c2_sizes: Dict[int, int] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock)
     expiry_seconds: int = 7 * 24 * 60 * 60  # Keep the cache entries alive for 7 days after its last access
 
     def __post_init__(self) -> None:
@@ -95,99 +225,302 @@ class Cache:
         return len(self._data)
 
     def update(self, path: Path, entry: CacheEntry) -> None:
-        self._data[path] = entry
-        self._changed = True
+        with self._lock:
+            self._drop(path)
+            self._data[path] = StoredEntry(entry.last_use, entry=entry)
+            self._unsaved.add(path)
+            self._changed = True
 
     def remove(self, cache_keys: List[Path]) -> None:
-        for key in cache_keys:
-            if key in self._data:
-                del self._data[key]
-                self._changed = True
+        with self._lock:
+            for key in cache_keys:
+                if key in self._data:
+                    self._drop(key)
+                    self._changed = True
+
+    def _drop(self, path: Path) -> None:
+        stored = self._data.pop(path, None)
+        self._unsaved.discard(path)
+        self._used.discard(path)
+        if stored is not None and stored.offset is not None:
+            self._live_bytes -= stored.record_size(len(str(path).encode()))
+            self._removed.add(path)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
 
     def save(self) -> None:
         try:
-            disk_cache_entries: Dict[str, DiskCacheEntry] = {
-                str(path): DiskCacheEntry(
-                    bytes(cache_entry.prover),
-                    cache_entry.farmer_public_key,
-                    cache_entry.pool_public_key,
-                    cache_entry.pool_contract_puzzle_hash,
-                    cache_entry.plot_public_key,
-                    uint64(int(cache_entry.last_use)),
-                )
-                for path, cache_entry in self.items()
-            }
-            cache_data: CacheDataV1 = CacheDataV1(
-                [(plot_id, cache_entry) for plot_id, cache_entry in disk_cache_entries.items()]
-            )
-            disk_cache: VersionedBlob = VersionedBlob(uint16(CURRENT_VERSION), bytes(cache_data))
-            serialized: bytes = bytes(disk_cache)
-            self._path.write_bytes(serialized)
-            self._changed = False
-            log.info(f"Saved {len(serialized)} bytes of cached data")
+            with self._lock:
+                garbage = self._file_size - self._live_bytes
+                if (
+                    self._file is None
+                    or self._needs_compaction
+                    or (garbage > COMPACTION_MIN_GARBAGE_BYTES and garbage > self._live_bytes)
+                ):
+                    self._compact()
+                else:
+                    self._append()
+                self._unsaved.clear()
+                self._removed.clear()
+                self._used.clear()
+                self._changed = False
         except Exception as e:
             log.error(f"Failed to save cache: {e}, {traceback.format_exc()}")
 
+    def _append(self) -> None:
+        assert self._file is not None
+        offset = self._file_size
+        records: List[bytes] = []
+        for path in self._removed:
+            record = _record_header(_RECORD_REMOVE, 0, str(path).encode(), 0, 0)
+            records.append(record)
+            offset += len(record)
+        used: List[StoredEntry] = []
+        for path in self._used - self._unsaved:
+            stored = self._data[path]
+            if stored.offset is None:
+                continue
+            record = _record_header(_RECORD_LAST_USE, stored.last_use, str(path).encode(), 0, 0)
+            records.append(record)
+            used.append(stored)
+            offset += len(record)
+        new_locations: List[Tuple[StoredEntry, int, int, int]] = []
+        for path in self._unsaved:
+            stored = self._data[path]
+            assert stored.entry is not None
+            data = bytes(stored.entry.to_disk_cache_entry())
+            crc = zlib.crc32(data)
+            record = _record_header(_RECORD_PUT, stored.last_use, str(path).encode(), len(data), crc)
+            records.extend([record, data])
+            new_locations.append((stored, offset + len(record), len(data), crc))
+            offset += len(record) + len(data)
+            self._live_bytes += len(record) + len(data)
+        self._file.seek(self._file_size)
+        self._file.write(b"".join(records))
+        self._file.flush()
+        for stored in used:
+            stored.saved_last_use = stored.last_use
+        for stored, data_offset, size, crc in new_locations:
+            stored.offset, stored.size, stored.crc = data_offset, size, crc
+            stored.saved_last_use = stored.last_use
+        log.info(f"Appended {offset - self._file_size} bytes of cached data")
+        self._file_size = offset
+
+    def _compact(self) -> None:
+        """
+        Writes a new cache file with only the live entries, and replaces the current one with it
+        """
+        temp_path = self._path.with_suffix(".tmp")
+        new_locations: List[Tuple[StoredEntry, int, int, int]] = []
+        with open(temp_path, "wb") as f:
+            f.write(_FILE_HEADER.pack(CACHE_MAGIC, CURRENT_VERSION))
+            offset = _FILE_HEADER.size
+            for path, stored in self._data.items():
+                if stored.offset is not None and path not in self._unsaved:
+                    assert self._file is not None
+                    self._file.seek(stored.offset)
+                    data = self._file.read(stored.size)
+                    crc = stored.crc
+                else:
+                    assert stored.entry is not None
+                    data = bytes(stored.entry.to_disk_cache_entry())
+                    crc = zlib.crc32(data)
+                record = _record_header(_RECORD_PUT, stored.last_use, str(path).encode(), len(data), crc)
+                f.write(record)
+                f.write(data)
+                new_locations.append((stored, offset + len(record), len(data), crc))
+                offset += len(record) + len(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        os.replace(temp_path, self._path)
+        self._file = open(self._path, "r+b")
+        for stored, data_offset, size, crc in new_locations:
+            stored.offset, stored.size, stored.crc = data_offset, size, crc
+            stored.saved_last_use = stored.last_use
+        self._file_size = offset
+        self._live_bytes = offset - _FILE_HEADER.size
+        self._needs_compaction = False
+        log.info(f"Saved {offset} bytes of cached data, {len(self._data)} entries")
+
     def load(self) -> None:
         try:
-            serialized = self._path.read_bytes()
-            log.info(f"Loaded {len(serialized)} bytes of cached data")
-            stored_cache: VersionedBlob = VersionedBlob.from_bytes(serialized)
-            if stored_cache.version == CURRENT_VERSION:
+            with self._lock:
                 start = time.time()
-                cache_data: CacheDataV1 = CacheDataV1.from_bytes(stored_cache.blob)
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
                 self._data = {}
-                estimated_c2_sizes: Dict[int, int] = {}
-                for path, cache_entry in cache_data.entries:
-                    new_entry = CacheEntry(
-                        DiskProver.from_bytes(cache_entry.prover_data),
-                        cache_entry.farmer_public_key,
-                        cache_entry.pool_public_key,
-                        cache_entry.pool_contract_puzzle_hash,
-                        cache_entry.plot_public_key,
-                        float(cache_entry.last_use),
-                    )
-                    # TODO, drop the below entry dropping after few versions or whenever we force a cache recreation.
-                    #       it's here to filter invalid cache entries coming from bladebit RAM plotting.
-                    #       Related: - https://github.com/Spare-Network/spare-blockchain/issues/13084
-                    #                - https://github.com/Spare-Network/chiapos/pull/337
-                    k = new_entry.prover.get_size()
-                    if k not in estimated_c2_sizes:
-                        estimated_c2_sizes[k] = ceil(2**k / 100_000_000) * ceil(k / 8)
-                    memo_size = len(new_entry.prover.get_memo())
-                    prover_size = len(cache_entry.prover_data)
-                    # Estimated C2 size + memo size + 2000 (static data + path)
-                    # static data: version(2) + table pointers (<=96) + id(32) + k(1) => ~130
-                    # path: up to ~1870, all above will lead to false positive.
-                    # See https://github.com/Spare-Network/chiapos/blob/3ee062b86315823dd775453ad320b8be892c7df3/src/prover_disk.hpp#L282-L287  # noqa: E501
-                    if prover_size > (estimated_c2_sizes[k] + memo_size + 2000):
-                        log.warning(
-                            "Suspicious cache entry dropped. Recommended: stop the harvester, remove "
-                            f"{self._path}, restart. Entry: size {prover_size}, path {path}"
-                        )
-                    else:
-                        self._data[Path(path)] = new_entry
-
-                log.info(f"Parsed {len(self._data)} cache entries in {time.time() - start:.2f}s")
-
-            else:
-                raise ValueError(f"Invalid cache version {stored_cache.version}. Expected version {CURRENT_VERSION}.")
+                self._unsaved = set()
+                self._removed = set()
+                self._used = set()
+                self._file_size = 0
+                self._live_bytes = 0
+                self._needs_compaction = False
+                self._changed = False
+                f = open(self._path, "r+b")
+                try:
+                    header = f.read(_FILE_HEADER.size)
+                    if len(header) < _FILE_HEADER.size or _FILE_HEADER.unpack(header)[0] != CACHE_MAGIC:
+                        f.close()
+                        self._load_legacy()
+                        return
+                    _, version = _FILE_HEADER.unpack(header)
+                    if version != CURRENT_VERSION:
+                        raise ValueError(f"Invalid cache version {version}. Expected version {CURRENT_VERSION}.")
+                    self._load_records(f)
+                except BaseException:
+                    f.close()
+                    raise
+                self._file = f
+                log.info(
+                    f"Loaded {len(self._data)} cache entries from {self._file_size} bytes in {time.time() - start:.2f}s"
+                )
         except FileNotFoundError:
             log.debug(f"Cache {self._path} not found")
         except Exception as e:
             log.error(f"Failed to load cache: {e}, {traceback.format_exc()}")
+            self._data = {}
+            self._needs_compaction = True
+
+    def _load_records(self, f: BinaryIO) -> None:
+        file_size = os.fstat(f.fileno()).st_size
+        offset = _FILE_HEADER.size
+        while offset < file_size:
+            header = f.read(_RECORD_HEADER.size)
+            if len(header) < _RECORD_HEADER.size:
+                break
+            header_crc, data_crc, kind, last_use, path_size, data_size = _RECORD_HEADER.unpack(header)
+            path_bytes = f.read(path_size)
+            data_offset = offset + _RECORD_HEADER.size + path_size
+            if (
+                len(path_bytes) < path_size
+                or zlib.crc32(path_bytes, zlib.crc32(header[4:])) != header_crc
+                or kind not in (_RECORD_PUT, _RECORD_REMOVE, _RECORD_LAST_USE)
+                or data_offset + data_size > file_size
+            ):
+                break
+            path = Path(path_bytes.decode())
+            if kind == _RECORD_LAST_USE:
+                stored = self._data.get(path)
+                if stored is not None:
+                    stored.stored_last_use = stored.saved_last_use = float(last_use)
+                offset = data_offset
+                continue
+            previous = self._data.pop(path, None)
+            if previous is not None:
+                self._live_bytes -= previous.record_size(path_size)
+            if kind == _RECORD_PUT:
+                self._data[path] = StoredEntry(float(last_use), data_offset, data_size, data_crc)
+                self._live_bytes += _RECORD_HEADER.size + path_size + data_size
+            f.seek(data_size, os.SEEK_CUR)
+            offset = data_offset + data_size
+        if offset < file_size:
+            log.warning(
+                f"Cache {self._path} is damaged at offset {offset}, dropping the {file_size - offset} bytes after it"
+            )
+            f.truncate(offset)
+        self._file_size = offset
+
+    def _load_legacy(self) -> None:
+        serialized = self._path.read_bytes()
+        log.info(f"Loaded {len(serialized)} bytes of cached data")
+        stored_cache: VersionedBlob = VersionedBlob.from_bytes(serialized)
+        if stored_cache.version != LEGACY_VERSION:
+            raise ValueError(f"Invalid cache version {stored_cache.version}. Expected version {LEGACY_VERSION}.")
+        start = time.time()
+        cache_data: CacheDataV1 = CacheDataV1.from_bytes(stored_cache.blob)
+        for path, cache_entry in cache_data.entries:
+            new_entry = CacheEntry.from_disk_cache_entry(cache_entry, float(cache_entry.last_use))
+            if _is_suspicious(new_entry.prover, len(cache_entry.prover_data), self._estimated_c2_sizes):
+                log.warning(
+                    "Suspicious cache entry dropped. Recommended: stop the harvester, remove "
+                    f"{self._path}, restart. Entry: size {len(cache_entry.prover_data)}, path {path}"
+                )
+            else:
+                self._data[Path(path)] = StoredEntry(new_entry.last_use, entry=new_entry)
+                self._unsaved.add(Path(path))
+        # Written in the current format on the next save
+        self._needs_compaction = True
+        self._changed = True
+        log.info(f"Parsed {len(self._data)} version {LEGACY_VERSION} cache entries in {time.time() - start:.2f}s")
+
+    def _deserialize(self, path: Path, stored: StoredEntry, data: bytes) -> Optional[CacheEntry]:
+        try:
+            if len(data) != stored.size or zlib.crc32(data) != stored.crc:
+                raise ValueError("checksum mismatch")
+            disk_cache_entry = DiskCacheEntry.from_bytes(data)
+            entry = CacheEntry.from_disk_cache_entry(disk_cache_entry, stored.stored_last_use)
+        except Exception as e:
+            log.warning(f"Dropping damaged cache entry for {path}: {e}")
+            return None
+        if _is_suspicious(entry.prover, len(disk_cache_entry.prover_data), self._estimated_c2_sizes):
+            log.warning(
+                "Suspicious cache entry dropped. Recommended: stop the harvester, remove "
+                f"{self._path}, restart. Entry: size {len(disk_cache_entry.prover_data)}, path {path}"
+            )
+            return None
+        return entry
 
     def keys(self) -> KeysView[Path]:
         return self._data.keys()
 
-    def values(self) -> ValuesView[CacheEntry]:
-        return self._data.values()
+    def values(self) -> Iterator[CacheEntry]:
+        """
+        Deserializes all entries, use `keys`, `last_use` and `bump_last_use` to avoid that
+        """
+        for _, entry in self.items():
+            yield entry
 
-    def items(self) -> ItemsView[Path, CacheEntry]:
-        return self._data.items()
+    def items(self) -> Iterator[Tuple[Path, CacheEntry]]:
+        for path in list(self._data.keys()):
+            entry = self.get(path)
+            if entry is not None:
+                yield path, entry
 
     def get(self, path: Path) -> Optional[CacheEntry]:
-        return self._data.get(path)
+        with self._lock:
+            stored = self._data.get(path)
+            if stored is None or stored.entry is not None:
+                return None if stored is None else stored.entry
+            assert self._file is not None and stored.offset is not None
+            self._file.seek(stored.offset)
+            data = self._file.read(stored.size)
+        # Deserialize outside of the lock, so entries can be loaded from several threads at a time
+        entry = self._deserialize(path, stored, data)
+        with self._lock:
+            if self._data.get(path) is not stored:
+                return entry
+            if entry is None:
+                # Broken entries are removed, the plot is opened again
+                self._drop(path)
+                self._changed = True
+            elif stored.entry is None:
+                stored.entry = entry
+            return stored.entry
+
+    def last_use(self, path: Path) -> Optional[float]:
+        stored = self._data.get(path)
+        return stored.last_use if stored is not None else None
+
+    def bump_last_use(self, path: Path) -> None:
+        with self._lock:
+            stored = self._data.get(path)
+            if stored is not None:
+                stored.bump_last_use()
+                if stored.last_use - stored.saved_last_use > LAST_USE_SAVE_INTERVAL:
+                    self._used.add(path)
+                    self._changed = True
+
+    def expired(self, path: Path) -> bool:
+        stored = self._data.get(path)
+        return stored is not None and stored.expired(self.expiry_seconds)
 
     def changed(self) -> bool:
         return self._changed
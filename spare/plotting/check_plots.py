@@ -1,16 +1,20 @@
 from __future__ import annotations
 
+import json
 import logging
 from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
 from pathlib import Path
-from time import sleep, time
-from typing import List, Optional
+from time import monotonic, sleep
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 from blspy import G1Element
 from chiapos import Verifier
 
 from spare.plotting.manager import PlotManager
 from spare.plotting.util import (
+    PlotInfo,
     PlotRefreshEvents,
     PlotRefreshResult,
     PlotsRefreshParameter,
@@ -32,6 +36,247 @@ def plot_refresh_callback(event: PlotRefreshEvents, refresh_result: PlotRefreshR
     log.info(f"event: {event.name}, loaded {len(refresh_result.loaded)} plots, {refresh_result.remaining} remaining")
 
 
+@dataclass
+class PlotCheckResult:
+    filename: str
+    size: int
+    file_size: int
+    challenges: int = 0
+    proofs: int = 0
+    errors: List[str] = field(default_factory=list)
+    max_quality_ms: int = 0
+    max_proof_ms: int = 0
+    # "good" or "bad" if the remaining challenges were skipped
+    early_exit: Optional[str] = None
+
+    def is_good(self) -> bool:
+        return self.proofs > 0 and len(self.errors) == 0
+
+    def to_json_dict(self) -> Dict[str, Any]:
+        return {
+            "filename": self.filename,
+            "size": self.size,
+            "file_size": self.file_size,
+            "challenges": self.challenges,
+            "proofs": self.proofs,
+            "errors": self.errors,
+            "max_quality_ms": self.max_quality_ms,
+            "max_proof_ms": self.max_proof_ms,
+            "early_exit": self.early_exit,
+            "good": self.is_good(),
+        }
+
+    @classmethod
+    def from_json_dict(cls, json_dict: Dict[str, Any]) -> PlotCheckResult:
+        return cls(
+            json_dict["filename"],
+            json_dict["size"],
+            json_dict["file_size"],
+            json_dict["challenges"],
+            json_dict["proofs"],
+            json_dict["errors"],
+            json_dict["max_quality_ms"],
+            json_dict["max_proof_ms"],
+            json_dict["early_exit"],
+        )
+
+
+def check_plot(
+    plot_path: Path,
+    plot_info: PlotInfo,
+    num_start: int,
+    num_end: int,
+    parallel_read: bool,
+    early_exit_challenges: Optional[int],
+    log_lookups: bool = False,
+) -> PlotCheckResult:
+    """
+    Runs the challenges `num_start` to `num_end` against one plot. The first error ends the check. With
+    `early_exit_challenges`, the remaining challenges are skipped once that many were evaluated and the plot is clearly
+    fine, with at least half as many proofs as challenges, or clearly broken, without any proofs. With `log_lookups`,
+    the time each quality and proof lookup took is logged.
+    """
+    pr = plot_info.prover
+    result = PlotCheckResult(str(plot_path), pr.get_size(), plot_info.file_size)
+    v = Verifier()
+    for i in range(num_start, num_end):
+        challenge = std_hash(i.to_bytes(32, "big"))
+        result.challenges += 1
+        # Some plot errors cause get_qualities_for_challenge to throw a RuntimeError, others cause get_full_proof or
+        # validate_proof to throw an AssertionError
+        try:
+            quality_start_time = monotonic()
+            qualities = pr.get_qualities_for_challenge(challenge)
+            quality_spent_time = int((monotonic() - quality_start_time) * 1000)
+            result.max_quality_ms = max(result.max_quality_ms, quality_spent_time)
+            if log_lookups and len(qualities) > 0:
+                if quality_spent_time > 5000:
+                    log.warning(
+                        f"\tLooking up qualities took: {quality_spent_time} ms. This should be below 5 seconds "
+                        f"to minimize risk of losing rewards."
+                    )
+                else:
+                    log.info(f"\tLooking up qualities took: {quality_spent_time} ms.")
+            for index, quality_str in enumerate(qualities):
+                proof_start_time = monotonic()
+                proof = pr.get_full_proof(challenge, index, parallel_read)
+                proof_spent_time = int((monotonic() - proof_start_time) * 1000)
+                result.max_proof_ms = max(result.max_proof_ms, proof_spent_time)
+                if log_lookups:
+                    if proof_spent_time > 15000:
+                        log.warning(
+                            f"\tFinding proof took: {proof_spent_time} ms. This should be below 15 seconds "
+                            f"to minimize risk of losing rewards."
+                        )
+                    else:
+                        log.info(f"\tFinding proof took: {proof_spent_time} ms")
+                result.proofs += 1
+                ver_quality_str = v.validate_proof(pr.get_id(), pr.get_size(), challenge, proof)
+                assert quality_str == ver_quality_str
+        except Exception as e:
+            result.errors.append(f"{type(e)}: {e}")
+            break
+        if early_exit_challenges is not None and result.challenges >= early_exit_challenges:
+            if result.proofs == 0:
+                result.early_exit = "bad"
+                break
+            if result.proofs * 2 >= result.challenges:
+                result.early_exit = "good"
+                break
+    return result
+
+
+def load_checked_plots(output_path: Path) -> Dict[str, PlotCheckResult]:
+    """
+    Reads the results of a previous, possibly interrupted, run from its JSONL output
+    """
+    checked: Dict[str, PlotCheckResult] = {}
+    if not output_path.exists():
+        return checked
+    with open(output_path) as f:
+        for line in f:
+            if line.strip() == "":
+                continue
+            try:
+                result = PlotCheckResult.from_json_dict(json.loads(line))
+            except Exception:
+                # The last line can be incomplete if the previous run was killed while writing it
+                log.warning(f"Ignoring invalid line in {output_path}: {line.strip()}")
+                continue
+            checked[result.filename] = result
+    return checked
+
+
+def check_plots_parallel(
+    plot_manager: PlotManager,
+    num_start: int,
+    num_end: int,
+    parallel_read: bool,
+    workers_per_disk: int,
+    output_path: Optional[Path],
+    resume: bool,
+    early_exit_challenges: Optional[int],
+) -> Optional[Tuple[Counter[str], int, List[Path]]]:
+    """
+    Checks the plots with `workers_per_disk` threads for each disk, and appends each result to the JSONL file
+    `output_path` as soon as the plot is done. With `resume`, the plots already in that file are skipped.
+    """
+    challenges = num_end - num_start
+    total_good_plots: Counter[str] = Counter()
+    total_size = 0
+    bad_plots_list: List[Path] = []
+
+    def add_result(result: PlotCheckResult) -> None:
+        nonlocal total_size
+        if result.is_good():
+            total_good_plots[result.size] += 1
+            total_size += result.file_size
+        else:
+            bad_plots_list.append(Path(result.filename))
+
+    checked: Dict[str, PlotCheckResult] = {}
+    if output_path is not None and resume:
+        checked = load_checked_plots(output_path)
+        for result in checked.values():
+            add_result(result)
+        log.info(f"Resuming, {len(checked)} plots were already checked")
+
+    with plot_manager:
+        remaining: Dict[int, List[Tuple[Path, PlotInfo]]] = {}
+        for plot_path, plot_info in plot_manager.plots.items():
+            if str(plot_path) not in checked:
+                remaining.setdefault(plot_info.device, []).append((plot_path, plot_info))
+        total = sum(len(plots) for plots in remaining.values())
+        log.info(
+            f"Testing {total} plots on {len(remaining)} disks with {challenges} challenges each, "
+            f"{workers_per_disk} workers per disk"
+        )
+        executors = [
+            ThreadPoolExecutor(max_workers=workers_per_disk, thread_name_prefix=f"check-disk-{device}-")
+            for device in remaining.keys()
+        ]
+        pending: Set[Future[PlotCheckResult]] = set()
+        for executor, plots in zip(executors, remaining.values()):
+            for plot_path, plot_info in plots:
+                pending.add(
+                    executor.submit(
+                        check_plot, plot_path, plot_info, num_start, num_end, parallel_read, early_exit_challenges
+                    )
+                )
+        output = None
+        if output_path is not None:
+            incomplete_line = False
+            if resume and output_path.exists() and output_path.stat().st_size > 0:
+                with open(output_path, "rb") as f:
+                    f.seek(-1, 2)
+                    incomplete_line = f.read(1) != b"\n"
+            output = open(output_path, "a" if resume else "w")
+            if incomplete_line:
+                # Don't continue on the incomplete last line of a killed run
+                output.write("\n")
+        done_count = 0
+        start_time = monotonic()
+        last_progress_time = start_time
+        try:
+            while len(pending) > 0:
+                done, pending = wait(pending, timeout=10, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    done_count += 1
+                    add_result(result)
+                    if output is not None:
+                        output.write(json.dumps(result.to_json_dict()) + "\n")
+                    log_message = (
+                        f"{result.filename} k={result.size}: proofs {result.proofs} / {result.challenges}, "
+                        f"max quality lookup {result.max_quality_ms} ms, max proof lookup {result.max_proof_ms} ms"
+                    )
+                    if result.is_good():
+                        log.info(log_message)
+                    else:
+                        log.error(f"{log_message}, {'; '.join(result.errors) if result.errors else 'no proofs'}")
+                if output is not None:
+                    output.flush()
+                now = monotonic()
+                if now - last_progress_time >= 30 and done_count > 0:
+                    last_progress_time = now
+                    rate = done_count / (now - start_time)
+                    log.info(
+                        f"Checked {done_count} / {total} plots, {len(bad_plots_list)} bad, {rate:.2f} plots/s, "
+                        f"about {int((total - done_count) / rate)} s remaining"
+                    )
+        except KeyboardInterrupt:
+            log.warning("Interrupted, closing")
+            for future in pending:
+                future.cancel()
+            return None
+        finally:
+            for executor in executors:
+                executor.shutdown(wait=True)
+            if output is not None:
+                output.close()
+    return total_good_plots, total_size, bad_plots_list
+
+
 def check_plots(
     root_path: Path,
     num: Optional[int],
@@ -39,6 +284,10 @@ def check_plots(
     grep_string: str,
     list_duplicates: bool,
     debug_show_memo: bool,
+    workers_per_disk: Optional[int] = None,
+    output_path: Optional[Path] = None,
+    resume: bool = False,
+    early_exit_challenges: Optional[int] = None,
 ) -> None:
     config = load_config(root_path, "config.yaml")
     address_prefix = config["network_overrides"]["config"][config["selected_network"]]["address_prefix"]
@@ -85,7 +334,6 @@ def check_plots(
 
     parallel_read: bool = config["harvester"].get("parallel_read", True)
 
-    v = Verifier()
     log.info(f"Loading plots in config.yaml using plot_manager loading code (parallel read: {parallel_read})\n")
     # Prompts interactively if the keyring is protected by a master passphrase. To use the daemon
     # for keychain access, KeychainProxy/connect_to_keychain should be used instead of Keychain.
@@ -101,87 +349,67 @@ def check_plots(
 
     plot_manager.stop_refreshing()
 
-    if plot_manager.plot_count() > 0:
-        log.info("")
-        log.info("")
-        log.info(f"Starting to test each plot with {num} challenges each\n")
     total_good_plots: Counter[str] = Counter()
     total_size = 0
     bad_plots_list: List[Path] = []
 
-    with plot_manager:
-        for plot_path, plot_info in plot_manager.plots.items():
-            pr = plot_info.prover
-            log.info(f"Testing plot {plot_path} k={pr.get_size()}")
-            if plot_info.pool_public_key is not None:
-                log.info(f"\t{'Pool public key:':<23} {plot_info.pool_public_key}")
-            if plot_info.pool_contract_puzzle_hash is not None:
-                pca: str = encode_puzzle_hash(plot_info.pool_contract_puzzle_hash, address_prefix)
-                log.info(f"\t{'Pool contract address:':<23} {pca}")
-
-            # Look up local_sk from plot to save locked memory
-            (
-                pool_public_key_or_puzzle_hash,
-                farmer_public_key,
-                local_master_sk,
-            ) = parse_plot_info(pr.get_memo())
-            local_sk = master_sk_to_local_sk(local_master_sk)
-            log.info(f"\t{'Farmer public key:' :<23} {farmer_public_key}")
-            log.info(f"\t{'Local sk:' :<23} {local_sk}")
-            total_proofs = 0
-            caught_exception: bool = False
-            for i in range(num_start, num_end):
-                challenge = std_hash(i.to_bytes(32, "big"))
-                # Some plot errors cause get_qualities_for_challenge to throw a RuntimeError
+    if workers_per_disk is not None or output_path is not None or early_exit_challenges is not None:
+        result = check_plots_parallel(
+            plot_manager,
+            num_start,
+            num_end,
+            parallel_read,
+            1 if workers_per_disk is None else workers_per_disk,
+            output_path,
+            resume,
+            early_exit_challenges,
+        )
+        if result is None:
+            return None
+        total_good_plots, total_size, bad_plots_list = result
+    else:
+        if plot_manager.plot_count() > 0:
+            log.info("")
+            log.info("")
+            log.info(f"Starting to test each plot with {num} challenges each\n")
+
+        with plot_manager:
+            for plot_path, plot_info in plot_manager.plots.items():
+                pr = plot_info.prover
+                log.info(f"Testing plot {plot_path} k={pr.get_size()}")
+                if plot_info.pool_public_key is not None:
+                    log.info(f"\t{'Pool public key:':<23} {plot_info.pool_public_key}")
+                if plot_info.pool_contract_puzzle_hash is not None:
+                    pca: str = encode_puzzle_hash(plot_info.pool_contract_puzzle_hash, address_prefix)
+                    log.info(f"\t{'Pool contract address:':<23} {pca}")
+
+                # Look up local_sk from plot to save locked memory
+                (
+                    pool_public_key_or_puzzle_hash,
+                    farmer_public_key,
+                    local_master_sk,
+                ) = parse_plot_info(pr.get_memo())
+                local_sk = master_sk_to_local_sk(local_master_sk)
+                log.info(f"\t{'Farmer public key:' :<23} {farmer_public_key}")
+                log.info(f"\t{'Local sk:' :<23} {local_sk}")
                 try:
-                    quality_start_time = int(round(time() * 1000))
-                    for index, quality_str in enumerate(pr.get_qualities_for_challenge(challenge)):
-                        quality_spent_time = int(round(time() * 1000)) - quality_start_time
-                        if quality_spent_time > 5000:
-                            log.warning(
-                                f"\tLooking up qualities took: {quality_spent_time} ms. This should be below 5 seconds "
-                                f"to minimize risk of losing rewards."
-                            )
-                        else:
-                            log.info(f"\tLooking up qualities took: {quality_spent_time} ms.")
-
-                        # Other plot errors cause get_full_proof or validate_proof to throw an AssertionError
-                        try:
-                            proof_start_time = int(round(time() * 1000))
-                            proof = pr.get_full_proof(challenge, index, parallel_read)
-                            proof_spent_time = int(round(time() * 1000)) - proof_start_time
-                            if proof_spent_time > 15000:
-                                log.warning(
-                                    f"\tFinding proof took: {proof_spent_time} ms. This should be below 15 seconds "
-                                    f"to minimize risk of losing rewards."
-                                )
-                            else:
-                                log.info(f"\tFinding proof took: {proof_spent_time} ms")
-                            total_proofs += 1
-                            ver_quality_str = v.validate_proof(pr.get_id(), pr.get_size(), challenge, proof)
-                            assert quality_str == ver_quality_str
-                        except AssertionError as e:
-                            log.error(f"{type(e)}: {e} error in proving/verifying for plot {plot_path}")
-                            caught_exception = True
-                        quality_start_time = int(round(time() * 1000))
+                    plot_result = check_plot(plot_path, plot_info, num_start, num_end, parallel_read, None, True)
                 except KeyboardInterrupt:
                     log.warning("Interrupted, closing")
                     return None
                 except SystemExit:
                     log.warning("System is shutting down.")
                     return None
-                except Exception as e:
-                    log.error(f"{type(e)}: {e} error in getting challenge qualities for plot {plot_path}")
-                    caught_exception = True
-                if caught_exception is True:
-                    break
-            if total_proofs > 0 and caught_exception is False:
-                log.info(f"\tProofs {total_proofs} / {challenges}, {round(total_proofs/float(challenges), 4)}")
-                total_good_plots[pr.get_size()] += 1
-                total_size += plot_path.stat().st_size
-            else:
-                log.error(f"\tProofs {total_proofs} / {challenges}, {round(total_proofs/float(challenges), 4)}")
-                bad_plots_list.append(plot_path)
+                for error in plot_result.errors:
+                    log.error(f"{error} error in checking plot {plot_path}")
+                total_proofs = plot_result.proofs
+                if plot_result.is_good():
+                    log.info(f"\tProofs {total_proofs} / {challenges}, {round(total_proofs/float(challenges), 4)}")
+                    total_good_plots[pr.get_size()] += 1
+                    total_size += plot_path.stat().st_size
+                else:
+                    log.error(f"\tProofs {total_proofs} / {challenges}, {round(total_proofs/float(challenges), 4)}")
+                    bad_plots_list.append(plot_path)
     log.info("")
     log.info("")
     log.info("Summary")
@@ -13,7 +13,16 @@ from chiapos import DiskProver
 
 from spare.consensus.pos_quality import UI_ACTUAL_SPACE_CONSTANT_FACTOR, _expected_plot_size
 from spare.plotting.cache import Cache, CacheEntry
-from spare.plotting.util import PlotInfo, PlotRefreshEvents, PlotRefreshResult, PlotsRefreshParameter, get_plot_filenames
+from spare.plotting.plot_id_table import PlotIdTable
+from spare.plotting.plot_scanner import PlotDirectoryScanner, PlotScanResult
+from spare.plotting.util import (
+    PlotInfo,
+    PlotRefreshEvents,
+    PlotRefreshResult,
+    PlotsRefreshParameter,
+    get_resolved_plot_directories,
+)
+from spare.util.config import load_config
 from spare.util.generator_tools import list_to_batches
 
 log = logging.getLogger(__name__)
@@ -21,6 +30,9 @@ log = logging.getLogger(__name__)
 
 class PlotManager:
     plots: Dict[Path, PlotInfo]
+    # the IDs of the plots in plots, for applying the plot filter
+    plot_id_table: PlotIdTable
+    plot_scanner: PlotDirectoryScanner
     plot_filename_paths: Dict[str, Tuple[str, Set[str]]]
     plot_filename_paths_lock: threading.Lock
     failed_to_open_filenames: Dict[Path, int]
@@ -49,6 +61,8 @@ class PlotManager:
     ):
         self.root_path = root_path
         self.plots = {}
+        self.plot_id_table = PlotIdTable()
+        self.plot_scanner = PlotDirectoryScanner(refresh_parameter.scan_threads)
         self.plot_filename_paths = {}
         self.plot_filename_paths_lock = threading.Lock()
         self.failed_to_open_filenames = {}
@@ -77,6 +91,8 @@ class PlotManager:
         with self:
             self.last_refresh_time = time.time()
             self.plots.clear()
+            self.plot_id_table.clear()
+            self.plot_scanner.reset()
             self.plot_filename_paths.clear()
             self.failed_to_open_filenames.clear()
             self.no_key_filenames.clear()
@@ -122,6 +138,7 @@ class PlotManager:
         if self._refresh_thread is not None and self._refresh_thread.is_alive():
             self._refresh_thread.join()
             self._refresh_thread = None
+        self.cache.close()
 
     def trigger_refresh(self) -> None:
         log.debug("trigger_refresh")
@@ -136,14 +153,29 @@ class PlotManager:
                 if not self._refreshing_enabled:
                     return
 
-                plot_filenames: Dict[Path, List[Path]] = get_plot_filenames(self.root_path)
-                plot_directories: Set[Path] = set(plot_filenames.keys())
+                config = load_config(self.root_path, "config.yaml")
+                self.plot_scanner.max_workers = max(1, self.refresh_parameter.scan_threads)
+                scan_result: PlotScanResult = self.plot_scanner.scan(
+                    get_resolved_plot_directories(self.root_path, config),
+                    config["harvester"].get("recursive_plot_scan", False),
+                )
+                plot_directories: Set[Path] = set(scan_result.plot_filenames.keys())
                 plot_paths: Set[Path] = set()
-                for paths in plot_filenames.values():
+                for paths in scan_result.plot_filenames.values():
                     plot_paths.update(paths)
 
+                # Plots which changed on disk are dropped below, like the ones which are gone, and loaded again on
+                # the next refresh. The plot sync doesn't allow a plot to be removed and loaded in the same sync.
+                if len(scan_result.changed) > 0:
+                    self.log.info(f"refresh_plots: {len(scan_result.changed)} plot files changed on disk")
+                    self.cache.remove(list(scan_result.changed))
+                    plot_paths -= scan_result.changed
+
+                # Only the files which aren't loaded already need to be processed
+                paths_to_process: List[Path] = sorted(path for path in plot_paths if path not in self.plots)
+
                 total_result: PlotRefreshResult = PlotRefreshResult()
-                total_size = len(plot_paths)
+                total_size = len(paths_to_process)
 
                 self._refresh_callback(PlotRefreshEvents.started, PlotRefreshResult(remaining=total_size))
 
@@ -165,6 +197,7 @@ class PlotManager:
                         with self:
                             if loaded_plot in self.plots:
                                 del self.plots[loaded_plot]
+                                self.plot_id_table.remove(loaded_plot)
                         total_result.removed.append(loaded_plot)
                         # No need to check the duplicates here since we drop the whole entry
                         continue
@@ -180,7 +213,11 @@ class PlotManager:
                 for filename in filenames_to_remove:
                     del self.plot_filename_paths[filename]
 
-                for remaining, batch in list_to_batches(sorted(list(plot_paths)), self.refresh_parameter.batch_size):
+                if total_size == 0:
+                    # Still report an (empty) last batch, the plot sync expects one
+                    self._refresh_callback(PlotRefreshEvents.batch_processed, PlotRefreshResult())
+
+                for remaining, batch in list_to_batches(paths_to_process, self.refresh_parameter.batch_size):
                     batch_result: PlotRefreshResult = self.refresh_batch(batch, plot_directories)
                     if not self._refreshing_enabled:
                         self.log.debug("refresh_plots: Aborted")
@@ -207,11 +244,11 @@ class PlotManager:
                 # Cleanup unused cache
                 self.log.debug(f"_refresh_task: cached entries before cleanup: {len(self.cache)}")
                 remove_paths: List[Path] = []
-                for path, cache_entry in self.cache.items():
-                    if cache_entry.expired(Cache.expiry_seconds) and path not in self.plots:
+                for path in self.cache.keys():
+                    if self.cache.expired(path) and path not in self.plots:
                         remove_paths.append(path)
                     elif path in self.plots:
-                        cache_entry.bump_last_use()
+                        self.cache.bump_last_use(path)
                 self.cache.remove(remove_paths)
                 self.log.debug(f"_refresh_task: cached entries removed: {len(remove_paths)}")
 
@@ -326,6 +363,7 @@ class PlotManager:
                     cache_entry.plot_public_key,
                     stat_info.st_size,
                     stat_info.st_mtime,
+                    stat_info.st_dev,
                 )
 
                 cache_entry.bump_last_use()
@@ -351,6 +389,8 @@ class PlotManager:
                 if new_plot is not None:
                     plots_refreshed[Path(new_plot.prover.get_filename())] = new_plot
             self.plots.update(plots_refreshed)
+            for path, plot_info in plots_refreshed.items():
+                self.plot_id_table.add(path, plot_info.prover.get_id())
 
         result.duration = time.time() - start_time
 
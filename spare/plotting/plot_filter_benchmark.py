@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import random
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+from spare.consensus.default_constants import DEFAULT_CONSTANTS
+from spare.plotting.plot_id_table import PlotIdTable
+from spare.types.blockchain_format.proof_of_space import passes_plot_filter
+from spare.types.blockchain_format.sized_bytes import bytes32
+
+# Compares applying the plot filter one plot at a time, the way the harvester
+# used to, with the batched filter over a PlotIdTable, for increasing numbers
+# of plots.
+#
+# usage: python -m spare.plotting.plot_filter_benchmark [runs]
+
+PLOT_COUNTS = [1000, 10000, 100000, 1000000]
+
+
+def measure_per_plot(plot_ids: List[bytes32], challenge_hash: bytes32, sp_hash: bytes32, runs: int) -> float:
+    start = time.perf_counter()
+    for _ in range(runs):
+        [plot_id for plot_id in plot_ids if passes_plot_filter(DEFAULT_CONSTANTS, plot_id, challenge_hash, sp_hash)]
+    return (time.perf_counter() - start) / runs
+
+
+def measure_batched(table: PlotIdTable, challenge_hash: bytes32, sp_hash: bytes32, runs: int) -> float:
+    start = time.perf_counter()
+    for _ in range(runs):
+        table.passing_plot_filter(DEFAULT_CONSTANTS, challenge_hash, sp_hash)
+    return (time.perf_counter() - start) / runs
+
+
+def main() -> None:
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    rng = random.Random(1337)
+    challenge_hash = bytes32(rng.getrandbits(256).to_bytes(32, "big"))
+    sp_hash = bytes32(rng.getrandbits(256).to_bytes(32, "big"))
+
+    print(f"{'plots':>10}{'per plot (s)':>15}{'batched (s)':>15}{'speedup':>10}")
+    for count in PLOT_COUNTS:
+        plot_ids = [bytes32(rng.getrandbits(256).to_bytes(32, "big")) for _ in range(count)]
+        table = PlotIdTable()
+        for index, plot_id in enumerate(plot_ids):
+            table.add(Path(f"plot-{index}.plot"), plot_id)
+
+        per_plot = measure_per_plot(plot_ids, challenge_hash, sp_hash, runs)
+        batched = measure_batched(table, challenge_hash, sp_hash, runs)
+        print(f"{count:>10}{per_plot:>15.4f}{batched:>15.4f}{per_plot / batched:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
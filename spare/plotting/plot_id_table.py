@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, List
+
+from spare.consensus.constants import ConsensusConstants
+from spare.types.blockchain_format.proof_of_space import plot_filter_batch
+from spare.types.blockchain_format.sized_bytes import bytes32
+
+
+class PlotIdTable:
+    """
+    The IDs of the loaded plots, back to back in one buffer, so the plot filter
+    can be applied to all of them in a single pass. Kept in sync with
+    PlotManager.plots, under the plot manager lock.
+    """
+
+    _ids: bytearray
+    _paths: List[Path]
+    _index: Dict[Path, int]
+
+    def __init__(self) -> None:
+        self._ids = bytearray()
+        self._paths = []
+        self._index = {}
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    def add(self, path: Path, plot_id: bytes32) -> None:
+        index = self._index.get(path)
+        if index is not None:
+            self._ids[index * 32 : (index + 1) * 32] = plot_id
+            return
+        self._index[path] = len(self._paths)
+        self._paths.append(path)
+        self._ids += plot_id
+
+    def remove(self, path: Path) -> None:
+        index = self._index.pop(path, None)
+        if index is None:
+            return
+        # move the last entry into the gap
+        last = len(self._paths) - 1
+        if index != last:
+            last_path = self._paths[last]
+            self._paths[index] = last_path
+            self._index[last_path] = index
+            self._ids[index * 32 : (index + 1) * 32] = self._ids[last * 32 :]
+        self._paths.pop()
+        del self._ids[last * 32 :]
+
+    def clear(self) -> None:
+        self._ids.clear()
+        self._paths.clear()
+        self._index.clear()
+
+    def passing_plot_filter(
+        self, constants: ConsensusConstants, challenge_hash: bytes32, signage_point: bytes32
+    ) -> List[Path]:
+        """
+        Returns the paths of the plots that pass the plot filter
+        """
+        return [self._paths[i] for i in plot_filter_batch(constants, self._ids, challenge_hash, signage_point)]
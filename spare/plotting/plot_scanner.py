@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+log = logging.getLogger(__name__)
+
+# A directory listing is only reused if the directory's mtime is at least this
+# old when it's listed. Otherwise a file added within the mtime granularity of
+# the filesystem (which can be seconds on FAT and some network filesystems)
+# could leave the mtime unchanged, and the file would never be seen.
+RACY_MTIME_NANOSECONDS = 2 * 1000 * 1000 * 1000
+
+
+@dataclass(frozen=True)
+class FileStat:
+    size: int
+    mtime_ns: int
+    inode: int
+
+
+@dataclass(frozen=True)
+class DirectoryListing:
+    # (st_dev, st_ino, st_mtime_ns) of the directory when it was listed, or
+    # None if it has to be listed again on the next scan
+    stat: Optional[Tuple[int, int, int]]
+    plots: Dict[Path, FileStat]
+    subdirectories: List[Path]
+
+
+@dataclass
+class PlotScanResult:
+    # plot files by configured plot directory, like `get_plot_filenames`
+    plot_filenames: Dict[Path, List[Path]] = field(default_factory=dict)
+    # plot files which were there on the previous scan, but whose size, mtime
+    # or inode changed since
+    changed: Set[Path] = field(default_factory=set)
+    directories_listed: int = 0
+    directories_skipped: int = 0
+    duration: float = 0
+
+
+def list_directory(
+    directory: Path, previous: Optional[DirectoryListing], recursive: bool
+) -> Tuple[Optional[DirectoryListing], bool]:
+    """
+    Returns the listing of the plots (and, if recursive, the subdirectories)
+    in directory, and whether it had to be listed. If the directory didn't
+    change since the previous listing, that one is returned as is.
+    """
+    try:
+        dir_stat = os.stat(directory)
+    except FileNotFoundError:
+        log.warning(f"Directory: {directory} does not exist.")
+        return None, False
+    except OSError as e:
+        log.warning(f"Error checking if directory {directory} exists: {e}")
+        return None, False
+
+    stat_key = (dir_stat.st_dev, dir_stat.st_ino, dir_stat.st_mtime_ns)
+    if previous is not None and previous.stat == stat_key:
+        return previous, False
+
+    listed_at = time.time_ns()
+    plots: Dict[Path, FileStat] = {}
+    subdirectories: List[Path] = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.name.endswith(".plot") and not entry.name.startswith("._") and entry.is_file():
+                        file_stat = entry.stat()
+                        plots[directory / entry.name] = FileStat(
+                            file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino
+                        )
+                    elif recursive and entry.is_dir() and not entry.is_symlink():
+                        subdirectories.append(directory / entry.name)
+                except OSError as e:
+                    log.warning(f"Error reading {directory / entry.name}: {e}")
+    except OSError as e:
+        log.warning(f"Error reading directory {directory} {e}")
+        return None, True
+
+    if listed_at - dir_stat.st_mtime_ns < RACY_MTIME_NANOSECONDS:
+        stat_key = None
+    return DirectoryListing(stat_key, plots, subdirectories), True
+
+
+class PlotDirectoryScanner:
+    """
+    Finds the plot files in the plot directories. The listing of every
+    directory is kept, together with the directory's mtime, and directories
+    whose mtime didn't change since the previous scan are not listed again.
+    The directories which do have to be listed are listed in parallel, which
+    matters most on network filesystems where every listing is a round trip.
+    """
+
+    max_workers: int
+    _listings: Dict[Path, DirectoryListing]
+    _recursive: bool
+
+    def __init__(self, max_workers: int) -> None:
+        self.max_workers = max(1, max_workers)
+        self._listings = {}
+        self._recursive = False
+
+    def reset(self) -> None:
+        self._listings = {}
+
+    def scan(self, directories: List[Path], recursive: bool) -> PlotScanResult:
+        start_time = time.time()
+        if recursive != self._recursive:
+            self._listings = {}
+            self._recursive = recursive
+        result = PlotScanResult()
+        listings: Dict[Path, DirectoryListing] = {}
+        visited: Set[Path] = set()
+        pending: Dict[Future[Tuple[Optional[DirectoryListing], bool]], Path] = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="plot_scan") as executor:
+
+            def submit(directory: Path) -> None:
+                if directory not in visited:
+                    visited.add(directory)
+                    previous = self._listings.get(directory)
+                    pending[executor.submit(list_directory, directory, previous, recursive)] = directory
+
+            for directory in directories:
+                submit(directory)
+            while len(pending) > 0:
+                done, _ = wait(pending.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    directory = pending.pop(future)
+                    listing, listed = future.result()
+                    if listed:
+                        result.directories_listed += 1
+                    else:
+                        result.directories_skipped += 1
+                    if listing is None:
+                        continue
+                    previous = self._listings.get(directory)
+                    if listed and previous is not None:
+                        for path, file_stat in listing.plots.items():
+                            previous_stat = previous.plots.get(path)
+                            if previous_stat is not None and previous_stat != file_stat:
+                                result.changed.add(path)
+                    listings[directory] = listing
+                    for subdirectory in listing.subdirectories:
+                        submit(subdirectory)
+
+        # Directories which are gone, or not configured anymore, are dropped here
+        self._listings = listings
+
+        for directory in directories:
+            plot_files: List[Path] = []
+            stack = [directory]
+            collected: Set[Path] = set()
+            while len(stack) > 0:
+                current = stack.pop()
+                listing = listings.get(current)
+                if current in collected or listing is None:
+                    continue
+                collected.add(current)
+                plot_files.extend(listing.plots.keys())
+                stack.extend(listing.subdirectories)
+            result.plot_filenames[directory] = plot_files
+
+        result.duration = time.time() - start_time
+        log.debug(
+            f"scan: {sum(len(paths) for paths in result.plot_filenames.values())} files found in "
+            f"{len(directories)} directories, recursive: {recursive}, listed {result.directories_listed}, "
+            f"skipped {result.directories_skipped}, changed {len(result.changed)}, "
+            f"duration: {result.duration:.2f} seconds"
+        )
+        return result
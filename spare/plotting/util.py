@@ -25,6 +25,7 @@ class PlotsRefreshParameter(Streamable):
     retry_invalid_seconds: uint32 = uint32(1200)
     batch_size: uint32 = uint32(300)
     batch_sleep_milliseconds: uint32 = uint32(1)
+    scan_threads: uint32 = uint32(8)
 
 
 @dataclass
@@ -35,6 +36,8 @@ class PlotInfo:
     plot_public_key: G1Element
     file_size: int
     time_modified: float
+    # the st_dev of the plot file, to tell which plots are on the same disk
+    device: int = 0
 
 
 class PlotRefreshEvents(Enum):
@@ -90,17 +93,22 @@ def get_plot_directories(root_path: Path, config: Dict = None) -> List[str]:
     return config["harvester"]["plot_directories"] or []
 
 
+def get_resolved_plot_directories(root_path: Path, config: Dict = None) -> List[Path]:
+    directories: List[Path] = []
+    for directory_name in get_plot_directories(root_path, config):
+        try:
+            directories.append(Path(directory_name).resolve())
+        except (OSError, RuntimeError):
+            log.exception(f"Failed to resolve {directory_name}")
+    return directories
+
+
 def get_plot_filenames(root_path: Path) -> Dict[Path, List[Path]]:
     # Returns a map from directory to a list of all plots in the directory
     all_files: Dict[Path, List[Path]] = {}
     config = load_config(root_path, "config.yaml")
     recursive_scan: bool = config["harvester"].get("recursive_plot_scan", False)
-    for directory_name in get_plot_directories(root_path, config):
-        try:
-            directory = Path(directory_name).resolve()
-        except (OSError, RuntimeError):
-            log.exception(f"Failed to resolve {directory_name}")
-            continue
+    for directory in get_resolved_plot_directories(root_path, config):
         all_files[directory] = get_filenames(directory, recursive_scan)
     return all_files
 
@@ -7,7 +7,7 @@ from blspy import G1Element, G2Element
 
 from spare.types.blockchain_format.proof_of_space import ProofOfSpace
 from spare.types.blockchain_format.sized_bytes import bytes32
-from spare.util.ints import int16, uint8, uint32, uint64
+from spare.util.ints import int16, uint8, uint16, uint32, uint64
 from spare.util.streamable import Streamable, streamable
 
 """
@@ -174,3 +174,27 @@ class PlotSyncResponse(Streamable):
 
     def __str__(self) -> str:
         return f"PlotSyncResponse: identifier {self.identifier}, message_type {self.message_type}, error {self.error}"
+
+
+@streamable
+@dataclass(frozen=True)
+class PlotSyncSummary(Streamable):
+    identifier: PlotSyncIdentifier
+    bucket_hashes: List[bytes32]
+
+    def __str__(self) -> str:
+        return f"PlotSyncSummary: identifier {self.identifier}, buckets {len(self.bucket_hashes)}"
+
+
+@streamable
+@dataclass(frozen=True)
+class PlotSyncSummaryResponse(Streamable):
+    identifier: PlotSyncIdentifier
+    differing_buckets: List[uint16]
+    error: Optional[PlotSyncError]
+
+    def __str__(self) -> str:
+        return (
+            f"PlotSyncSummaryResponse: identifier {self.identifier}, "
+            f"differing_buckets {len(self.differing_buckets)}, error {self.error}"
+        )
@@ -14,6 +14,10 @@ from spare.util.streamable import Streamable, streamable
 
 POOL_PROTOCOL_VERSION = uint8(1)
 
+# Pools reject partials which reach them more than this many seconds after their signage point with TOO_LATE. This is
+# the reference pool's `partial_time_limit`.
+POOL_PARTIAL_TIME_LIMIT = 25
+
 
 class PoolErrorCode(Enum):
     REVERTED_SIGNAGE_POINT = 1
@@ -113,3 +113,5 @@ class ProtocolMessageTypes(Enum):
     respond_block_headers = 88
     request_fee_estimates = 89
     respond_fee_estimates = 90
+    plot_sync_summary = 93
+    plot_sync_summary_response = 94
@@ -30,6 +30,9 @@ class Capability(IntEnum):
     # a node can handle a None response and not wait the full timeout
     NONE_RESPONSE = 4
 
+    # the initial plot sync starts with a summary of the plot set, and only the differing plots are sent after it
+    PLOT_SYNC_SUMMARY = 5
+
 
 @streamable
 @dataclass(frozen=True)
@@ -47,5 +50,6 @@ capabilities = [
     (uint16(Capability.BASE.value), "1"),
     (uint16(Capability.BLOCK_HEADERS.value), "1"),
     (uint16(Capability.RATE_LIMITS_V2.value), "1"),
+    (uint16(Capability.PLOT_SYNC_SUMMARY.value), "1"),
     # (uint16(Capability.NONE_RESPONSE.value), "1"), # capability removed but functionality is still supported
 ]
@@ -1,12 +1,12 @@
 from __future__ import annotations
 
 import dataclasses
-import operator
-from typing import Any, Callable, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Sequence
 
 from typing_extensions import Protocol
 
 from spare.farmer.farmer import Farmer
+from spare.farmer.plot_index import HarvesterPlotIndex
 from spare.plot_sync.receiver import Receiver
 from spare.protocols.harvester_protocol import Plot
 from spare.rpc.rpc_server import Endpoint, EndpointResult
@@ -60,7 +60,7 @@ class PlotPathRequestData(Streamable):
     reverse: bool = False
 
 
-def paginated_plot_request(source: List[Any], request: PaginatedRequestData) -> Dict[str, object]:
+def paginated_plot_request(source: Sequence[Any], request: PaginatedRequestData) -> Dict[str, object]:
     paginator: Paginator = Paginator(source, request.page_size)
     return {
         "node_id": request.node_id.hex(),
@@ -94,6 +94,9 @@ class FarmerRpcApi:
             "/set_payout_instructions": self.set_payout_instructions,
             "/get_harvesters": self.get_harvesters,
             "/get_harvesters_summary": self.get_harvesters_summary,
+            "/get_plot_aggregates": self.get_plot_aggregates,
+            "/get_proof_timings": self.get_proof_timings,
+            "/get_pool_client_metrics": self.get_pool_client_metrics,
             "/get_harvester_plots_valid": self.get_harvester_plots_valid,
             "/get_harvester_plots_invalid": self.get_harvester_plots_invalid,
             "/get_harvester_plots_keys_missing": self.get_harvester_plots_keys_missing,
@@ -271,12 +274,7 @@ class FarmerRpcApi:
         return {}
 
     def get_pool_contract_puzzle_hash_plot_count(self, pool_contract_puzzle_hash: bytes32) -> int:
-        plot_count: int = 0
-        for receiver in self.service.plot_sync_receivers.values():
-            plot_count += sum(
-                plot.pool_contract_puzzle_hash == pool_contract_puzzle_hash for plot in receiver.plots().values()
-            )
-        return plot_count
+        return self.service.plot_index.total().pool_contracts.get(pool_contract_puzzle_hash, 0)
 
     async def get_pool_state(self, request: Dict[str, Any]) -> EndpointResult:
         pools_list = []
@@ -298,20 +296,33 @@ class FarmerRpcApi:
     async def get_harvesters_summary(self, _: Dict[str, object]) -> EndpointResult:
         return await self.service.get_harvesters(True)
 
+    async def get_plot_aggregates(self, _: Dict[str, object]) -> EndpointResult:
+        return self.service.get_plot_aggregates()
+
+    async def get_proof_timings(self, _: Dict[str, object]) -> EndpointResult:
+        return {"timings": self.service.get_proof_timings()}
+
+    async def get_pool_client_metrics(self, _: Dict[str, object]) -> EndpointResult:
+        return self.service.get_pool_client_metrics()
+
     async def get_harvester_plots_valid(self, request_dict: Dict[str, object]) -> EndpointResult:
-        # TODO: Consider having a extra List[PlotInfo] in Receiver to avoid rebuilding the list for each call
         request = PlotInfoRequestData.from_json_dict(request_dict)
-        plot_list = list(self.service.get_receiver(request.node_id).plots().values())
+        # Make sure the harvester is connected
+        self.service.get_receiver(request.node_id)
+        try:
+            harvester_index = self.service.plot_index.harvester(request.node_id)
+        except KeyError:
+            # No sync finished yet
+            harvester_index = HarvesterPlotIndex()
+        # Apply sort_key and reverse by using the sorted index
+        plot_list: Sequence[Plot] = harvester_index.sorted_plots(request.sort_key, request.reverse)
         # Apply filter
-        plot_list = [
-            plot for plot in plot_list if all(plot_matches_filter(plot, filter_item) for filter_item in request.filter)
-        ]
-        restricted_sort_keys: List[str] = ["pool_contract_puzzle_hash", "pool_public_key", "plot_public_key"]
-        # Apply sort_key and reverse if sort_key is not restricted
-        if request.sort_key in restricted_sort_keys:
-            raise KeyError(f"Can't sort by optional attributes: {restricted_sort_keys}")
-        # Sort by plot_id also by default since its unique
-        plot_list = sorted(plot_list, key=operator.attrgetter(request.sort_key, "plot_id"), reverse=request.reverse)
+        if len(request.filter) > 0:
+            plot_list = [
+                plot
+                for plot in plot_list
+                if all(plot_matches_filter(plot, filter_item) for filter_item in request.filter)
+            ]
         return paginated_plot_request(plot_list, request)
 
     def paginated_plot_path_request(
@@ -66,6 +66,15 @@ class FarmerRpcClient(RpcClient):
     async def get_harvesters_summary(self) -> Dict[str, object]:
         return await self.fetch("get_harvesters_summary", {})
 
+    async def get_plot_aggregates(self) -> Dict[str, Any]:
+        return await self.fetch("get_plot_aggregates", {})
+
+    async def get_proof_timings(self) -> Dict[str, Any]:
+        return (await self.fetch("get_proof_timings", {}))["timings"]
+
+    async def get_pool_client_metrics(self) -> Dict[str, Any]:
+        return await self.fetch("get_pool_client_metrics", {})
+
     async def get_harvester_plots_valid(self, request: PlotInfoRequestData) -> Dict[str, Any]:
         return await self.fetch("get_harvester_plots_valid", dataclass_to_json_dict(request))
 
@@ -63,12 +63,14 @@ class FullNodeRpcApi:
             "/get_coin_records_by_names": self.get_coin_records_by_names,
             "/get_coin_records_by_parent_ids": self.get_coin_records_by_parent_ids,
             "/get_coin_records_by_hint": self.get_coin_records_by_hint,
+            "/check_unspent_coin_index": self.check_unspent_coin_index,
             "/push_tx": self.push_tx,
             "/get_puzzle_and_solution": self.get_puzzle_and_solution,
             # Mempool
             "/get_all_mempool_tx_ids": self.get_all_mempool_tx_ids,
             "/get_all_mempool_items": self.get_all_mempool_items,
             "/get_mempool_item_by_tx_id": self.get_mempool_item_by_tx_id,
+            "/get_pre_validation_metrics": self.get_pre_validation_metrics,
             # Fee estimation
             "/get_fee_estimate": self.get_fee_estimate,
         }
@@ -723,6 +725,16 @@ class FullNodeRpcApi:
             "removals": [coin_record_dict_backwards_compat(cr.to_json_dict()) for cr in removals],
         }
 
+    async def check_unspent_coin_index(self, _: Dict[str, Any]) -> EndpointResult:
+        """
+        Compares the in-memory unspent coin index against the database, returns the names of the coins which differ.
+        """
+        if self.service.coin_store.unspent_index is None:
+            raise ValueError("The unspent coin index is not enabled")
+        async with self.service._blockchain_lock_low_priority:
+            mismatches: List[bytes32] = await self.service.coin_store.check_unspent_index()
+        return {"mismatches": [name.hex() for name in mismatches]}
+
     async def get_all_mempool_tx_ids(self, _: Dict[str, Any]) -> EndpointResult:
         ids = list(self.service.mempool_manager.mempool.all_spend_ids())
         return {"tx_ids": ids}
@@ -733,6 +745,9 @@ class FullNodeRpcApi:
             spends[item.name.hex()] = item.to_json_dict()
         return {"mempool_items": spends}
 
+    async def get_pre_validation_metrics(self, _: Dict[str, Any]) -> EndpointResult:
+        return {"metrics": self.service.mempool_manager.pre_validation_batcher.get_metrics()}
+
     async def get_mempool_item_by_tx_id(self, request: Dict[str, Any]) -> EndpointResult:
         if "tx_id" not in request:
             raise ValueError("No tx_id in request")
@@ -179,6 +179,10 @@ class FullNodeRpcClient(RpcClient):
         response = await self.fetch("get_coin_records_by_hint", d)
         return [CoinRecord.from_json_dict(coin_record_dict_backwards_compat(coin)) for coin in response["coin_records"]]
 
+    async def check_unspent_coin_index(self) -> List[bytes32]:
+        response = await self.fetch("check_unspent_coin_index", {})
+        return [bytes32.from_hexstr(name) for name in response["mismatches"]]
+
     async def get_additions_and_removals(self, header_hash: bytes32) -> Tuple[List[CoinRecord], List[CoinRecord]]:
         try:
             response = await self.fetch("get_additions_and_removals", {"header_hash": header_hash.hex()})
@@ -242,6 +246,10 @@ class FullNodeRpcClient(RpcClient):
         except Exception:
             return None
 
+    async def get_pre_validation_metrics(self) -> Dict[str, Any]:
+        response = await self.fetch("get_pre_validation_metrics", {})
+        return response["metrics"]
+
     async def get_recent_signage_point_or_eos(
         self, sp_hash: Optional[bytes32], challenge_hash: Optional[bytes32]
     ) -> Optional[Any]:
@@ -31,3 +31,6 @@ class HarvesterRpcClient(RpcClient):
 
     async def remove_plot_directory(self, dirname: str) -> bool:
         return (await self.fetch("remove_plot_directory", {"dirname": dirname}))["success"]
+
+    async def get_lookup_metrics(self) -> Dict[str, Any]:
+        return (await self.fetch("get_lookup_metrics", {}))["metrics"]
@@ -76,6 +76,24 @@ class RpcClient:
     async def close_connection(self, node_id: bytes32) -> Dict:
         return await self.fetch("close_connection", {"node_id": node_id.hex()})
 
+    async def get_broadcast_metrics(self) -> Dict:
+        return await self.fetch("get_broadcast_metrics", {})
+
+    async def get_outbound_queue_metrics(self, node_id: Optional[bytes32] = None) -> List[Dict]:
+        request = {}
+        if node_id is not None:
+            request["node_id"] = node_id.hex()
+        response = await self.fetch("get_outbound_queue_metrics", request)
+        for connection in response["connections"]:
+            connection["node_id"] = hexstr_to_bytes(connection["node_id"])
+        return response["connections"]
+
+    async def get_inbound_metrics(self) -> Dict:
+        response = await self.fetch("get_inbound_metrics", {})
+        for connection in response["connections"]:
+            connection["node_id"] = hexstr_to_bytes(connection["node_id"])
+        return response
+
     async def stop_node(self) -> Dict:
         return await self.fetch("stop_node", {})
 
@@ -252,6 +252,9 @@ class RpcServer:
             "/get_connections": self.get_connections,
             "/open_connection": self.open_connection,
             "/close_connection": self.close_connection,
+            "/get_broadcast_metrics": self.get_broadcast_metrics,
+            "/get_outbound_queue_metrics": self.get_outbound_queue_metrics,
+            "/get_inbound_metrics": self.get_inbound_metrics,
             "/stop_node": self.stop_node,
             "/get_routes": self._get_routes,
             "/healthz": self.healthz,
@@ -295,6 +298,46 @@ class RpcServer:
             await connection.close()
         return {}
 
+    async def get_broadcast_metrics(self, request: Dict[str, Any]) -> EndpointResult:
+        if self.rpc_api.service.server is None:
+            raise ValueError("Global connections is not set")
+        return {"broadcast_metrics": self.rpc_api.service.server.broadcast_metrics.to_json_dict()}
+
+    async def get_outbound_queue_metrics(self, request: Dict[str, Any]) -> EndpointResult:
+        if self.rpc_api.service.server is None:
+            raise ValueError("Global connections is not set")
+        node_id: Optional[bytes] = None
+        if "node_id" in request:
+            node_id = hexstr_to_bytes(request["node_id"])
+        return {
+            "connections": [
+                {
+                    "node_id": connection.peer_node_id,
+                    "peer_host": connection.peer_info.host,
+                    "outbound_queue": connection.outgoing_queue.to_json_dict(),
+                }
+                for connection in self.rpc_api.service.server.get_connections()
+                if node_id is None or connection.peer_node_id == node_id
+            ]
+        }
+
+    async def get_inbound_metrics(self, request: Dict[str, Any]) -> EndpointResult:
+        if self.rpc_api.service.server is None:
+            raise ValueError("Global connections is not set")
+        server = self.rpc_api.service.server
+        return {
+            "inbound_metrics": server.inbound_pipeline.metrics.to_json_dict(),
+            "connections": [
+                {
+                    "node_id": connection.peer_node_id,
+                    "peer_host": connection.peer_info.host,
+                    "inbound_window": connection.inbound_window.to_json_dict(),
+                }
+                for connection in server.get_connections()
+                if connection.inbound_window is not None
+            ],
+        }
+
     async def stop_node(self, request: Dict[str, Any]) -> EndpointResult:
         """
         Shuts down the node.
@@ -3,6 +3,7 @@ from __future__ import annotations
 import logging
 import math
 import time
+from array import array
 from asyncio import Lock
 from random import choice, randrange
 from secrets import randbits
@@ -32,6 +33,19 @@ log = logging.getLogger(__name__)
 
 # This is a Python port from 'CAddrInfo' class from Bitcoin core code.
 class ExtendedPeerInfo:
+    __slots__ = (
+        "peer_info",
+        "timestamp",
+        "src",
+        "random_pos",
+        "is_tried",
+        "ref_count",
+        "last_success",
+        "last_try",
+        "num_attempts",
+        "last_count_attempt",
+    )
+
     def __init__(
         self,
         addr: TimestampedPeerInfo,
@@ -163,8 +177,9 @@ class AddressManager:
     id_count: int
     key: int
     random_pos: List[int]
-    tried_matrix: List[List[int]]
-    new_matrix: List[List[int]]
+    # One array of node ids per bucket, -1 for an empty position
+    tried_matrix: List[array[int]]
+    new_matrix: List[array[int]]
     tried_count: int
     new_count: int
     map_addr: Dict[str, int]
@@ -174,17 +189,21 @@ class AddressManager:
     used_new_matrix_positions: Set[Tuple[int, int]]
     used_tried_matrix_positions: Set[Tuple[int, int]]
     allow_private_subnets: bool
+    # The changes since the peers file was last written, as records of `AddressManagerStore`'s journal. `None` while
+    # changes aren't recorded.
+    journal: Optional[List[str]]
 
     def __init__(self) -> None:
         self.clear()
         self.lock: Lock = Lock()
+        self.journal = None
 
     def clear(self) -> None:
         self.id_count = 0
         self.key = randbits(256)
         self.random_pos = []
-        self.tried_matrix = [[-1 for x in range(BUCKET_SIZE)] for y in range(TRIED_BUCKET_COUNT)]
-        self.new_matrix = [[-1 for x in range(BUCKET_SIZE)] for y in range(NEW_BUCKET_COUNT)]
+        self.tried_matrix = [array("q", [-1] * BUCKET_SIZE) for y in range(TRIED_BUCKET_COUNT)]
+        self.new_matrix = [array("q", [-1] * BUCKET_SIZE) for y in range(NEW_BUCKET_COUNT)]
         self.tried_count = 0
         self.new_count = 0
         self.map_addr = {}
@@ -198,9 +217,18 @@ class AddressManager:
     def make_private_subnets_valid(self) -> None:
         self.allow_private_subnets = True
 
+    def _journal_host(self, node_id: int) -> str:
+        return "-" if node_id == -1 else self.map_info[node_id].peer_info.host
+
+    def _journal_peer(self, info: ExtendedPeerInfo) -> None:
+        if self.journal is not None:
+            self.journal.append("P " + info.to_string())
+
     # Use only this method for modifying new matrix.
     def _set_new_matrix(self, row: int, col: int, value: int) -> None:
         self.new_matrix[row][col] = value
+        if self.journal is not None:
+            self.journal.append(f"N {row} {col} {self._journal_host(value)}")
         if value == -1:
             if (row, col) in self.used_new_matrix_positions:
                 self.used_new_matrix_positions.remove((row, col))
@@ -211,6 +239,8 @@ class AddressManager:
     # Use only this method for modifying tried matrix.
     def _set_tried_matrix(self, row: int, col: int, value: int) -> None:
         self.tried_matrix[row][col] = value
+        if self.journal is not None:
+            self.journal.append(f"T {row} {col} {self._journal_host(value)}")
         if value == -1:
             if (row, col) in self.used_tried_matrix_positions:
                 self.used_tried_matrix_positions.remove((row, col))
@@ -354,10 +384,12 @@ class AddressManager:
         if info is None or info.random_pos is None:
             return None
         self.swap_random_(info.random_pos, len(self.random_pos) - 1)
-        self.random_pos = self.random_pos[:-1]
+        self.random_pos.pop()
         del self.map_addr[info.peer_info.host]
         del self.map_info[node_id]
         self.new_count -= 1
+        if self.journal is not None:
+            self.journal.append(f"D {info.peer_info.host}")
 
     def add_to_new_table_(self, addr: TimestampedPeerInfo, source: Optional[PeerInfo], penalty: int) -> bool:
         is_unique = False
@@ -379,6 +411,7 @@ class AddressManager:
                 info.timestamp > 0 or info.timestamp < addr.timestamp - update_interval - penalty
             ):
                 info.timestamp = max(0, addr.timestamp - penalty)
+                self._journal_peer(info)
 
             # do not update if no new information is present
             if addr.timestamp == 0 or (info.timestamp > 0 and addr.timestamp <= info.timestamp):
@@ -399,6 +432,7 @@ class AddressManager:
         else:
             (info, node_id) = self.create_(addr, source)
             info.timestamp = max(0, info.timestamp - penalty)
+            self._journal_peer(info)
             self.new_count += 1
             is_unique = True
 
@@ -591,6 +625,7 @@ class AddressManager:
         update_interval = 20 * 60
         if timestamp - info.timestamp > update_interval:
             info.timestamp = timestamp
+            self._journal_peer(info)
 
     async def size(self) -> int:
         async with self.lock:
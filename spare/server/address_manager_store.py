@@ -4,6 +4,7 @@ import asyncio
 import logging
 from dataclasses import dataclass
 from pathlib import Path
+from secrets import randbits
 from timeit import default_timer as timer
 from typing import Any, Dict, List, Optional, Tuple
 
@@ -13,15 +14,20 @@ from spare.server.address_manager import (
     BUCKET_SIZE,
     NEW_BUCKET_COUNT,
     NEW_BUCKETS_PER_ADDRESS,
+    TRIED_BUCKET_COUNT,
     AddressManager,
     ExtendedPeerInfo,
 )
+from spare.types.peer_info import TimestampedPeerInfo
 from spare.util.files import write_file_async
 from spare.util.ints import uint64
 from spare.util.streamable import Streamable, streamable
 
 log = logging.getLogger(__name__)
 
+# The journal is compacted into a new peers file once it's larger than the peers file, and at least this large
+JOURNAL_COMPACT_MIN_BYTES = 1024 * 1024
+
 
 @streamable
 @dataclass(frozen=True)
@@ -75,18 +81,30 @@ class AddressManagerStore:
     * Once we know the buckets, we can also deduce the bucket positions.
     Every other information, such as tried_matrix, map_addr, map_info, random_pos,
     be deduced and it is not explicitly stored, instead it is recalculated.
+
+    Changes after the peers file was written are appended to a journal next to it, one record per line:
+    - J journal_id: the first line, matches the journal_id in the metadata of the peers file
+    - P host port timestamp src_host src_port: a node was added, or its timestamp changed
+    - D host: a node was removed
+    - N bucket pos host, T bucket pos host: a position of the new or tried table was set, host is - if it was cleared
+    Records refer to nodes by their host, since the node ids are reassigned when the peers file is loaded.
     """
 
+    @classmethod
+    def journal_path(cls, peers_file_path: Path) -> Path:
+        return peers_file_path.with_name(peers_file_path.name + ".journal")
+
     @classmethod
     async def create_address_manager(cls, peers_file_path: Path) -> AddressManager:
         """
         Create an address manager using data deserialized from a peers file.
         """
         address_manager: Optional[AddressManager] = None
+        journal_id: Optional[str] = None
         if peers_file_path.exists():
             try:
                 log.info(f"Loading peers from {peers_file_path}")
-                address_manager = await cls._deserialize(peers_file_path)
+                address_manager, journal_id = await cls._deserialize(peers_file_path)
             except Exception:
                 log.exception(f"Unable to create address_manager from {peers_file_path}")
 
@@ -94,8 +112,53 @@ class AddressManagerStore:
             log.info("Creating new address_manager")
             address_manager = AddressManager()
 
+        try:
+            await cls._replay_journal(address_manager, peers_file_path, journal_id)
+        except Exception:
+            log.exception(f"Unable to replay the peers journal of {peers_file_path}")
+        address_manager.journal = []
+
         return address_manager
 
+    @classmethod
+    async def flush(cls, address_manager: AddressManager, peers_file_path: Path) -> None:
+        """
+        Persist the address manager's changes by appending them to the journal. Writes a new peers file instead once
+        the journal grew larger than the peers file.
+        """
+        journal = address_manager.journal
+        journal_path = cls.journal_path(peers_file_path)
+        try:
+            compact = (
+                journal is None
+                or not peers_file_path.exists()
+                or not journal_path.exists()
+                or journal_path.stat().st_size >= max(JOURNAL_COMPACT_MIN_BYTES, peers_file_path.stat().st_size)
+            )
+        except OSError:
+            compact = True
+        if compact:
+            await cls.serialize(address_manager, peers_file_path)
+            return
+
+        assert journal is not None
+        if len(journal) == 0:
+            return
+        try:
+            start_time = timer()
+            async with aiofiles.open(journal_path, "a") as f:
+                await f.write("".join(record + "\n" for record in journal))
+            log.debug(f"Appending {len(journal)} peer changes took {timer() - start_time} seconds")
+        except Exception:
+            log.exception(f"Failed to append peer changes to {journal_path}")
+            # The journal might end with a partial record now, the next flush writes a new peers file instead
+            try:
+                journal_path.unlink()
+            except OSError:
+                log.exception(f"Failed to remove {journal_path}")
+            return
+        address_manager.journal = []
+
     @classmethod
     async def serialize(cls, address_manager: AddressManager, peers_file_path: Path) -> None:
         """
@@ -109,6 +172,8 @@ class AddressManagerStore:
 
         log.info("Serializing peer data")
         metadata.append(("key", str(address_manager.key)))
+        journal_id = str(randbits(64))
+        metadata.append(("journal_id", journal_id))
 
         for node_id, info in address_manager.map_info.items():
             unique_ids[node_id] = count_ids
@@ -139,16 +204,27 @@ class AddressManagerStore:
             peers_file_path.parent.mkdir(parents=True, exist_ok=True)
             start_time = timer()
             await cls._write_peers(peers_file_path, metadata, nodes, new_table_entries)
+            # Start a new journal, the one of the previous peers file doesn't match the journal_id anymore
+            await write_file_async(cls.journal_path(peers_file_path), f"J {journal_id}\n", file_mode=0o644)
+            if address_manager.journal is not None:
+                address_manager.journal = []
             log.debug(f"Serializing peer data took {timer() - start_time} seconds")
         except Exception:
             log.exception(f"Failed to write peer data to {peers_file_path}")
+            # Make sure the next flush writes a new peers file, instead of appending to a journal which doesn't match
+            try:
+                cls.journal_path(peers_file_path).unlink()
+            except OSError:
+                pass
 
     @classmethod
-    async def _deserialize(cls, peers_file_path: Path) -> AddressManager:
+    async def _deserialize(cls, peers_file_path: Path) -> Tuple[AddressManager, Optional[str]]:
         """
-        Create an address manager using data deserialized from a peers file.
+        Create an address manager using data deserialized from a peers file. Also returns the id of the journal
+        which belongs to the peers file.
         """
         peer_data: Optional[PeerDataSerialization] = None
+        journal_id: Optional[str] = None
         address_manager = AddressManager()
         start_time = timer()
         try:
@@ -165,6 +241,7 @@ class AddressManagerStore:
             log.debug(f"Deserializing peer data took {timer() - start_time} seconds")
 
             address_manager.key = int(metadata["key"])
+            journal_id = metadata.get("journal_id")
             address_manager.new_count = int(metadata["new_count"])
             # address_manager.tried_count = int(metadata["tried_count"])
             address_manager.tried_count = 0
@@ -212,7 +289,103 @@ class AddressManagerStore:
 
             address_manager.load_used_table_positions()
 
-        return address_manager
+        return address_manager, journal_id
+
+    @classmethod
+    async def _replay_journal(
+        cls, address_manager: AddressManager, peers_file_path: Path, journal_id: Optional[str]
+    ) -> None:
+        """
+        Apply the records of the journal to an address manager which was loaded from the peers file.
+        """
+        journal_path = cls.journal_path(peers_file_path)
+        if not journal_path.exists():
+            return
+        async with aiofiles.open(journal_path, "r") as f:
+            lines = (await f.read()).split("\n")
+        # Each record ends with a newline, so the last element is either empty or an incomplete record
+        records = lines[:-1]
+        if journal_id is None or len(records) == 0 or records[0] != f"J {journal_id}":
+            log.info(f"Removing {journal_path}, it doesn't belong to the peers file")
+            journal_path.unlink()
+            return
+
+        start_time = timer()
+        replayed = 1
+        for record in records[1:]:
+            try:
+                cls._replay_record(address_manager, record)
+            except Exception:
+                log.exception(f"Invalid record in {journal_path}: {record}")
+                break
+            replayed += 1
+        cls._rebuild_counts(address_manager)
+        log.debug(f"Replaying {replayed - 1} peer changes took {timer() - start_time} seconds")
+
+        if replayed < len(records) or lines[-1] != "":
+            log.warning(f"Dropping the records after the first {replayed - 1} ones of {journal_path}")
+            # New records must not be appended after an invalid one
+            await write_file_async(
+                journal_path, "".join(record + "\n" for record in records[:replayed]), file_mode=0o644
+            )
+
+    @classmethod
+    def _replay_record(cls, address_manager: AddressManager, record: str) -> None:
+        kind, _, data = record.partition(" ")
+        if kind == "P":
+            info = ExtendedPeerInfo.from_string(data)
+            existing, _ = address_manager.find_(info.peer_info)
+            if existing is None:
+                address_manager.create_(
+                    TimestampedPeerInfo(info.peer_info.host, info.peer_info.port, uint64(info.timestamp)), info.src
+                )
+            else:
+                existing.timestamp = info.timestamp
+        elif kind == "D":
+            node_id = address_manager.map_addr.get(data)
+            if node_id is not None:
+                address_manager.delete_new_entry_(node_id)
+        elif kind in ("N", "T"):
+            bucket_str, pos_str, host = data.split(" ")
+            bucket = int(bucket_str)
+            pos = int(pos_str)
+            if kind == "N":
+                assert 0 <= bucket < NEW_BUCKET_COUNT
+                matrix = address_manager.new_matrix
+            else:
+                assert 0 <= bucket < TRIED_BUCKET_COUNT
+                matrix = address_manager.tried_matrix
+            assert 0 <= pos < BUCKET_SIZE
+            matrix[bucket][pos] = -1 if host == "-" else address_manager.map_addr.get(host, -1)
+        else:
+            raise ValueError(f"Unknown journal record {kind}")
+
+    @classmethod
+    def _rebuild_counts(cls, address_manager: AddressManager) -> None:
+        """
+        Recalculate everything the journal doesn't store from the new and tried tables
+        """
+        for info in address_manager.map_info.values():
+            info.ref_count = 0
+            info.is_tried = False
+        for matrix, is_tried in [(address_manager.new_matrix, False), (address_manager.tried_matrix, True)]:
+            for row in matrix:
+                for pos, node_id in enumerate(row):
+                    if node_id == -1:
+                        continue
+                    info = address_manager.map_info.get(node_id)
+                    if info is None:
+                        row[pos] = -1
+                    elif is_tried:
+                        info.is_tried = True
+                    else:
+                        info.ref_count += 1
+        for node_id, info in list(address_manager.map_info.items()):
+            if not info.is_tried and info.ref_count == 0:
+                address_manager.delete_new_entry_(node_id)
+        address_manager.tried_count = sum(1 for info in address_manager.map_info.values() if info.is_tried)
+        address_manager.new_count = len(address_manager.map_info) - address_manager.tried_count
+        address_manager.load_used_table_positions()
 
     @classmethod
     async def _read_peers(cls, peers_file_path: Path) -> PeerDataSerialization:
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict
+
+from spare.protocols.protocol_message_types import ProtocolMessageTypes
+from spare.server.outbound_message import Message
+from spare.util.latency_histogram import LatencyHistogram
+
+
+@dataclass
+class BroadcastTypeMetrics:
+    broadcasts: int = 0
+    # Sum of the peers each broadcast was queued to
+    peers: int = 0
+    encoded_bytes: int = 0
+    # Broadcasts which at least one peer didn't send, because it was rate limited
+    dropped: int = 0
+    # Time it took to queue the message to all peers
+    enqueue: LatencyHistogram = field(default_factory=LatencyHistogram)
+    # Time from the broadcast until the first and the last peer wrote the message to its socket
+    first_write: LatencyHistogram = field(default_factory=LatencyHistogram)
+    last_write: LatencyHistogram = field(default_factory=LatencyHistogram)
+
+    def to_json_dict(self) -> Dict[str, Any]:
+        return {
+            "broadcasts": self.broadcasts,
+            "peers": self.peers,
+            "encoded_bytes": self.encoded_bytes,
+            "dropped": self.dropped,
+            "enqueue": self.enqueue.to_json_dict(),
+            "first_write": self.first_write.to_json_dict(),
+            "last_write": self.last_write.to_json_dict(),
+        }
+
+
+class BroadcastMetrics:
+    _types: Dict[int, BroadcastTypeMetrics]
+
+    def __init__(self) -> None:
+        self._types = {}
+
+    def for_type(self, message_type: int) -> BroadcastTypeMetrics:
+        metrics = self._types.get(message_type)
+        if metrics is None:
+            metrics = BroadcastTypeMetrics()
+            self._types[message_type] = metrics
+        return metrics
+
+    def to_json_dict(self) -> Dict[str, Any]:
+        return {
+            ProtocolMessageTypes(message_type).name: metrics.to_json_dict()
+            for message_type, metrics in self._types.items()
+        }
+
+
+class Broadcast:
+    """
+    A message which is queued to many connections at once. It's serialized only once, all connections write the same
+    buffer.
+    """
+
+    message: Message
+    encoded: bytes
+    _start: float
+    _peers: int
+    _written: int
+    _dropped: int
+    _metrics: BroadcastTypeMetrics
+
+    def __init__(self, message: Message, metrics: BroadcastTypeMetrics) -> None:
+        self.message = message
+        self.encoded = bytes(message)
+        self._start = time.monotonic()
+        self._peers = 0
+        self._written = 0
+        self._dropped = 0
+        self._metrics = metrics
+
+    def set_peers(self, peers: int) -> None:
+        """
+        Called after the broadcast was queued to all peers, with the number of peers which accepted it
+        """
+        self._peers = peers
+        self._metrics.broadcasts += 1
+        self._metrics.peers += peers
+        self._metrics.encoded_bytes += len(self.encoded)
+        self._metrics.enqueue.record(time.monotonic() - self._start)
+
+    def written(self) -> None:
+        self._written += 1
+        seconds = time.monotonic() - self._start
+        if self._written == 1:
+            self._metrics.first_write.record(seconds)
+        if self._written == self._peers - self._dropped:
+            self._metrics.last_write.record(seconds)
+
+    def dropped(self) -> None:
+        if self._dropped == 0:
+            self._metrics.dropped += 1
+        self._dropped += 1
+        if self._written == self._peers - self._dropped and self._written > 0:
+            self._metrics.last_write.record(time.monotonic() - self._start)
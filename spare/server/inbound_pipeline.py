@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Type, TypeVar
+
+from spare.util.latency_histogram import LatencyHistogram
+from spare.util.streamable import Streamable
+
+_T_Streamable = TypeVar("_T_Streamable", bound=Streamable)
+
+
+@dataclass
+class InboundMetrics:
+    # Time to decode the payloads on the event loop, and in the worker pool including the wait for a worker
+    decode_inline: LatencyHistogram = field(default_factory=LatencyHistogram)
+    decode_offloaded: LatencyHistogram = field(default_factory=LatencyHistogram)
+    # Time messages waited for a credit of their connection before they were handled
+    queue_wait: LatencyHistogram = field(default_factory=LatencyHistogram)
+    # Time connections stopped reading because too many bytes were waiting for credits
+    read_stall: LatencyHistogram = field(default_factory=LatencyHistogram)
+    # How much later than scheduled the event loop woke up a sleeping task
+    loop_lag: LatencyHistogram = field(default_factory=LatencyHistogram)
+
+    def to_json_dict(self) -> Dict[str, Any]:
+        return {
+            "decode_inline": self.decode_inline.to_json_dict(),
+            "decode_offloaded": self.decode_offloaded.to_json_dict(),
+            "queue_wait": self.queue_wait.to_json_dict(),
+            "read_stall": self.read_stall.to_json_dict(),
+            "loop_lag": self.loop_lag.to_json_dict(),
+        }
+
+
+class InboundWindow:
+    """
+    The back-pressure of one connection. At most `max_in_flight` messages are handled at once, each takes a credit
+    until its api call is done. Further messages wait in the incoming queue, and once `max_queued_bytes` wait there
+    the connection stops reading from the socket.
+
+    The responses to our own requests to the peer are only seen once they are read from the socket, and the handlers
+    holding the credits may be waiting for them. So while any of our requests to the peer are waiting for a response,
+    reading goes on until twice `max_queued_bytes` are queued. Past that, reading stops regardless, and the requests
+    still waiting for a response time out.
+    """
+
+    max_in_flight: int
+    max_queued_bytes: int
+    in_flight: int
+    queued_bytes: int
+    awaiting_responses: int
+    _changed: asyncio.Event
+
+    def __init__(self, max_in_flight: int, max_queued_bytes: int) -> None:
+        self.max_in_flight = max_in_flight
+        self.max_queued_bytes = max_queued_bytes
+        self.in_flight = 0
+        self.queued_bytes = 0
+        self.awaiting_responses = 0
+        self._changed = asyncio.Event()
+
+    async def _wait_until(self, condition: Callable[[], bool]) -> None:
+        while not condition():
+            self._changed.clear()
+            await self._changed.wait()
+
+    def has_space(self) -> bool:
+        if self.queued_bytes < self.max_queued_bytes:
+            return True
+        return self.awaiting_responses > 0 and self.queued_bytes < 2 * self.max_queued_bytes
+
+    async def wait_for_space(self) -> float:
+        """
+        Waits until the connection may read the next message, returns the seconds it waited
+        """
+        if self.has_space():
+            return 0.0
+        start = time.monotonic()
+        await self._wait_until(self.has_space)
+        return time.monotonic() - start
+
+    def expect_response(self) -> None:
+        self.awaiting_responses += 1
+        self._changed.set()
+
+    def response_done(self) -> None:
+        self.awaiting_responses -= 1
+        self._changed.set()
+
+    def queued(self, size: int) -> None:
+        self.queued_bytes += size
+
+    async def acquire(self, size: int) -> None:
+        await self._wait_until(lambda: self.in_flight < self.max_in_flight)
+        self.in_flight += 1
+        self.queued_bytes -= size
+        self._changed.set()
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._changed.set()
+
+    def to_json_dict(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queued_bytes": self.queued_bytes,
+            "max_queued_bytes": self.max_queued_bytes,
+            "awaiting_responses": self.awaiting_responses,
+        }
+
+
+class InboundPipeline:
+    """
+    Settings, decode workers and metrics shared by the inbound side of all connections of a server. Payloads of at
+    least `offload_bytes` are decoded in a worker thread instead of on the event loop.
+    """
+
+    max_in_flight: int
+    max_queued_bytes: int
+    offload_bytes: int
+    decode_threads: int
+    metrics: InboundMetrics
+    _executor: Optional[ThreadPoolExecutor]
+    _loop_lag_task: Optional[asyncio.Task[None]]
+
+    def __init__(
+        self,
+        max_in_flight: int = 200,
+        max_queued_bytes: int = 64 * 1024 * 1024,
+        offload_bytes: int = 256 * 1024,
+        decode_threads: int = 2,
+    ) -> None:
+        self.max_in_flight = max_in_flight
+        self.max_queued_bytes = max_queued_bytes
+        self.offload_bytes = offload_bytes
+        self.decode_threads = decode_threads
+        self.metrics = InboundMetrics()
+        self._executor = None
+        self._loop_lag_task = None
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> InboundPipeline:
+        return cls(
+            max_in_flight=config.get("inbound_max_in_flight", 200),
+            max_queued_bytes=config.get("inbound_max_queued_bytes", 64 * 1024 * 1024),
+            offload_bytes=config.get("inbound_decode_offload_bytes", 256 * 1024),
+            decode_threads=config.get("inbound_decode_threads", 2),
+        )
+
+    def create_window(self) -> InboundWindow:
+        return InboundWindow(self.max_in_flight, self.max_queued_bytes)
+
+    async def decode(self, message_class: Type[_T_Streamable], data: bytes) -> _T_Streamable:
+        start = time.monotonic()
+        if self.decode_threads <= 0 or len(data) < self.offload_bytes:
+            result = message_class.from_bytes(data)
+            self.metrics.decode_inline.record(time.monotonic() - start)
+            return result
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.decode_threads, thread_name_prefix="inbound-decode-")
+        result = await asyncio.get_running_loop().run_in_executor(self._executor, message_class.from_bytes, data)
+        self.metrics.decode_offloaded.record(time.monotonic() - start)
+        return result
+
+    async def _monitor_loop_lag(self, interval: float) -> None:
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(interval)
+            self.metrics.loop_lag.record(max(0.0, time.monotonic() - start - interval))
+
+    def start(self, loop_lag_interval: float = 0.1) -> None:
+        if self._loop_lag_task is None:
+            self._loop_lag_task = asyncio.create_task(self._monitor_loop_lag(loop_lag_interval))
+
+    def close(self) -> None:
+        if self._loop_lag_task is not None:
+            self._loop_lag_task.cancel()
+            self._loop_lag_task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Deque, Dict, Optional, Set, Tuple, Union
+
+from spare.protocols.protocol_message_types import ProtocolMessageTypes
+from spare.server.broadcast import Broadcast
+from spare.server.outbound_message import Message
+from spare.util.latency_histogram import LatencyHistogram
+
+
+class OutboundClass(IntEnum):
+    # Messages of a lower class are sent first
+    critical = 0
+    normal = 1
+    bulk = 2
+
+
+# Announcements which the network needs quickly to stay in consensus and to farm
+critical_message_types: Set[ProtocolMessageTypes] = {
+    ProtocolMessageTypes.handshake,
+    ProtocolMessageTypes.new_peak,
+    ProtocolMessageTypes.new_peak_wallet,
+    ProtocolMessageTypes.new_peak_timelord,
+    ProtocolMessageTypes.new_signage_point_or_end_of_sub_slot,
+    ProtocolMessageTypes.new_unfinished_block,
+    ProtocolMessageTypes.new_unfinished_block_timelord,
+    ProtocolMessageTypes.new_infusion_point_vdf,
+    ProtocolMessageTypes.new_signage_point_vdf,
+    ProtocolMessageTypes.new_end_of_sub_slot_vdf,
+    ProtocolMessageTypes.new_signage_point,
+    ProtocolMessageTypes.new_signage_point_harvester,
+    ProtocolMessageTypes.new_proof_of_space,
+    ProtocolMessageTypes.declare_proof_of_space,
+    ProtocolMessageTypes.request_signatures,
+    ProtocolMessageTypes.respond_signatures,
+    ProtocolMessageTypes.request_signed_values,
+    ProtocolMessageTypes.signed_values,
+}
+
+# Large responses, mostly to syncing peers, which can wait behind everything else
+bulk_message_types: Set[ProtocolMessageTypes] = {
+    ProtocolMessageTypes.respond_blocks,
+    ProtocolMessageTypes.respond_block,
+    ProtocolMessageTypes.respond_proof_of_weight,
+    ProtocolMessageTypes.respond_header_blocks,
+    ProtocolMessageTypes.respond_block_headers,
+    ProtocolMessageTypes.respond_ses_hashes,
+    ProtocolMessageTypes.respond_compact_vdf,
+    ProtocolMessageTypes.respond_peers,
+    ProtocolMessageTypes.respond_peers_introducer,
+    ProtocolMessageTypes.plot_sync_loaded,
+    ProtocolMessageTypes.plot_sync_removed,
+    ProtocolMessageTypes.plot_sync_invalid,
+    ProtocolMessageTypes.plot_sync_keys_missing,
+    ProtocolMessageTypes.plot_sync_duplicates,
+}
+
+# The bytes a class may send in a row while a lower class is waiting, before one message of the lower class is sent.
+# The lowest class has no budget.
+DEFAULT_OUTBOUND_BUDGETS: Dict[OutboundClass, int] = {
+    OutboundClass.critical: 1024 * 1024,
+    OutboundClass.normal: 4 * 1024 * 1024,
+}
+
+
+def outbound_class(message_type: int) -> OutboundClass:
+    try:
+        protocol_message_type = ProtocolMessageTypes(message_type)
+    except ValueError:
+        return OutboundClass.normal
+    if protocol_message_type in critical_message_types:
+        return OutboundClass.critical
+    if protocol_message_type in bulk_message_types:
+        return OutboundClass.bulk
+    return OutboundClass.normal
+
+
+def outbound_budgets_from_config(config: Dict[str, Any]) -> Dict[OutboundClass, int]:
+    budgets = dict(DEFAULT_OUTBOUND_BUDGETS)
+    for name, budget in config.get("outbound_queue_budgets", {}).items():
+        budgets[OutboundClass[name]] = int(budget)
+    return budgets
+
+
+@dataclass
+class OutboundClassMetrics:
+    max_queued: int = 0
+    sent_messages: int = 0
+    sent_bytes: int = 0
+    # Time the messages spent in the queue
+    wait: LatencyHistogram = field(default_factory=LatencyHistogram)
+
+
+class OutboundQueue:
+    """
+    The messages waiting to be sent to one peer, in one queue per `OutboundClass`. The queue of the lowest class
+    which has messages is served first, until its byte budget is used up while a lower class is waiting.
+    """
+
+    _queues: Dict[OutboundClass, Deque[Tuple[Union[Message, Broadcast], int, float]]]
+    _budgets: Dict[OutboundClass, int]
+    # Bytes sent by each class since a lower class was last served
+    _sent_in_row: Dict[OutboundClass, int]
+    _not_empty: asyncio.Event
+    _size: int
+    metrics: Dict[OutboundClass, OutboundClassMetrics]
+
+    def __init__(self, budgets: Optional[Dict[OutboundClass, int]] = None) -> None:
+        self._queues = {outbound_class: deque() for outbound_class in OutboundClass}
+        self._budgets = DEFAULT_OUTBOUND_BUDGETS if budgets is None else budgets
+        self._sent_in_row = {outbound_class: 0 for outbound_class in OutboundClass}
+        self._not_empty = asyncio.Event()
+        self._size = 0
+        self.metrics = {outbound_class: OutboundClassMetrics() for outbound_class in OutboundClass}
+
+    def qsize(self) -> int:
+        return self._size
+
+    def empty(self) -> bool:
+        return self._size == 0
+
+    def put_nowait(self, item: Union[Message, Broadcast]) -> None:
+        if isinstance(item, Broadcast):
+            item_class = outbound_class(item.message.type)
+            size = len(item.encoded)
+        else:
+            item_class = outbound_class(item.type)
+            size = len(item.data)
+        queue = self._queues[item_class]
+        queue.append((item, size, time.monotonic()))
+        metrics = self.metrics[item_class]
+        metrics.max_queued = max(metrics.max_queued, len(queue))
+        self._size += 1
+        self._not_empty.set()
+
+    async def put(self, item: Union[Message, Broadcast]) -> None:
+        self.put_nowait(item)
+
+    def _next_class(self) -> OutboundClass:
+        lower_waiting = False
+        selected: Optional[OutboundClass] = None
+        for item_class in reversed(OutboundClass):
+            if len(self._queues[item_class]) == 0:
+                continue
+            budget = self._budgets.get(item_class)
+            # A class which used up its budget gives a waiting lower class a turn
+            if not lower_waiting or budget is None or self._sent_in_row[item_class] < budget:
+                selected = item_class
+            lower_waiting = True
+        assert selected is not None
+        return selected
+
+    async def get(self) -> Union[Message, Broadcast]:
+        while self._size == 0:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        item_class = self._next_class()
+        queue = self._queues[item_class]
+        item, size, queued_at = queue.popleft()
+        self._size -= 1
+        # Serving a class ends the runs of all higher classes
+        for higher_class in OutboundClass:
+            if higher_class >= item_class:
+                break
+            self._sent_in_row[higher_class] = 0
+        # An empty queue also ends the run of its class
+        self._sent_in_row[item_class] = 0 if len(queue) == 0 else self._sent_in_row[item_class] + size
+        metrics = self.metrics[item_class]
+        metrics.sent_messages += 1
+        metrics.sent_bytes += size
+        metrics.wait.record(time.monotonic() - queued_at)
+        return item
+
+    def to_json_dict(self) -> Dict[str, Any]:
+        return {
+            item_class.name: {
+                "queued": len(self._queues[item_class]),
+                "max_queued": metrics.max_queued,
+                "sent_messages": metrics.sent_messages,
+                "sent_bytes": metrics.sent_bytes,
+                "wait": metrics.wait.to_json_dict(),
+            }
+            for item_class, metrics in self.metrics.items()
+        }
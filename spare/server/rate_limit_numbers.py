@@ -141,6 +141,8 @@ rate_limits = {
             ProtocolMessageTypes.plot_sync_duplicates: RLSettings(1000, 100 * 1024 * 1024),
             ProtocolMessageTypes.plot_sync_done: RLSettings(1000, 100 * 1024 * 1024),
             ProtocolMessageTypes.plot_sync_response: RLSettings(3000, 100 * 1024 * 1024),
+            ProtocolMessageTypes.plot_sync_summary: RLSettings(1000, 1024 * 1024),
+            ProtocolMessageTypes.plot_sync_summary_response: RLSettings(1000, 1024 * 1024),
             ProtocolMessageTypes.coin_state_update: RLSettings(1000, 100 * 1024 * 1024),
             ProtocolMessageTypes.register_interest_in_puzzle_hash: RLSettings(1000, 100 * 1024 * 1024),
             ProtocolMessageTypes.respond_to_ph_update: RLSettings(1000, 100 * 1024 * 1024),
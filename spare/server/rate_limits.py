@@ -3,8 +3,7 @@ from __future__ import annotations
 import dataclasses
 import logging
 import time
-from collections import Counter
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
 from spare.protocols.protocol_message_types import ProtocolMessageTypes
 from spare.protocols.shared_protocol import Capability
@@ -14,33 +13,158 @@ from spare.server.rate_limit_numbers import RLSettings, get_rate_limits_to_use
 log = logging.getLogger(__name__)
 
 
+@dataclasses.dataclass(frozen=True)
+class RateLimitEntry:
+    # Both scaled by percentage_of_limit, per reset_seconds
+    frequency: float
+    max_total_size: float
+    max_size: int
+    # Also counts towards the limits shared by all non transaction messages
+    non_tx: bool
+
+
+@dataclasses.dataclass(frozen=True)
+class RateLimitTable:
+    """
+    The rate limits for each message type, for one rate limits version and percentage_of_limit
+    """
+
+    entries: Dict[int, RateLimitEntry]
+    default: RateLimitEntry
+    non_tx_frequency: float
+    non_tx_max_total_size: float
+
+
+rate_limit_tables: Dict[Tuple[bool, int], RateLimitTable] = {}
+
+
+def get_rate_limit_table(
+    our_capabilities: List[Capability], peer_capabilities: List[Capability], percentage_of_limit: int
+) -> RateLimitTable:
+    v2 = Capability.RATE_LIMITS_V2 in our_capabilities and Capability.RATE_LIMITS_V2 in peer_capabilities
+    table = rate_limit_tables.get((v2, percentage_of_limit))
+    if table is not None:
+        return table
+
+    rate_limits = get_rate_limits_to_use(our_capabilities, peer_capabilities)
+    proportion_of_limit: float = percentage_of_limit / 100
+
+    def entry(limits: RLSettings, non_tx: bool) -> RateLimitEntry:
+        max_total_size = limits.max_total_size
+        if max_total_size is None:
+            max_total_size = limits.frequency * limits.max_size
+        return RateLimitEntry(
+            limits.frequency * proportion_of_limit, max_total_size * proportion_of_limit, limits.max_size, non_tx
+        )
+
+    entries: Dict[int, RateLimitEntry] = {}
+    for message_type, limits in rate_limits["rate_limits_other"].items():
+        entries[message_type.value] = entry(limits, True)
+    for message_type, limits in rate_limits["rate_limits_tx"].items():
+        entries[message_type.value] = entry(limits, False)
+    table = RateLimitTable(
+        entries,
+        entry(rate_limits["default_settings"], False),
+        rate_limits["non_tx_freq"] * proportion_of_limit,
+        rate_limits["non_tx_max_total_size"] * proportion_of_limit,
+    )
+    rate_limit_tables[(v2, percentage_of_limit)] = table
+    return table
+
+
+class TokenBuckets:
+    """
+    A message count and a message size token bucket, which refill smoothly to their capacity within reset_seconds
+    """
+
+    __slots__ = ("count", "size", "updated")
+
+    count: float
+    size: float
+    updated: float
+
+    def __init__(self, count: float, size: float, now: float) -> None:
+        self.count = count
+        self.size = size
+        self.updated = now
+
+    def refill(self, frequency: float, max_total_size: float, now: float, reset_seconds: int) -> None:
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.count = min(frequency, self.count + elapsed * frequency / reset_seconds)
+            self.size = min(max_total_size, self.size + elapsed * max_total_size / reset_seconds)
+            self.updated = now
+
+    def has(self, size: int) -> bool:
+        return self.count >= 1 and self.size >= size
+
+    def take(self, size: int) -> None:
+        self.count = max(0.0, self.count - 1)
+        self.size = max(0.0, self.size - size)
+
+    def seconds_until(self, size: int, frequency: float, max_total_size: float, reset_seconds: int) -> Optional[float]:
+        """
+        Returns the time until `has(size)` is true, `None` if it never will be
+        """
+        if frequency < 1 or max_total_size < size:
+            return None
+        return max(
+            (1 - self.count) * reset_seconds / frequency,
+            (size - self.size) * reset_seconds / max_total_size if max_total_size > 0 else 0.0,
+            0.0,
+        )
+
+
 # TODO: only full node disconnects based on rate limits
 class RateLimiter:
     incoming: bool
     reset_seconds: int
-    current_minute: int
-    message_counts: Counter[ProtocolMessageTypes]
-    message_cumulative_sizes: Counter[ProtocolMessageTypes]
     percentage_of_limit: int
-    non_tx_message_counts: int = 0
-    non_tx_cumulative_size: int = 0
+    # From message type to its buckets, created full when the type is seen for the first time
+    buckets: Dict[int, TokenBuckets]
+    non_tx_buckets: Optional[TokenBuckets]
 
     def __init__(self, incoming: bool, reset_seconds: int = 60, percentage_of_limit: int = 100):
         """
-        The incoming parameter affects whether counters are incremented
-        unconditionally or not. For incoming messages, the counters are always
-        incremented. For outgoing messages, the counters are only incremented
-        if they are allowed to be sent by the rate limiter, since we won't send
-        the messages otherwise.
+        The incoming parameter affects whether tokens are taken unconditionally
+        or not. For incoming messages, the tokens are always taken. For
+        outgoing messages, the tokens are only taken if they are allowed to be
+        sent by the rate limiter, since we won't send the messages otherwise.
         """
         self.incoming = incoming
         self.reset_seconds = reset_seconds
-        self.current_minute = int(time.time() // reset_seconds)
-        self.message_counts = Counter()
-        self.message_cumulative_sizes = Counter()
         self.percentage_of_limit = percentage_of_limit
-        self.non_tx_message_counts = 0
-        self.non_tx_cumulative_size = 0
+        self.buckets = {}
+        self.non_tx_buckets = None
+
+    def _get_entry(
+        self, message: Message, our_capabilities: List[Capability], peer_capabilities: List[Capability]
+    ) -> Tuple[RateLimitTable, Optional[RateLimitEntry]]:
+        table = get_rate_limit_table(our_capabilities, peer_capabilities, self.percentage_of_limit)
+        entry = table.entries.get(message.type)
+        if entry is None:
+            try:
+                message_type = ProtocolMessageTypes(message.type)
+            except Exception as e:
+                log.warning(f"Invalid message: {message.type}, {e}")
+                return table, None
+            log.warning(f"Message type {message_type} not found in rate limits")
+            entry = table.default
+        return table, entry
+
+    def _refill(self, message_type: int, table: RateLimitTable, entry: RateLimitEntry, now: float) -> TokenBuckets:
+        buckets = self.buckets.get(message_type)
+        if buckets is None:
+            buckets = TokenBuckets(entry.frequency, entry.max_total_size, now)
+            self.buckets[message_type] = buckets
+        else:
+            buckets.refill(entry.frequency, entry.max_total_size, now, self.reset_seconds)
+        if entry.non_tx:
+            if self.non_tx_buckets is None:
+                self.non_tx_buckets = TokenBuckets(table.non_tx_frequency, table.non_tx_max_total_size, now)
+            else:
+                self.non_tx_buckets.refill(table.non_tx_frequency, table.non_tx_max_total_size, now, self.reset_seconds)
+        return buckets
 
     def process_msg_and_check(
         self, message: Message, our_capabilities: List[Capability], peer_capabilities: List[Capability]
@@ -48,66 +172,45 @@ class RateLimiter:
         """
         Returns True if message can be processed successfully, false if a rate limit is passed.
         """
-
-        current_minute = int(time.time() // self.reset_seconds)
-        if current_minute != self.current_minute:
-            self.current_minute = current_minute
-            self.message_counts = Counter()
-            self.message_cumulative_sizes = Counter()
-            self.non_tx_message_counts = 0
-            self.non_tx_cumulative_size = 0
-        try:
-            message_type = ProtocolMessageTypes(message.type)
-        except Exception as e:
-            log.warning(f"Invalid message: {message.type}, {e}")
+        table, entry = self._get_entry(message, our_capabilities, peer_capabilities)
+        if entry is None:
             return True
 
-        new_message_counts: int = self.message_counts[message_type] + 1
-        new_cumulative_size: int = self.message_cumulative_sizes[message_type] + len(message.data)
-        new_non_tx_count: int = self.non_tx_message_counts
-        new_non_tx_size: int = self.non_tx_cumulative_size
-        proportion_of_limit: float = self.percentage_of_limit / 100
-
-        ret: bool = False
-        rate_limits = get_rate_limits_to_use(our_capabilities, peer_capabilities)
-
-        try:
-            limits: RLSettings = rate_limits["default_settings"]
-            if message_type in rate_limits["rate_limits_tx"]:
-                limits = rate_limits["rate_limits_tx"][message_type]
-            elif message_type in rate_limits["rate_limits_other"]:
-                limits = rate_limits["rate_limits_other"][message_type]
-                non_tx_freq = rate_limits["non_tx_freq"]
-                non_tx_max_total_size = rate_limits["non_tx_max_total_size"]
-                new_non_tx_count = self.non_tx_message_counts + 1
-                new_non_tx_size = self.non_tx_cumulative_size + len(message.data)
-                if new_non_tx_count > non_tx_freq * proportion_of_limit:
-                    return False
-                if new_non_tx_size > non_tx_max_total_size * proportion_of_limit:
-                    return False
-            else:
-                log.warning(f"Message type {message_type} not found in rate limits")
-
-            if limits.max_total_size is None:
-                limits = dataclasses.replace(limits, max_total_size=limits.frequency * limits.max_size)
-            assert limits.max_total_size is not None
+        size = len(message.data)
+        buckets = self._refill(message.type, table, entry, time.monotonic())
+        allowed = size <= entry.max_size and buckets.has(size)
+        if entry.non_tx:
+            assert self.non_tx_buckets is not None
+            allowed = allowed and self.non_tx_buckets.has(size)
 
-            if new_message_counts > limits.frequency * proportion_of_limit:
-                return False
-            if len(message.data) > limits.max_size:
-                return False
-            if new_cumulative_size > limits.max_total_size * proportion_of_limit:
-                return False
+        if self.incoming or allowed:
+            # now that we determined that it's OK to send the message, take the
+            # tokens. Alternatively, if this was an incoming message, we already
+            # received it and it should take the tokens unconditionally
+            buckets.take(size)
+            if entry.non_tx:
+                assert self.non_tx_buckets is not None
+                self.non_tx_buckets.take(size)
+        return allowed
 
-            ret = True
-            return True
-        finally:
-            if self.incoming or ret:
-                # now that we determined that it's OK to send the message, commit the
-                # updates to the counters. Alternatively, if this was an
-                # incoming message, we already received it and it should
-                # increment the counters unconditionally
-                self.message_counts[message_type] = new_message_counts
-                self.message_cumulative_sizes[message_type] = new_cumulative_size
-                self.non_tx_message_counts = new_non_tx_count
-                self.non_tx_cumulative_size = new_non_tx_size
+    def seconds_until_allowed(
+        self, message: Message, our_capabilities: List[Capability], peer_capabilities: List[Capability]
+    ) -> Optional[float]:
+        """
+        Returns the time until an outgoing message which was rate limited can be sent, `None` if it never can be
+        """
+        table, entry = self._get_entry(message, our_capabilities, peer_capabilities)
+        if entry is None:
+            return 0.0
+        size = len(message.data)
+        if size > entry.max_size:
+            return None
+        buckets = self._refill(message.type, table, entry, time.monotonic())
+        seconds = buckets.seconds_until(size, entry.frequency, entry.max_total_size, self.reset_seconds)
+        if seconds is not None and entry.non_tx:
+            assert self.non_tx_buckets is not None
+            non_tx_seconds = self.non_tx_buckets.seconds_until(
+                size, table.non_tx_frequency, table.non_tx_max_total_size, self.reset_seconds
+            )
+            seconds = None if non_tx_seconds is None else max(seconds, non_tx_seconds)
+        return seconds
@@ -28,8 +28,11 @@ from spare.protocols.protocol_message_types import ProtocolMessageTypes
 from spare.protocols.protocol_state_machine import message_requires_reply
 from spare.protocols.protocol_timing import INVALID_PROTOCOL_BAN_SECONDS
 from spare.protocols.shared_protocol import protocol_version
+from spare.server.broadcast import Broadcast, BroadcastMetrics
+from spare.server.inbound_pipeline import InboundPipeline
 from spare.server.introducer_peers import IntroducerPeers
 from spare.server.outbound_message import Message, NodeType
+from spare.server.outbound_queue import OutboundClass, outbound_budgets_from_config
 from spare.server.ssl_context import private_ssl_paths, public_ssl_paths
 from spare.server.ws_connection import ConnectionCallback, WSSpareConnection
 from spare.types.blockchain_format.sized_bytes import bytes32
@@ -122,6 +125,8 @@ class SpareServer:
     _network_id: str
     _inbound_rate_limit_percent: int
     _outbound_rate_limit_percent: int
+    _outbound_queue_budgets: Dict[OutboundClass, int]
+    inbound_pipeline: InboundPipeline
     api: Any
     node: Any
     root_path: Path
@@ -140,6 +145,7 @@ class SpareServer:
     connection_close_task: Optional[asyncio.Task[None]] = None
     received_message_callback: Optional[ConnectionCallback] = None
     banned_peers: Dict[str, float] = field(default_factory=dict)
+    broadcast_metrics: BroadcastMetrics = field(default_factory=BroadcastMetrics)
     invalid_protocol_ban_seconds = INVALID_PROTOCOL_BAN_SECONDS
 
     @classmethod
@@ -223,6 +229,8 @@ class SpareServer:
             _network_id=network_id,
             _inbound_rate_limit_percent=inbound_rate_limit_percent,
             _outbound_rate_limit_percent=outbound_rate_limit_percent,
+            _outbound_queue_budgets=outbound_budgets_from_config(config),
+            inbound_pipeline=InboundPipeline.from_config(config),
             log=log,
             api=api,
             node=node,
@@ -284,6 +292,7 @@ class SpareServer:
             raise RuntimeError("SpareServer already started")
         if self.gc_task is None:
             self.gc_task = asyncio.create_task(self.garbage_collect_connections_task())
+        self.inbound_pipeline.start()
 
         if listen:
             self.on_connect = on_connect
@@ -335,6 +344,8 @@ class SpareServer:
                 inbound_rate_limit_percent=self._inbound_rate_limit_percent,
                 outbound_rate_limit_percent=self._outbound_rate_limit_percent,
                 local_capabilities_for_handshake=self._local_capabilities_for_handshake,
+                outbound_queue_budgets=self._outbound_queue_budgets,
+                inbound_pipeline=self.inbound_pipeline,
             )
             await connection.perform_handshake(self._network_id, protocol_version, self._port, self._local_type)
             assert connection.connection_type is not None, "handshake failed to set connection type, still None"
@@ -481,6 +492,8 @@ class SpareServer:
                 outbound_rate_limit_percent=self._outbound_rate_limit_percent,
                 local_capabilities_for_handshake=self._local_capabilities_for_handshake,
                 session=session,
+                outbound_queue_budgets=self._outbound_queue_budgets,
+                inbound_pipeline=self.inbound_pipeline,
             )
             await connection.perform_handshake(self._network_id, protocol_version, self._port, self._local_type)
             await self.connection_added(connection, on_connect)
@@ -560,12 +573,24 @@ class SpareServer:
         node_type: NodeType,
         origin_peer: WSSpareConnection,
     ) -> None:
-        for node_id, connection in self.all_connections.items():
-            if node_id == origin_peer.peer_node_id:
-                continue
-            if connection.connection_type is node_type:
-                for message in messages:
-                    await connection.send_message(message)
+        self.broadcast(
+            messages,
+            [
+                connection
+                for node_id, connection in self.all_connections.items()
+                if node_id != origin_peer.peer_node_id and connection.connection_type is node_type
+            ],
+        )
+
+    def broadcast(self, messages: List[Message], connections: List[WSSpareConnection]) -> None:
+        """
+        Serializes each message once and queues it to all connections, without waiting for any of them to send it.
+        Messages of the same OutboundClass are sent in order, but a connection may send a more urgent message, of a
+        lower class, before an earlier and less urgent one.
+        """
+        for message in messages:
+            broadcast = Broadcast(message, self.broadcast_metrics.for_type(message.type))
+            broadcast.set_peers(sum(1 for connection in connections if connection.queue_broadcast(broadcast)))
 
     async def validate_broadcast_message_type(self, messages: List[Message], node_type: NodeType) -> None:
         for message in messages:
@@ -588,10 +613,14 @@ class SpareServer:
         exclude: Optional[bytes32] = None,
     ) -> None:
         await self.validate_broadcast_message_type(messages, node_type)
-        for _, connection in self.all_connections.items():
-            if connection.connection_type is node_type and connection.peer_node_id != exclude:
-                for message in messages:
-                    await connection.send_message(message)
+        self.broadcast(
+            messages,
+            [
+                connection
+                for connection in self.all_connections.values()
+                if connection.connection_type is node_type and connection.peer_node_id != exclude
+            ],
+        )
 
     async def send_to_specific(self, messages: List[Message], node_id: bytes32) -> None:
         if node_id in self.all_connections:
@@ -626,6 +655,7 @@ class SpareServer:
         if self.gc_task is not None:
             self.gc_task.cancel()
             self.gc_task = None
+        self.inbound_pipeline.close()
 
     async def await_closed(self) -> None:
         self.log.debug("Await Closed")
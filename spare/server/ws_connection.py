@@ -2,13 +2,15 @@ from __future__ import annotations
 
 import asyncio
 import contextlib
+import heapq
+import itertools
 import logging
 import math
 import time
 import traceback
 from dataclasses import dataclass, field
 from secrets import token_bytes
-from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Set, Tuple, Union
 
 from aiohttp import ClientSession, WSCloseCode, WSMessage, WSMsgType
 from aiohttp.client import ClientWebSocketResponse
@@ -20,8 +22,11 @@ from spare.protocols.protocol_message_types import ProtocolMessageTypes
 from spare.protocols.protocol_state_machine import message_response_ok
 from spare.protocols.protocol_timing import API_EXCEPTION_BAN_SECONDS, INTERNAL_PROTOCOL_ERROR_BAN_SECONDS
 from spare.protocols.shared_protocol import Capability, Handshake
+from spare.server.broadcast import Broadcast
 from spare.server.capabilities import known_active_capabilities
+from spare.server.inbound_pipeline import InboundPipeline, InboundWindow
 from spare.server.outbound_message import Message, NodeType, make_msg
+from spare.server.outbound_queue import OutboundClass, OutboundQueue
 from spare.server.rate_limits import RateLimiter
 from spare.types.blockchain_format.sized_bytes import bytes32
 from spare.types.peer_info import PeerInfo
@@ -83,8 +88,15 @@ class WSSpareConnection:
 
     # Messaging
     received_message_callback: Optional[ConnectionCallback] = field(repr=False)
-    incoming_queue: asyncio.Queue[Message] = field(default_factory=asyncio.Queue, repr=False)
-    outgoing_queue: asyncio.Queue[Message] = field(default_factory=asyncio.Queue, repr=False)
+    # Messages waiting for a credit of the inbound window, with the time they were read
+    incoming_queue: asyncio.Queue[Tuple[Message, float]] = field(default_factory=asyncio.Queue, repr=False)
+    inbound_pipeline: InboundPipeline = field(default_factory=InboundPipeline, repr=False)
+    inbound_window: Optional[InboundWindow] = field(default=None, repr=False)
+    outgoing_queue: OutboundQueue = field(default_factory=OutboundQueue, repr=False)
+    # Rate limited outbound messages as a heap of (time they can be sent, sequence, message)
+    deferred_messages: List[Tuple[float, int, Union[Message, Broadcast]]] = field(default_factory=list, repr=False)
+    deferred_sequence: Iterator[int] = field(default_factory=itertools.count, repr=False)
+    deferred_task: Optional[asyncio.Task[None]] = field(default=None, repr=False)
     api_tasks: Dict[bytes32, asyncio.Task[None]] = field(default_factory=dict, repr=False)
     # Contains task ids of api tasks which should not be canceled
     execute_tasks: Set[bytes32] = field(default_factory=set, repr=False)
@@ -135,6 +147,8 @@ class WSSpareConnection:
         outbound_rate_limit_percent: int,
         local_capabilities_for_handshake: List[Tuple[uint16, str]],
         session: Optional[ClientSession] = None,
+        outbound_queue_budgets: Optional[Dict[OutboundClass, int]] = None,
+        inbound_pipeline: Optional[InboundPipeline] = None,
     ) -> WSSpareConnection:
         assert ws._writer is not None
         peername = ws._writer.transport.get_extra_info("peername")
@@ -166,8 +180,14 @@ class WSSpareConnection:
             is_outbound=is_outbound,
             received_message_callback=received_message_callback,
             session=session,
+            outgoing_queue=OutboundQueue(outbound_queue_budgets),
+            inbound_pipeline=InboundPipeline() if inbound_pipeline is None else inbound_pipeline,
         )
 
+    def __post_init__(self) -> None:
+        if self.inbound_window is None:
+            self.inbound_window = self.inbound_pipeline.create_window()
+
     def _get_extra_info(self, name: str) -> Optional[Any]:
         writer = self.ws._writer
         assert writer is not None, "websocket's ._writer is None, was .prepare() called?"
@@ -288,6 +308,8 @@ class WSSpareConnection:
                 self.incoming_message_task.cancel()
             if self.outbound_task is not None:
                 self.outbound_task.cancel()
+            if self.deferred_task is not None:
+                self.deferred_task.cancel()
             if self.ws is not None and self.ws.closed is False:
                 await self.ws.close(code=ws_close_code, message=message)
             if self.session is not None:
@@ -382,10 +404,15 @@ class WSSpareConnection:
                 self.execute_tasks.add(task_id)
                 timeout = None
 
+            # Large payloads are decoded in a worker thread, so that they don't stall the event loop
+            kwargs: Dict[str, Any] = {}
+            if metadata.bytes_required:
+                kwargs[metadata.message_name_bytes] = full_message.data
+            request = await self.inbound_pipeline.decode(metadata.message_class, full_message.data)
             if metadata.peer_required:
-                coroutine = f(full_message.data, self)
+                coroutine = f(request, self, **kwargs)
             else:
-                coroutine = f(full_message.data)
+                coroutine = f(request, **kwargs)
 
             async def wrapped_coroutine() -> Optional[Message]:
                 try:
@@ -432,17 +459,27 @@ class WSSpareConnection:
                 self.api_tasks.pop(task_id)
             if task_id in self.execute_tasks:
                 self.execute_tasks.remove(task_id)
+            assert self.inbound_window is not None
+            self.inbound_window.release()
 
     async def incoming_message_handler(self) -> None:
+        assert self.inbound_window is not None
         while True:
-            message = await self.incoming_queue.get()
+            message, read_time = await self.incoming_queue.get()
+            await self.inbound_window.acquire(len(message.data))
+            self.inbound_pipeline.metrics.queue_wait.record(time.monotonic() - read_time)
             task_id: bytes32 = bytes32(token_bytes(32))
             api_task = asyncio.create_task(self._api_call(message, task_id))
             self.api_tasks[task_id] = api_task
 
     async def inbound_handler(self) -> None:
+        assert self.inbound_window is not None
         try:
             while not self.closed:
+                # Stop reading while too much is waiting to be handled, so that TCP pushes back on the peer
+                stalled = await self.inbound_window.wait_for_space()
+                if stalled > 0:
+                    self.inbound_pipeline.metrics.read_stall.record(stalled)
                 message = await self._read_one_message()
                 if message is not None:
                     if message.id in self.pending_requests:
@@ -450,7 +487,8 @@ class WSSpareConnection:
                         event = self.pending_requests[message.id]
                         event.set()
                     else:
-                        await self.incoming_queue.put(message)
+                        self.inbound_window.queued(len(message.data))
+                        self.incoming_queue.put_nowait((message, time.monotonic()))
                 else:
                     continue
         except asyncio.CancelledError:
@@ -467,6 +505,16 @@ class WSSpareConnection:
         await self.outgoing_queue.put(message)
         return True
 
+    def queue_broadcast(self, broadcast: Broadcast) -> bool:
+        """
+        Queues an already serialized message without waiting, used by `SpareServer` to fan out a message to many
+        connections.
+        """
+        if self.closed:
+            return False
+        self.outgoing_queue.put_nowait(broadcast)
+        return True
+
     async def call_api(
         self,
         request_method: Callable[..., Awaitable[Optional[Message]]],
@@ -528,11 +576,19 @@ class WSSpareConnection:
         message = Message(message_no_id.type, request_id, message_no_id.data)
         assert message.id is not None
         self.pending_requests[message.id] = event
-        await self.outgoing_queue.put(message)
+        # Keeps the inbound handler reading while it's past the queued bytes limit, so the response isn't stuck
+        # behind the messages waiting to be handled
+        if self.inbound_window is not None:
+            self.inbound_window.expect_response()
+        try:
+            await self.outgoing_queue.put(message)
 
-        # Either the result is available below or not, no need to detect the timeout error
-        with contextlib.suppress(asyncio.TimeoutError):
-            await asyncio.wait_for(event.wait(), timeout=timeout)
+            # Either the result is available below or not, no need to detect the timeout error
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(event.wait(), timeout=timeout)
+        finally:
+            if self.inbound_window is not None:
+                self.inbound_window.response_done()
 
         self.pending_requests.pop(message.id)
         result: Optional[Message] = None
@@ -552,18 +608,45 @@ class WSSpareConnection:
         for message in messages:
             await self.outgoing_queue.put(message)
 
-    async def _wait_and_retry(self, msg: Message) -> None:
-        try:
-            await asyncio.sleep(1)
-            await self.outgoing_queue.put(msg)
-        except Exception as e:
-            self.log.debug(f"Exception {e} while waiting to retry sending rate limited message")
+    def _defer_message(self, queued: Union[Message, Broadcast], message: Message) -> None:
+        """
+        Parks a rate limited message until the rate limiter allows it, all parked messages of the connection share
+        one task which puts them back in the outgoing queue.
+        """
+        seconds = self.outbound_rate_limiter.seconds_until_allowed(
+            message, self.local_capabilities, self.peer_capabilities
+        )
+        if seconds is None:
+            self.log.warning(
+                f"Dropping {ProtocolMessageTypes(message.type).name} to {self.peer_info.host}, "
+                f"it's larger than the rate limits allow"
+            )
+            if isinstance(queued, Broadcast):
+                queued.dropped()
             return None
+        heapq.heappush(self.deferred_messages, (time.monotonic() + seconds, next(self.deferred_sequence), queued))
+        if self.deferred_task is None or self.deferred_task.done():
+            self.deferred_task = asyncio.create_task(self._send_deferred_messages())
 
-    async def _send_message(self, message: Message) -> None:
-        encoded: bytes = bytes(message)
-        size = len(encoded)
-        assert len(encoded) < (2 ** (LENGTH_BYTES * 8))
+    async def _send_deferred_messages(self) -> None:
+        try:
+            while len(self.deferred_messages) > 0 and not self.closed:
+                # Messages deferred while sleeping can be due earlier, so wake up at least every second
+                await asyncio.sleep(min(1.0, max(0.0, self.deferred_messages[0][0] - time.monotonic())))
+                now = time.monotonic()
+                while len(self.deferred_messages) > 0 and self.deferred_messages[0][0] <= now:
+                    _, _, queued = heapq.heappop(self.deferred_messages)
+                    self.outgoing_queue.put_nowait(queued)
+        except asyncio.CancelledError:
+            pass
+
+    async def _send_message(self, queued: Union[Message, Broadcast]) -> None:
+        broadcast: Optional[Broadcast] = None
+        if isinstance(queued, Broadcast):
+            broadcast = queued
+            message = broadcast.message
+        else:
+            message = queued
         if not self.outbound_rate_limiter.process_msg_and_check(
             message, self.local_capabilities, self.peer_capabilities
         ):
@@ -578,7 +661,9 @@ class WSSpareConnection:
 
                 # TODO: fix this special case. This function has rate limits which are too low.
                 if ProtocolMessageTypes(message.type) != ProtocolMessageTypes.respond_peers:
-                    asyncio.create_task(self._wait_and_retry(message))
+                    self._defer_message(queued, message)
+                elif broadcast is not None:
+                    broadcast.dropped()
 
                 return None
             else:
@@ -587,7 +672,12 @@ class WSSpareConnection:
                     f"peer: {self.peer_info.host}"
                 )
 
+        encoded = bytes(message) if broadcast is None else broadcast.encoded
+        size = len(encoded)
+        assert len(encoded) < (2 ** (LENGTH_BYTES * 8))
         await self.ws.send_bytes(encoded)
+        if broadcast is not None:
+            broadcast.written()
         self.log.debug(
             f"-> {ProtocolMessageTypes(message.type).name} to peer {self.peer_info.host} {self.peer_node_id}"
         )
@@ -258,13 +258,14 @@ class BlockTools:
         def test_callback(event: PlotRefreshEvents, update_result: PlotRefreshResult):
             assert update_result.duration < 15
             if event == PlotRefreshEvents.started:
-                self.total_result = PlotRefreshResult()
+                # Only the plots which aren't loaded yet are processed, `remaining` holds their number here
+                self.total_result = PlotRefreshResult(remaining=update_result.remaining)
 
             if event == PlotRefreshEvents.batch_processed:
                 self.total_result.loaded += update_result.loaded
                 self.total_result.processed += update_result.processed
                 self.total_result.duration += update_result.duration
-                assert update_result.remaining >= len(self.expected_plots) - self.total_result.processed
+                assert update_result.remaining >= self.total_result.remaining - self.total_result.processed
                 assert len(update_result.loaded) <= self.plot_manager.refresh_parameter.batch_size
 
             if event == PlotRefreshEvents.done:
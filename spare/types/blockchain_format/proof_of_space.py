@@ -1,8 +1,10 @@
 from __future__ import annotations
 
+import hashlib
 import logging
+import struct
 from dataclasses import dataclass
-from typing import Optional, cast
+from typing import List, Optional, Union, cast
 
 from bitstring import BitArray
 from blspy import AugSchemeMPL, G1Element, PrivateKey
@@ -87,6 +89,35 @@ def passes_plot_filter(
     return cast(bool, plot_filter[: constants.NUMBER_ZERO_BITS_PLOT_FILTER].uint == 0)
 
 
+def plot_filter_batch(
+    constants: ConsensusConstants,
+    plot_ids: Union[bytes, bytearray, memoryview],
+    challenge_hash: bytes32,
+    signage_point: bytes32,
+) -> List[int]:
+    """
+    Applies the plot filter to plot_ids, a buffer of back to back 32 byte plot
+    IDs, and returns the indices of the ones that pass. This gives the same
+    result as calling passes_plot_filter() for each plot ID, but in a single
+    pass over the buffer, without converting each hash to a bit array.
+    """
+    zero_bits = constants.NUMBER_ZERO_BITS_PLOT_FILTER
+    if len(plot_ids) % 32 != 0:
+        raise ValueError(f"plot ID buffer size {len(plot_ids)} is not a multiple of 32")
+    if zero_bits == 0:
+        return list(range(len(plot_ids) // 32))
+    # a hash starts with zero_bits zeros if, as a big endian number, it's less
+    # than this
+    threshold = (1 << (256 - zero_bits)).to_bytes(32, "big")
+    suffix = challenge_hash + signage_point
+    sha256 = hashlib.sha256
+    return [
+        index
+        for index, (plot_id,) in enumerate(struct.iter_unpack("32s", plot_ids))
+        if sha256(plot_id + suffix).digest() < threshold
+    ]
+
+
 def calculate_plot_filter_input(plot_id: bytes32, challenge_hash: bytes32, signage_point: bytes32) -> bytes32:
     return std_hash(plot_id + challenge_hash + signage_point)
 
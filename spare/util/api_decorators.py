@@ -29,6 +29,8 @@ class ApiMetadata:
     bytes_required: bool = False
     execute_task: bool = False
     reply_types: List[ProtocolMessageTypes] = field(default_factory=list)
+    # The keyword argument which receives the message bytes if bytes_required is set
+    message_name_bytes: str = ""
 
 
 def get_metadata(function: Callable[..., object]) -> Optional[ApiMetadata]:
@@ -63,7 +65,7 @@ def api_request(
                 arg = message_class.from_bytes(original)
             else:
                 arg = original
-                if metadata.bytes_required:
+                if metadata.bytes_required and message_name_bytes not in kwargs:
                     kwargs[message_name_bytes] = bytes(original)
 
             return f(self, arg, *args, **kwargs)
@@ -80,6 +82,7 @@ def api_request(
             execute_task=execute_task,
             reply_types=non_optional_reply_types,
             message_class=message_class,
+            message_name_bytes=message_name_bytes,
         )
 
         _set_metadata(function=wrapper, metadata=metadata)
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import io
 from dataclasses import dataclass
-from typing import Callable, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from blspy import G1Element, G2Element
 from chia_rs import serialized_length
@@ -12,7 +12,9 @@ from spare.types.blockchain_format.coin import Coin
 from spare.types.blockchain_format.foliage import TransactionsInfo
 from spare.types.blockchain_format.serialized_program import SerializedProgram
 from spare.types.blockchain_format.sized_bytes import bytes32
-from spare.util.ints import uint32
+from spare.types.full_block import FullBlock
+from spare.util.hash import std_hash
+from spare.util.ints import uint32, uint128
 
 
 def skip_list(buf: memoryview, skip_item: Callable[[memoryview], memoryview]) -> memoryview:
@@ -322,3 +324,141 @@ def header_block_from_block(
         header_block += bytes(transactions_info)
 
     return header_block
+
+
+def skip_transactions_generator(buf: memoryview) -> memoryview:
+    return buf[serialized_length(buf) :]
+
+
+def full_block_field_offsets(buf: memoryview) -> List[int]:
+    """
+    Returns the offsets at which each field of the serialized FullBlock in
+    buf begins, followed by the end offset of the last field. Field i spans
+    buf[offsets[i] : offsets[i + 1]]
+    """
+    skips: List[Callable[[memoryview], memoryview]] = [
+        lambda b: skip_list(b, skip_end_of_sub_slot_bundle),  # finished_sub_slots
+        skip_reward_chain_block,  # reward_chain_block
+        lambda b: skip_optional(b, skip_vdf_proof),  # challenge_chain_sp_proof
+        skip_vdf_proof,  # challenge_chain_ip_proof
+        lambda b: skip_optional(b, skip_vdf_proof),  # reward_chain_sp_proof
+        skip_vdf_proof,  # reward_chain_ip_proof
+        lambda b: skip_optional(b, skip_vdf_proof),  # infused_challenge_chain_ip_proof
+        skip_foliage,  # foliage
+        lambda b: skip_optional(b, skip_foliage_transaction_block),  # foliage_transaction_block
+        lambda b: skip_optional(b, skip_transactions_info),  # transactions_info
+        lambda b: skip_optional(b, skip_transactions_generator),  # transactions_generator
+        lambda b: skip_list(b, skip_uint32),  # transactions_generator_ref_list
+    ]
+    total = len(buf)
+    offsets = [0]
+    for skip in skips:
+        buf = skip(buf)
+        offsets.append(total - len(buf))
+    return offsets
+
+
+_FULL_BLOCK_FIELDS = {field.name: i for i, field in enumerate(FullBlock._streamable_fields)}
+_FOLIAGE = _FULL_BLOCK_FIELDS["foliage"]
+_REWARD_CHAIN_BLOCK = _FULL_BLOCK_FIELDS["reward_chain_block"]
+_FOLIAGE_TRANSACTION_BLOCK = _FULL_BLOCK_FIELDS["foliage_transaction_block"]
+_TRANSACTIONS_GENERATOR = _FULL_BLOCK_FIELDS["transactions_generator"]
+
+
+class FullBlockView:
+    """
+    A read-only view of a serialized FullBlock. Field offsets are found with
+    the skip_* functions above, and fields are only parsed when they are
+    accessed (and then cached). The commonly used header_hash, height,
+    prev_header_hash, weight and total_iters are read straight out of the
+    buffer without parsing anything. bytes() of a view returns the buffer it
+    was created from, so serving a block doesn't re-serialize it.
+    """
+
+    __slots__ = ("_blob", "_buf", "_offsets", "_fields", "_header_hash")
+
+    def __init__(self, blob: bytes) -> None:
+        self._blob = blob
+        self._buf = memoryview(blob)
+        self._offsets: Optional[List[int]] = None
+        self._fields: Dict[str, Any] = {}
+        self._header_hash: Optional[bytes32] = None
+
+    @classmethod
+    def from_full_block(cls, block: FullBlock) -> FullBlockView:
+        view = cls(bytes(block))
+        for field in FullBlock._streamable_fields:
+            view._fields[field.name] = getattr(block, field.name)
+        return view
+
+    def _field_range(self, index: int) -> memoryview:
+        if self._offsets is None:
+            self._offsets = full_block_field_offsets(self._buf)
+            # the buffer must contain exactly one FullBlock
+            assert self._offsets[-1] == len(self._buf)
+        return self._buf[self._offsets[index] : self._offsets[index + 1]]
+
+    def __getattr__(self, name: str) -> Any:
+        index = _FULL_BLOCK_FIELDS.get(name)
+        if index is None:
+            raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+        try:
+            return self._fields[name]
+        except KeyError:
+            pass
+        value = FullBlock._streamable_fields[index].parse_function(io.BytesIO(self._field_range(index)))
+        self._fields[name] = value
+        return value
+
+    def __bytes__(self) -> bytes:
+        return self._blob
+
+    def __len__(self) -> int:
+        return len(self._blob)
+
+    def to_full_block(self) -> FullBlock:
+        return FullBlock.from_bytes(self._blob)
+
+    @property
+    def header_hash(self) -> bytes32:
+        if self._header_hash is None:
+            # this is the same as foliage.get_hash()
+            self._header_hash = std_hash(self._field_range(_FOLIAGE), skip_bytes_conversion=True)
+        return self._header_hash
+
+    @property
+    def prev_header_hash(self) -> bytes32:
+        return bytes32(self._field_range(_FOLIAGE)[:32])
+
+    @property
+    def weight(self) -> uint128:
+        return uint128.from_bytes(self._field_range(_REWARD_CHAIN_BLOCK)[:16])
+
+    @property
+    def height(self) -> uint32:
+        return uint32.from_bytes(self._field_range(_REWARD_CHAIN_BLOCK)[16:20])
+
+    @property
+    def total_iters(self) -> uint128:
+        return uint128.from_bytes(self._field_range(_REWARD_CHAIN_BLOCK)[20:36])
+
+    def is_transaction_block(self) -> bool:
+        return self._field_range(_FOLIAGE_TRANSACTION_BLOCK)[0] != 0
+
+    def has_transactions_generator(self) -> bool:
+        return self._field_range(_TRANSACTIONS_GENERATOR)[0] != 0
+
+    def bytes_without_generator(self) -> bytes:
+        """
+        The serialized block with its transactions_generator set to None (but
+        the generator ref list retained). This is what peers get when they
+        request blocks without the transaction generator.
+        """
+        if not self.has_transactions_generator():
+            return self._blob
+        assert self._offsets is not None
+        return (
+            self._buf[: self._offsets[_TRANSACTIONS_GENERATOR]].tobytes()
+            + b"\x00"
+            + self._buf[self._offsets[_TRANSACTIONS_GENERATOR + 1] :].tobytes()
+        )
@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+# upper bounds, in seconds, of the latency histogram buckets. The last bucket
+# has no upper bound
+LATENCY_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+@dataclass
+class LatencyHistogram:
+    counts: List[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+    count: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    def record(self, seconds: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def to_json_dict(self) -> Dict[str, Any]:
+        upper_bounds: List[Optional[float]] = [*LATENCY_BUCKETS, None]
+        return {
+            "count": self.count,
+            "average_seconds": self.total_seconds / self.count if self.count > 0 else 0.0,
+            "max_seconds": self.max_seconds,
+            "buckets": [{"le": le, "count": count} for le, count in zip(upper_bounds, self.counts)],
+        }
@@ -26,9 +26,10 @@ from blspy import G1Element, G2Element, PrivateKey
 from typing_extensions import TYPE_CHECKING, Literal, get_args, get_origin
 
 from spare.types.blockchain_format.sized_bytes import bytes32
-from spare.util.byte_types import hexstr_to_bytes
+from spare.util.byte_types import SizedBytes, hexstr_to_bytes
 from spare.util.hash import std_hash
 from spare.util.ints import uint32
+from spare.util.struct_stream import StructStream
 
 if TYPE_CHECKING:
     from _typeshed import DataclassInstance
@@ -529,6 +530,294 @@ def function_to_stream_one_item(f_type: Type[Any]) -> StreamFunctionType:
         raise UnsupportedType(f"can't stream {f_type}")
 
 
+# The functions below generate (and cache) one parse and one stream function per
+# streamable class. Instead of walking the per-field closures above and going
+# through a BinaryIO for every item, the generated parser reads straight out of
+# a memoryview at an offset, and the generated serializer appends to a
+# bytearray. Types the generator has no fast path for are handled by calling
+# their own parse()/stream() against a BytesIO over the same buffer.
+#
+# parse functions have the signature:
+#   (buf: memoryview, pos: int, end: int, f: io.BytesIO) -> Tuple[object, int]
+# where `f` holds the same data as `buf` and the returned int is the new offset.
+# stream functions have the signature:
+#   (item: object, out: bytearray) -> None
+
+CompiledParseFunction = Callable[[memoryview, int, int, io.BytesIO], Tuple[Any, int]]
+CompiledStreamFunction = Callable[[Any, bytearray], None]
+
+# set to False to use the closure based (interpreted) code path for all
+# streamable classes. This is mostly useful for benchmarking and debugging
+compiled_streamable_enabled = True
+
+
+def _unexpected_eof() -> None:
+    raise AssertionError("unexpected end of buffer")
+
+
+class _CodeGenerator:
+    def __init__(self) -> None:
+        self.lines: List[str] = []
+        self.namespace: Dict[str, Any] = {
+            "_eof": _unexpected_eof,
+            "_int_new": int.__new__,
+            "_bytes_new": bytes.__new__,
+            "_object_new": object.__new__,
+            "_setattr": object.__setattr__,
+            "_BytesIO": io.BytesIO,
+        }
+        self.counter = 0
+
+    def name(self, prefix: str) -> str:
+        self.counter += 1
+        return f"{prefix}{self.counter}"
+
+    def constant(self, value: object, prefix: str = "_t") -> str:
+        name = self.name(prefix)
+        self.namespace[name] = value
+        return name
+
+    def emit(self, indent: int, line: str) -> None:
+        self.lines.append("    " * indent + line)
+
+    def build(self, function_name: str) -> Callable[..., Any]:
+        source = "\n".join(self.lines)
+        exec(compile(source, f"<streamable {function_name}>", "exec"), self.namespace)
+        function: Callable[..., Any] = self.namespace[function_name]
+        return function
+
+
+def _is_plain_streamable(f_type: Type[Any]) -> bool:
+    # the generated code may only be used when the class doesn't customize
+    # its own serialization
+    return (
+        isinstance(f_type, type)
+        and issubclass(f_type, Streamable)
+        and "_streamable_fields" in f_type.__dict__
+        and getattr(f_type.parse, "__func__", None) is Streamable.parse.__func__
+        and f_type.stream is Streamable.stream
+    )
+
+
+def _emit_read_uint32(g: _CodeGenerator, indent: int, target: str) -> None:
+    g.emit(indent, "if pos + 4 > end: _eof()")
+    g.emit(indent, f'{target} = int.from_bytes(buf[pos : pos + 4], "big")')
+    g.emit(indent, "pos += 4")
+
+
+def _emit_parse(g: _CodeGenerator, f_type: Type[Any], indent: int, target: str) -> None:
+    """
+    Emits code parsing a value of f_type at `pos` into the variable `target`.
+    The cases mirror function_to_parse_one_item()
+    """
+    if f_type is bool:
+        flag = g.name("_b")
+        g.emit(indent, "if pos >= end: _eof()")
+        g.emit(indent, f"{flag} = buf[pos]")
+        g.emit(indent, "pos += 1")
+        g.emit(indent, f"if {flag} > 1: raise ValueError('Bool byte must be 0 or 1')")
+        g.emit(indent, f"{target} = {flag} == 1")
+        return
+    if is_type_SpecificOptional(f_type):
+        flag = g.name("_o")
+        g.emit(indent, "if pos >= end: _eof()")
+        g.emit(indent, f"{flag} = buf[pos]")
+        g.emit(indent, "pos += 1")
+        g.emit(indent, f"if {flag} == 0:")
+        g.emit(indent + 1, f"{target} = None")
+        g.emit(indent, f"elif {flag} == 1:")
+        _emit_parse(g, get_args(f_type)[0], indent + 1, target)
+        g.emit(indent, "else:")
+        g.emit(indent + 1, "raise ValueError('Optional must be 0 or 1')")
+        return
+    if hasattr(f_type, "parse_rust"):
+        t = g.constant(f_type)
+        advance = g.name("_n")
+        g.emit(indent, f"{target}, {advance} = {t}.parse_rust(buf[pos:end])")
+        g.emit(indent, f"pos += {advance}")
+        return
+    if hasattr(f_type, "parse"):
+        if _is_plain_streamable(f_type):
+            parse_function = g.constant(compiled_parse_function(f_type), "_p")
+            g.emit(indent, f"{target}, pos = {parse_function}(buf, pos, end, f)")
+        elif issubclass(f_type, SizedBytes) and f_type.parse.__func__ is SizedBytes.parse.__func__:
+            # an incomplete read fails in the SizedBytes constructor, just
+            # like SizedBytes.parse(). A complete one has the right size, so
+            # the (python level) check in __init__() can be skipped
+            t = g.constant(f_type)
+            g.emit(indent, f"if pos + {f_type._size} > end:")
+            g.emit(indent + 1, f"{t}(buf[pos:end])")
+            if f_type.__new__ is bytes.__new__ and f_type.__init__ is SizedBytes.__init__:
+                g.emit(indent, f"{target} = _bytes_new({t}, buf[pos : pos + {f_type._size}])")
+            else:
+                g.emit(indent, f"{target} = {t}(buf[pos : pos + {f_type._size}])")
+            g.emit(indent, f"pos += {f_type._size}")
+        elif issubclass(f_type, StructStream) and f_type.parse.__func__ is StructStream.parse.__func__:
+            # any value of the right width fits in the type, so the range
+            # check in the StructStream constructor can be skipped
+            t = g.constant(f_type)
+            g.emit(indent, f"if pos + {f_type.SIZE} > end:")
+            g.emit(indent + 1, f"{t}.from_bytes(buf[pos:end])")
+            g.emit(
+                indent,
+                f'{target} = _int_new({t}, int.from_bytes(buf[pos : pos + {f_type.SIZE}], "big", '
+                f"signed={f_type.SIGNED}))",
+            )
+            g.emit(indent, f"pos += {f_type.SIZE}")
+        else:
+            t = g.constant(f_type)
+            g.emit(indent, "f.seek(pos)")
+            g.emit(indent, f"{target} = {t}.parse(f)")
+            g.emit(indent, "pos = f.tell()")
+        return
+    if f_type == bytes:
+        size = g.name("_s")
+        _emit_read_uint32(g, indent, size)
+        g.emit(indent, f"if pos + {size} > end: _eof()")
+        g.emit(indent, f"{target} = bytes(buf[pos : pos + {size}])")
+        g.emit(indent, f"pos += {size}")
+        return
+    if is_type_List(f_type):
+        size = g.name("_s")
+        item = g.name("_i")
+        _emit_read_uint32(g, indent, size)
+        g.emit(indent, f"{target} = []")
+        g.emit(indent, f"for _ in range({size}):")
+        _emit_parse(g, get_args(f_type)[0], indent + 1, item)
+        g.emit(indent + 1, f"{target}.append({item})")
+        return
+    if is_type_Tuple(f_type):
+        items = []
+        for inner_type in get_args(f_type):
+            item = g.name("_i")
+            _emit_parse(g, inner_type, indent, item)
+            items.append(item)
+        g.emit(indent, f"{target} = ({''.join(item + ', ' for item in items)})")
+        return
+    if hasattr(f_type, "from_bytes") and f_type.__name__ in size_hints:
+        t = g.constant(f_type)
+        size_hint = size_hints[f_type.__name__]
+        from_bytes = "from_bytes_unchecked" if hasattr(f_type, "from_bytes_unchecked") else "from_bytes"
+        g.emit(indent, f"if pos + {size_hint} > end: _eof()")
+        g.emit(indent, f"{target} = {t}.{from_bytes}(bytes(buf[pos : pos + {size_hint}]))")
+        g.emit(indent, f"pos += {size_hint}")
+        return
+    if f_type is str:
+        size = g.name("_s")
+        _emit_read_uint32(g, indent, size)
+        g.emit(indent, f"if pos + {size} > end: _eof()")
+        g.emit(indent, f'{target} = bytes(buf[pos : pos + {size}]).decode("utf-8")')
+        g.emit(indent, f"pos += {size}")
+        return
+    raise UnsupportedType(f"Type {f_type} does not have parse")
+
+
+def _emit_stream(g: _CodeGenerator, f_type: Type[Any], indent: int, item: str) -> None:
+    """
+    Emits code appending the serialization of the variable `item` (of type
+    f_type) to `out`. The cases mirror function_to_stream_one_item()
+    """
+    if is_type_SpecificOptional(f_type):
+        g.emit(indent, f"if {item} is None:")
+        g.emit(indent + 1, "out.append(0)")
+        g.emit(indent, "else:")
+        g.emit(indent + 1, "out.append(1)")
+        _emit_stream(g, get_args(f_type)[0], indent + 1, item)
+    elif f_type == bytes:
+        g.emit(indent, f'out += len({item}).to_bytes(4, "big")')
+        g.emit(indent, f"out += {item}")
+    elif hasattr(f_type, "stream"):
+        if _is_plain_streamable(f_type):
+            stream_function = g.constant(compiled_stream_function(f_type), "_w")
+            g.emit(indent, f"{stream_function}({item}, out)")
+        elif issubclass(f_type, SizedBytes) and f_type.stream is SizedBytes.stream:
+            g.emit(indent, f"out += {item}")
+        elif issubclass(f_type, StructStream) and f_type.stream is StructStream.stream:
+            g.emit(indent, f'out += {item}.to_bytes({f_type.SIZE}, "big", signed={f_type.SIGNED})')
+        else:
+            stream = g.name("_f")
+            g.emit(indent, f"{stream} = _BytesIO()")
+            g.emit(indent, f"{item}.stream({stream})")
+            g.emit(indent, f"out += {stream}.getvalue()")
+    elif hasattr(f_type, "__bytes__"):
+        g.emit(indent, f"out += {item}.__bytes__()")
+    elif is_type_List(f_type):
+        element = g.name("_e")
+        g.emit(indent, f'out += len({item}).to_bytes(4, "big")')
+        g.emit(indent, f"for {element} in {item}:")
+        _emit_stream(g, get_args(f_type)[0], indent + 1, element)
+    elif is_type_Tuple(f_type):
+        inner_types = get_args(f_type)
+        g.emit(indent, f"assert len({item}) == {len(inner_types)}")
+        for i, inner_type in enumerate(inner_types):
+            element = g.name("_e")
+            g.emit(indent, f"{element} = {item}[{i}]")
+            _emit_stream(g, inner_type, indent, element)
+    elif f_type is str:
+        encoded = g.name("_e")
+        g.emit(indent, f'{encoded} = {item}.encode("utf-8")')
+        g.emit(indent, f'out += len({encoded}).to_bytes(4, "big")')
+        g.emit(indent, f"out += {encoded}")
+    elif f_type is bool:
+        g.emit(indent, f"out.append(1 if {item} else 0)")
+    else:
+        raise UnsupportedType(f"can't stream {f_type}")
+
+
+def compiled_parse_function(cls: Type[Streamable]) -> CompiledParseFunction:
+    """
+    Returns the generated parse function for a streamable class, generating it
+    on first use.
+    """
+    function: Optional[CompiledParseFunction] = cls.__dict__.get("_streamable_compiled_parse")
+    if function is not None:
+        return function
+
+    g = _CodeGenerator()
+    t = g.constant(cls)
+    g.emit(0, "def parse(buf, pos, end, f):")
+    values = []
+    for field in cls._streamable_fields:
+        value = g.name("_v")
+        _emit_parse(g, field.type, 1, value)
+        values.append((field.name, value))
+    g.emit(1, f"obj = _object_new({t})")
+    if "__slots__" in cls.__dict__:
+        for field_name, value in values:
+            g.emit(1, f"_setattr(obj, {field_name!r}, {value})")
+    else:
+        # frozen dataclasses only prevent assignment through setattr, filling
+        # in the instance dict directly is equivalent (and faster)
+        g.emit(1, "d = obj.__dict__")
+        for field_name, value in values:
+            g.emit(1, f"d[{field_name!r}] = {value}")
+    g.emit(1, "return obj, pos")
+    function = g.build("parse")
+    setattr(cls, "_streamable_compiled_parse", function)
+    return function
+
+
+def compiled_stream_function(cls: Type[Streamable]) -> CompiledStreamFunction:
+    """
+    Returns the generated stream function for a streamable class, generating
+    it on first use.
+    """
+    function: Optional[CompiledStreamFunction] = cls.__dict__.get("_streamable_compiled_stream")
+    if function is not None:
+        return function
+
+    g = _CodeGenerator()
+    g.emit(0, "def stream(obj, out):")
+    for field in cls._streamable_fields:
+        item = g.name("_v")
+        g.emit(1, f"{item} = obj.{field.name}")
+        _emit_stream(g, field.type, 1, item)
+    g.emit(1, "return None")
+    function = g.build("stream")
+    setattr(cls, "_streamable_compiled_stream", function)
+    return function
+
+
 def streamable(cls: Type[_T_Streamable]) -> Type[_T_Streamable]:
     """
     This decorator forces correct streamable protocol syntax/usage and populates the caches for types hints and
@@ -629,13 +918,25 @@ class Streamable:
 
     @classmethod
     def parse(cls: Type[_T_Streamable], f: BinaryIO) -> _T_Streamable:
+        if compiled_streamable_enabled and isinstance(f, io.BytesIO):
+            parse_function = compiled_parse_function(cls)
+            with f.getbuffer() as buf:
+                obj: _T_Streamable
+                obj, pos = parse_function(buf, f.tell(), len(buf), f)
+            f.seek(pos)
+            return obj
         # Create the object without calling __init__() to avoid unnecessary post-init checks in strictdataclass
-        obj: _T_Streamable = object.__new__(cls)
+        obj = object.__new__(cls)
         for field in cls._streamable_fields:
             object.__setattr__(obj, field.name, field.parse_function(f))
         return obj
 
     def stream(self, f: BinaryIO) -> None:
+        if compiled_streamable_enabled:
+            out = bytearray()
+            compiled_stream_function(type(self))(self, out)
+            f.write(out)
+            return
         for field in self._streamable_fields:
             field.stream_function(getattr(self, field.name), f)
 
@@ -644,12 +945,24 @@ class Streamable:
 
     @classmethod
     def from_bytes(cls: Type[_T_Streamable], blob: bytes) -> _T_Streamable:
+        if compiled_streamable_enabled and getattr(cls.parse, "__func__", None) is Streamable.parse.__func__:
+            if not isinstance(blob, bytes):
+                blob = bytes(blob)
+            parsed: _T_Streamable
+            # BytesIO shares the memory of a bytes object, until it's written to
+            parsed, pos = compiled_parse_function(cls)(memoryview(blob), 0, len(blob), io.BytesIO(blob))
+            assert pos == len(blob)
+            return parsed
         f = io.BytesIO(blob)
         parsed = cls.parse(f)
         assert f.read() == b""
         return parsed
 
     def __bytes__(self: Any) -> bytes:
+        if compiled_streamable_enabled and type(self).stream is Streamable.stream:
+            out = bytearray()
+            compiled_stream_function(type(self))(self, out)
+            return bytes(out)
         f = io.BytesIO()
         self.stream(f)
         return bytes(f.getvalue())
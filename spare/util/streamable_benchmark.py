@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import gc
+import random
+import sys
+import time
+from typing import Any, Callable, Dict, List, Tuple, Type
+
+from blspy import G1Element, G2Element
+from typing_extensions import get_args
+
+import spare.util.streamable as streamable_module
+from spare.types.blockchain_format.coin import Coin
+from spare.types.blockchain_format.serialized_program import SerializedProgram
+from spare.types.blockchain_format.sized_bytes import bytes32
+from spare.types.full_block import FullBlock
+from spare.types.header_block import HeaderBlock
+from spare.types.spend_bundle import SpendBundle
+from spare.types.weight_proof import WeightProof
+from spare.util.byte_types import SizedBytes
+from spare.util.ints import uint64
+from spare.util.streamable import Streamable, is_type_List, is_type_SpecificOptional, is_type_Tuple
+from spare.util.struct_stream import StructStream
+
+# (1 . (q . 1)) as a stand-in for puzzles and generators
+_PROGRAM = SerializedProgram.fromhex("ff01ff01ff0180")
+
+
+def random_bytes(rng: random.Random, size: int) -> bytes:
+    return rng.getrandbits(size * 8).to_bytes(size, "big") if size > 0 else b""
+
+
+def random_item(rng: random.Random, f_type: Type[Any], list_length: int) -> Any:
+    """
+    Builds a random (but serializable) value of the given streamable field type
+    """
+    if is_type_SpecificOptional(f_type):
+        if rng.random() < 0.5:
+            return None
+        return random_item(rng, get_args(f_type)[0], list_length)
+    if is_type_List(f_type):
+        return [random_item(rng, get_args(f_type)[0], list_length) for _ in range(list_length)]
+    if is_type_Tuple(f_type):
+        return tuple(random_item(rng, t, list_length) for t in get_args(f_type))
+    if f_type is bool:
+        return rng.random() < 0.5
+    if f_type is bytes:
+        return random_bytes(rng, rng.randrange(1000))
+    if f_type is str:
+        return "x" * rng.randrange(100)
+    if f_type is G1Element:
+        return G1Element()
+    if f_type is G2Element:
+        return G2Element()
+    if f_type is SerializedProgram:
+        return _PROGRAM
+    if f_type is Coin:
+        return Coin(bytes32(random_bytes(rng, 32)), bytes32(random_bytes(rng, 32)), uint64(rng.randrange(2**64)))
+    if isinstance(f_type, type) and issubclass(f_type, SizedBytes):
+        return f_type(random_bytes(rng, f_type._size))
+    if isinstance(f_type, type) and issubclass(f_type, StructStream):
+        return f_type(rng.randrange(f_type.MINIMUM, f_type.MAXIMUM_EXCLUSIVE))
+    if isinstance(f_type, type) and issubclass(f_type, Streamable):
+        return random_streamable(rng, f_type, list_length)
+    raise ValueError(f"don't know how to build a random {f_type}")
+
+
+def random_streamable(rng: random.Random, cls: Type[Streamable], list_length: int) -> Any:
+    # nested lists get shorter, so the objects don't explode in size
+    fields = {field.name: random_item(rng, field.type, max(list_length - 1, 1)) for field in cls.streamable_fields()}
+    return cls(**fields)
+
+
+def measure(function: Callable[[], object], runs: int) -> float:
+    # the fastest run, with the garbage collector disabled. Otherwise a full
+    # collection (of all the objects kept around for the benchmark) is billed
+    # to whichever path happens to trigger it
+    gc.collect()
+    gc.disable()
+    try:
+        fastest = float("inf")
+        for _ in range(runs):
+            start = time.perf_counter()
+            function()
+            fastest = min(fastest, time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return fastest
+
+
+def benchmark(cls: Type[Streamable], count: int, runs: int, list_length: int) -> Dict[str, Tuple[float, float]]:
+    rng = random.Random(1337)
+    objects = [random_streamable(rng, cls, list_length) for _ in range(count)]
+    previous_enabled = streamable_module.compiled_streamable_enabled
+
+    # the interpreted path is the reference the compiled one has to match
+    streamable_module.compiled_streamable_enabled = False
+    blobs = [bytes(obj) for obj in objects]
+    parsed = [cls.from_bytes(blob) for blob in blobs]
+    streamable_module.compiled_streamable_enabled = True
+    try:
+        for obj, blob, reference in zip(objects, blobs, parsed):
+            assert bytes(obj) == blob
+            compiled_parsed = cls.from_bytes(blob)
+            assert compiled_parsed == reference
+            assert bytes(compiled_parsed) == blob
+
+        results: Dict[str, Tuple[float, float]] = {}
+        for compiled in (False, True):
+            streamable_module.compiled_streamable_enabled = compiled
+            parse_time = measure(lambda: [cls.from_bytes(blob) for blob in blobs], runs)
+            stream_time = measure(lambda: [bytes(obj) for obj in objects], runs)
+            results["compiled" if compiled else "interpreted"] = (parse_time, stream_time)
+    finally:
+        streamable_module.compiled_streamable_enabled = previous_enabled
+
+    total_bytes = sum(len(blob) for blob in blobs)
+    return {
+        name: (total_bytes / parse_time / 1000000, total_bytes / stream_time / 1000000)
+        for name, (parse_time, stream_time) in results.items()
+    }
+
+
+def main() -> None:
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    count = 100
+    classes: List[Tuple[Type[Streamable], int]] = [
+        (FullBlock, 3),
+        (HeaderBlock, 3),
+        (SpendBundle, 10),
+        (WeightProof, 4),
+    ]
+    print(f"{'class':<14}{'path':<13}{'parse MB/s':>12}{'stream MB/s':>13}")
+    for cls, list_length in classes:
+        results = benchmark(cls, count, runs, list_length)
+        for name, (parse_rate, stream_rate) in results.items():
+            print(f"{cls.__name__:<14}{name:<13}{parse_rate:>12.2f}{stream_rate:>13.2f}")
+        speedup_parse = results["compiled"][0] / results["interpreted"][0]
+        speedup_stream = results["compiled"][1] / results["interpreted"][1]
+        print(f"{'':<14}{'speedup':<13}{speedup_parse:>11.2f}x{speedup_stream:>12.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+from typing import AsyncIterator, List
+
+import pytest
+import pytest_asyncio
+
+from spare.full_node.coin_store import CoinStore
+from spare.types.blockchain_format.coin import Coin
+from spare.types.blockchain_format.sized_bytes import bytes32
+from spare.util.db_wrapper import DBWrapper2
+from spare.util.ints import uint32, uint64
+
+
+def make_coin(height: int, n: int) -> Coin:
+    return Coin(bytes32(bytes([height, n]) * 16), bytes32(bytes([n]) * 32), uint64(1000 + n))
+
+
+def reward_coins(height: int) -> List[Coin]:
+    if height == 0:
+        return []
+    return [make_coin(height, 0), make_coin(height, 1)]
+
+
+@pytest_asyncio.fixture(scope="function")
+async def coin_store(tmp_path: Path) -> AsyncIterator[CoinStore]:
+    db_wrapper = await DBWrapper2.create(database=tmp_path / "coins.sqlite", db_version=2, reader_count=2)
+    try:
+        yield await CoinStore.create(db_wrapper, unspent_index_shards=4)
+    finally:
+        await db_wrapper.close()
+
+
+@pytest.mark.asyncio
+async def test_blocks_and_reorgs_keep_index_consistent(coin_store: CoinStore) -> None:
+    async def add_block(height: int, removals: List[bytes32]) -> None:
+        tx_additions = [make_coin(height, 2)]
+        async with coin_store.unspent_index_transaction():
+            await coin_store.new_block(
+                uint32(height), uint64(height * 20), set(reward_coins(height)), tx_additions, removals
+            )
+        assert await coin_store.check_unspent_index() == []
+
+    for height in range(5):
+        removals = [] if height < 2 else [make_coin(height - 1, 0).name(), make_coin(height - 2, 2).name()]
+        await add_block(height, removals)
+
+    # reorg back to height 2, the coins spent at heights 3 and 4 become unspent again
+    async with coin_store.unspent_index_transaction():
+        await coin_store.rollback_to_block(2)
+    assert await coin_store.check_unspent_index() == []
+    assert await coin_store.get_coin_record(make_coin(3, 0).name()) is None
+    record = await coin_store.get_coin_record(make_coin(2, 0).name())
+    assert record is not None and not record.spent
+
+    # the other fork
+    for height in range(3, 6):
+        await add_block(height, [make_coin(height - 1, 1).name()])
+
+    # rollback_to_block is its own transaction as well
+    await coin_store.rollback_to_block(-1)
+    assert await coin_store.check_unspent_index() == []
+    assert coin_store.unspent_index is not None
+    assert list(coin_store.unspent_index.records()) == []
+
+
+@pytest.mark.asyncio
+async def test_failed_transaction_undoes_index(coin_store: CoinStore) -> None:
+    async with coin_store.unspent_index_transaction():
+        await coin_store.new_block(uint32(1), uint64(20), set(reward_coins(1)), [], [])
+
+    with pytest.raises(RuntimeError):
+        async with coin_store.unspent_index_transaction():
+            await coin_store.new_block(uint32(2), uint64(40), set(reward_coins(2)), [], [make_coin(1, 0).name()])
+            await coin_store.rollback_to_block(1)
+            await coin_store.new_block(uint32(2), uint64(40), set(reward_coins(2)), [], [make_coin(1, 1).name()])
+            raise RuntimeError("failed")
+
+    assert await coin_store.check_unspent_index() == []
+    assert coin_store.unspent_index is not None
+    assert {record.name for record in coin_store.unspent_index.records()} == {c.name() for c in reward_coins(1)}
+
+
+@pytest.mark.asyncio
+async def test_readers_dont_see_uncommitted_changes(coin_store: CoinStore) -> None:
+    async with coin_store.unspent_index_transaction():
+        await coin_store.new_block(uint32(1), uint64(20), set(reward_coins(1)), [], [])
+
+    spent = make_coin(1, 0).name()
+    added = make_coin(2, 0).name()
+    async with coin_store.unspent_index_transaction():
+        await coin_store.new_block(uint32(2), uint64(40), set(reward_coins(2)), [], [spent])
+        # the writer sees its own changes
+        assert await coin_store.get_coin_record(added) is not None
+        # other tasks see the committed state only
+        other = await asyncio.create_task(coin_store.get_coin_records([spent, added]))
+        assert [(record.name, record.spent) for record in other] == [(spent, False)]
+        assert await asyncio.create_task(coin_store.get_coin_record(added)) is None
+
+    other = await asyncio.create_task(coin_store.get_coin_records([spent, added]))
+    assert sorted((record.name, record.spent) for record in other) == sorted([(spent, True), (added, False)])
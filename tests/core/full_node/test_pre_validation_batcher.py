@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import pytest
+
+from spare.consensus.constants import ConsensusConstants
+from spare.consensus.default_constants import DEFAULT_CONSTANTS
+from spare.full_node.pre_validation_batcher import PreValidationBatcher
+from spare.types.blockchain_format.sized_bytes import bytes32
+from spare.util.errors import Err
+from spare.util.ints import uint32
+
+batches: List[Tuple[List[bytes], int]] = []
+
+
+def validate_batch(
+    spend_bundles: List[bytes], max_cost: int, constants: ConsensusConstants, height: uint32
+) -> Tuple[List[Tuple[Optional[Err], bytes]], Dict[bytes32, bytes]]:
+    batches.append((spend_bundles, height))
+    if b"fail" in spend_bundles:
+        raise RuntimeError("validation failed")
+    return [(None, spend_bundle[::-1]) for spend_bundle in spend_bundles], {}
+
+
+@pytest.mark.asyncio
+async def test_batches_by_size_and_height() -> None:
+    batches.clear()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        batcher = PreValidationBatcher(
+            pool, validate_batch, 1000, DEFAULT_CONSTANTS, max_batch_size=3, batch_window=0.05
+        )
+        inputs = [(b"ab", 1), (b"cd", 1), (b"ef", 1), (b"gh", 1), (b"ij", 2)]
+        results = await asyncio.gather(*(batcher.validate(data, uint32(height)) for data, height in inputs))
+        assert results == [(None, data[::-1]) for data, _ in inputs]
+        # the batch at height 1 is sent when it's full, the next one when a
+        # spend bundle for height 2 arrives, and the last one when the batch
+        # window has passed
+        assert batches == [([b"ab", b"cd", b"ef"], 1), ([b"gh"], 1), ([b"ij"], 2)]
+        assert batcher.metrics.spend_bundles == 5
+        # the tasks of the finished batches have been released
+        assert len(batcher._tasks) == 0
+        batcher.close()
+
+
+@pytest.mark.asyncio
+async def test_batch_window_and_failure() -> None:
+    batches.clear()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        batcher = PreValidationBatcher(pool, validate_batch, 1000, DEFAULT_CONSTANTS)
+        assert batcher.max_batch_size == 16
+        results = await asyncio.gather(
+            batcher.validate(b"ok", uint32(1)), batcher.validate(b"fail", uint32(1)), return_exceptions=True
+        )
+        assert len(batches) == 1
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert len(batcher._tasks) == 0
+        batcher.close()
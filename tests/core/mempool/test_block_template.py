@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+import random
+from typing import Any
+
+import pytest
+
+from spare.full_node.mempool_manager import MEMPOOL_BACKENDS
+from spare.types.blockchain_format.sized_bytes import bytes32
+from tests.core.mempool.test_mempool_backends import RecordingFeeEstimator, make_item, make_mempool_info
+
+
+@pytest.mark.parametrize("backend", MEMPOOL_BACKENDS.values())
+@pytest.mark.parametrize("invalidate", [False, True])
+def test_template_matches_full_scan(backend: Any, invalidate: bool) -> None:
+    rng = random.Random(3)
+    mempool = backend(make_mempool_info(1_000_000, 50_000), RecordingFeeEstimator())
+    if invalidate:
+        mempool.block_template.invalidate()
+    coin_ids = [bytes32(rng.randbytes(32)) for _ in range(200)]
+    for _ in range(100):
+        mempool.add_to_pool(make_item(rng, coin_ids, 10, 10000))
+    if invalidate:
+        assert mempool.block_template.stale
+    expected = mempool.create_bundle_from_mempool_items(lambda _: True)
+    assert expected is not None
+    assert mempool.create_bundle_from_block_template() == expected
+    assert not mempool.block_template.stale
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import random
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytest
+from blspy import G2Element
+from chia_rs import Spend, SpendBundleConditions
+
+from spare.consensus.cost_calculator import NPCResult
+from spare.full_node.fee_estimation import FeeBlockInfo, FeeMempoolInfo, MempoolInfo, MempoolItemInfo
+from spare.full_node.mempool import Mempool, MempoolBase, MempoolRemoveReason
+from spare.full_node.mempool_manager import MEMPOOL_BACKENDS
+from spare.full_node.native_mempool import NativeMempool
+from spare.types.blockchain_format.sized_bytes import bytes32
+from spare.types.clvm_cost import CLVMCost
+from spare.types.fee_rate import FeeRate, FeeRateV2
+from spare.types.mempool_item import MempoolItem
+from spare.types.mojos import Mojos
+from spare.types.spend_bundle import SpendBundle
+from spare.util.ints import uint32, uint64
+
+# The backends are driven with the same operations, and every observable result has to be the same
+
+
+class RecordingFeeEstimator:
+    def __init__(self) -> None:
+        self.calls: List[Tuple[str, int, int, int, int, int]] = []
+
+    def new_block_height(self, block_height: uint32) -> None:
+        pass
+
+    def new_block(self, block_info: FeeBlockInfo) -> None:
+        pass
+
+    def add_mempool_item(self, mempool_item_info: FeeMempoolInfo, mempool_item: MempoolItemInfo) -> None:
+        self._record("add", mempool_item_info, mempool_item)
+
+    def remove_mempool_item(self, mempool_info: FeeMempoolInfo, mempool_item: MempoolItemInfo) -> None:
+        self._record("remove", mempool_info, mempool_item)
+
+    def _record(self, kind: str, info: FeeMempoolInfo, item: MempoolItemInfo) -> None:
+        self.calls.append(
+            (
+                kind,
+                int(info.current_mempool_cost),
+                info.current_mempool_fees,
+                item.cost,
+                item.fee,
+                item.height_added_to_mempool,
+            )
+        )
+
+    def estimate_fee_rate(self, *, time_offset_seconds: int) -> FeeRateV2:
+        return FeeRateV2(0)
+
+    def mempool_size(self) -> CLVMCost:
+        return CLVMCost(uint64(0))
+
+    def mempool_max_size(self) -> CLVMCost:
+        return CLVMCost(uint64(0))
+
+    def request_fee_estimates(self, request_times: Any) -> Any:
+        return None
+
+
+def make_mempool_info(max_size_in_cost: int, max_block_clvm_cost: int) -> MempoolInfo:
+    return MempoolInfo(
+        CLVMCost(uint64(max_size_in_cost)),
+        FeeRate.create(Mojos(uint64(5)), CLVMCost(uint64(1))),
+        CLVMCost(uint64(max_block_clvm_cost)),
+    )
+
+
+def make_item(
+    rng: random.Random,
+    coin_ids: List[bytes32],
+    height: int,
+    timestamp: int,
+) -> MempoolItem:
+    name = bytes32(rng.randbytes(32))
+    # a few costs and fees, so that items often have the same fee rate
+    cost = rng.choice([1000, 2000, 5000, 10000])
+    fee = cost * rng.choice([0, 1, 2, 3, 5])
+    spent = rng.sample(coin_ids, rng.randint(1, 3))
+    spends = [Spend(coin_id, bytes32(b"\0" * 32), None, 0, None, None, None, None, [], [], 0) for coin_id in spent]
+    assert_before_height: Optional[uint32] = None
+    assert_before_seconds: Optional[uint64] = None
+    if rng.random() < 0.3:
+        assert_before_height = uint32(height + rng.randint(1, 60))
+    if rng.random() < 0.3:
+        assert_before_seconds = uint64(timestamp + rng.randint(1, 1200))
+    conds = SpendBundleConditions(spends, 0, 0, 0, assert_before_height, assert_before_seconds, [], cost, 0, 0)
+    return MempoolItem(
+        SpendBundle([], G2Element()),
+        uint64(fee),
+        NPCResult(None, conds, uint64(cost)),
+        name,
+        uint32(height),
+        None,
+        assert_before_height,
+        assert_before_seconds,
+    )
+
+
+def observe(mempool: MempoolBase, coin_ids: List[bytes32]) -> Dict[str, Any]:
+    min_fee_rates: List[Optional[float]] = []
+    for cost in [1000, 10000, 50000]:
+        try:
+            min_fee_rates.append(mempool.get_min_fee_rate(cost))
+        except ValueError:
+            min_fee_rates.append(None)
+    bundle = mempool.create_bundle_from_block_template()
+    return {
+        "size": mempool.size(),
+        "total_cost": int(mempool.total_mempool_cost()),
+        "total_fees": int(mempool.total_mempool_fees()),
+        # the SQLite queries without an ORDER BY don't define an order
+        "all_spends": sorted(item.name for item in mempool.all_spends()),
+        "all_spend_ids": sorted(mempool.all_spend_ids()),
+        "by_feerate": [item.name for item in mempool.spends_by_feerate()],
+        "by_coin_id": {
+            coin_id: sorted(item.name for item in mempool.get_spends_by_coin_id(coin_id)) for coin_id in coin_ids
+        },
+        "min_fee_rates": min_fee_rates,
+        "at_full_capacity": mempool.at_full_capacity(5000),
+        "bundle": None if bundle is None else (bundle[0].name(), bundle[1]),
+    }
+
+
+def test_backends_registered() -> None:
+    assert MEMPOOL_BACKENDS == {"sqlite": Mempool, "native": NativeMempool}
+    for backend in MEMPOOL_BACKENDS.values():
+        assert issubclass(backend, MempoolBase)
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("max_size_in_cost,max_block_clvm_cost", [(1_000_000, 200_000), (60_000, 20_000)])
+def test_backends_behave_the_same(seed: int, max_size_in_cost: int, max_block_clvm_cost: int) -> None:
+    rng = random.Random(seed)
+    estimators = [RecordingFeeEstimator() for _ in MEMPOOL_BACKENDS]
+    mempool_info = make_mempool_info(max_size_in_cost, max_block_clvm_cost)
+    mempools = [backend(mempool_info, estimator) for backend, estimator in zip(MEMPOOL_BACKENDS.values(), estimators)]
+    coin_ids = [bytes32(rng.randbytes(32)) for _ in range(40)]
+    height = 10
+    timestamp = 10000
+
+    for _ in range(300):
+        for estimator in estimators:
+            estimator.calls.clear()
+        operation = rng.random()
+        results: List[Any]
+        if operation < 0.7:
+            item = make_item(rng, coin_ids, height, timestamp)
+            results = [mempool.add_to_pool(item) for mempool in mempools]
+        elif operation < 0.85:
+            names = sorted(mempools[0].all_spend_ids())
+            removed = rng.sample(names, min(len(names), rng.randint(1, 5)))
+            reason = rng.choice([MempoolRemoveReason.CONFLICT, MempoolRemoveReason.BLOCK_INCLUSION])
+            results = [mempool.remove_from_pool(removed, reason) for mempool in mempools]
+        else:
+            height += rng.randint(1, 5)
+            timestamp += rng.randint(1, 100)
+            results = [mempool.new_tx_block(uint32(height), uint64(timestamp)) for mempool in mempools]
+
+        assert results[0] == results[1]
+        observations = [observe(mempool, coin_ids) for mempool in mempools]
+        assert observations[0] == observations[1]
+        # the SQLite mempool reports the items removed together in no particular order
+        assert sorted(estimators[0].calls) == sorted(estimators[1].calls)
+
+
+@pytest.mark.parametrize("backend", MEMPOOL_BACKENDS.values())
+def test_get_spend_by_id(backend: Any) -> None:
+    rng = random.Random(1)
+    mempool = backend(make_mempool_info(1_000_000, 200_000), RecordingFeeEstimator())
+    coin_ids = [bytes32(rng.randbytes(32)) for _ in range(5)]
+    item = make_item(rng, coin_ids, 10, 10000)
+    assert mempool.get_spend_by_id(item.name) is None
+    assert mempool.add_to_pool(item) is None
+    assert mempool.get_spend_by_id(item.name) == item
+    mempool.remove_from_pool([item.name], MempoolRemoveReason.CONFLICT)
+    assert mempool.get_spend_by_id(item.name) is None
+    assert mempool.size() == 0
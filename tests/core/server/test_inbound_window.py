@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from spare.server.inbound_pipeline import InboundWindow
+
+
+async def can_read(window: InboundWindow) -> bool:
+    try:
+        await asyncio.wait_for(window.wait_for_space(), timeout=0.05)
+    except asyncio.TimeoutError:
+        return False
+    return True
+
+
+@pytest.mark.asyncio
+async def test_reading_stops_at_limit() -> None:
+    window = InboundWindow(max_in_flight=1, max_queued_bytes=100)
+    window.queued(99)
+    assert await can_read(window)
+    window.queued(1)
+    assert not await can_read(window)
+    # A handler picking up a message frees its bytes
+    await window.acquire(50)
+    assert await can_read(window)
+
+
+@pytest.mark.asyncio
+async def test_reading_goes_on_while_awaiting_responses() -> None:
+    window = InboundWindow(max_in_flight=1, max_queued_bytes=100)
+    # The only credit is held by a handler, which waits for the response to a request it sent to the peer
+    await window.acquire(0)
+    window.queued(150)
+    assert not await can_read(window)
+
+    waiter = asyncio.create_task(window.wait_for_space())
+    await asyncio.sleep(0)
+    window.expect_response()
+    # The reader wakes up, so it can read the response
+    await asyncio.wait_for(waiter, timeout=1)
+    assert await can_read(window)
+
+    # Up to a hard limit
+    window.queued(50)
+    assert not await can_read(window)
+    window.response_done()
+    assert window.awaiting_responses == 0
+    assert not await can_read(window)
+
+    window.release()
+    await window.acquire(150)
+    assert await can_read(window)
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+from spare.protocols.pool_protocol import PoolErrorCode
+
+
+class StandInPoolServer:
+    """
+    A local HTTP server which answers the pool requests the farmer's PoolClient makes, and records them. It can be
+    told to fail requests, reject partials or answer slowly.
+    """
+
+    def __init__(self) -> None:
+        self.partials: List[Dict[str, Any]] = []
+        self.request_times: List[float] = []
+        # The next this many requests fail with an HTTP 500
+        self.fail_requests = 0
+        # Partials are rejected with this error code, if set
+        self.partial_error: Optional[PoolErrorCode] = None
+        self.delay = 0.0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._runner: Optional[web.AppRunner] = None
+        self.url = ""
+
+    async def start(self) -> None:
+        app = web.Application(middlewares=[self._track])
+        app.add_routes([web.get("/pool_info", self._pool_info), web.post("/partial", self._partial)])
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @web.middleware
+    async def _track(self, request: web.Request, handler: Any) -> web.StreamResponse:
+        self.request_times.append(time.monotonic())
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.delay > 0:
+                await asyncio.sleep(self.delay)
+            if self.fail_requests > 0:
+                self.fail_requests -= 1
+                return web.Response(status=500)
+            response: web.StreamResponse = await handler(request)
+            return response
+        finally:
+            self.in_flight -= 1
+
+    async def _pool_info(self, request: web.Request) -> web.Response:
+        return web.json_response({"name": "stand-in pool", "minimum_difficulty": 1, "protocol_version": 1})
+
+    async def _partial(self, request: web.Request) -> web.Response:
+        partial = await request.json()
+        if self.partial_error is not None:
+            return web.json_response({"error_code": self.partial_error.value, "error_message": self.partial_error.name})
+        self.partials.append(partial)
+        return web.json_response({"new_difficulty": 1})
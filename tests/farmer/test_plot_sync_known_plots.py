@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+import pytest
+from blspy import G1Element
+
+from spare.consensus.default_constants import DEFAULT_CONSTANTS
+from spare.farmer.farmer import Farmer
+from spare.protocols.harvester_protocol import Plot
+from spare.server.outbound_message import Message, NodeType
+from spare.types.blockchain_format.sized_bytes import bytes32
+from spare.util.ints import uint8, uint64
+
+
+class HarvesterConnection:
+    connection_type = NodeType.HARVESTER
+
+    def __init__(self, index: int) -> None:
+        self.peer_node_id = bytes32(index.to_bytes(32, "big"))
+
+    def get_peer_logging(self) -> str:
+        return f"harvester {self.peer_node_id.hex()}"
+
+    async def send_message(self, message: Message) -> None:
+        pass
+
+
+def make_plots(index: int) -> Dict[str, Plot]:
+    filename = f"/plots/plot-{index}.plot"
+    plot = Plot(
+        filename, uint8(32), bytes32(index.to_bytes(32, "big")), G1Element(), None, G1Element(), uint64(100), uint64(0)
+    )
+    return {filename: plot}
+
+
+def make_farmer(tmp_path: Path) -> Farmer:
+    farmer = Farmer(
+        tmp_path, {"plot_sync_known_harvesters": 2, "plot_sync_known_plots_max_age": 60}, {}, DEFAULT_CONSTANTS
+    )
+    # the handshake with the harvesters isn't part of these tests
+    farmer._shut_down = True
+    return farmer
+
+
+async def connect(farmer: Farmer, harvester: HarvesterConnection) -> Optional[Dict[str, Plot]]:
+    """
+    Connects the harvester, and returns the plots the farmer still knew of it
+    """
+    await farmer.on_connect(harvester)  # type: ignore[arg-type]
+    receiver = farmer.plot_sync_receivers[harvester.peer_node_id]
+    known_plots = receiver._known_plots
+    return known_plots if len(known_plots) > 0 else None
+
+
+def disconnect(farmer: Farmer, harvester: HarvesterConnection, index: int) -> None:
+    farmer.plot_sync_receivers[harvester.peer_node_id]._plots = make_plots(index)
+    farmer.on_disconnect(harvester)  # type: ignore[arg-type]
+
+
+@pytest.mark.asyncio
+async def test_reconnect(tmp_path: Path) -> None:
+    farmer = make_farmer(tmp_path)
+    harvester = HarvesterConnection(1)
+    assert await connect(farmer, harvester) is None
+    disconnect(farmer, harvester, 1)
+    assert await connect(farmer, harvester) == make_plots(1)
+    # the plots are handed over to the new connection
+    assert farmer.take_known_plots(harvester.peer_node_id) is None
+
+
+@pytest.mark.asyncio
+async def test_only_recent_harvesters_are_kept(tmp_path: Path) -> None:
+    farmer = make_farmer(tmp_path)
+    harvesters = [HarvesterConnection(i) for i in range(3)]
+    for i, harvester in enumerate(harvesters):
+        await connect(farmer, harvester)
+        disconnect(farmer, harvester, i)
+    assert len(farmer.plot_sync_known_plots.cache) == 2
+    assert await connect(farmer, harvesters[0]) is None
+    assert await connect(farmer, harvesters[1]) == make_plots(1)
+    assert await connect(farmer, harvesters[2]) == make_plots(2)
+
+
+@pytest.mark.asyncio
+async def test_old_plots_are_evicted(tmp_path: Path) -> None:
+    farmer = make_farmer(tmp_path)
+    harvesters = [HarvesterConnection(i) for i in range(2)]
+    for i, harvester in enumerate(harvesters):
+        await connect(farmer, harvester)
+        disconnect(farmer, harvester, i)
+    # the first one disconnected a while ago
+    disconnect_time, plots = farmer.plot_sync_known_plots.cache[harvesters[0].peer_node_id]
+    farmer.plot_sync_known_plots.cache[harvesters[0].peer_node_id] = (disconnect_time - 120, plots)
+    farmer.evict_known_plots(time.time())
+    assert list(farmer.plot_sync_known_plots.cache) == [harvesters[1].peer_node_id]
+
+    # plots which are too old when the harvester reconnects aren't used either
+    assert await connect(farmer, harvesters[0]) is None
+    assert await connect(farmer, harvesters[1]) == make_plots(1)
+    disconnect(farmer, harvesters[1], 1)
+    farmer.plot_sync_known_plots_max_age = 0
+    time.sleep(0.01)
+    assert await connect(farmer, harvesters[1]) is None
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import AsyncIterator
+
+import pytest
+import pytest_asyncio
+
+from spare.farmer.pool_client import PartialRetryQueue, PoolClient, PoolRequestError, QueuedPartial
+from spare.protocols.pool_protocol import POOL_PARTIAL_TIME_LIMIT, PoolErrorCode
+from spare.types.blockchain_format.sized_bytes import bytes32
+from spare.util.ints import uint64
+from tests.farmer.pool_server import StandInPoolServer
+
+
+@pytest_asyncio.fixture(scope="function")
+async def pool_server() -> AsyncIterator[StandInPoolServer]:
+    server = StandInPoolServer()
+    await server.start()
+    yield server
+    await server.stop()
+
+
+def make_partial(pool_url: str, created: float, index: int = 0) -> QueuedPartial:
+    return QueuedPartial(pool_url, bytes32(b"\1" * 32), uint64(1), {"payload": {"index": index}}, created)
+
+
+@pytest.mark.asyncio
+async def test_request(pool_server: StandInPoolServer) -> None:
+    client = PoolClient(pool_server.url, None)
+    try:
+        response = await client.request("GET", "/pool_info")
+        assert response["name"] == "stand-in pool"
+        pool_server.fail_requests = 1
+        with pytest.raises(PoolRequestError) as e:
+            await client.request("GET", "/pool_info")
+        assert e.value.status == 500
+        assert client.metrics.requests == 2
+        assert client.metrics.failed_requests == 1
+        assert client.metrics.latency.count == 2
+    finally:
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_unreachable_pool(pool_server: StandInPoolServer) -> None:
+    await pool_server.stop()
+    client = PoolClient(pool_server.url, None)
+    try:
+        with pytest.raises(PoolRequestError) as e:
+            await client.request("GET", "/pool_info")
+        assert e.value.status is None
+        assert client.metrics.failed_requests == 1
+    finally:
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_concurrency_and_interval(pool_server: StandInPoolServer) -> None:
+    pool_server.delay = 0.05
+    client = PoolClient(pool_server.url, None, max_concurrent_requests=2, min_request_interval=0.02)
+    try:
+        await asyncio.gather(*(client.request("GET", "/pool_info") for _ in range(6)))
+    finally:
+        await client.close()
+    assert pool_server.max_in_flight == 2
+    assert len(pool_server.request_times) == 6
+    gaps = [b - a for a, b in zip(pool_server.request_times, pool_server.request_times[1:])]
+    # allow for timer granularity
+    assert min(gaps) >= 0.015
+
+
+@pytest.mark.asyncio
+async def test_partial_retried_until_accepted(pool_server: StandInPoolServer, tmp_path: Path) -> None:
+    queue = PartialRetryQueue(tmp_path / "queue.json")
+    client = PoolClient(pool_server.url, None)
+    partial = make_partial(pool_server.url, time.time())
+    pool_server.fail_requests = 1
+    try:
+        with pytest.raises(PoolRequestError):
+            await client.request("POST", "/partial", json_data=partial.request)
+        assert queue.put(partial) is None
+        due, expired = queue.take_due(time.time())
+        assert due == [] and expired == []
+        due, expired = queue.take_due(partial.next_attempt)
+        assert due == [partial] and expired == []
+        response = await client.request("POST", "/partial", json_data=due[0].request)
+        assert "error_code" not in response
+        assert pool_server.partials == [partial.request]
+
+        pool_server.partial_error = PoolErrorCode.TOO_LATE
+        response = await client.request("POST", "/partial", json_data=partial.request)
+        assert response["error_code"] == PoolErrorCode.TOO_LATE.value
+    finally:
+        await client.close()
+
+
+def test_max_age_capped(tmp_path: Path) -> None:
+    queue = PartialRetryQueue(tmp_path / "queue.json", max_age=300)
+    now = time.time()
+    fresh = make_partial("http://pool", now - POOL_PARTIAL_TIME_LIMIT + 5, 0)
+    stale = make_partial("http://pool", now - POOL_PARTIAL_TIME_LIMIT - 5, 1)
+    queue.put(fresh)
+    queue.put(stale)
+    # just after the first backoff
+    due, expired = queue.take_due(now + 3)
+    assert due == [fresh]
+    assert expired == [stale]
+    assert len(queue) == 0
+
+
+@pytest.mark.asyncio
+async def test_load_drops_expired(tmp_path: Path) -> None:
+    path = tmp_path / "queue.json"
+    queue = PartialRetryQueue(path)
+    now = time.time()
+    partials = [make_partial("http://pool", now - age, index) for index, age in enumerate([1, 10, 60, 600])]
+    for partial in partials:
+        queue.put(partial)
+    await queue.save()
+    assert len(json.loads(path.read_text())) == 4
+
+    reloaded = PartialRetryQueue(path)
+    reloaded.load()
+    assert len(reloaded) == 2
+    due, expired = reloaded.take_due(now + 3)
+    assert [partial.request for partial in due] == [partials[0].request, partials[1].request]
+    assert expired == []
+    # the expired entries are also dropped from the file
+    await reloaded.save()
+    assert json.loads(path.read_text()) == []
@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import dataclasses
+from typing import Any, Dict, List, Optional, Set
+
+import pytest
+from blspy import G1Element
+
+from spare.plot_sync.delta import Delta
+from spare.plot_sync.receiver import Receiver
+from spare.plot_sync.sender import Sender
+from spare.plot_sync.summary import plot_bucket
+from spare.plotting.util import PlotInfo
+from spare.protocols.harvester_protocol import (
+    Plot,
+    PlotSyncDone,
+    PlotSyncPathList,
+    PlotSyncPlotList,
+    PlotSyncResponse,
+    PlotSyncStart,
+    PlotSyncSummary,
+    PlotSyncSummaryResponse,
+)
+from spare.protocols.protocol_message_types import ProtocolMessageTypes
+from spare.server.outbound_message import Message, NodeType
+from spare.types.blockchain_format.sized_bytes import bytes32
+from spare.util.ints import uint8, uint64
+
+
+class FakeProver:
+    def __init__(self, filename: str, plot_id: bytes32) -> None:
+        self._filename = filename
+        self._plot_id = plot_id
+
+    def get_filename(self) -> str:
+        return self._filename
+
+    def get_size(self) -> uint8:
+        return uint8(32)
+
+    def get_id(self) -> bytes32:
+        return self._plot_id
+
+
+@dataclasses.dataclass
+class FakeRefreshParameter:
+    batch_size: int = 7
+
+
+class FakePlotManager:
+    def __init__(self, plots: Dict[str, PlotInfo]) -> None:
+        self.plots = plots
+        self.refresh_parameter = FakeRefreshParameter()
+        self.failed_to_open_filenames: Dict[str, int] = {}
+        self.no_key_filenames: Set[str] = set()
+
+    def initial_refresh(self) -> bool:
+        return True
+
+    def plot_count(self) -> int:
+        return len(self.plots)
+
+    def get_duplicates(self) -> List[str]:
+        return []
+
+
+class FarmerConnection:
+    """
+    The harvester's connection to the farmer, which hands the messages straight to the farmer's receiver
+    """
+
+    connection_type = NodeType.FARMER
+    peer_node_id = bytes32(b"\1" * 32)
+    receiver: Receiver
+    summaries_sent: int
+
+    def __init__(self) -> None:
+        self.summaries_sent = 0
+
+    def has_capability(self, capability: Any) -> bool:
+        return True
+
+    async def send_message(self, message: Message) -> bool:
+        message_type = ProtocolMessageTypes(message.type)
+        handlers = {
+            ProtocolMessageTypes.plot_sync_start: (PlotSyncStart, self.receiver.sync_started),
+            ProtocolMessageTypes.plot_sync_loaded: (PlotSyncPlotList, self.receiver.process_loaded),
+            ProtocolMessageTypes.plot_sync_summary: (PlotSyncSummary, self.receiver.process_summary),
+            ProtocolMessageTypes.plot_sync_removed: (PlotSyncPathList, self.receiver.process_removed),
+            ProtocolMessageTypes.plot_sync_invalid: (PlotSyncPathList, self.receiver.process_invalid),
+            ProtocolMessageTypes.plot_sync_keys_missing: (PlotSyncPathList, self.receiver.process_keys_missing),
+            ProtocolMessageTypes.plot_sync_duplicates: (PlotSyncPathList, self.receiver.process_duplicates),
+            ProtocolMessageTypes.plot_sync_done: (PlotSyncDone, self.receiver.sync_done),
+        }
+        payload_type, handler = handlers[message_type]
+        if message_type == ProtocolMessageTypes.plot_sync_summary:
+            self.summaries_sent += 1
+        await handler(payload_type.from_bytes(message.data))  # type: ignore[attr-defined]
+        return True
+
+
+class HarvesterConnection:
+    """
+    The farmer's connection to the harvester, which hands the responses straight to the harvester's sender
+    """
+
+    peer_node_id = bytes32(b"\2" * 32)
+
+    def __init__(self, sender: Sender) -> None:
+        self.sender = sender
+
+    async def send_message(self, message: Message) -> bool:
+        if message.type == ProtocolMessageTypes.plot_sync_summary_response.value:
+            self.sender.set_summary_response(PlotSyncSummaryResponse.from_bytes(message.data))
+        else:
+            assert message.type == ProtocolMessageTypes.plot_sync_response.value
+            self.sender.set_response(PlotSyncResponse.from_bytes(message.data))
+        return True
+
+
+def make_plot_info(index: int, time_modified: float = 1000.0) -> PlotInfo:
+    plot_id = bytes32(index.to_bytes(32, "big"))
+    return PlotInfo(
+        FakeProver(f"/plots/plot-{index}.plot", plot_id), None, None, G1Element(), 100 + index, time_modified
+    )
+
+
+def to_plot(plot_info: PlotInfo) -> Plot:
+    return Plot(
+        plot_info.prover.get_filename(),
+        plot_info.prover.get_size(),
+        plot_info.prover.get_id(),
+        plot_info.pool_public_key,
+        plot_info.pool_contract_puzzle_hash,
+        plot_info.plot_public_key,
+        uint64(plot_info.file_size),
+        uint64(int(plot_info.time_modified)),
+    )
+
+
+class Setup:
+    def __init__(self, harvester_plots: List[PlotInfo], known_plots: Optional[Dict[str, Plot]]) -> None:
+        self.plot_manager = FakePlotManager({plot.prover.get_filename(): plot for plot in harvester_plots})
+        self.sender = Sender(self.plot_manager)  # type: ignore[arg-type]
+        self.farmer_connection = FarmerConnection()
+        self.sender.set_connection(self.farmer_connection)  # type: ignore[arg-type]
+        self.deltas: List[Delta] = []
+        self.receiver = Receiver(
+            HarvesterConnection(self.sender), self.update_callback, known_plots  # type: ignore[arg-type]
+        )
+        self.farmer_connection.receiver = self.receiver
+
+    async def update_callback(self, peer_id: bytes32, delta: Optional[Delta]) -> None:
+        if delta is not None:
+            self.deltas.append(delta)
+
+    def queue_initial_sync(self) -> None:
+        plots = list(self.plot_manager.plots.values())
+        self.sender.sync_start(len(plots), True)
+        batch_size = self.plot_manager.refresh_parameter.batch_size
+        for start in range(0, len(plots), batch_size):
+            batch = plots[start : start + batch_size]
+            self.sender.process_batch(batch, len(plots) - start - len(batch))
+        self.sender.sync_done([], 0)
+
+    async def run_sync(self) -> int:
+        # Returns the number of loaded plots sent to the farmer
+        sent = 0
+        while self.sender.sync_active():
+            message = self.sender._messages[self.sender._next_message_id]
+            if message.message_type == ProtocolMessageTypes.plot_sync_loaded:
+                sent += len(list(message.args)[0])  # type: ignore[arg-type]
+            assert await self.sender._send_next_message()
+        return sent
+
+    def expected_plots(self) -> Dict[str, Plot]:
+        return {filename: to_plot(plot_info) for filename, plot_info in self.plot_manager.plots.items()}
+
+
+@pytest.mark.asyncio
+async def test_summary_sync_matching_buckets() -> None:
+    harvester_plots = [make_plot_info(i) for i in range(50)]
+    known_plots = {plot.prover.get_filename(): to_plot(plot) for plot in harvester_plots}
+    setup = Setup(harvester_plots, known_plots)
+    setup.queue_initial_sync()
+    assert await setup.run_sync() == 0
+    assert setup.farmer_connection.summaries_sent == 1
+    assert setup.receiver.last_sync().differing_buckets == []
+    assert setup.receiver.plots() == setup.expected_plots()
+    assert setup.receiver.last_sync().plots_processed == 50
+
+
+@pytest.mark.asyncio
+async def test_summary_sync_differing_buckets() -> None:
+    harvester_plots = [make_plot_info(i) for i in range(50)]
+    known_plots = {plot.prover.get_filename(): to_plot(plot) for plot in harvester_plots}
+    # The farmer doesn't know about plot 0, knows a plot 50 the harvester no longer has and an outdated plot 1
+    del known_plots[harvester_plots[0].prover.get_filename()]
+    known_plots[make_plot_info(50).prover.get_filename()] = to_plot(make_plot_info(50))
+    known_plots[harvester_plots[1].prover.get_filename()] = to_plot(make_plot_info(1, time_modified=1.0))
+    changed = [harvester_plots[0].prover.get_filename(), harvester_plots[1].prover.get_filename()]
+    changed_buckets = sorted(
+        {plot_bucket(filename) for filename in changed + [make_plot_info(50).prover.get_filename()]}
+    )
+
+    setup = Setup(harvester_plots, known_plots)
+    setup.queue_initial_sync()
+    sent = await setup.run_sync()
+    assert setup.farmer_connection.summaries_sent == 1
+    assert setup.receiver.last_sync().differing_buckets == changed_buckets
+    # Only the plots of the differing buckets are sent
+    assert sent == len([plot for plot in harvester_plots if plot_bucket(plot.prover.get_filename()) in changed_buckets])
+    assert 2 <= sent < len(harvester_plots)
+    assert setup.receiver.plots() == setup.expected_plots()
+
+
+@pytest.mark.asyncio
+async def test_summary_sync_fallback(monkeypatch: pytest.MonkeyPatch) -> None:
+    harvester_plots = [make_plot_info(i) for i in range(20)]
+    known_plots = {plot.prover.get_filename(): to_plot(plot) for plot in harvester_plots}
+    setup = Setup(harvester_plots, known_plots)
+
+    async def failing_summary(summary: PlotSyncSummary) -> None:
+        raise ValueError("summary failed")
+
+    monkeypatch.setattr(setup.receiver, "_process_summary", failing_summary)
+    setup.queue_initial_sync()
+    # The start message goes through, the summary fails and can't be recovered from
+    assert await setup.sender._send_next_message()
+    assert not await setup.sender._send_next_message()
+    assert setup.sender._summary_disabled
+    assert not setup.sender.sync_active()
+
+    # The next initial sync sends all plots, without a summary
+    setup.receiver.reset()
+    setup.queue_initial_sync()
+    assert await setup.run_sync() == len(harvester_plots)
+    assert setup.farmer_connection.summaries_sent == 1
+    assert setup.receiver.plots() == setup.expected_plots()
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import time
+import zlib
+from pathlib import Path
+
+from spare.plotting.cache import (
+    _FILE_HEADER,
+    _RECORD_PUT,
+    CACHE_MAGIC,
+    CURRENT_VERSION,
+    LAST_USE_SAVE_INTERVAL,
+    Cache,
+    _record_header,
+)
+
+
+def write_cache_file(path: Path, last_use: float, *plot_paths: Path) -> None:
+    # the entries are never looked up, so their data doesn't need to be a valid DiskCacheEntry
+    data = b"entry data"
+    records = [_FILE_HEADER.pack(CACHE_MAGIC, CURRENT_VERSION)]
+    for plot_path in plot_paths:
+        records.extend(
+            [_record_header(_RECORD_PUT, last_use, str(plot_path).encode(), len(data), zlib.crc32(data)), data]
+        )
+    path.write_bytes(b"".join(records))
+
+
+def load_cache(path: Path) -> Cache:
+    cache = Cache(path)
+    cache.load()
+    return cache
+
+
+def test_last_use_is_saved(tmp_path: Path) -> None:
+    cache_path = tmp_path / "plot_manager.dat"
+    used, unused = Path("used.plot"), Path("unused.plot")
+    first_use = int(time.time()) - 3 * 24 * 60 * 60
+    write_cache_file(cache_path, first_use, used, unused)
+
+    cache = load_cache(cache_path)
+    assert cache.last_use(used) == first_use
+    cache.bump_last_use(used)
+    assert cache.changed()
+    file_size = cache_path.stat().st_size
+    cache.save()
+    # only the last use is appended, not the entry
+    assert cache_path.stat().st_size - file_size < 100
+    cache.close()
+
+    cache = load_cache(cache_path)
+    last_use = cache.last_use(used)
+    assert last_use is not None and last_use > first_use + LAST_USE_SAVE_INTERVAL
+    assert cache.last_use(unused) == first_use
+    # a recent last use isn't written again
+    cache.bump_last_use(used)
+    assert not cache.changed()
+
+    # compaction keeps it as well
+    cache._needs_compaction = True
+    cache.save()
+    cache.close()
+    cache = load_cache(cache_path)
+    assert cache.last_use(used) == last_use
+    assert cache.last_use(unused) == first_use
+    cache.close()
+
+
+def test_last_use_of_removed_entry_is_dropped(tmp_path: Path) -> None:
+    cache_path = tmp_path / "plot_manager.dat"
+    plot_path = Path("removed.plot")
+    write_cache_file(cache_path, int(time.time()) - 3 * 24 * 60 * 60, plot_path)
+
+    cache = load_cache(cache_path)
+    cache.bump_last_use(plot_path)
+    cache.remove([plot_path])
+    cache.save()
+    cache.close()
+
+    cache = load_cache(cache_path)
+    assert len(cache) == 0
+    assert cache.last_use(plot_path) is None
+    cache.close()
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import List
+
+from blspy import G1Element
+
+from spare.plotting.check_plots import PlotCheckResult, check_plot
+from spare.plotting.util import PlotInfo
+from spare.types.blockchain_format.sized_bytes import bytes32
+
+
+class FakeProver:
+    def __init__(self, fail_at: int = -1) -> None:
+        self.fail_at = fail_at
+        self.lookups = 0
+
+    def get_size(self) -> int:
+        return 32
+
+    def get_id(self) -> bytes32:
+        return bytes32(b"\0" * 32)
+
+    def get_qualities_for_challenge(self, challenge: bytes32) -> List[bytes32]:
+        self.lookups += 1
+        if self.lookups == self.fail_at:
+            raise RuntimeError("bad plot")
+        return []
+
+
+def make_plot_info(prover: FakeProver) -> PlotInfo:
+    return PlotInfo(prover, None, None, G1Element(), 100, 0.0)  # type: ignore[arg-type]
+
+
+def test_plot_without_proofs() -> None:
+    prover = FakeProver()
+    result = check_plot(Path("a.plot"), make_plot_info(prover), 0, 30, False, None, True)
+    assert result.challenges == 30 and result.proofs == 0
+    assert not result.is_good()
+    assert result.early_exit is None
+
+
+def test_early_exit() -> None:
+    prover = FakeProver()
+    result = check_plot(Path("a.plot"), make_plot_info(prover), 0, 30, False, 5)
+    assert result.challenges == 5
+    assert result.early_exit == "bad"
+    assert PlotCheckResult.from_json_dict(result.to_json_dict()) == result
+
+
+def test_error_ends_check() -> None:
+    prover = FakeProver(fail_at=3)
+    result = check_plot(Path("a.plot"), make_plot_info(prover), 0, 30, False, None)
+    assert result.challenges == 3
+    assert len(result.errors) == 1 and "bad plot" in result.errors[0]
+    assert not result.is_good()